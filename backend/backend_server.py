@@ -0,0 +1,375 @@
+# backend_server.py
+"""Long-lived backend process speaking JSON-RPC 2.0 over stdio.
+
+The Electron main process starts this once and sends one request per line on
+stdin; each response is written as a single line on stdout. Keeping the
+interpreter alive means the Docker SDK import, ``docker.from_env()`` and the
+SQLite schema setup are paid once instead of on every IPC call.
+
+Requests are handled on a small pool of worker threads and answered by id as
+they finish, so a slow call (a refresh, a delete's grace period, a backup)
+never holds up a cheap read behind it. Each worker uses its own SQLite
+connection.
+
+Anything the backend functions print is redirected to stderr so it can never
+corrupt the protocol stream. After "subscribe_instances" the server also
+writes JSON-RPC notifications (requests without an id) for instance state
+changes; deletes, creates, bulk start/stop, backups, image pulls and
+background refreshes report their progress the same way.
+
+With CW_PROFILE set in its environment the server records timings for every
+request (see profiling.py); "profile_report" returns them.
+"""
+import contextlib
+import inspect
+import json
+import queue
+import sys
+import threading
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+SERVER_ERROR = -32000
+REQUEST_WORKERS = 4
+
+
+class BackendContext:
+    """Resources shared by every request: one Docker client and a SQLite connection per thread.
+
+    A connection passed in is shared by every thread instead, so it must be
+    opened with ``check_same_thread=False`` if requests are served by workers.
+    """
+
+    def __init__(self, client=None, conn=None):
+        from workers import ExecBudget
+        self._client = client
+        self._conn = conn
+        self._local = threading.local()
+        self._conns = []
+        # Guards creating the shared members below, not the requests using them.
+        self.lock = threading.RLock()
+        self.watcher = None
+        # Warm container pool, once configure_pool has been called.
+        self.pool = None
+        # Background resource sampler, once container_metrics has been called.
+        self.metrics = None
+        # Background refresh scheduler, once view_project has been called.
+        self.scheduler = None
+        # Docker execs in flight for refreshes; the scheduler gives way to update_database calls.
+        self.exec_budget = ExecBudget()
+        # Set by serve(): sends a JSON-RPC notification to the client.
+        self.notify = lambda method, params: None
+
+    @property
+    def client(self):
+        import profiling
+        if self._client is None:
+            with self.lock:
+                if self._client is None:
+                    import docker
+                    self._client = docker.from_env()
+        return profiling.instrument_client(self._client)
+
+    @property
+    def conn(self):
+        if self._conn is not None:
+            return self._conn
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            import db_operations
+            conn = self._local.conn = db_operations.connect()
+            with self.lock:
+                self._conns.append(conn)
+        return conn
+
+    def close(self):
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+        if self.metrics is not None:
+            self.metrics.stop()
+            self.metrics = None
+        if self.scheduler is not None:
+            self.scheduler.stop()
+            self.scheduler = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        with self.lock:
+            conns, self._conns = self._conns, []
+        for conn in conns:
+            conn.close()
+        self._local = threading.local()
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+
+# Handlers import their backend module on first use so that starting the
+# server (and answering "ping") never waits on the Docker SDK.
+
+def _ping(ctx):
+    return "pong"
+
+def _list_docker_compose_projects(ctx, service_name="frappe"):
+    from list_instances import list_docker_compose_projects
+    return list_docker_compose_projects(service_name=service_name, client=ctx.client)
+
+def _get_project_info(ctx, project_name):
+    from db_operations import get_project_info
+    return get_project_info(project_name, conn=ctx.conn)
+
+def _get_all_projects_info(ctx):
+    from db_operations import get_all_projects_info
+    return get_all_projects_info(conn=ctx.conn)
+
+def _cache_stats(ctx):
+    from db_operations import get_cache_stats
+    return get_cache_stats()
+
+def _instance_info(ctx, args=()):
+    # Same arguments as the frappe_instance_info.py command line.
+    from frappe_instance_info import build_parser, run_query
+    try:
+        parsed = build_parser().parse_args(list(args))
+    except SystemExit:
+        raise ValueError(f"Invalid arguments: {' '.join(args)}")
+    return run_query(parsed, conn=ctx.conn)
+
+def _update_database(ctx, project_name=None, specific_site=None, update_bench=True, update_sites=True,
+                     update_apps=True, jobs=4, timeout=120, force=False, inventory=True):
+    from update_db import update_database
+    with ctx.exec_budget.held(jobs):
+        return update_database(
+            project_name=project_name,
+            specific_site=specific_site,
+            update_bench=update_bench,
+            update_sites=update_sites,
+            update_apps=update_apps,
+            client=ctx.client,
+            conn=ctx.conn,
+            jobs=jobs,
+            timeout=timeout,
+            force=force,
+            inventory=inventory,
+            # Each container's result is pushed as a refresh_progress notification as it finishes.
+            on_event=lambda event: ctx.notify("refresh_progress", event),
+        )
+
+def _create_frappe_instance(ctx, config):
+    from create_instance import create_frappe_instance
+    with ctx.lock:
+        pool = ctx.pool
+    return create_frappe_instance(
+        config, client=ctx.client, conn=ctx.conn, pool=pool,
+        on_event=lambda event: ctx.notify(event["type"], event)
+    )
+
+def _pull_image(ctx, image=None):
+    # Returns at once; pull_progress, pull_complete or pull_error notifications follow.
+    from provisioning import DEFAULT_IMAGE, start_prepull
+    start_prepull([image or DEFAULT_IMAGE], client=ctx.client, on_event=lambda event: ctx.notify(event["type"], event))
+    return {"started": True}
+
+def _configure_pool(ctx, size=1, max_age=None, image=None):
+    # The pool opens its own short-lived connections: it refills on background threads.
+    from provisioning import DEFAULT_IMAGE, POOL_MAX_AGE, WarmPool
+    if size <= 0:
+        with ctx.lock:
+            pool, ctx.pool = ctx.pool, None
+        if pool is not None:
+            pool.size = 0
+            pool.evict()
+        return {"size": 0}
+    pool = WarmPool(client=ctx.client, image=image or DEFAULT_IMAGE, size=size, max_age=max_age or POOL_MAX_AGE)
+    with ctx.lock:
+        ctx.pool = pool
+    pool.refill_in_background(on_event=lambda event: ctx.notify(event["type"], event))
+    return {"size": size, "members": [c.name for c in pool.members()]}
+
+def _delete_frappe_instance(ctx, project_name, grace=10):
+    from delete_instance import delete_frappe_instance
+    # Per-resource progress is pushed as delete_progress notifications.
+    return json.loads(delete_frappe_instance(
+        project_name, client=ctx.client, conn=ctx.conn, grace=grace,
+        on_event=lambda event: ctx.notify("delete_progress", dict(event, project=project_name))
+    ))
+
+def _bulk_lifecycle(ctx, action, projects=(), labels=(), jobs=8, timeout=120, grace=10):
+    from lifecycle import bulk_action
+    # Per-container and per-project progress is pushed as lifecycle_progress notifications.
+    return bulk_action(action, projects, labels, client=ctx.client, jobs=jobs, timeout=timeout, grace=grace,
+                       on_event=lambda event: ctx.notify("lifecycle_progress", event))
+
+def _backup_sites(ctx, projects, dest, sites=None, jobs=8, per_container=2):
+    from backup import backup_sites
+    # Per-site progress and throughput is pushed as backup_progress notifications.
+    return backup_sites(projects, dest, sites=sites, client=ctx.client, conn=ctx.conn, jobs=jobs,
+                        per_container=per_container, on_event=lambda event: ctx.notify("backup_progress", event))
+
+def _restore_sites(ctx, source, projects=None, sites=None, jobs=8, per_container=2, db_root_password=None,
+                   force=False):
+    from backup import restore_sites
+    return restore_sites(source, projects, sites=sites, client=ctx.client, conn=ctx.conn, jobs=jobs,
+                         per_container=per_container, db_root_password=db_root_password, force=force,
+                         on_event=lambda event: ctx.notify("backup_progress", event))
+
+def _subscribe_instances(ctx):
+    # Starts pushing instance_changed / instance_removed notifications and
+    # returns the current state of every project.
+    with ctx.lock:
+        if ctx.watcher is None:
+            from instance_watcher import InstanceWatcher
+            watcher = InstanceWatcher(client=ctx.client)
+            watcher.subscribe(lambda change: ctx.notify(change["type"], change))
+            snapshot = watcher.start()
+            ctx.watcher = watcher
+            return snapshot
+    return ctx.watcher.snapshot()
+
+def _container_metrics(ctx, project_name=None, by="project", sort_by="cpu_percent", top=None, window=None):
+    # The first call starts sampling in the background; until the first round
+    # completes there is nothing to report.
+    with ctx.lock:
+        if ctx.metrics is None:
+            from metrics import MetricsSampler
+            ctx.metrics = MetricsSampler(client=ctx.client)
+            ctx.metrics.start()
+    if project_name:
+        return ctx.metrics.containers(project_name, window)
+    return ctx.metrics.top(top or len(ctx.metrics.containers()), sort_by, by, window)
+
+def _view_project(ctx, project_name=None):
+    # The first call starts refreshing projects in the background; each
+    # refresh is pushed as a background_refresh notification. The viewed
+    # project goes first whenever its data is more than a few seconds old.
+    with ctx.lock:
+        if ctx.scheduler is None:
+            from scheduler import RefreshScheduler
+            ctx.scheduler = RefreshScheduler(client=ctx.client, budget=ctx.exec_budget)
+            ctx.scheduler.start(on_event=lambda event: ctx.notify("background_refresh", event))
+    ctx.scheduler.view(project_name)
+    return {"viewed": project_name}
+
+def _refresh_status(ctx):
+    if ctx.scheduler is None:
+        from db_operations import get_refresh_status
+        return get_refresh_status(conn=ctx.conn)
+    return ctx.scheduler.status()
+
+def _profile_report(ctx, reset=False):
+    import profiling
+    report = {"enabled": profiling.enabled(), "spans": profiling.recorder.summary(),
+              "counters": dict(profiling.recorder.counters)}
+    if reset:
+        profiling.recorder.clear()
+    return report
+
+def _find_available_port(ctx, start_port=8000):
+    from port_scanner import find_available_port
+    return find_available_port(start_port, client=ctx.client, conn=ctx.conn)
+
+
+METHODS = {
+    "ping": _ping,
+    "list_docker_compose_projects": _list_docker_compose_projects,
+    "get_project_info": _get_project_info,
+    "get_all_projects_info": _get_all_projects_info,
+    "instance_info": _instance_info,
+    "cache_stats": _cache_stats,
+    "container_metrics": _container_metrics,
+    "view_project": _view_project,
+    "refresh_status": _refresh_status,
+    "profile_report": _profile_report,
+    "update_database": _update_database,
+    "create_frappe_instance": _create_frappe_instance,
+    "delete_frappe_instance": _delete_frappe_instance,
+    "bulk_lifecycle": _bulk_lifecycle,
+    "backup_sites": _backup_sites,
+    "restore_sites": _restore_sites,
+    "find_available_port": _find_available_port,
+    "pull_image": _pull_image,
+    "configure_pool": _configure_pool,
+    "subscribe_instances": _subscribe_instances,
+}
+
+
+def _error(request_id, code, message):
+    return {"jsonrpc": "2.0", "id": request_id, "error": {"code": code, "message": message}}
+
+def handle_request(ctx, line):
+    """Handle one JSON-RPC request line and return the response dict (None for notifications)."""
+    try:
+        request = json.loads(line)
+    except json.JSONDecodeError as e:
+        return _error(None, PARSE_ERROR, f"Parse error: {e}")
+
+    if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+        return _error(None, INVALID_REQUEST, "Invalid request")
+
+    request_id = request.get("id")
+    handler = METHODS.get(request["method"])
+    if handler is None:
+        return _error(request_id, METHOD_NOT_FOUND, f"Method not found: {request['method']}")
+
+    params = request.get("params") or {}
+    try:
+        if isinstance(params, list):
+            bound = inspect.signature(handler).bind(ctx, *params)
+        else:
+            bound = inspect.signature(handler).bind(ctx, **params)
+    except TypeError as e:
+        return _error(request_id, INVALID_PARAMS, str(e))
+
+    try:
+        result = handler(*bound.args, **bound.kwargs)
+    except Exception as e:
+        return _error(request_id, SERVER_ERROR, str(e))
+
+    if "id" not in request:
+        return None
+    return {"jsonrpc": "2.0", "id": request_id, "result": result}
+
+def serve(ctx, stdin=sys.stdin, stdout=sys.stdout, workers=REQUEST_WORKERS):
+    """Answer requests from ``stdin`` on ``workers`` threads until it closes, then finish the ones in flight."""
+    # Responses and notifications from background threads share stdout.
+    write_lock = threading.Lock()
+    requests = queue.Queue()
+
+    def send(message):
+        with write_lock:
+            stdout.write(json.dumps(message) + "\n")
+            stdout.flush()
+
+    def worker():
+        for line in iter(requests.get, None):
+            response = handle_request(ctx, line)
+            if response is not None:
+                send(response)
+
+    ctx.notify = lambda method, params: send({"jsonrpc": "2.0", "method": method, "params": params})
+    threads = [threading.Thread(target=worker, name=f"request-worker-{i}", daemon=True) for i in range(workers)]
+    # Handlers and background threads (the refresh scheduler) print too; the
+    # protocol keeps the real stdout and everything else goes to stderr.
+    with contextlib.redirect_stdout(sys.stderr):
+        for thread in threads:
+            thread.start()
+        for line in iter(stdin.readline, ""):
+            if line.strip():
+                requests.put(line)
+        for _ in threads:
+            requests.put(None)
+        for thread in threads:
+            thread.join()
+
+def main():
+    ctx = BackendContext()
+    try:
+        serve(ctx)
+    finally:
+        ctx.close()
+
+if __name__ == "__main__":
+    main()
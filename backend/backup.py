@@ -0,0 +1,309 @@
+# backup.py
+"""Back up and restore Frappe sites in parallel, streaming archives to local files.
+
+``backup_sites`` finds each project's bench and sites the way update_db does,
+then runs ``bench --site SITE backup --with-files`` into a scratch directory
+of the frappe container. The directory is read back with ``get_archive`` and
+its tar chunks are written through gzip straight to
+``DEST/PROJECT/SITE-STAMP.tar.gz``, so no archive is ever held in memory.
+DEST/manifest.json lists the newest archive of every site backed up there.
+
+``restore_sites`` goes the other way: each archive is sent from the open file
+with ``put_archive`` (the daemon unpacks gzip itself) and ``bench --site SITE
+restore`` is run on the database dump and file archives it contains.
+
+Sites run on at most ``jobs`` threads in total and ``per_container`` at once
+in any one container, since bench backups compete for the same database
+server and disk. Each container's sites wait in their own queue, so a busy
+container never holds a thread another could use, and a site's timeout only
+starts when it does. Each site reports a progress event when it starts and a
+result (with bytes, seconds and MB/s) or error event when it ends.
+
+The database root password for a restore is kept off command lines, where
+any ``ps`` in the container would show it: it is passed in the exec
+environment (still readable from /proc by the same user and by root) and
+written to bench's password prompt on stdin.
+"""
+import argparse
+import contextlib
+import gzip
+import json
+import os
+import sys
+import time
+import uuid
+from pathlib import Path
+
+import profiling
+from event_stream import add_argument as add_stream_argument, run_streamed
+from list_instances import PROJECT_LABEL, SERVICE_LABEL
+from update_db import find_bench_directory_in_container, get_sites
+from workers import MAX_WORKERS, run_grouped
+
+MANIFEST = "manifest.json"
+# Scratch space inside the container, removed after every site.
+REMOTE_ROOT = "/tmp"
+PER_CONTAINER = 2
+SITE_TIMEOUT = 1800
+CHUNK_SIZE = 1024 * 1024
+# Database dumps are gzipped already; a middling level keeps the stream fast.
+COMPRESS_LEVEL = 6
+# Writes $CW_STDIN to the command's stdin; printf is a shell builtin, so the value is in no process's argv
+# (the wrapping shell still has it in its environment).
+STDIN_FROM_ENV = 'printf "%s\\n" "$CW_STDIN" | (unset CW_STDIN; exec "$@")'
+
+def _frappe_containers(client, projects):
+    """The running frappe container of each project."""
+    containers = {}
+    filters = {"label": [PROJECT_LABEL, f"{SERVICE_LABEL}=frappe"]}
+    for container in client.containers.list(filters=filters):
+        project = container.labels.get(PROJECT_LABEL)
+        if project in projects:
+            containers.setdefault(project, container)
+    return containers
+
+def _exec(container, cmd, workdir=None, stdin=None):
+    """Run ``cmd`` and return its output; ``stdin``, if given, is the line it reads from stdin."""
+    if stdin is None:
+        exit_code, output = container.exec_run(cmd, workdir=workdir)
+    else:
+        exit_code, output = container.exec_run(["sh", "-c", STDIN_FROM_ENV, "sh", *cmd], workdir=workdir,
+                                               environment={"CW_STDIN": stdin})
+    if exit_code != 0:
+        message = output.decode("utf-8", "replace").strip().splitlines()
+        raise Exception(f"{' '.join(cmd[:4])} exited with {exit_code}: {message[-1] if message else ''}")
+    return output.decode("utf-8", "replace")
+
+def _mb_per_s(size, seconds):
+    return round(size / 1e6 / seconds, 2) if seconds > 0 else None
+
+def _run_sites(stage, groups, jobs, per_container, timeout, on_event):
+    """Run the ``(key, func)`` tasks of every container; returns the summary of outcomes."""
+    started = time.monotonic()
+    results = {"succeeded": [], "failed": [], "timed_out": []}
+    for (project, site), outcome, value in run_grouped(groups, max(1, jobs), max(1, per_container), timeout):
+        if outcome == "ok":
+            results["succeeded"].append(dict(value, project=project, site=site))
+            on_event(dict(value, type="result", stage=stage, project=project, site=site))
+        else:
+            error = str(value) if outcome == "error" else f"Timed out after {timeout}s"
+            results["failed" if outcome == "error" else "timed_out"].append(
+                {"project": project, "site": site, "error": error})
+            on_event({"type": "error", "stage": stage, "project": project, "site": site, "error": error})
+    seconds = time.monotonic() - started
+    total = sum(item["bytes"] for item in results["succeeded"])
+    results.update(bytes=total, seconds=round(seconds, 3), mb_per_s=_mb_per_s(total, seconds))
+    return results
+
+def _download(container, path, archive):
+    """Stream ``path`` from the container into a gzipped tar at ``archive``; returns the bytes read."""
+    stream, _ = container.get_archive(path, chunk_size=CHUNK_SIZE)
+    partial = archive.with_name(archive.name + ".partial")
+    size = 0
+    try:
+        with gzip.open(partial, "wb", compresslevel=COMPRESS_LEVEL) as f:
+            for chunk in stream:
+                f.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+    os.replace(partial, archive)
+    return size
+
+def _backup_site(container, project, site, bench_dir, directory, stamp, on_event):
+    on_event({"type": "progress", "stage": "backup", "project": project, "site": site})
+    started = time.monotonic()
+    remote = f"{REMOTE_ROOT}/cw-backup-{uuid.uuid4().hex[:12]}"
+    archive = directory / f"{site}-{stamp}.tar.gz"
+    try:
+        _exec(container, ["bench", "--site", site, "backup", "--with-files", "--backup-path", f"{remote}/{site}"],
+              workdir=bench_dir)
+        size = _download(container, f"{remote}/{site}", archive)
+    finally:
+        container.exec_run(["rm", "-rf", remote])
+    seconds = time.monotonic() - started
+    return {"archive": str(archive), "bytes": size, "compressed_bytes": archive.stat().st_size,
+            "seconds": round(seconds, 3), "mb_per_s": _mb_per_s(size, seconds)}
+
+def _write_manifest(dest, succeeded):
+    path = dest / MANIFEST
+    entries = {}
+    if path.exists():
+        entries = {(e["project"], e["site"]): e for e in json.loads(path.read_text())["archives"]}
+    for item in succeeded:
+        entries[(item["project"], item["site"])] = {
+            "project": item["project"], "site": item["site"],
+            "archive": str(Path(item["archive"]).relative_to(dest)), "created_at": time.time(),
+        }
+    partial = path.with_name(MANIFEST + ".partial")
+    partial.write_text(json.dumps({"archives": sorted(entries.values(), key=lambda e: (e["project"], e["site"]))},
+                                  indent=2))
+    os.replace(partial, path)
+
+@profiling.timed("backup.backup_sites")
+def backup_sites(projects, dest, sites=None, client=None, conn=None, jobs=MAX_WORKERS, per_container=PER_CONTAINER,
+                 timeout=SITE_TIMEOUT, on_event=None):
+    """Back up every site (or only ``sites``) of ``projects`` into ``dest``.
+
+    Returns the sites that succeeded (with their archive, size and
+    throughput), failed and timed out, plus the overall bytes and MB/s.
+    """
+    if client is None:
+        import docker
+        client = docker.from_env()
+    client = profiling.instrument_client(client)
+    on_event = on_event or (lambda event: None)
+    dest = Path(dest)
+    stamp = time.strftime("%Y%m%d_%H%M%S")
+
+    containers = _frappe_containers(client, projects)
+    groups, missing = [], []
+    for project in projects:
+        container = containers.get(project)
+        # Discovery prints its findings; keep them off stdout, which carries the events.
+        with contextlib.redirect_stdout(sys.stderr):
+            bench_dir = find_bench_directory_in_container(container, conn=conn) if container else None
+        if not bench_dir:
+            missing.append({"project": project, "site": None, "error": "No running bench found"})
+            continue
+        project_sites = [s for s in get_sites(container, bench_dir) if not sites or s in sites]
+        directory = dest / project
+        directory.mkdir(parents=True, exist_ok=True)
+        groups.append([
+            ((project, site), lambda container=container, project=project, site=site, bench_dir=bench_dir,
+             directory=directory: _backup_site(container, project, site, bench_dir, directory, stamp, on_event))
+            for site in project_sites
+        ])
+    for item in missing:
+        on_event(dict(item, type="error", stage="backup"))
+    on_event({"type": "progress", "stage": "backup", "total": sum(len(group) for group in groups)})
+
+    results = _run_sites("backup", groups, jobs, per_container, timeout, on_event)
+    results["failed"] = missing + results["failed"]
+    if results["succeeded"]:
+        _write_manifest(dest, results["succeeded"])
+    return results
+
+def _restore_site(container, project, site, bench_dir, archive, on_event, db_root_password, force):
+    on_event({"type": "progress", "stage": "restore", "project": project, "site": site})
+    started = time.monotonic()
+    remote = f"{REMOTE_ROOT}/cw-restore-{uuid.uuid4().hex[:12]}"
+    try:
+        _exec(container, ["mkdir", "-p", remote])
+        with open(archive, "rb") as f:
+            container.put_archive(remote, f)
+        # NUL-separated: uploaded file names may contain spaces or newlines.
+        files = [f for f in _exec(container, ["find", remote, "-type", "f", "-print0"]).split("\0") if f]
+        database = next((f for f in files if f.endswith(("-database.sql.gz", "-database.sql"))), None)
+        if database is None:
+            raise Exception(f"{archive} has no database dump")
+        cmd = ["bench", "--site", site, "restore", database]
+        private = [f for f in files if f.endswith("-private-files.tar")]
+        public = [f for f in files if f.endswith("-files.tar") and f not in private]
+        if public:
+            cmd += ["--with-public-files", public[0]]
+        if private:
+            cmd += ["--with-private-files", private[0]]
+        if force:
+            cmd.append("--force")
+        # Without the password option bench asks for it, and with no TTY it reads the answer from stdin.
+        _exec(container, cmd, workdir=bench_dir, stdin=db_root_password or None)
+    finally:
+        container.exec_run(["rm", "-rf", remote])
+    size = os.path.getsize(archive)
+    seconds = time.monotonic() - started
+    return {"archive": str(archive), "bytes": size, "seconds": round(seconds, 3), "mb_per_s": _mb_per_s(size, seconds)}
+
+@profiling.timed("backup.restore_sites")
+def restore_sites(source, projects=None, sites=None, client=None, conn=None, jobs=MAX_WORKERS,
+                  per_container=PER_CONTAINER, timeout=SITE_TIMEOUT, db_root_password=None, force=False,
+                  on_event=None):
+    """Restore the archives listed in ``source``/manifest.json (optionally only some projects or sites).
+
+    Each site is restored into the project of the same name, which must be
+    running. Returns the same summary as backup_sites.
+    """
+    source = Path(source)
+    manifest = source / MANIFEST
+    if not manifest.exists():
+        raise Exception(f"No {MANIFEST} in {source}")
+    entries = [e for e in json.loads(manifest.read_text())["archives"]
+               if (not projects or e["project"] in projects) and (not sites or e["site"] in sites)]
+    if client is None:
+        import docker
+        client = docker.from_env()
+    client = profiling.instrument_client(client)
+    on_event = on_event or (lambda event: None)
+
+    by_project = {}
+    for entry in entries:
+        by_project.setdefault(entry["project"], []).append(entry)
+    containers = _frappe_containers(client, by_project)
+    groups, missing = [], []
+    for project, project_entries in by_project.items():
+        container = containers.get(project)
+        with contextlib.redirect_stdout(sys.stderr):
+            bench_dir = find_bench_directory_in_container(container, conn=conn) if container else None
+        if not bench_dir:
+            missing += [{"project": project, "site": e["site"], "error": "No running bench found"}
+                        for e in project_entries]
+            continue
+        groups.append([
+            ((project, e["site"]), lambda container=container, project=project, site=e["site"], bench_dir=bench_dir,
+             archive=source / e["archive"]: _restore_site(
+                container, project, site, bench_dir, archive, on_event, db_root_password, force))
+            for e in project_entries
+        ])
+    for item in missing:
+        on_event(dict(item, type="error", stage="restore"))
+    on_event({"type": "progress", "stage": "restore", "total": sum(len(group) for group in groups)})
+
+    results = _run_sites("restore", groups, jobs, per_container, timeout, on_event)
+    results["failed"] = missing + results["failed"]
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Back up or restore Frappe sites in parallel")
+    commands = parser.add_subparsers(dest="command", required=True)
+    backup = commands.add_parser("backup", help="Back up sites to local .tar.gz archives")
+    backup.add_argument("projects", nargs="+", help="Docker Compose project names")
+    backup.add_argument("--dest", required=True, help="Local directory for the archives and manifest")
+    restore = commands.add_parser("restore", help="Restore sites from a backup directory")
+    restore.add_argument("source", help="Directory holding manifest.json")
+    restore.add_argument("-p", "--project", action="append", dest="projects", help="Only restore this project")
+    restore.add_argument("--db-root-password", default=os.environ.get("CW_DB_ROOT_PASSWORD"),
+                         help="MariaDB root password for bench restore (or set CW_DB_ROOT_PASSWORD)")
+    restore.add_argument("--force", action="store_true", help="Pass --force to bench restore")
+    for command in (backup, restore):
+        command.add_argument("--site", action="append", dest="sites", help="Only this site (repeatable)")
+        command.add_argument("-j", "--jobs", type=int, default=MAX_WORKERS,
+                             help=f"Sites handled in parallel (default: {MAX_WORKERS})")
+        command.add_argument("--per-container", type=int, default=PER_CONTAINER,
+                             help=f"Sites handled at once in one container (default: {PER_CONTAINER})")
+        command.add_argument("--timeout", type=float, default=SITE_TIMEOUT,
+                             help=f"Seconds allowed per site (default: {SITE_TIMEOUT}, 0 disables)")
+        profiling.add_argument(command)
+        add_stream_argument(command)
+    args = parser.parse_args()
+    profiling.enable_from_args(args)
+
+    options = dict(sites=args.sites, jobs=args.jobs, per_container=args.per_container, timeout=args.timeout or None)
+    if args.command == "backup":
+        run = lambda on_event: backup_sites(args.projects, args.dest, on_event=on_event, **options)
+    else:
+        run = lambda on_event: restore_sites(args.source, args.projects, db_root_password=args.db_root_password,
+                                             force=args.force, on_event=on_event, **options)
+
+    if not args.stream:
+        results = run(lambda event: print(json.dumps(event), flush=True))
+        print(json.dumps(results))
+        sys.exit(1 if results["failed"] or results["timed_out"] else 0)
+
+    run_streamed(run, lambda results, writer: (
+        "error" if results["failed"] or results["timed_out"] else "ok",
+        {"succeeded": len(results["succeeded"]), "failed": len(results["failed"]),
+         "timed_out": len(results["timed_out"]), "bytes": results["bytes"], "mb_per_s": results["mb_per_s"]}))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# bench_metadata.py
+"""Read a bench's site and app metadata from a tar of its config files.
+
+One exec finds ``sites/apps.txt``, ``sites/common_site_config.json`` and each
+``sites/<site>/site_config.json`` and tars just those, so assets, uploaded
+files and backups never leave the container. The archive is parsed without
+temp files. A site is a directory holding a site_config.json, so names such
+as ``apps.example.com`` or ``reports.json.local`` are classified correctly.
+
+The archive is still capped at ``max_bytes``; past that ArchiveTooLarge is
+raised and callers fall back to listing the directories with execs.
+"""
+import io
+import json
+import posixpath
+import tarfile
+
+# Upper bound on the archive bytes read for one bench.
+MAX_ARCHIVE_BYTES = 64 * 1024 * 1024
+# Relative to the bench directory; site configs sit exactly two levels down.
+CONFIG_PATHS = ("sites/apps.txt", "sites/common_site_config.json", "sites/*/site_config.json")
+
+
+class ArchiveTooLarge(Exception):
+    pass
+
+
+class _ChunkReader(io.RawIOBase):
+    """A read-only file over an iterator of byte chunks, counting what it hands out."""
+
+    def __init__(self, chunks, max_bytes):
+        self._chunks = iter(chunks)
+        self._buffer = b""
+        self.max_bytes = max_bytes
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while not self._buffer:
+            try:
+                self._buffer = next(self._chunks)
+            except StopIteration:
+                return 0
+        size = min(len(target), len(self._buffer))
+        target[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        self.bytes_read += size
+        if self.max_bytes is not None and self.bytes_read > self.max_bytes:
+            raise ArchiveTooLarge(f"Archive is larger than {self.max_bytes} bytes")
+        return size
+
+
+def _load_json(data):
+    try:
+        value = json.loads(data.decode("utf-8"))
+    except ValueError:
+        return None
+    return value if isinstance(value, dict) else None
+
+def parse_sites_archive(chunks, max_bytes=MAX_ARCHIVE_BYTES):
+    """Parse the tar stream of a ``sites`` directory into site and app records.
+
+    Returns ``{"apps": [...], "sites": [{"name", "db_name"}, ...], "common_config": {...}}``;
+    ``apps`` is None when the bench has no apps.txt. Site configs are read for
+    their DB name only; passwords and other settings are not returned.
+    """
+    reader = io.BufferedReader(_ChunkReader(chunks, max_bytes), buffer_size=64 * 1024)
+    apps = None
+    common_config = {}
+    sites = {}
+    if not reader.peek(1):
+        # Nothing matched, so nothing was archived.
+        return {"apps": None, "sites": [], "common_config": {}}
+    # "r|" reads the archive strictly front to back, as a stream; find may
+    # have run tar more than once, so archives can follow one another.
+    with tarfile.open(fileobj=reader, mode="r|", ignore_zeros=True) as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            # Members are named relative to the archived directory: "sites/...".
+            parts = posixpath.normpath(member.name).split("/")[1:]
+            if parts == ["apps.txt"]:
+                content = archive.extractfile(member).read().decode("utf-8")
+                apps = list(dict.fromkeys(line.strip() for line in content.splitlines() if line.strip()))
+            elif parts == ["common_site_config.json"]:
+                common_config = _load_json(archive.extractfile(member).read()) or {}
+            elif len(parts) == 2 and parts[1] == "site_config.json":
+                config = _load_json(archive.extractfile(member).read())
+                sites[parts[0]] = {"name": parts[0], "db_name": (config or {}).get("db_name")}
+
+    return {
+        "apps": apps,
+        "sites": [sites[name] for name in sorted(sites)],
+        "common_config": common_config,
+    }
+
+def config_archive_command():
+    """The exec (run in the bench directory) writing a tar of the config files to stdout."""
+    matches = []
+    for path in CONFIG_PATHS:
+        matches += ["-o", "-path", path]
+    return ["find", "sites", "-maxdepth", "2", "(", *matches[1:], ")", "-type", "f",
+            "-exec", "tar", "-cf", "-", "{}", "+"]
+
+def read_bench_metadata(container, bench_dir, max_bytes=MAX_ARCHIVE_BYTES):
+    """Site and app records for the bench at ``bench_dir``, from one exec."""
+    result = container.exec_run(config_archive_command(), workdir=bench_dir, stderr=False)
+    return parse_config_archive(result, bench_dir, max_bytes)
+
+def parse_config_archive(result, bench_dir, max_bytes=MAX_ARCHIVE_BYTES):
+    """read_bench_metadata for the ``(exit_code, output)`` of a config_archive_command already run."""
+    exit_code, output = result
+    if exit_code != 0:
+        raise Exception(f"Archiving the config files under {bench_dir}/sites failed with exit code {exit_code}")
+    return parse_sites_archive([output], max_bytes)
@@ -1,31 +1,106 @@
 # create_instance.py
 import json
 import sys
-import docker
 
-def create_frappe_instance(config):
-    """Create a new Frappe Docker container."""
-    client = docker.from_env()
-    
+import profiling
+from event_stream import pop_flag as pop_stream_flag, run_streamed
+from db_operations import confirm_port_reservations, release_port_reservations
+from port_scanner import reserve_ports
+from provisioning import CONTAINER_PORTS, DEFAULT_IMAGE, instance_environment, resolve_image
+
+@profiling.timed("create_instance.create_frappe_instance")
+def create_frappe_instance(config, client=None, conn=None, pool=None, on_event=None):
+    """Create a new Frappe Docker container.
+
+    ``config['port']`` is where the search for a free host port starts; the
+    port actually reserved is returned as ``port``. With a warm ``pool`` a
+    pre-created container is claimed when one is available; it runs with the
+    same environment a cold create passes.
+    """
+    if client is None:
+        import docker
+        client = docker.from_env()
+    client = profiling.instrument_client(client)
+    project_name = config['projectName']
+    environment = instance_environment(config)
+
+    if pool is not None:
+        try:
+            claimed = pool.claim(project_name, environment)
+        except Exception as e:
+            print(f"Warm pool unavailable, creating from scratch: {e}")
+            claimed = None
+        if claimed:
+            container, ports = claimed
+            pool.refill_in_background(on_event=on_event)
+            return {
+                'status': 'success',
+                'containerId': container.id,
+                'projectName': project_name,
+                'port': ports.get('web'),
+                'ports': ports,
+                'pooled': True
+            }
+
+    try:
+        # The pinned digest, pulled first (with progress events) if it isn't local yet.
+        image = resolve_image(DEFAULT_IMAGE, client=client, conn=conn, on_event=on_event)
+        ports = reserve_ports(project_name, list(CONTAINER_PORTS), config['port'], client=client, conn=conn)
+    except Exception as e:
+        return {
+            'status': 'error',
+            'message': str(e)
+        }
+
     try:
         container = client.containers.run(
-            "frappe/frappe-docker:latest",
-            name=config['projectName'],
+            image,
+            name=project_name,
             ports={
-                '80/tcp': config['port']
+                CONTAINER_PORTS[service]: port for service, port in ports.items()
             },
             detach=True,
-            environment={
-                'SITE_NAME': config['siteName']
-            }
+            environment=environment
         )
-        print(json.dumps({
-            'status': 'success',
-            'containerId': container.id,
-            'projectName': config['projectName']
-        }))
     except Exception as e:
-        print(json.dumps({
+        release_port_reservations(project_name, conn=conn)
+        return {
             'status': 'error',
             'message': str(e)
-        }))
\ No newline at end of file
+        }
+
+    confirm_port_reservations(project_name, conn=conn)
+    return {
+        'status': 'success',
+        'containerId': container.id,
+        'projectName': project_name,
+        'port': ports['web'],
+        'ports': ports
+    }
+
+def main():
+    profiling.enable_from_argv(sys.argv)
+    if not pop_stream_flag(sys.argv):
+        if len(sys.argv) < 2:
+            print(json.dumps({'status': 'error', 'message': 'Instance config not provided'}))
+        else:
+            print(json.dumps(create_frappe_instance(json.loads(sys.argv[1]))))
+        return
+
+    # Image pull progress is streamed while the instance is created.
+    def create(writer):
+        if len(sys.argv) < 2:
+            raise ValueError('Instance config not provided')
+        return create_frappe_instance(json.loads(sys.argv[1]), on_event=writer)
+
+    def summarize(result, writer):
+        if result['status'] != 'success':
+            writer.error(result['message'])
+            return 'error', {}
+        writer.emit(dict(result, type='result'))
+        return 'ok', {}
+
+    run_streamed(create, summarize)
+
+if __name__ == "__main__":
+    main()
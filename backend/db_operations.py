@@ -1,171 +1,1054 @@
 import sqlite3
 import json
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from pathlib import Path
 
+import profiling
+
 DB_FILE = Path(__file__).parent / "frappe_instances.db"
 
-def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute('''
+# WAL lets readers (the dashboard) run while a refresh is writing, and with
+# WAL, synchronous=NORMAL only risks the last transaction on power loss.
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",
+)
+
+def configure_connection(conn):
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+# Database files whose schema is known to be current in this process.
+_schema_checked = set()
+_schema_lock = threading.Lock()
+
+def connect():
+    """Open a connection to the instances database.
+
+    The connection may be shared across threads, so callers are responsible
+    for serializing access to it; the backend server keeps one open per worker
+    thread instead. The first connection in a process brings the schema up to
+    date; later ones skip the check.
+    """
+    conn = configure_connection(
+        sqlite3.connect(DB_FILE, check_same_thread=False, factory=profiling.connection_factory())
+    )
+    if DB_FILE not in _schema_checked:
+        with _schema_lock:
+            if DB_FILE not in _schema_checked:
+                _init_db(conn)
+                _schema_checked.add(DB_FILE)
+    return conn
+
+@contextmanager
+def _connection(conn=None):
+    # Reuse the caller's connection when given one, otherwise open a
+    # short-lived connection for this call only.
+    if conn is not None:
+        yield conn
+        return
+    conn = connect()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+def init_db(conn=None):
+    with _connection(conn) as conn:
+        _init_db(conn)
+
+def _trigram_supported(conn):
+    """Whether this SQLite has FTS5 with the trigram tokenizer (3.34 and later)."""
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp.trigram_probe USING fts5(name, tokenize = 'trigram')")
+    except sqlite3.OperationalError:
+        return False
+    conn.execute("DROP TABLE temp.trigram_probe")
+    return True
+
+def _search_index_table(conn):
+    # Without trigram support search_index is a plain table with the same
+    # rows, and search() scans it with LIKE instead of using the index.
+    if _trigram_supported(conn):
+        return "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(name, tokenize = 'trigram');"
+    return "CREATE TABLE IF NOT EXISTS search_index (id INTEGER PRIMARY KEY, name TEXT NOT NULL);"
+
+# Schema changes are applied in order and tracked with PRAGMA user_version,
+# so a database only ever runs the migrations it has not seen yet. A
+# migration that depends on the SQLite build is a function of the connection
+# returning its script.
+MIGRATIONS = [
+    # 1: projects, containers, sites and apps, plus the bench discovery cache
+    '''
     CREATE TABLE IF NOT EXISTS projects (
         id INTEGER PRIMARY KEY,
         name TEXT UNIQUE NOT NULL
-    )
-    ''')
-    cursor.execute('''
+    );
     CREATE TABLE IF NOT EXISTS containers (
         id INTEGER PRIMARY KEY,
         project_id INTEGER,
         container_id TEXT UNIQUE NOT NULL,
         bench_dir TEXT,
         FOREIGN KEY (project_id) REFERENCES projects (id)
-    )
-    ''')
-    cursor.execute('''
+    );
     CREATE TABLE IF NOT EXISTS sites (
         id INTEGER PRIMARY KEY,
         container_id INTEGER,
         name TEXT NOT NULL,
         UNIQUE(container_id, name),
         FOREIGN KEY (container_id) REFERENCES containers (id)
-    )
-    ''')
-    cursor.execute('''
+    );
     CREATE TABLE IF NOT EXISTS apps (
         id INTEGER PRIMARY KEY,
         container_id INTEGER,
         name TEXT NOT NULL,
         UNIQUE(container_id, name),
         FOREIGN KEY (container_id) REFERENCES containers (id)
-    )
-    ''')
-    conn.commit()
-    conn.close()
+    );
+    CREATE TABLE IF NOT EXISTS bench_cache (
+        container_id TEXT PRIMARY KEY,
+        image_id TEXT NOT NULL,
+        bench_dir TEXT NOT NULL
+    );
+    ''',
+    # 2: index the project -> container join and record which apps are
+    # installed on which site. sites and apps are already indexed on
+    # container_id through their UNIQUE (container_id, name) constraints.
+    '''
+    CREATE INDEX IF NOT EXISTS idx_containers_project_id ON containers (project_id);
+    CREATE TABLE IF NOT EXISTS site_apps (
+        site_id INTEGER NOT NULL,
+        app_id INTEGER NOT NULL,
+        PRIMARY KEY (site_id, app_id),
+        FOREIGN KEY (site_id) REFERENCES sites (id) ON DELETE CASCADE,
+        FOREIGN KEY (app_id) REFERENCES apps (id) ON DELETE CASCADE
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_site_apps_app_id ON site_apps (app_id);
+    ''',
+    # 3: last known state of each Frappe container, kept current by instance_watcher
+    '''
+    CREATE TABLE IF NOT EXISTS container_state (
+        container_id TEXT PRIMARY KEY,
+        project_name TEXT NOT NULL,
+        status TEXT NOT NULL,
+        ports TEXT NOT NULL DEFAULT '[]',
+        updated_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_container_state_project_name ON container_state (project_name);
+    ''',
+    # 4: host ports handed out by port_scanner; expires_at is NULL once the
+    # owning instance exists, so only abandoned reservations lapse
+    '''
+    CREATE TABLE IF NOT EXISTS port_reservations (
+        port INTEGER PRIMARY KEY,
+        project_name TEXT NOT NULL,
+        service TEXT NOT NULL,
+        reserved_at REAL NOT NULL,
+        expires_at REAL
+    );
+    CREATE INDEX IF NOT EXISTS idx_port_reservations_project_name ON port_reservations (project_name);
+    ''',
+    # 5: image tags pinned to the digest pulled for them, kept by provisioning
+    '''
+    CREATE TABLE IF NOT EXISTS image_pins (
+        image TEXT PRIMARY KEY,
+        reference TEXT NOT NULL,
+        pulled_at REAL NOT NULL
+    );
+    ''',
+    # 6: per-container fingerprint of the last full refresh, so update_db can
+    # skip benches that haven't changed since
+    '''
+    CREATE TABLE IF NOT EXISTS refresh_fingerprints (
+        container_id TEXT PRIMARY KEY,
+        fingerprint TEXT NOT NULL,
+        refresh_seconds REAL NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    ''',
+    # 7: each site's database name, read from its site_config.json
+    '''
+    ALTER TABLE sites ADD COLUMN db_name TEXT;
+    ''',
+    # 8: per-site inventory and app versions collected by update_db;
+    # containers.inventory_at records when they were last read
+    '''
+    ALTER TABLE containers ADD COLUMN inventory_at REAL;
+    CREATE TABLE IF NOT EXISTS app_versions (
+        app_id INTEGER PRIMARY KEY,
+        version TEXT,
+        branch TEXT,
+        git_commit TEXT,
+        FOREIGN KEY (app_id) REFERENCES apps (id) ON DELETE CASCADE
+    );
+    CREATE TABLE IF NOT EXISTS site_inventory (
+        site_id INTEGER PRIMARY KEY,
+        db_size INTEGER,
+        files_size INTEGER,
+        last_backup REAL,
+        FOREIGN KEY (site_id) REFERENCES sites (id) ON DELETE CASCADE
+    );
+    ''',
+    # 9: trigram index over project, bench directory, site and app names for
+    # search(). Row IDs encode the source row: id * 4 + 0 project, 1 bench,
+    # 2 site, 3 app. The write paths keep it current (see _index_rows); FTS5
+    # under per-row triggers is an order of magnitude slower to fill. SQLite
+    # builds without the trigram tokenizer get a plain table instead.
+    lambda conn: _search_index_table(conn) + '''
+    INSERT INTO search_index (rowid, name) SELECT id * 4, name FROM projects;
+    INSERT INTO search_index (rowid, name) SELECT id * 4 + 1, bench_dir FROM containers WHERE bench_dir IS NOT NULL;
+    INSERT INTO search_index (rowid, name) SELECT id * 4 + 2, name FROM sites;
+    INSERT INTO search_index (rowid, name) SELECT id * 4 + 3, name FROM apps;
+    ''',
+    # 10: per-project bookkeeping of the background refresh scheduler: last
+    # success and attempt, failures since the last success and the backoff
+    '''
+    CREATE TABLE IF NOT EXISTS refresh_status (
+        project_name TEXT PRIMARY KEY,
+        refreshed_at REAL,
+        attempted_at REAL NOT NULL,
+        failures INTEGER NOT NULL DEFAULT 0,
+        retry_at REAL,
+        error TEXT
+    );
+    ''',
+]
 
-def update_project(project_name, container_id, bench_dir, sites, apps):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    # Insert or update project
-    cursor.execute('INSERT OR IGNORE INTO projects (name) VALUES (?)', (project_name,))
-    cursor.execute('SELECT id FROM projects WHERE name = ?', (project_name,))
-    project_id = cursor.fetchone()[0]
-    
-    # Insert or update container
-    cursor.execute('''
-    INSERT OR REPLACE INTO containers (project_id, container_id, bench_dir)
-    VALUES (?, ?, ?)
-    ''', (project_id, container_id, bench_dir))
-    container_db_id = cursor.lastrowid
-    
-    # Update sites
-    cursor.execute('DELETE FROM sites WHERE container_id = ?', (container_db_id,))
-    for site in set(sites):  # Use set to remove duplicates
-        cursor.execute('INSERT OR IGNORE INTO sites (container_id, name) VALUES (?, ?)', (container_db_id, site))
-    
-    # Update apps
-    cursor.execute('DELETE FROM apps WHERE container_id = ?', (container_db_id,))
-    for app in set(apps):  # Use set to remove duplicates
-        cursor.execute('INSERT OR IGNORE INTO apps (container_id, name) VALUES (?, ?)', (container_db_id, app))
-    
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def _statements(script):
+    statement = ""
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            yield statement.strip()
+            statement = ""
+
+def _init_db(conn):
+    # An up-to-date database costs one pragma read.
+    if conn.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+        return
+    if conn.in_transaction:
+        conn.commit()
+    # Under the write lock the version is read again: another process may
+    # have migrated while this one waited, and ALTER TABLE can't be repeated.
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        for number in range(version, SCHEMA_VERSION):
+            script = MIGRATIONS[number]
+            for statement in _statements(script(conn) if callable(script) else script):
+                conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {number + 1}')
+    except BaseException:
+        conn.rollback()
+        raise
     conn.commit()
-    conn.close()
 
+@contextmanager
+def write_transaction(conn=None):
+    """Run the block in a BEGIN IMMEDIATE transaction.
 
-def get_site_apps(project_name, site_name):
-    # Add a query to filter apps specifically for the given site
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-    SELECT a.name 
-    FROM projects p
-    JOIN containers c ON p.id = c.project_id
-    JOIN sites s ON c.id = s.container_id
-    JOIN apps a ON c.id = a.container_id
-    WHERE p.name = ? AND s.name = ?
-    ''', (project_name, site_name))
-    
-    apps = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    
-    return {"site": site_name, "installed_apps": apps}
+    The write lock is taken up front, so read-then-write sequences (such as
+    picking free ports and recording them) are serialized across processes.
+    """
+    with _connection(conn) as conn:
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+@contextmanager
+def read_transaction(conn=None):
+    """Run the block in one read transaction, so every query sees the same state of the database."""
+    with _connection(conn) as conn:
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute('BEGIN')
+        try:
+            yield conn
+        finally:
+            conn.rollback()
+
+# Bound parameters per statement stay well below SQLITE_MAX_VARIABLE_NUMBER.
+_IN_CHUNK = 500
+
+def _select_in(conn, query, values):
+    """Run ``query`` (containing a single ``IN ({})``) over ``values`` in chunks."""
+    values = list(values)
+    rows = []
+    for i in range(0, len(values), _IN_CHUNK):
+        chunk = values[i:i + _IN_CHUNK]
+        rows.extend(conn.execute(query.format(', '.join('?' * len(chunk))), chunk).fetchall())
+    return rows
+
+# search_index row IDs are the source row's id * 4 + the kind's position here.
+SEARCH_KINDS = ("project", "bench", "site", "app")
+_SEARCH_SOURCES = {"project": ("projects", "name"), "bench": ("containers", "bench_dir"),
+                   "site": ("sites", "name"), "app": ("apps", "name")}
+
+def _index_rows(conn, kind, where, params):
+    """Add the ``kind`` rows matching ``where`` to search_index, once per parameter tuple."""
+    table, column = _SEARCH_SOURCES[kind]
+    conn.executemany(f'''
+    INSERT INTO search_index (rowid, name)
+    SELECT id * 4 + {SEARCH_KINDS.index(kind)}, {column} FROM {table} WHERE {where} AND {column} IS NOT NULL
+    ''', params)
+
+def _unindex_rows(conn, kind, where, params):
+    """Drop the ``kind`` rows matching ``where`` from search_index; call before deleting them."""
+    table, _ = _SEARCH_SOURCES[kind]
+    conn.executemany(f'''
+    DELETE FROM search_index WHERE rowid IN (SELECT id * 4 + {SEARCH_KINDS.index(kind)} FROM {table} WHERE {where})
+    ''', params)
+
+def rebuild_search_index(conn=None):
+    """Refill search_index from the tables, for bulk loads that bypass update_projects."""
+    with _connection(conn) as conn:
+        conn.execute('DELETE FROM search_index')
+        for kind in SEARCH_KINDS:
+            _index_rows(conn, kind, '1', [()])
 
-def get_project_info(project_name):
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
+def update_project(project_name, container_id, bench_dir, sites, apps, conn=None):
+    update_projects([{
+        "project_name": project_name,
+        "container_id": container_id,
+        "bench_dir": bench_dir,
+        "sites": sites,
+        "apps": apps,
+    }], conn=conn)
+
+def update_projects(projects, conn=None):
+    """Upsert many container records in one transaction.
+
+    Each record is a dict with ``project_name``, ``container_id``,
+    ``bench_dir``, ``sites`` and ``apps``, and optionally ``site_apps``
+    mapping each site to the apps installed on it and ``site_db_names``
+    mapping each site to its database name. Project and container rows
+    keep their IDs across refreshes, and only sites, apps and installations
+    that were added or removed since the last refresh are written.
+    """
+    projects = list(projects)
+    if not projects:
+        return
+    with _connection(conn) as conn:
+        with conn:
+            _update_projects(conn, projects)
+    project_cache.invalidate()
+
+def _update_projects(conn, projects):
     cursor = conn.cursor()
-    
-    cursor.execute('''
-    SELECT c.bench_dir, s.name as site_name, GROUP_CONCAT(DISTINCT a.name) as apps
+
+    project_names = {p["project_name"] for p in projects}
+    known = {name for (name,) in _select_in(conn, 'SELECT name FROM projects WHERE name IN ({})', project_names)}
+    cursor.executemany(
+        'INSERT INTO projects (name) VALUES (?) ON CONFLICT (name) DO NOTHING',
+        [(name,) for name in project_names]
+    )
+    _index_rows(conn, "project", "name = ?", [(name,) for name in project_names - known])
+    project_ids = dict(_select_in(conn, 'SELECT name, id FROM projects WHERE name IN ({})', project_names))
+
+    bench_dirs = dict(_select_in(
+        conn, 'SELECT container_id, bench_dir FROM containers WHERE container_id IN ({})',
+        [p["container_id"] for p in projects]
+    ))
+    moved = [(p["container_id"],) for p in projects
+             if p["container_id"] not in bench_dirs or bench_dirs[p["container_id"]] != p["bench_dir"]]
+    _unindex_rows(conn, "bench", "container_id = ?", moved)
+    cursor.executemany('''
+    INSERT INTO containers (project_id, container_id, bench_dir) VALUES (?, ?, ?)
+    ON CONFLICT (container_id) DO UPDATE SET project_id = excluded.project_id, bench_dir = excluded.bench_dir
+    WHERE project_id IS NOT excluded.project_id OR bench_dir IS NOT excluded.bench_dir
+    ''', [(project_ids[p["project_name"]], p["container_id"], p["bench_dir"]) for p in projects])
+    _index_rows(conn, "bench", "container_id = ?", moved)
+    container_ids = dict(_select_in(
+        conn, 'SELECT container_id, id FROM containers WHERE container_id IN ({})',
+        [p["container_id"] for p in projects]
+    ))
+
+    wanted = {"sites": {}, "apps": {}}
+    for p in projects:
+        container_db_id = container_ids[p["container_id"]]
+        # Remove duplicates but keep the listed order, which becomes row order.
+        wanted["sites"][container_db_id] = dict.fromkeys(p["sites"])
+        wanted["apps"][container_db_id] = dict.fromkeys(p["apps"])
+
+    for table, names_by_container in wanted.items():
+        current = {container_db_id: set() for container_db_id in names_by_container}
+        for container_db_id, name in _select_in(
+            conn, f'SELECT container_id, name FROM {table} WHERE container_id IN ({{}})', names_by_container
+        ):
+            current[container_db_id].add(name)
+
+        removed = [(cid, name) for cid, names in current.items() for name in names if name not in names_by_container[cid]]
+        added = [(cid, name) for cid, names in names_by_container.items() for name in names if name not in current[cid]]
+        kind = "site" if table == "sites" else "app"
+        if removed:
+            _unindex_rows(conn, kind, "container_id = ? AND name = ?", removed)
+            # Explicit rather than relying on ON DELETE CASCADE, which only
+            # fires on connections with foreign_keys enabled.
+            column, details = ("site_id", "site_inventory") if table == "sites" else ("app_id", "app_versions")
+            for dependent in ("site_apps", details):
+                cursor.executemany(
+                    f'DELETE FROM {dependent} WHERE {column} IN (SELECT id FROM {table} WHERE container_id = ? AND name = ?)',
+                    removed
+                )
+            cursor.executemany(f'DELETE FROM {table} WHERE container_id = ? AND name = ?', removed)
+        if added:
+            cursor.executemany(f'INSERT INTO {table} (container_id, name) VALUES (?, ?)', added)
+            _index_rows(conn, kind, "container_id = ? AND name = ?", added)
+
+    db_names = [
+        (db_name, container_ids[p["container_id"]], site)
+        for p in projects for site, db_name in (p.get("site_db_names") or {}).items()
+    ]
+    if db_names:
+        cursor.executemany(
+            'UPDATE sites SET db_name = ? WHERE container_id = ? AND name = ? AND db_name IS NOT ?',
+            [(db_name, cid, site, db_name) for db_name, cid, site in db_names]
+        )
+
+    installs = {
+        container_ids[p["container_id"]]: p["site_apps"]
+        for p in projects if p.get("site_apps") is not None
+    }
+    if installs:
+        _update_site_apps(conn, installs)
+
+def _update_site_apps(conn, installs):
+    # installs: containers.id -> {site name: [app names]}
+    site_ids = {(cid, name): sid for cid, name, sid in _select_in(
+        conn, 'SELECT container_id, name, id FROM sites WHERE container_id IN ({})', installs)}
+    app_ids = {(cid, name): aid for cid, name, aid in _select_in(
+        conn, 'SELECT container_id, name, id FROM apps WHERE container_id IN ({})', installs)}
+
+    wanted = set()
+    for cid, site_apps in installs.items():
+        for site, apps in site_apps.items():
+            if (cid, site) not in site_ids:
+                continue
+            for app in apps:
+                # Apps missing from the bench's apps/ directory have no row to point at.
+                if (cid, app) in app_ids:
+                    wanted.add((site_ids[(cid, site)], app_ids[(cid, app)]))
+
+    current = set(_select_in(
+        conn,
+        'SELECT sa.site_id, sa.app_id FROM site_apps sa JOIN sites s ON s.id = sa.site_id WHERE s.container_id IN ({})',
+        installs
+    ))
+    if current - wanted:
+        conn.executemany('DELETE FROM site_apps WHERE site_id = ? AND app_id = ?', current - wanted)
+    if wanted - current:
+        conn.executemany('INSERT INTO site_apps (site_id, app_id) VALUES (?, ?)', wanted - current)
+
+def save_inventories(inventories, collected_at=None, conn=None):
+    """Store site_inventory output for many containers in one transaction.
+
+    ``inventories`` maps a Docker container ID to ``{"apps": {app: {"version",
+    "branch", "commit"}}, "sites": {site: {"db_size", "files_size",
+    "last_backup"}}}``. Apps and sites without a row (not refreshed yet) are
+    left out.
+    """
+    if not inventories:
+        return
+    collected_at = time.time() if collected_at is None else collected_at
+    with _connection(conn) as conn:
+        with conn:
+            container_ids = dict(_select_in(
+                conn, 'SELECT container_id, id FROM containers WHERE container_id IN ({})', inventories
+            ))
+            site_ids = {(cid, name): sid for cid, name, sid in _select_in(
+                conn, 'SELECT container_id, name, id FROM sites WHERE container_id IN ({})', container_ids.values())}
+            app_ids = {(cid, name): aid for cid, name, aid in _select_in(
+                conn, 'SELECT container_id, name, id FROM apps WHERE container_id IN ({})', container_ids.values())}
+
+            versions, sizes = [], []
+            for container_id, inventory in inventories.items():
+                cid = container_ids.get(container_id)
+                for app, info in (inventory.get("apps") or {}).items():
+                    if (cid, app) in app_ids:
+                        versions.append((app_ids[(cid, app)], info.get("version"), info.get("branch"), info.get("commit")))
+                for site, info in (inventory.get("sites") or {}).items():
+                    if (cid, site) in site_ids:
+                        sizes.append((site_ids[(cid, site)], info.get("db_size"), info.get("files_size"),
+                                      info.get("last_backup")))
+
+            conn.executemany('''
+            INSERT INTO app_versions (app_id, version, branch, git_commit) VALUES (?, ?, ?, ?)
+            ON CONFLICT (app_id) DO UPDATE SET
+                version = excluded.version, branch = excluded.branch, git_commit = excluded.git_commit
+            ''', versions)
+            conn.executemany('''
+            INSERT INTO site_inventory (site_id, db_size, files_size, last_backup) VALUES (?, ?, ?, ?)
+            ON CONFLICT (site_id) DO UPDATE SET
+                db_size = excluded.db_size, files_size = excluded.files_size, last_backup = excluded.last_backup
+            ''', sizes)
+            conn.executemany('UPDATE containers SET inventory_at = ? WHERE id = ?',
+                             [(collected_at, cid) for cid in container_ids.values()])
+    project_cache.invalidate()
+
+def get_inventory_times(container_ids, conn=None):
+    """Map container ID -> when its inventory was last collected, for containers that have one."""
+    with _connection(conn) as conn:
+        return dict(_select_in(
+            conn, 'SELECT container_id, inventory_at FROM containers WHERE inventory_at IS NOT NULL AND container_id IN ({})',
+            container_ids
+        ))
+
+def get_cached_bench_dir(container_id, image_id, conn=None):
+    """Return the bench directory found earlier in this container, if its image is unchanged."""
+    with _connection(conn) as conn:
+        row = conn.execute(
+            'SELECT bench_dir FROM bench_cache WHERE container_id = ? AND image_id = ?',
+            (container_id, image_id)
+        ).fetchone()
+    return row[0] if row else None
+
+def cache_bench_dir(container_id, image_id, bench_dir, conn=None):
+    cache_bench_dirs([(container_id, image_id, bench_dir)], conn=conn)
+
+def cache_bench_dirs(entries, conn=None):
+    """Record many ``(container_id, image_id, bench_dir)`` discoveries at once."""
+    with _connection(conn) as conn:
+        with conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO bench_cache (container_id, image_id, bench_dir) VALUES (?, ?, ?)',
+                entries
+            )
+
+def get_refresh_fingerprints(container_ids, conn=None):
+    """Map container ID -> ``(fingerprint, refresh_seconds)`` recorded by the last full refresh."""
+    with _connection(conn) as conn:
+        rows = _select_in(conn, '''
+        SELECT container_id, fingerprint, refresh_seconds FROM refresh_fingerprints WHERE container_id IN ({})
+        ''', container_ids)
+    return {container_id: (fingerprint, seconds) for container_id, fingerprint, seconds in rows}
+
+def save_refresh_fingerprints(entries, conn=None):
+    """Record ``(container_id, fingerprint, refresh_seconds)`` after full refreshes."""
+    now = time.time()
+    with _connection(conn) as conn:
+        with conn:
+            conn.executemany('''
+            INSERT INTO refresh_fingerprints (container_id, fingerprint, refresh_seconds, updated_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (container_id) DO UPDATE SET fingerprint = excluded.fingerprint,
+                refresh_seconds = excluded.refresh_seconds, updated_at = excluded.updated_at
+            ''', [(container_id, fingerprint, seconds, now) for container_id, fingerprint, seconds in entries])
+
+def get_refresh_status(conn=None):
+    """Map project name -> its refresh_status row as a dict."""
+    with _connection(conn) as conn:
+        rows = conn.execute('''
+        SELECT project_name, refreshed_at, attempted_at, failures, retry_at, error FROM refresh_status
+        ''').fetchall()
+    return {row[0]: dict(zip(("refreshed_at", "attempted_at", "failures", "retry_at", "error"), row[1:]))
+            for row in rows}
+
+def record_refresh(project_name, attempted_at, error=None, retry_at=None, conn=None):
+    """Record a refresh attempt: a success clears the failures, an ``error`` adds one and sets ``retry_at``."""
+    with _connection(conn) as conn:
+        with conn:
+            if error is None:
+                conn.execute('''
+                INSERT INTO refresh_status (project_name, refreshed_at, attempted_at) VALUES (?, ?, ?)
+                ON CONFLICT (project_name) DO UPDATE SET refreshed_at = excluded.refreshed_at,
+                    attempted_at = excluded.attempted_at, failures = 0, retry_at = NULL, error = NULL
+                ''', (project_name, attempted_at, attempted_at))
+            else:
+                conn.execute('''
+                INSERT INTO refresh_status (project_name, attempted_at, failures, retry_at, error)
+                VALUES (?, ?, 1, ?, ?)
+                ON CONFLICT (project_name) DO UPDATE SET attempted_at = excluded.attempted_at,
+                    failures = failures + 1, retry_at = excluded.retry_at, error = excluded.error
+                ''', (project_name, attempted_at, retry_at, error))
+
+def save_container_states(states, conn=None, replace_all=False):
+    """Upsert ``(container_id, project_name, status, ports, updated_at)`` rows.
+
+    With ``replace_all`` the given rows become the complete state, dropping
+    containers that no longer exist.
+    """
+    states = list(states)
+    with _connection(conn) as conn:
+        with conn:
+            if replace_all:
+                conn.execute('DELETE FROM container_state')
+            conn.executemany('''
+            INSERT INTO container_state (container_id, project_name, status, ports, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (container_id) DO UPDATE SET project_name = excluded.project_name,
+                status = excluded.status, ports = excluded.ports, updated_at = excluded.updated_at
+            ''', [(cid, project, status, json.dumps(ports), updated_at)
+                  for cid, project, status, ports, updated_at in states])
+
+def delete_container_state(container_id, conn=None):
+    with _connection(conn) as conn:
+        with conn:
+            conn.execute('DELETE FROM container_state WHERE container_id = ?', (container_id,))
+
+def get_container_states(project_name=None, conn=None):
+    """Return the stored container states, optionally for one project only."""
+    query = 'SELECT container_id, project_name, status, ports, updated_at FROM container_state'
+    params = ()
+    if project_name:
+        query += ' WHERE project_name = ?'
+        params = (project_name,)
+    with _connection(conn) as conn:
+        rows = conn.execute(query + ' ORDER BY project_name, container_id', params).fetchall()
+    return [
+        {"container_id": cid, "project_name": project, "status": status, "ports": json.loads(ports),
+         "updated_at": updated_at}
+        for cid, project, status, ports, updated_at in rows
+    ]
+
+def get_used_ports(now=None, conn=None):
+    """Host ports held by live reservations or last seen on a Frappe container."""
+    now = time.time() if now is None else now
+    with _connection(conn) as conn:
+        rows = conn.execute('''
+        SELECT port FROM port_reservations WHERE expires_at IS NULL OR expires_at > ?
+        ''', (now,)).fetchall()
+        ports = {row[0] for row in rows}
+        for (container_ports,) in conn.execute('SELECT ports FROM container_state'):
+            ports.update(int(port) for port in json.loads(container_ports) if port)
+    return ports
+
+def get_port_reservations(project_name, conn=None):
+    """Map of service -> port reserved for a project."""
+    with _connection(conn) as conn:
+        rows = conn.execute(
+            'SELECT service, port FROM port_reservations WHERE project_name = ? ORDER BY port', (project_name,)
+        ).fetchall()
+    return dict(rows)
+
+def set_port_reservations(conn, project_name, ports, reserved_at, expires_at):
+    """Replace a project's reservations with ``{service: port}``, inside an open write_transaction()."""
+    conn.execute('DELETE FROM port_reservations WHERE project_name = ?', (project_name,))
+    conn.executemany('''
+    INSERT INTO port_reservations (port, project_name, service, reserved_at, expires_at) VALUES (?, ?, ?, ?, ?)
+    ''', [(port, project_name, service, reserved_at, expires_at) for service, port in ports.items()])
+
+def expire_port_reservations(conn, now):
+    conn.execute('DELETE FROM port_reservations WHERE expires_at IS NOT NULL AND expires_at <= ?', (now,))
+
+def confirm_port_reservations(project_name, conn=None):
+    """Keep a project's reservations until they are released."""
+    with _connection(conn) as conn:
+        with conn:
+            conn.execute('UPDATE port_reservations SET expires_at = NULL WHERE project_name = ?', (project_name,))
+
+def release_port_reservations(project_name, conn=None):
+    with _connection(conn) as conn:
+        with conn:
+            conn.execute('DELETE FROM port_reservations WHERE project_name = ?', (project_name,))
+
+def delete_project(project_name, conn=None):
+    """Remove every cached row belonging to a project; returns the number of rows deleted."""
+    with _connection(conn) as conn:
+        with conn:
+            container_ids = [row[0] for row in conn.execute('''
+            SELECT c.id FROM containers c JOIN projects p ON c.project_id = p.id WHERE p.name = ?
+            ''', (project_name,))]
+            placeholders = ', '.join('?' * len(container_ids))
+            deleted = 0
+            if container_ids:
+                for kind in ("site", "app", "bench"):
+                    _unindex_rows(conn, kind, f"container_id IN ({placeholders})" if kind != "bench"
+                                  else f"id IN ({placeholders})", [container_ids])
+                # Explicit rather than relying on ON DELETE CASCADE, which only
+                # fires on connections with foreign_keys enabled.
+                for statement in (
+                    f'DELETE FROM site_apps WHERE site_id IN (SELECT id FROM sites WHERE container_id IN ({placeholders}))',
+                    f'DELETE FROM site_inventory WHERE site_id IN (SELECT id FROM sites WHERE container_id IN ({placeholders}))',
+                    f'DELETE FROM app_versions WHERE app_id IN (SELECT id FROM apps WHERE container_id IN ({placeholders}))',
+                    f'DELETE FROM bench_cache WHERE container_id IN (SELECT container_id FROM containers WHERE id IN ({placeholders}))',
+                    f'DELETE FROM refresh_fingerprints WHERE container_id IN (SELECT container_id FROM containers WHERE id IN ({placeholders}))',
+                    f'DELETE FROM sites WHERE container_id IN ({placeholders})',
+                    f'DELETE FROM apps WHERE container_id IN ({placeholders})',
+                    f'DELETE FROM containers WHERE id IN ({placeholders})',
+                ):
+                    deleted += conn.execute(statement, container_ids).rowcount
+            _unindex_rows(conn, "project", "name = ?", [(project_name,)])
+            for statement in (
+                'DELETE FROM projects WHERE name = ?',
+                'DELETE FROM container_state WHERE project_name = ?',
+                'DELETE FROM port_reservations WHERE project_name = ?',
+                'DELETE FROM refresh_status WHERE project_name = ?',
+            ):
+                deleted += conn.execute(statement, (project_name,)).rowcount
+    project_cache.invalidate()
+    return deleted
+
+def rename_port_reservations(old_project_name, new_project_name, conn=None):
+    """Hand a project's reservations over to another project name."""
+    with _connection(conn) as conn:
+        with conn:
+            conn.execute('UPDATE port_reservations SET project_name = ? WHERE project_name = ?',
+                         (new_project_name, old_project_name))
+
+def get_image_pin(image, conn=None):
+    """The digest reference (``repo@sha256:...``) last pulled for ``image``, if any."""
+    with _connection(conn) as conn:
+        row = conn.execute('SELECT reference FROM image_pins WHERE image = ?', (image,)).fetchone()
+    return row[0] if row else None
+
+def pin_image(image, reference, pulled_at=None, conn=None):
+    with _connection(conn) as conn:
+        with conn:
+            conn.execute('''
+            INSERT INTO image_pins (image, reference, pulled_at) VALUES (?, ?, ?)
+            ON CONFLICT (image) DO UPDATE SET reference = excluded.reference, pulled_at = excluded.pulled_at
+            ''', (image, reference, time.time() if pulled_at is None else pulled_at))
+
+def get_site_apps(project_name, site_name, conn=None):
+    with _connection(conn) as conn:
+        return _get_site_apps(conn, project_name, site_name)
+
+def _get_site_apps(conn, project_name, site_name):
+    apps = [row[0] for row in conn.execute('''
+    SELECT a.name
     FROM projects p
-    JOIN containers c ON p.id = c.project_id
-    LEFT JOIN sites s ON c.id = s.container_id
-    LEFT JOIN apps a ON c.id = a.container_id
+    JOIN containers c ON c.project_id = p.id
+    JOIN sites s ON s.container_id = c.id AND s.name = ?
+    JOIN site_apps sa ON sa.site_id = s.id
+    JOIN apps a ON a.id = sa.app_id
     WHERE p.name = ?
-    GROUP BY c.id, s.id
-    ''', (project_name,))
-    
-    rows = cursor.fetchall()
-    if not rows:
-        return None
-    
-    result = {
-        "project_name": project_name,
-        "bench_directory": rows[0]['bench_dir'],
-        "sites": [],
-        "available_apps": set()
-    }
-    
-    for row in rows:
-        if row['site_name']:
-            result["sites"].append(row['site_name'])
-        if row['apps']:
-            result["available_apps"].update(row['apps'].split(','))
-    
-    result["available_apps"] = list(result["available_apps"])
-    
-    conn.close()
-    return result
-
-def get_all_projects_info():
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-    SELECT p.name as project_name, c.bench_dir, s.name as site_name, GROUP_CONCAT(DISTINCT a.name) as apps
+    ORDER BY a.id
+    ''', (site_name, project_name))]
+
+    if not apps:
+        # Every site has at least frappe installed, so no rows means the
+        # installations were never recorded; fall back to the bench's apps.
+        apps = [row[0] for row in conn.execute('''
+        SELECT DISTINCT a.name
+        FROM projects p
+        JOIN containers c ON c.project_id = p.id
+        JOIN apps a ON a.container_id = c.id
+        WHERE p.name = ?
+        ORDER BY a.id
+        ''', (project_name,))]
+
+    return {"site": site_name, "installed_apps": apps}
+
+def _load_projects(conn, where="", params=()):
+    """Read projects matching ``where`` (a clause over ``projects p``).
+
+    Containers, sites, apps and per-site installations are fetched with one
+    set-based query each and stitched together here, instead of joining them
+    into a sites x apps cross product.
+    """
+    base = f'''
     FROM projects p
-    JOIN containers c ON p.id = c.project_id
-    LEFT JOIN sites s ON c.id = s.container_id
-    LEFT JOIN apps a ON c.id = a.container_id
-    GROUP BY p.id, c.id, s.id
-    ''')
-    
-    rows = cursor.fetchall()
+    JOIN containers c ON c.project_id = p.id
+    {{joins}}
+    {where}
+    '''
     projects = {}
-    
-    for row in rows:
-        project_name = row['project_name']
-        if project_name not in projects:
-            projects[project_name] = {
-                "bench_directory": row['bench_dir'],
-                "sites": [],
-                "available_apps": set()
-            }
-        
-        if row['site_name']:
-            projects[project_name]["sites"].append(row['site_name'])
-        if row['apps']:
-            projects[project_name]["available_apps"].update(row['apps'].split(','))
-    
+    container_project = {}
+    for project_name, container_db_id, bench_dir in conn.execute(
+        'SELECT p.name, c.id, c.bench_dir ' + base.format(joins='') + ' ORDER BY p.id, c.id', params
+    ):
+        container_project[container_db_id] = project_name
+        projects.setdefault(project_name, {
+            "bench_directory": bench_dir,
+            "sites": {},
+            "available_apps": {},
+            "site_apps": {},
+            "site_db_names": {},
+        })
+
+    site_names = {}
+    for site_id, container_db_id, site_name, db_name in conn.execute(
+        'SELECT s.id, c.id, s.name, s.db_name ' + base.format(joins='JOIN sites s ON s.container_id = c.id')
+        + ' ORDER BY s.id', params
+    ):
+        project = projects[container_project[container_db_id]]
+        site_names[site_id] = (container_project[container_db_id], site_name)
+        project["sites"][site_name] = None
+        if db_name is not None:
+            project["site_db_names"][site_name] = db_name
+
+    app_names = {}
+    for app_id, container_db_id, app_name in conn.execute(
+        'SELECT a.id, c.id, a.name ' + base.format(joins='JOIN apps a ON a.container_id = c.id') + ' ORDER BY a.id',
+        params
+    ):
+        app_names[app_id] = app_name
+        projects[container_project[container_db_id]]["available_apps"][app_name] = None
+
+    # Installations come back as ID pairs in primary key order and are
+    # resolved against the names already loaded above.
+    for site_id, app_id in conn.execute(
+        'SELECT sa.site_id, sa.app_id ' + base.format(joins='''
+        JOIN sites s ON s.container_id = c.id
+        JOIN site_apps sa ON sa.site_id = s.id''') + ' ORDER BY sa.site_id, sa.app_id', params
+    ):
+        project_name, site_name = site_names[site_id]
+        projects[project_name]["site_apps"].setdefault(site_name, []).append(app_names[app_id])
+
+    # Dicts above keep first-seen order while dropping duplicates.
     for project in projects.values():
+        project["sites"] = list(project["sites"])
         project["available_apps"] = list(project["available_apps"])
-    
-    conn.close()
-    return {"projects": projects}
+    return projects
+
+class QueryCache:
+    """Read-through cache for project queries with a TTL and LRU eviction.
+
+    Entries are keyed by the connection they were read from (or the database
+    file for short-lived connections) so separate databases never mix. Writes
+    made through this module clear it; the TTL bounds how long changes made by
+    other processes can go unseen. Cached results are shared, so callers must
+    not modify them.
+    """
 
-# Initialize the database when this module is imported
-init_db()
+    def __init__(self, maxsize=128, ttl=10.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Bumped by invalidate() so a read that raced a write is not stored.
+        self._generation = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
 
+    def get(self, key, loader):
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self._generation
+
+        value = loader()
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return value
+        with self._lock:
+            if generation != self._generation:
+                return value
+            self._entries[key] = (now + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+project_cache = QueryCache()
+
+def _cached(conn, key, loader):
+    return project_cache.get((DB_FILE if conn is None else conn,) + key, lambda: loader(conn))
+
+def get_cache_stats():
+    return project_cache.stats()
+
+def get_project_info(project_name, conn=None):
+    def load(conn):
+        with _connection(conn) as conn:
+            return _get_project_info(conn, project_name)
+    return _cached(conn, ("project", project_name), load)
+
+def _get_project_info(conn, project_name):
+    project = _load_projects(conn, 'WHERE p.name = ?', (project_name,)).get(project_name)
+    if project is None:
+        return None
+    return dict(project_name=project_name, **project)
+
+def get_all_projects_info(conn=None):
+    def load(conn):
+        with _connection(conn) as conn:
+            return {"projects": _load_projects(conn)}
+    return _cached(conn, ("all",), load)
+
+# get_site_inventory sort key -> SQL expression; sites without a value sort last.
+INVENTORY_SORT_KEYS = {
+    "db_size": "i.db_size",
+    "files_size": "i.files_size",
+    "total_size": "i.db_size + i.files_size",
+    "last_backup": "i.last_backup",
+    "site": "s.name",
+    "project": "p.name",
+}
+
+def get_site_inventory(project_name=None, sort_by="db_size", descending=True, limit=None, conn=None):
+    """Every site (or every site of one project) with its sizes, last backup and app versions.
+
+    Sorted by ``sort_by`` (a key of INVENTORY_SORT_KEYS) and cut to ``limit``
+    rows in SQL, so "the ten heaviest sites" costs one small query plus one
+    for the apps of the sites returned.
+    """
+    if sort_by not in INVENTORY_SORT_KEYS:
+        raise ValueError(f"Unknown sort key: {sort_by}")
+    def load(conn):
+        with _connection(conn) as conn:
+            return _get_site_inventory(conn, project_name, sort_by, descending, limit)
+    return _cached(conn, ("inventory", project_name, sort_by, descending, limit), load)
+
+def _get_site_inventory(conn, project_name, sort_by, descending, limit):
+    expression = INVENTORY_SORT_KEYS[sort_by]
+    rows = conn.execute(f'''
+    SELECT s.id, c.id, p.name, s.name, s.db_name, i.db_size, i.files_size, i.last_backup
+    FROM projects p
+    JOIN containers c ON c.project_id = p.id
+    JOIN sites s ON s.container_id = c.id
+    LEFT JOIN site_inventory i ON i.site_id = s.id
+    {'WHERE p.name = ?' if project_name is not None else ''}
+    ORDER BY ({expression}) IS NULL, {expression} {'DESC' if descending else 'ASC'}, p.name, s.name
+    LIMIT ?
+    ''', ((project_name,) if project_name is not None else ()) + (-1 if limit is None else limit,)).fetchall()
+
+    apps_by_site = {}
+    for site_id, name, version, branch, commit in _select_in(conn, '''
+    SELECT sa.site_id, a.name, v.version, v.branch, v.git_commit
+    FROM site_apps sa
+    JOIN apps a ON a.id = sa.app_id
+    LEFT JOIN app_versions v ON v.app_id = a.id
+    WHERE sa.site_id IN ({})
+    ORDER BY a.id
+    ''', [row[0] for row in rows]):
+        apps_by_site.setdefault(site_id, []).append({"name": name, "version": version, "branch": branch, "commit": commit})
+
+    # Sites whose installations were never recorded fall back to the bench's apps.
+    apps_by_container = {}
+    for container_db_id, name, version, branch, commit in _select_in(conn, '''
+    SELECT a.container_id, a.name, v.version, v.branch, v.git_commit
+    FROM apps a
+    LEFT JOIN app_versions v ON v.app_id = a.id
+    WHERE a.container_id IN ({})
+    ORDER BY a.id
+    ''', {row[1] for row in rows if row[0] not in apps_by_site}):
+        apps_by_container.setdefault(container_db_id, []).append(
+            {"name": name, "version": version, "branch": branch, "commit": commit})
+
+    sites = []
+    for site_id, container_db_id, project, site, db_name, db_size, files_size, last_backup in rows:
+        sites.append({
+            "project": project,
+            "site": site,
+            "db_name": db_name,
+            "db_size": db_size,
+            "files_size": files_size,
+            "total_size": db_size + files_size if db_size is not None and files_size is not None else None,
+            "last_backup": last_backup,
+            "installed_apps": apps_by_site.get(site_id, apps_by_container.get(container_db_id, [])),
+        })
+    return sites
+
+
+SEARCH_MODES = ("substring", "prefix", "glob")
+
+def _like_pattern(query, mode):
+    """``(LIKE pattern, needs ESCAPE)``; glob ``*`` and ``?`` become ``%`` and ``_``."""
+    escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    if mode == "glob":
+        pattern = escaped.replace("*", "%").replace("?", "_")
+    elif mode == "prefix":
+        pattern = escaped + "%"
+    else:
+        pattern = "%" + escaped + "%"
+    return pattern, escaped != query
+
+def _trigram_query(query, mode):
+    """An FTS5 query requiring each literal run of three or more characters, or None."""
+    runs = query.replace("?", "*").split("*") if mode == "glob" else [query]
+    phrases = ['"' + run.replace('"', '""') + '"' for run in runs if len(run) >= 3]
+    return " AND ".join(phrases) or None
+
+def search(query, kinds=None, project_name=None, mode="substring", limit=50, offset=0, conn=None):
+    """Projects, bench directories, sites and apps whose name matches ``query``, a page at a time.
+
+    ``mode`` is "substring", "prefix" or "glob" (``*.complaints.*``); matching
+    ignores ASCII case. Queries of three characters or more are answered from
+    the trigram index, shorter ones scan it, as do all queries when this
+    SQLite had no trigram tokenizer to build the index with. Results are
+    ordered by kind, then name, then project, and come with the total number
+    of matches.
+    """
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode: {mode}")
+    kinds = list(kinds or SEARCH_KINDS)
+    unknown = set(kinds) - set(SEARCH_KINDS)
+    if unknown:
+        raise ValueError(f"Unknown search kind: {', '.join(sorted(unknown))}")
+    def load(conn):
+        with _connection(conn) as conn:
+            return _search(conn, query, kinds, project_name, mode, limit, offset)
+    return _cached(conn, ("search", query, tuple(kinds), project_name, mode, limit, offset), load)
+
+def _search_index_is_fts(conn):
+    sql = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'search_index'").fetchone()[0]
+    return "fts5" in sql.lower()
+
+def _search(conn, query, kinds, project_name, mode, limit, offset):
+    pattern, escape = _like_pattern(query, mode)
+    # LIKE decides what matches. Without ESCAPE it is answered from the index
+    # directly; with one (names like "erpnext_custom") the index is reached
+    # through MATCH on the literal runs and LIKE only checks those rows.
+    conditions = ["f.name LIKE ? ESCAPE '\\'" if escape else "f.name LIKE ?"]
+    params = [pattern]
+    phrases = _trigram_query(query, mode) if escape and _search_index_is_fts(conn) else None
+    if phrases:
+        conditions.append("f.name MATCH ?")
+        params.append(phrases)
+    if len(kinds) < len(SEARCH_KINDS):
+        conditions.append(f"f.rowid % 4 IN ({', '.join('?' * len(kinds))})")
+        params += [SEARCH_KINDS.index(kind) for kind in kinds]
+    if project_name is not None:
+        conditions.append("p.name = ?")
+        params.append(project_name)
+
+    matches = f'''
+    SELECT f.rowid % 4 AS kind, f.name AS name, p.name AS project
+    FROM search_index f
+    LEFT JOIN sites s ON f.rowid % 4 = 2 AND s.id = f.rowid / 4
+    LEFT JOIN apps a ON f.rowid % 4 = 3 AND a.id = f.rowid / 4
+    LEFT JOIN containers c ON c.id = CASE f.rowid % 4
+        WHEN 1 THEN f.rowid / 4 WHEN 2 THEN s.container_id WHEN 3 THEN a.container_id END
+    JOIN projects p ON p.id = CASE WHEN f.rowid % 4 = 0 THEN f.rowid / 4 ELSE c.project_id END
+    WHERE {' AND '.join(conditions)}
+    '''
+    total = conn.execute(f'SELECT COUNT(*) FROM ({matches})', params).fetchone()[0]
+    rows = conn.execute(f'{matches} ORDER BY kind, name, project LIMIT ? OFFSET ?',
+                        params + [-1 if limit is None else limit, offset]).fetchall()
+    return {
+        "query": query,
+        "mode": mode,
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "results": [{"kind": SEARCH_KINDS[kind], "name": name, "project": project} for kind, name, project in rows],
+    }
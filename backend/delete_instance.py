@@ -1,41 +1,154 @@
-import sys
-import json
-import docker
-import os
-
-def delete_frappe_instance(project_name):
-    client = docker.from_env()
-
-    try:
-        # Stop and remove containers
-        containers = client.containers.list(all=True, filters={'label': f'com.docker.compose.project={project_name}'})
-        for container in containers:
-            container.stop()
-            container.remove()
-
-        # Remove volumes
-        volumes = client.volumes.list(filters={'label': f'com.docker.compose.project={project_name}'})
-        for volume in volumes:
-            volume.remove()
-
-        # Remove networks
-        networks = client.networks.list(filters={'label': f'com.docker.compose.project={project_name}'})
-        for network in networks:
-            network.remove()
-
-        # Remove project directory
-        project_dir = os.path.join(os.path.expanduser('~'), 'frappe-projects', project_name)
-        if os.path.exists(project_dir):
-            os.system(f'rm -rf {project_dir}')
-
-        return json.dumps({"status": "success", "message": f"Instance {project_name} deleted successfully"})
-    except Exception as e:
-        return json.dumps({"status": "error", "message": str(e)})
-
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print(json.dumps({"status": "error", "message": "Project name not provided"}))
-    else:
-        project_name = sys.argv[1]
-        print(delete_frappe_instance(project_name))
-
+# delete_instance.py
+"""Tear down a Frappe project: containers, volumes, networks, files and cache rows.
+
+Containers are stopped and removed concurrently; volumes and networks, which
+can only go once no container uses them, are then removed together. Each
+resource produces a progress event, printed as one JSON line when run from the
+command line:
+
+    {"type": "progress", "resource": "container", "name": "...", "action": "removed", "status": "ok"}
+
+followed by the overall result. With ``--stream`` the output follows the
+event_stream protocol instead: the same progress events, then a result or
+error event, timing and done.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import profiling
+from event_stream import add_argument as add_stream_argument, run_streamed
+from db_operations import delete_project
+from list_instances import PROJECT_LABEL
+from workers import MAX_WORKERS, STOP_GRACE_PERIOD
+PROJECTS_DIR = os.path.join(os.path.expanduser('~'), 'frappe-projects')
+
+def _remove_container(container, grace):
+    if container.status == 'running':
+        container.stop(timeout=grace)
+    container.remove()
+
+def _run_stage(items, func, on_event, jobs):
+    """Apply ``func`` to ``(resource, name, item)`` triples concurrently; returns the failed ``(resource, name)``."""
+    failed = []
+    if not items:
+        return failed
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(items)))) as executor:
+        futures = {executor.submit(func, item): (resource, name) for resource, name, item in items}
+        for future in as_completed(futures):
+            resource, name = futures[future]
+            event = {"type": "progress", "resource": resource, "name": name, "action": "removed"}
+            try:
+                future.result()
+                event["status"] = "ok"
+            except Exception as e:
+                event.update(status="error", error=str(e))
+                failed.append((resource, name))
+            on_event(event)
+    return failed
+
+def _project_directory(project_name):
+    # Refuse names that aren't a single path component; checked on the name
+    # alone, so a symlinked project directory doesn't stop the teardown.
+    separators = {os.sep, os.altsep} - {None}
+    if project_name in ("", ".", "..") or any(sep in project_name for sep in separators):
+        raise ValueError(f"Invalid project name: {project_name}")
+    return os.path.join(PROJECTS_DIR, project_name)
+
+def _remove_directory(project_dir):
+    if os.path.islink(project_dir):
+        os.unlink(project_dir)  # the link is the project's; what it points at is left alone
+        return
+    if os.path.dirname(os.path.realpath(project_dir)) != os.path.realpath(PROJECTS_DIR):
+        raise OSError(f"{project_dir} resolves outside {PROJECTS_DIR}")
+    shutil.rmtree(project_dir)
+
+@profiling.timed("delete_instance.teardown_project")
+def teardown_project(project_name, client=None, conn=None, grace=STOP_GRACE_PERIOD, jobs=MAX_WORKERS,
+                     on_event=None):
+    """Remove everything belonging to ``project_name`` and return the failed ``(resource, name)`` pairs."""
+    if client is None:
+        import docker
+        client = docker.from_env()
+    client = profiling.instrument_client(client)
+    on_event = on_event or (lambda event: None)
+    label = {'label': f'{PROJECT_LABEL}={project_name}'}
+    project_dir = _project_directory(project_name)
+
+    containers = client.containers.list(all=True, filters=label)
+    failed = _run_stage(
+        [("container", c.name, c) for c in containers],
+        lambda container: _remove_container(container, grace), on_event, jobs
+    )
+
+    # Volumes and networks only depend on the containers, not on each other.
+    volumes = client.volumes.list(filters=label)
+    networks = client.networks.list(filters=label)
+    failed += _run_stage(
+        [("volume", v.name, v) for v in volumes] + [("network", n.name, n) for n in networks],
+        lambda resource: resource.remove(), on_event, jobs
+    )
+
+    if os.path.lexists(project_dir):
+        event = {"type": "progress", "resource": "directory", "name": project_dir, "action": "removed"}
+        try:
+            _remove_directory(project_dir)
+            event["status"] = "ok"
+        except OSError as e:
+            event.update(status="error", error=str(e))
+            failed.append(("directory", project_dir))
+        on_event(event)
+
+    rows = delete_project(project_name, conn=conn)
+    on_event({"type": "progress", "resource": "database", "name": project_name, "action": "removed",
+              "status": "ok", "rows": rows})
+    return failed
+
+def delete_frappe_instance(project_name, client=None, conn=None, grace=STOP_GRACE_PERIOD, on_event=None):
+    try:
+        started = time.monotonic()
+        failed = teardown_project(project_name, client=client, conn=conn, grace=grace, on_event=on_event)
+        failures = [f"{resource} {name}" for resource, name in failed]
+        if failures:
+            return json.dumps({"status": "error", "message": f"Could not remove: {', '.join(failures)}"})
+        return json.dumps({"status": "success", "message": f"Instance {project_name} deleted successfully",
+                           "seconds": round(time.monotonic() - started, 3)})
+    except Exception as e:
+        return json.dumps({"status": "error", "message": str(e)})
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete a Frappe project and everything it created")
+    parser.add_argument("project_name", help="Docker Compose project name")
+    parser.add_argument("--grace", type=int, default=STOP_GRACE_PERIOD,
+                        help=f"Seconds containers get to stop before being killed (default: {STOP_GRACE_PERIOD})")
+    profiling.add_argument(parser)
+    add_stream_argument(parser)
+    args = parser.parse_args()
+    profiling.enable_from_args(args)
+
+    if not args.stream:
+        print(delete_frappe_instance(
+            args.project_name, grace=args.grace,
+            on_event=lambda event: print(json.dumps(event), flush=True)
+        ))
+        return
+
+    def summarize(result, writer):
+        if result["status"] != "success":
+            writer.error(result["message"], project=args.project_name)
+            return "error", {}
+        writer.emit(dict(result, type="result", project=args.project_name))
+        return "ok", {}
+
+    run_streamed(lambda writer: json.loads(delete_frappe_instance(args.project_name, grace=args.grace,
+                                                                  on_event=writer)), summarize)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(json.dumps({"status": "error", "message": "Project name not provided"}))
+    else:
+        main()
@@ -0,0 +1,122 @@
+# event_stream.py
+"""JSON-lines output for long-running backend commands.
+
+With ``--stream``, update_db, delete_instance, create_instance and
+list_instances write one JSON object per line on stdout instead of free-form
+text and a final blob, so a reader can act on each line as it arrives:
+
+    {"type": "progress", ...}   work started or advanced (stage, done, total, ...)
+    {"type": "result", ...}     one finished item: a refreshed project, a listed project, the created instance
+    {"type": "error", ...}      one failed item, or the command itself ("message")
+    {"type": "log", "message"}  anything the command printed
+    {"type": "timing", ...}     elapsed seconds, plus per-span timings when profiling is on
+    {"type": "done", "status"}  always the last line; "ok" or "error", with summary counts
+
+Every line also carries ``"v"`` (the protocol version) and ``"ts"`` (Unix time).
+"""
+import contextlib
+import io
+import json
+import sys
+import threading
+import time
+
+import profiling
+
+PROTOCOL_VERSION = 1
+
+
+class _LogStream(io.TextIOBase):
+    """A text stream turning each complete line written to it into a log event."""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self._pending = ""
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        self._pending += text
+        *lines, self._pending = self._pending.split("\n")
+        for line in lines:
+            if line.strip():
+                self.writer.emit({"type": "log", "message": line})
+        return len(text)
+
+    def flush(self):
+        if self._pending.strip():
+            self.writer.emit({"type": "log", "message": self._pending})
+        self._pending = ""
+
+
+class JsonLinesWriter:
+    """Writes events as JSON lines; callable, so it can be passed as ``on_event``."""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def emit(self, event):
+        line = json.dumps(dict(event, v=PROTOCOL_VERSION, ts=round(time.time(), 3)), default=str)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+    __call__ = emit
+
+    def error(self, message, **fields):
+        self.emit(dict(fields, type="error", message=message))
+
+    @contextlib.contextmanager
+    def capture_prints(self):
+        """Send whatever the block prints to stdout as log events."""
+        log = _LogStream(self)
+        with contextlib.redirect_stdout(log):
+            try:
+                yield
+            finally:
+                log.flush()
+
+    def finish(self, status="ok", **summary):
+        """Emit the timing events and the final done event."""
+        self.emit({"type": "timing", "name": "total", "seconds": round(time.monotonic() - self.started, 3)})
+        if profiling.enabled():
+            for name, row in profiling.recorder.summary().items():
+                self.emit(dict(row, type="timing", name=name))
+        self.emit(dict(summary, type="done", status=status))
+
+
+def run_streamed(run, summarize=None):
+    """The ``--stream`` mode of a command: ``run(writer)`` with its prints as log events, then the done event.
+
+    ``summarize(value, writer)`` gets what ``run`` returned; it may emit
+    result and error events and returns the done status with its summary
+    fields. If ``run`` raises, the error is reported instead. Exits with
+    status 1 unless the command finished "ok"; otherwise returns the value.
+    """
+    writer = JsonLinesWriter()
+    try:
+        with writer.capture_prints():
+            value = run(writer)
+    except Exception as e:
+        writer.error(str(e))
+        writer.finish("error")
+        sys.exit(1)
+    status, summary = summarize(value, writer) if summarize else ("ok", {})
+    writer.finish(status, **summary)
+    if status != "ok":
+        sys.exit(1)
+    return value
+
+def add_argument(parser):
+    parser.add_argument("--stream", action="store_true",
+                        help="Write typed JSON-lines events (progress, result, error, timing, done) to stdout")
+
+def pop_flag(argv):
+    """For scripts without argparse: remove ``--stream`` from ``argv`` and report whether it was there."""
+    if "--stream" in argv[1:]:
+        argv.remove("--stream")
+        return True
+    return False
@@ -0,0 +1,303 @@
+# exec_session.py
+"""Long-lived shell sessions for running many commands in a container.
+
+Every ``container.exec_run`` is three Docker API requests: create, start and
+inspect. An ExecSession starts one ``sh`` per container with stdin attached
+and writes commands to it instead, each followed by a marker carrying its
+exit status, so once the two requests that open the session are paid a batch
+of commands costs one write and one read on the attached socket. Commands run
+in a subshell with stdin from /dev/null, so they can neither change the shell
+nor read the commands queued behind them.
+
+A session that drops (the container restarted, the connection was reset) is
+reopened and the unfinished commands are sent again, so sessions are only for
+commands that are safe to repeat; once its pool is closed it stays closed. A
+read that waits longer than the pool's ``timeout`` drops the session too. A
+container whose session can't be opened falls back to exec_run.
+
+    python exec_session.py PROJECT COMMAND [COMMAND ...] [--workdir DIR]
+"""
+import argparse
+import json
+import os
+import secrets
+import shlex
+import struct
+import sys
+import threading
+import time
+from collections import namedtuple
+
+import profiling
+from list_instances import PROJECT_LABEL, SERVICE_LABEL
+
+ExecResult = namedtuple("ExecResult", ["exit_code", "output"])
+
+# Docker API requests behind one exec_run (create, start, inspect) and behind opening a session (create, start).
+EXEC_RUN_REQUESTS = 3
+OPEN_REQUESTS = 2
+# Stream type of stdout frames on a non-TTY attached socket.
+STDOUT = 1
+RECV_SIZE = 64 * 1024
+
+class SessionDropped(Exception):
+    """The shell went away, or could not be started, before answering."""
+
+def frame_command(cmd, marker, workdir=None, stderr=True):
+    """The shell line that runs ``cmd`` like exec_run would, then prints ``marker`` and the exit status."""
+    args = shlex.split(cmd) if isinstance(cmd, str) else [str(arg) for arg in cmd]
+    cd = f"cd {shlex.quote(workdir)} && " if workdir else ""
+    redirect = "2>&1" if stderr else "2>/dev/null"
+    return f"( {cd}exec {shlex.join(args)} ) </dev/null {redirect}; printf '%s %d\\n' {marker} \"$?\"\n"
+
+
+class ExecSession:
+    """One ``sh`` in one container, running batches of commands in order."""
+
+    def __init__(self, client, container_id, retries=1, timeout=None):
+        self.client = client
+        self.container_id = container_id
+        self.retries = retries
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.sock = None
+        # Set by ExecPool.close: the session is not reopened after that.
+        self.closed = False
+        self.token = secrets.token_hex(16)
+        self.seq = 0
+        self._raw = bytearray()
+        self._output = bytearray()
+        self.opens = 0
+        self.open_seconds = 0.0
+        self.commands = 0
+        self.batches = 0
+
+    def open(self):
+        started = time.perf_counter()
+        try:
+            exec_id = self.client.api.exec_create(self.container_id, ["sh"], stdin=True, stdout=True, stderr=True,
+                                                  tty=False)["Id"]
+            self.sock = self.client.api.exec_start(exec_id, socket=True)
+            self._socket(self.sock).settimeout(self.timeout)
+        except Exception as e:
+            raise SessionDropped(f"Could not start a shell: {e}") from e
+        self.open_seconds += time.perf_counter() - started
+        self.opens += 1
+        self._raw.clear()
+        self._output.clear()
+
+    def close(self):
+        sock, self.sock = self.sock, None
+        if sock is None:
+            return
+        try:
+            self._socket(sock).sendall(b"exit\n")
+        except OSError:
+            pass
+        try:
+            sock.close()
+        except OSError:
+            pass
+
+    @staticmethod
+    def _socket(sock):
+        # docker-py hands out a SocketIO over unix sockets; the raw socket is behind _sock.
+        return getattr(sock, "_sock", sock)
+
+    def _fill(self):
+        chunk = self._socket(self.sock).recv(RECV_SIZE)
+        if not chunk:
+            raise SessionDropped("The shell closed its output")
+        self._raw += chunk
+        # Frames are an 8-byte header (stream, 3 padding bytes, big-endian size) and the payload.
+        while len(self._raw) >= 8:
+            stream, size = struct.unpack_from(">BxxxL", self._raw)
+            if len(self._raw) < 8 + size:
+                break
+            if stream == STDOUT:
+                self._output += self._raw[8:8 + size]
+            del self._raw[:8 + size]
+
+    def _read_result(self, marker):
+        tag = marker.encode() + b" "
+        while True:
+            start = self._output.find(tag)
+            end = self._output.find(b"\n", start) if start != -1 else -1
+            if end != -1:
+                result = ExecResult(int(self._output[start + len(tag):end]), bytes(self._output[:start]))
+                del self._output[:end + 1]
+                return result
+            self._fill()
+
+    def run_many(self, commands, workdir=None, stderr=True):
+        """Run ``commands`` in order and return an ExecResult for each.
+
+        The whole batch is written at once and the results read back in
+        order. Raises SessionDropped once ``retries`` reopened sessions have
+        dropped as well.
+        """
+        commands = list(commands)
+        results = []
+        with self.lock:
+            for attempt in range(self.retries + 1):
+                try:
+                    if self.sock is None:
+                        if self.closed:
+                            raise SessionDropped("The session's pool is closed")
+                        self.open()
+                    markers, lines = [], []
+                    for cmd in commands[len(results):]:
+                        self.seq += 1
+                        markers.append(f"{self.token}:{self.seq}")
+                        lines.append(frame_command(cmd, markers[-1], workdir, stderr))
+                    self._socket(self.sock).sendall("".join(lines).encode())
+                    for marker in markers:
+                        results.append(self._read_result(marker))
+                        self.commands += 1
+                    self.batches += 1
+                    return results
+                except (SessionDropped, OSError) as e:
+                    self.close()
+                    # A timeout means a command is still running; sending it again won't help.
+                    if isinstance(e, TimeoutError) or attempt == self.retries:
+                        raise SessionDropped(str(e) or type(e).__name__) from e
+        return results
+
+
+class PooledContainer:
+    """A container whose exec_run goes through its pooled session; everything else passes through."""
+
+    def __init__(self, pool, container):
+        self._pool = pool
+        self._container = container
+
+    def __getattr__(self, attr):
+        return getattr(self._container, attr)
+
+    def exec_run(self, cmd, stdout=True, stderr=True, workdir=None, **kwargs):
+        if not stdout or kwargs:
+            # Users, environments, demuxed output and the like need a real exec.
+            return self._container.exec_run(cmd, stdout=stdout, stderr=stderr, workdir=workdir, **kwargs)
+        program = os.path.basename(((shlex.split(cmd) if isinstance(cmd, str) else list(cmd)) or [""])[0])
+        with profiling.span(f"exec_session.exec_run[{program}]"):
+            return self._pool.exec_batch(self._container, [cmd], workdir=workdir, stderr=stderr)[0]
+
+    def exec_batch(self, commands, workdir=None, stderr=True):
+        with profiling.span("exec_session.exec_batch", commands=len(commands)):
+            return self._pool.exec_batch(self._container, commands, workdir=workdir, stderr=stderr)
+
+    def __repr__(self):
+        return f"<pooled {self._container!r}>"
+
+
+class ExecPool:
+    """One ExecSession per container, opened on first use and closed together.
+
+    Use as a context manager, or call close(). ``timeout`` bounds each wait
+    for a session's output, in seconds. stats() reports the commands
+    run, the round-trips they saved over an exec_run apiece and the time that
+    saved, estimated from how long opening the sessions took and summed over
+    the threads that used them.
+    """
+
+    def __init__(self, client, retries=1, timeout=None):
+        self.client = client
+        self.retries = retries
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.unavailable = set()
+        self.fallbacks = 0
+        self.closed = False
+
+    def session(self, container):
+        """The container's session, or None once it has proved unusable or the pool is closed."""
+        with self.lock:
+            if self.closed or container.id in self.unavailable:
+                return None
+            if container.id not in self.sessions:
+                self.sessions[container.id] = ExecSession(self.client, container.id, self.retries, self.timeout)
+            return self.sessions[container.id]
+
+    def exec_batch(self, container, commands, workdir=None, stderr=True):
+        session = self.session(container)
+        if session is not None:
+            try:
+                return session.run_many(commands, workdir=workdir, stderr=stderr)
+            except SessionDropped as e:
+                print(f"Exec session for {container.name} unavailable, using exec_run: {e}")
+                with self.lock:
+                    self.unavailable.add(container.id)
+        with self.lock:
+            self.fallbacks += len(commands)
+        return [container.exec_run(cmd, stderr=stderr, workdir=workdir) for cmd in commands]
+
+    def wrap(self, container):
+        return PooledContainer(self, container)
+
+    def stats(self):
+        with self.lock:
+            sessions = list(self.sessions.values())
+            fallbacks = self.fallbacks
+        opens = sum(s.opens for s in sessions)
+        commands = sum(s.commands for s in sessions)
+        round_trips = OPEN_REQUESTS * opens + sum(s.batches for s in sessions)
+        saved = EXEC_RUN_REQUESTS * commands - round_trips
+        per_request = sum(s.open_seconds for s in sessions) / (OPEN_REQUESTS * opens) if opens else 0.0
+        return {"sessions": len([s for s in sessions if s.opens]), "reconnects": max(0, opens - len(sessions)),
+                "commands": commands, "fallbacks": fallbacks, "round_trips": round_trips,
+                "round_trips_saved": saved, "seconds_saved": round(max(0.0, saved * per_request), 3)}
+
+    def close(self):
+        # Sessions stay in the map so stats() still describes the pool's work.
+        with self.lock:
+            self.closed = True
+            sessions = list(self.sessions.values())
+        for session in sessions:
+            session.closed = True
+            session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def exec_batch(container, commands, workdir=None, stderr=True):
+    """Run ``commands`` in ``container`` in order: one round-trip if it is pooled, one exec each otherwise."""
+    if isinstance(container, PooledContainer):
+        return container.exec_batch(commands, workdir=workdir, stderr=stderr)
+    return [container.exec_run(cmd, stderr=stderr, workdir=workdir) for cmd in commands]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run commands in a project's frappe container over one exec session")
+    parser.add_argument("project", help="Docker Compose project name")
+    parser.add_argument("commands", nargs="+", help="Commands to run, in order (each split like a shell would)")
+    parser.add_argument("-w", "--workdir", help="Directory to run the commands in")
+    parser.add_argument("--service", default="frappe", help="Compose service of the container (default: frappe)")
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+    profiling.enable_from_args(args)
+
+    import docker
+    client = profiling.instrument_client(docker.from_env())
+    containers = client.containers.list(filters={"label": [f"{PROJECT_LABEL}={args.project}",
+                                                           f"{SERVICE_LABEL}={args.service}"]})
+    if not containers:
+        print(json.dumps({"error": f"No running {args.service} container in project {args.project}"}))
+        sys.exit(1)
+
+    with ExecPool(client) as pool:
+        results = pool.exec_batch(containers[0], args.commands, workdir=args.workdir)
+    print(json.dumps({
+        "results": [{"command": cmd, "exit_code": result.exit_code,
+                     "output": result.output.decode("utf-8", "replace")}
+                    for cmd, result in zip(args.commands, results)],
+        "stats": pool.stats(),
+    }, indent=2))
+    if any(result.exit_code != 0 for result in results):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,66 @@
-import docker
 import json
 import argparse
 import sys
-from db_operations import get_project_info, get_all_projects_info
 
-def get_site_apps(project_name, site_name):
-    project_info = get_project_info(project_name)
-    if not project_info:
-        return {"error": f"No information found for project {project_name}"}
-    
+import profiling
+from db_operations import (
+    INVENTORY_SORT_KEYS, SEARCH_KINDS, SEARCH_MODES, get_project_info, get_all_projects_info, get_site_inventory,
+    search,
+)
+
+def _installed_apps(project_info, site_name):
+    # Sites refreshed before per-site installs were recorded fall back to
+    # every app in the bench.
+    return project_info["site_apps"].get(site_name, project_info["available_apps"])
+
+def _site_apps(project_info, project_name, site_name):
     if site_name not in project_info["sites"]:
         return {"error": f"Site {site_name} not found in project {project_name}"}
-    
-    # In this simplified version, we're assuming all apps are installed on all sites
-    # For a more accurate representation, you might need to modify the database schema
-    return {"site": site_name, "installed_apps": project_info["available_apps"]}
+    return {"site": site_name, "installed_apps": _installed_apps(project_info, site_name)}
 
-def get_site_info(project_name, site_name):
-    project_info = get_project_info(project_name)
-    if not project_info:
-        return {"error": f"No information found for project {project_name}"}
-    
+def _site_info(project_info, project_name, site_name):
     if site_name not in project_info["sites"]:
         return {"error": f"Site {site_name} not found in project {project_name}"}
-    
     return {
         "site": site_name,
         "project": project_name,
         "bench_directory": project_info["bench_directory"],
-        "installed_apps": project_info["available_apps"]  # Simplified, as mentioned above
+        "installed_apps": _installed_apps(project_info, site_name)
     }
 
-def main():
+def get_site_apps(project_name, site_name, conn=None):
+    project_info = get_project_info(project_name, conn=conn)
+    if not project_info:
+        return {"error": f"No information found for project {project_name}"}
+    return _site_apps(project_info, project_name, site_name)
+
+def get_site_info(project_name, site_name, conn=None):
+    project_info = get_project_info(project_name, conn=conn)
+    if not project_info:
+        return {"error": f"No information found for project {project_name}"}
+    return _site_info(project_info, project_name, site_name)
+
+# --get-many query -> answer from the project info (and the site, for "name=SITE" queries)
+MANY_QUERIES = {
+    "sites": lambda info, project, site: info["sites"],
+    "apps": lambda info, project, site: info["available_apps"],
+    "all": lambda info, project, site: info,
+    "site-apps": _site_apps,
+    "site-info": _site_info,
+}
+
+def get_many(project_info, project_name, queries):
+    """Answer several queries about one project from a single read, keyed by query."""
+    results = {}
+    for query in queries:
+        name, _, site = query.partition("=")
+        if name not in MANY_QUERIES or (name in ("site-apps", "site-info")) != bool(site):
+            results[query] = {"error": f"Unknown query: {query}"}
+        else:
+            results[query] = MANY_QUERIES[name](project_info, project_name, site or None)
+    return results
+
+def build_parser():
     parser = argparse.ArgumentParser(description="Frappe Instance Info")
     parser.add_argument("-p", "--project", help="Docker Compose project name")
     group = parser.add_mutually_exclusive_group()
@@ -40,30 +69,60 @@ def main():
     group.add_argument("--get-apps", action="store_true", help="Get all available apps for the project")
     group.add_argument("--get-site-info", metavar="SITE", help="Get detailed information for a specific site")
     group.add_argument("--all", action="store_true", help="Get all information for the project")
+    group.add_argument("--get-many", nargs="+", metavar="QUERY",
+                       help="Answer several queries at once: sites, apps, all, site-apps=SITE, site-info=SITE")
+    group.add_argument("--inventory", action="store_true",
+                       help="List sites with DB size, file size, last backup and app versions (all projects unless -p)")
+    group.add_argument("--search", metavar="QUERY",
+                       help="Find projects, bench paths, sites and apps by name (all projects unless -p)")
+    parser.add_argument("--sort-by", choices=sorted(INVENTORY_SORT_KEYS), default="db_size",
+                        help="Inventory sort key (default: db_size)")
+    parser.add_argument("--ascending", action="store_true", help="Sort the inventory smallest/oldest first")
+    parser.add_argument("--limit", type=int, help="Return at most this many inventory rows or search results")
+    parser.add_argument("--offset", type=int, default=0, help="Skip this many search results (for paging)")
+    parser.add_argument("--match", choices=SEARCH_MODES, help="How --search matches names "
+                        "(default: glob if the query has * or ?, otherwise substring)")
+    parser.add_argument("--kind", action="append", choices=SEARCH_KINDS, help="Only search these kinds (repeatable)")
+    profiling.add_argument(parser)
+    return parser
 
-    args = parser.parse_args()
-
-    try:
-        if args.project:
-            project_info = get_project_info(args.project)
-            if not project_info:
-                raise Exception(f"No information found for project {args.project}")
-            
-            if args.get_sites:
-                result = {"sites": project_info["sites"]}
-            elif args.get_site_apps:
-                result = get_site_apps(args.project, args.get_site_apps)
-            elif args.get_apps:
-                result = {"available_apps": project_info["available_apps"]}
-            elif args.get_site_info:
-                result = get_site_info(args.project, args.get_site_info)
-            elif args.all:
-                result = project_info
-            else:
-                raise Exception("No option specified")
+def run_query(args, conn=None):
+    """Answer a parsed command line query and return the result as a dict."""
+    if args.search is not None:
+        mode = args.match or ("glob" if any(c in args.search for c in "*?") else "substring")
+        return search(args.search, kinds=args.kind, project_name=args.project, mode=mode,
+                      limit=50 if args.limit is None else args.limit, offset=args.offset, conn=conn)
+    if args.inventory:
+        sites = get_site_inventory(args.project, sort_by=args.sort_by, descending=not args.ascending,
+                                   limit=args.limit, conn=conn)
+        return {"sites": sites}
+    if args.project:
+        project_info = get_project_info(args.project, conn=conn)
+        if not project_info:
+            raise Exception(f"No information found for project {args.project}")
+        
+        if args.get_sites:
+            return {"sites": project_info["sites"]}
+        elif args.get_site_apps:
+            return _site_apps(project_info, args.project, args.get_site_apps)
+        elif args.get_apps:
+            return {"available_apps": project_info["available_apps"]}
+        elif args.get_site_info:
+            return _site_info(project_info, args.project, args.get_site_info)
+        elif args.all:
+            return project_info
+        elif args.get_many:
+            return get_many(project_info, args.project, args.get_many)
         else:
-            result = get_all_projects_info()
+            raise Exception("No option specified")
+    return get_all_projects_info(conn=conn)
 
+def main():
+    args = build_parser().parse_args()
+    profiling.enable_from_args(args)
+
+    try:
+        result = run_query(args)
         print(json.dumps(result, indent=2))
     except Exception as e:
         print(json.dumps({"error": str(e)}, indent=2), file=sys.stderr)
@@ -0,0 +1,233 @@
+# instance_watcher.py
+"""Keep Frappe project status and ports current from the Docker events stream.
+
+Rather than re-listing every container on a timer, the watcher takes one
+snapshot at start-up and then applies container events as they arrive. State is
+held in memory, persisted to the container_state table, and pushed to
+subscribers as change events:
+
+    {"type": "instance_changed", "project": ..., "status": ..., "ports": [...], "containers": [...]}
+    {"type": "instance_removed", "project": ...}
+
+If the stream drops (the daemon restarted, the connection was reset) the
+watcher reconnects with exponential backoff, reloads the snapshot and
+publishes a change for every project that differs from what it held, so
+subscribers catch up on whatever happened while it was disconnected.
+
+Run directly, it prints the snapshot and then each change as one JSON line.
+"""
+import json
+import sys
+import threading
+import time
+
+from db_operations import connect, save_container_states, delete_container_state
+from list_instances import PROJECT_LABEL, SERVICE_LABEL, get_host_ports, list_service_containers, project_status
+
+# Container event actions -> the status `docker ps` would report afterwards.
+ACTION_STATUS = {
+    "create": "created",
+    "start": "running",
+    "restart": "running",
+    "unpause": "running",
+    "pause": "paused",
+    "die": "exited",
+    "stop": "exited",
+    "kill": "exited",
+    "destroy": None,  # container is gone
+}
+RECONNECT_DELAY = 1.0
+MAX_RECONNECT_DELAY = 30.0
+
+
+class InstanceWatcher:
+    def __init__(self, client=None, conn=None, service_name="frappe", reconnect_delay=RECONNECT_DELAY,
+                 max_reconnect_delay=MAX_RECONNECT_DELAY):
+        if client is None:
+            import docker
+            client = docker.from_env()
+        self.client = client
+        self.conn = conn
+        self.service_name = service_name
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        # When the last snapshot was taken; the events stream is followed from there.
+        self.loaded_at = None
+        self.containers = {}  # container id -> {"project", "status", "ports"}
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._stream = None
+        self._stopped = threading.Event()
+
+    def subscribe(self, callback):
+        """Call ``callback(event)`` for every change; returns a function that unsubscribes."""
+        with self._lock:
+            self._subscribers.append(callback)
+        return lambda: self._subscribers.remove(callback)
+
+    def snapshot(self):
+        """Current state of every project, in the change event format."""
+        with self._lock:
+            projects = {c["project"] for c in self.containers.values()}
+            return [self._project_event(project) for project in sorted(projects)]
+
+    def load(self):
+        """Seed state from one container listing; replaces whatever was stored before."""
+        loaded_at = time.time()
+        containers = list_service_containers(self.client, self.service_name)
+        with self._lock:
+            self.containers = {
+                c["id"]: {"project": c["project"], "status": c["status"], "ports": c["ports"]}
+                for c in containers
+            }
+            self.loaded_at = loaded_at
+        now = time.time()
+        save_container_states(
+            [(cid, c["project"], c["status"], c["ports"], now) for cid, c in self.containers.items()],
+            conn=self._connection(), replace_all=True
+        )
+        return self.snapshot()
+
+    def resync(self):
+        """Reload the snapshot and publish a change for every project that differs from the state held before."""
+        before = {change["project"]: change for change in self.snapshot()}
+        after = {change["project"]: change for change in self.load()}
+        for project in sorted(before.keys() | after.keys()):
+            if before.get(project) != after.get(project):
+                self._publish(after.get(project) or {"type": "instance_removed", "project": project})
+
+    def handle_event(self, event):
+        """Apply one Docker event; returns the change event it produced, if any."""
+        if event.get("Type") != "container":
+            return None
+        action = event.get("Action", "")
+        if action not in ACTION_STATUS:
+            return None  # exec_start, health_status: ..., attach and friends
+
+        actor = event.get("Actor", {})
+        attributes = actor.get("Attributes", {})
+        project = attributes.get(PROJECT_LABEL)
+        if not project or attributes.get(SERVICE_LABEL) != self.service_name:
+            return None
+
+        container_id = actor.get("ID") or event.get("id")
+        status = ACTION_STATUS[action]
+        conn = self._connection()
+        with self._lock:
+            ports = self.containers.get(container_id, {}).get("ports", [])
+        # Inspected without the lock, so snapshot() doesn't wait on the Docker round trip.
+        if status is not None and (status == "running" or not ports):
+            ports = self._container_ports(container_id, ports)
+        with self._lock:
+            if status is None:
+                self.containers.pop(container_id, None)
+            else:
+                self.containers[container_id] = {"project": project, "status": status, "ports": ports}
+            change = self._project_event(project)
+
+        if status is None:
+            delete_container_state(container_id, conn=conn)
+        else:
+            save_container_states([(container_id, project, status, ports, time.time())], conn=conn)
+        self._publish(change)
+        return change
+
+    def follow(self, since=None):
+        """Apply events from one events stream, starting at Unix time ``since``, until it ends or stop() is called."""
+        self._stream = self.client.events(decode=True, since=since, filters={
+            "type": "container",
+            "label": f"{SERVICE_LABEL}={self.service_name}",
+            "event": list(ACTION_STATUS),
+        })
+        try:
+            for event in self._stream:
+                if self._stopped.is_set():
+                    break
+                self.handle_event(event)
+        finally:
+            self._stream = None
+
+    def run(self):
+        """Follow the events stream until stop() is called, reconnecting and resyncing whenever it drops."""
+        self._stopped.clear()
+        delay = self.reconnect_delay
+        resync = self.loaded_at is None
+        while not self._stopped.is_set():
+            try:
+                if resync:
+                    self.resync()
+                    delay = self.reconnect_delay
+                # Whole seconds: events in the snapshot's second may be applied twice, which is harmless.
+                self.follow(since=int(self.loaded_at))
+                error = "stream ended"
+            except Exception as e:
+                error = str(e) or type(e).__name__
+            if self._stopped.is_set():
+                break
+            print(f"Docker events stream lost ({error}), reconnecting in {delay:g}s", file=sys.stderr)
+            self._stopped.wait(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+            resync = True
+
+    def start(self):
+        """Load a snapshot and follow events on a background thread."""
+        snapshot = self.load()
+        threading.Thread(target=self.run, daemon=True).start()
+        return snapshot
+
+    def stop(self):
+        self._stopped.set()
+        if self._stream is not None and hasattr(self._stream, "close"):
+            self._stream.close()
+
+    def _connection(self):
+        # Opened on first use, by load() or by the first event, and shared by both: connect()
+        # connections may cross threads, and load() runs before the events thread starts or on it.
+        if self.conn is None:
+            self.conn = connect()
+        return self.conn
+
+    def _container_ports(self, container_id, default):
+        try:
+            return get_host_ports(self.client.containers.get(container_id).attrs)
+        except Exception:
+            return default
+
+    def _project_event(self, project):
+        containers = [
+            {"id": cid, "status": c["status"], "ports": c["ports"]}
+            for cid, c in self.containers.items() if c["project"] == project
+        ]
+        if not containers:
+            return {"type": "instance_removed", "project": project}
+        ports = []
+        for container in containers:
+            ports.extend(port for port in container["ports"] if port not in ports)
+        return {
+            "type": "instance_changed",
+            "project": project,
+            "status": project_status(c["status"] for c in containers),
+            "ports": ports,
+            "containers": containers,
+        }
+
+    def _publish(self, change):
+        for callback in list(self._subscribers):
+            try:
+                callback(change)
+            except Exception as e:
+                print(f"Error in instance watcher subscriber: {e}", file=sys.stderr)
+
+
+def main():
+    watcher = InstanceWatcher()
+    watcher.subscribe(lambda change: print(json.dumps(change), flush=True))
+    for project in watcher.load():
+        print(json.dumps(project), flush=True)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        watcher.stop()
+
+if __name__ == "__main__":
+    main()
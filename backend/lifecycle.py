@@ -0,0 +1,163 @@
+# lifecycle.py
+"""Start, stop or restart many compose projects at once.
+
+Projects are picked by name, by label selectors (``key`` or ``key=value``), or
+both, using the compose labels delete_instance and list_instances rely on.
+Up to ``jobs`` projects are handled concurrently, each within ``timeout``
+seconds. Inside a project, containers go in dependency order: databases and
+redis are started before frappe and the other services, and stopped after
+them. A restart is a stop followed by a start, so the order holds both ways.
+
+Each container produces a progress event and each project a result (or error)
+event:
+
+    {"type": "progress", "project": "...", "container": "...", "service": "...", "action": "start", "status": "ok"}
+    {"type": "result", "project": "...", "action": "start", "containers": 4, "seconds": 1.2}
+
+Containers already in the requested state are left alone.
+"""
+import argparse
+import json
+import sys
+import time
+
+import profiling
+from event_stream import add_argument as add_stream_argument, run_streamed
+from list_instances import PROJECT_LABEL, SERVICE_LABEL
+from workers import MAX_WORKERS, STOP_GRACE_PERIOD, run_bounded
+
+ACTIONS = ("start", "stop", "restart")
+# Services the rest of a bench depends on; everything else starts after them.
+BACKING_SERVICES = ("mariadb", "mysql", "db", "postgres", "postgresql", "redis")
+PROJECT_TIMEOUT = 120
+
+def service_tier(service):
+    """0 for databases and redis (``redis-cache``, ``redis-queue``, ...), 1 for everything else."""
+    service = (service or "").lower()
+    return 0 if any(service == name or service.startswith(name + "-") for name in BACKING_SERVICES) else 1
+
+def select_projects(client, projects=(), labels=()):
+    """Map each selected project to its containers, in start order.
+
+    With both ``projects`` and ``labels``, a project must match both. Stopped
+    containers are included, since they are what start acts on.
+    """
+    filters = {"label": [PROJECT_LABEL] + list(labels)}
+    wanted = set(projects)
+    selected = {}
+    for container in client.containers.list(all=True, filters=filters):
+        project = container.labels.get(PROJECT_LABEL)
+        if wanted and project not in wanted:
+            continue
+        selected.setdefault(project, []).append(container)
+    for containers in selected.values():
+        containers.sort(key=lambda c: (service_tier(c.labels.get(SERVICE_LABEL)), c.name))
+    return selected
+
+def _apply(container, action, grace):
+    """Bring one container to the state ``action`` asks for; returns "ok" or "unchanged"."""
+    running = container.status == "running"
+    if action == "start":
+        if running:
+            return "unchanged"
+        container.start()
+    elif action == "stop":
+        if not running:
+            return "unchanged"
+        container.stop(timeout=grace)
+    return "ok"
+
+def _run_project(project, containers, action, grace, on_event):
+    started = time.monotonic()
+    steps = []
+    if action in ("stop", "restart"):
+        steps += [(c, "stop") for c in reversed(containers)]
+    if action in ("start", "restart"):
+        steps += [(c, "start") for c in containers]
+
+    for container, step in steps:
+        event = {"type": "progress", "project": project, "container": container.name,
+                 "service": container.labels.get(SERVICE_LABEL), "action": step}
+        try:
+            event["status"] = _apply(container, step, grace)
+        except Exception as e:
+            # Later steps depend on this one, so the project stops here.
+            on_event(dict(event, status="error", error=str(e)))
+            raise Exception(f"Could not {step} {container.name}: {e}")
+        on_event(event)
+    return {"containers": len(containers), "seconds": round(time.monotonic() - started, 3)}
+
+@profiling.timed("lifecycle.bulk_action")
+def bulk_action(action, projects=(), labels=(), client=None, jobs=MAX_WORKERS, timeout=PROJECT_TIMEOUT,
+                grace=STOP_GRACE_PERIOD, on_event=None):
+    """Run ``action`` on every selected project; returns the projects that succeeded, failed and timed out.
+
+    Requested project names that match no container are reported as failed.
+    """
+    if action not in ACTIONS:
+        raise ValueError(f"Unknown action: {action} (expected one of {', '.join(ACTIONS)})")
+    if not projects and not labels:
+        raise ValueError("Select projects by name or label")
+    if client is None:
+        import docker
+        client = docker.from_env()
+    client = profiling.instrument_client(client)
+    on_event = on_event or (lambda event: None)
+
+    selected = select_projects(client, projects, labels)
+    results = {"succeeded": [], "failed": [], "timed_out": []}
+    for project in projects:
+        if project not in selected:
+            results["failed"].append({"project": project, "error": "No containers found"})
+            on_event({"type": "error", "project": project, "action": action, "error": "No containers found"})
+    on_event({"type": "progress", "stage": action, "total": len(selected)})
+
+    tasks = [
+        (project, lambda project=project, containers=containers: _run_project(
+            project, containers, action, grace, on_event))
+        for project, containers in selected.items()
+    ]
+    for project, outcome, value in run_bounded(tasks, max(1, jobs), timeout):
+        if outcome == "ok":
+            results["succeeded"].append(dict(value, project=project))
+            on_event(dict(value, type="result", project=project, action=action))
+        elif outcome == "error":
+            results["failed"].append({"project": project, "error": str(value)})
+            on_event({"type": "error", "project": project, "action": action, "error": str(value)})
+        else:
+            results["timed_out"].append({"project": project, "timeout": timeout})
+            on_event({"type": "error", "project": project, "action": action, "error": f"Timed out after {timeout}s"})
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Start, stop or restart many Frappe projects at once")
+    parser.add_argument("action", choices=ACTIONS)
+    parser.add_argument("projects", nargs="*", help="Docker Compose project names")
+    parser.add_argument("-l", "--label", action="append", default=[], metavar="KEY[=VALUE]",
+                        help="Select projects whose containers carry this label (repeatable)")
+    parser.add_argument("-j", "--jobs", type=int, default=MAX_WORKERS,
+                        help=f"Projects handled in parallel (default: {MAX_WORKERS})")
+    parser.add_argument("--timeout", type=float, default=PROJECT_TIMEOUT,
+                        help=f"Seconds allowed per project (default: {PROJECT_TIMEOUT}, 0 disables)")
+    parser.add_argument("--grace", type=int, default=STOP_GRACE_PERIOD,
+                        help=f"Seconds containers get to stop before being killed (default: {STOP_GRACE_PERIOD})")
+    profiling.add_argument(parser)
+    add_stream_argument(parser)
+    args = parser.parse_args()
+    profiling.enable_from_args(args)
+
+    if not args.projects and not args.label:
+        parser.error("name at least one project or pass --label")
+
+    run = lambda on_event: bulk_action(args.action, args.projects, args.label, jobs=args.jobs,
+                                       timeout=args.timeout or None, grace=args.grace, on_event=on_event)
+    if not args.stream:
+        results = run(lambda event: print(json.dumps(event), flush=True))
+        print(json.dumps(results))
+        sys.exit(1 if results["failed"] or results["timed_out"] else 0)
+
+    run_streamed(run, lambda results, writer: ("error" if results["failed"] or results["timed_out"] else "ok",
+                                               {key: len(value) for key, value in results.items()}))
+
+if __name__ == "__main__":
+    main()
@@ -1,40 +1,115 @@
-import docker
 import json
+import sys
 
-def list_docker_compose_projects(service_name="frappe"):
-    client = docker.from_env()
-    projects = {}
+import profiling
+from event_stream import pop_flag as pop_stream_flag, run_streamed
 
-    try:
-        containers = client.containers.list(all=True)
+# The Docker Compose labels every module identifies projects and their services by.
+PROJECT_LABEL = "com.docker.compose.project"
+SERVICE_LABEL = "com.docker.compose.service"
+
+def get_host_ports(attrs):
+    """Host ports published by a container, falling back to its configured bindings when stopped."""
+    ports = attrs['NetworkSettings']['Ports']
+    if not ports:
+        ports = attrs['HostConfig']['PortBindings']
+
+    host_ports = []
+    for container_port, bindings in (ports or {}).items():
+        if bindings:
+            for binding in bindings:
+                if binding['HostPort'] not in host_ports:
+                    host_ports.append(binding['HostPort'])
+    return host_ports
+
+def get_summary_host_ports(summary):
+    """Host ports from a container list summary (only published while the container runs)."""
+    host_ports = []
+    for port in summary.get('Ports') or []:
+        public_port = port.get('PublicPort')
+        if public_port and str(public_port) not in host_ports:
+            host_ports.append(str(public_port))
+    return host_ports
+
+def project_status(statuses):
+    """A single status for a project: the shared status, or "partial" if its containers disagree."""
+    statuses = set(statuses)
+    if len(statuses) == 1:
+        return statuses.pop()
+    return "partial" if statuses else "removed"
+
+def list_service_containers(client, service_name="frappe"):
+    """Compact records for every compose container of one service.
 
-        for container in containers:
-            labels = container.labels
-            project_name = labels.get('com.docker.compose.project', None)
-            service = labels.get('com.docker.compose.service', None)
+    The label filter runs in the daemon and only list summaries are read, so
+    unrelated containers never reach us and no full inspect is needed except
+    for stopped containers, which publish no ports; their configured bindings
+    are reported instead.
+    """
+    records = []
+    for summary in client.api.containers(all=True, filters={"label": f"{SERVICE_LABEL}={service_name}"}):
+        project_name = (summary.get('Labels') or {}).get(PROJECT_LABEL)
+        if not project_name:
+            continue
 
-            if service == service_name and project_name:
-                if project_name not in projects:
-                    projects[project_name] = {"ports": [], "status": container.status}
+        ports = get_summary_host_ports(summary)
+        if not ports and summary.get('State') != 'running':
+            ports = get_host_ports(client.api.inspect_container(summary['Id']))
 
-                ports = container.attrs['NetworkSettings']['Ports']
-                if not ports:
-                    ports = container.attrs['HostConfig']['PortBindings']
+        records.append({
+            "id": summary['Id'],
+            "name": (summary.get('Names') or [''])[0].lstrip('/'),
+            "project": project_name,
+            "status": summary.get('State'),
+            "ports": ports,
+        })
+    return records
 
-                for container_port, bindings in ports.items():
-                    if bindings:
-                        for binding in bindings:
-                            host_port = binding['HostPort']
-                            if host_port not in projects[project_name]["ports"]:
-                                projects[project_name]["ports"].append(host_port)
+@profiling.timed("list_instances.list_docker_compose_projects")
+def list_docker_compose_projects(service_name="frappe", client=None):
+    # Imported here so the pure helpers above don't need the Docker SDK.
+    import docker
+    client = profiling.instrument_client(client or docker.from_env())
+    projects = {}
+
+    try:
+        for container in list_service_containers(client, service_name):
+            project = projects.setdefault(container["project"], {"ports": [], "containers": []})
+            project["ports"].extend(port for port in container["ports"] if port not in project["ports"])
+            project["containers"].append({
+                "id": container["id"][:12],
+                "name": container["name"],
+                "status": container["status"],
+            })
 
     except docker.errors.DockerException as e:
         print(f"Error interacting with Docker: {e}")
 
-    return [{"projectName": name, "ports": data["ports"], "status": data["status"]} for name, data in projects.items()]
+    return [
+        {
+            "projectName": name,
+            "ports": data["ports"],
+            "status": project_status(c["status"] for c in data["containers"]),
+            "containers": data["containers"],
+        }
+        for name, data in projects.items()
+    ]
 
-if __name__ == "__main__":
+def main():
+    profiling.enable_from_argv(sys.argv)
     service_name = "frappe"
-    projects = list_docker_compose_projects(service_name=service_name)
-    print(json.dumps(projects))
+    if not pop_stream_flag(sys.argv):
+        projects = list_docker_compose_projects(service_name=service_name)
+        print(json.dumps(projects))
+        return
 
+    # The listing is a single Docker call, so the projects are all known at once; each gets its own result line.
+    def summarize(projects, writer):
+        for project in projects:
+            writer.emit(dict(project, type="result"))
+        return "ok", {"projects": len(projects)}
+
+    run_streamed(lambda writer: list_docker_compose_projects(service_name=service_name), summarize)
+
+if __name__ == "__main__":
+    main()
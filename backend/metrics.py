@@ -0,0 +1,308 @@
+# metrics.py
+"""CPU, memory, network and block I/O history for Frappe project containers.
+
+A MetricsSampler asks Docker for a one-shot stats reading of every running
+container in a Frappe project (a compose project with a frappe service) every
+``interval`` seconds, with up to ``jobs`` readings in flight since each one
+takes the daemon about a second. Readings go into a RingBuffer per container:
+one preallocated array of doubles holding the last ``capacity`` samples, so
+history costs ``capacity * 8 * 8`` bytes per container however long the sampler
+runs. Containers that stop or disappear are dropped at the next round.
+
+From the history, ``containers()`` and ``projects()`` report the latest CPU and
+memory, the mean CPU and the network and disk throughput over a window of
+samples, and ``top()`` ranks either by any of those figures.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from array import array
+
+import profiling
+from event_stream import add_argument as add_stream_argument, run_streamed
+from list_instances import PROJECT_LABEL, SERVICE_LABEL
+from workers import MAX_WORKERS, run_bounded
+
+# One sample, in array order. The network and block I/O figures are the
+# cumulative counters Docker reports; throughput is derived from them.
+FIELDS = ("ts", "cpu_percent", "memory_bytes", "memory_limit",
+          "net_rx_bytes", "net_tx_bytes", "block_read_bytes", "block_write_bytes")
+WIDTH = len(FIELDS)
+DEFAULT_CAPACITY = 360
+DEFAULT_INTERVAL = 10
+STATS_TIMEOUT = 10
+SORT_KEYS = ("cpu_percent", "cpu_avg", "memory_bytes", "memory_percent", "net_rx_rate", "net_tx_rate",
+             "block_read_rate", "block_write_rate")
+
+def parse_stats(stats, now=None):
+    """One sample tuple (in FIELDS order) from a ``stats(stream=False)`` payload.
+
+    CPU is computed the way ``docker stats`` does it, from the reading and the
+    one the daemon took just before; memory excludes the page cache.
+    """
+    cpu, precpu = stats.get("cpu_stats") or {}, stats.get("precpu_stats") or {}
+    cpu_delta = cpu.get("cpu_usage", {}).get("total_usage", 0) - precpu.get("cpu_usage", {}).get("total_usage", 0)
+    system_delta = cpu.get("system_cpu_usage", 0) - precpu.get("system_cpu_usage", 0)
+    online_cpus = cpu.get("online_cpus") or len(cpu.get("cpu_usage", {}).get("percpu_usage") or []) or 1
+    cpu_percent = cpu_delta / system_delta * online_cpus * 100 if cpu_delta > 0 and system_delta > 0 else 0.0
+
+    memory = stats.get("memory_stats") or {}
+    # cgroup v2 reports inactive_file, v1 reports cache.
+    page_cache = (memory.get("stats") or {}).get("inactive_file", (memory.get("stats") or {}).get("cache", 0))
+    memory_bytes = max(memory.get("usage", 0) - page_cache, 0)
+
+    networks = (stats.get("networks") or {}).values()
+    rx = sum(n.get("rx_bytes", 0) for n in networks)
+    tx = sum(n.get("tx_bytes", 0) for n in networks)
+
+    read = write = 0
+    for entry in (stats.get("blkio_stats") or {}).get("io_service_bytes_recursive") or []:
+        op = entry.get("op", "").lower()
+        if op == "read":
+            read += entry.get("value", 0)
+        elif op == "write":
+            write += entry.get("value", 0)
+
+    return (now if now is not None else time.time(), cpu_percent, memory_bytes, memory.get("limit", 0),
+            rx, tx, read, write)
+
+
+class RingBuffer:
+    """The last ``capacity`` samples in one fixed array, overwriting the oldest."""
+
+    __slots__ = ("capacity", "_data", "_next", "_size")
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self._data = array("d", bytes(8 * WIDTH * capacity))
+        self._next = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, sample):
+        start = self._next * WIDTH
+        self._data[start:start + WIDTH] = array("d", sample)
+        self._next = (self._next + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def samples(self, window=None):
+        """The newest ``window`` samples (all by default) as tuples, oldest first."""
+        count = self._size if window is None else max(0, min(window, self._size))
+        first = (self._next - count) % self.capacity
+        rows = []
+        for i in range(count):
+            start = (first + i) % self.capacity * WIDTH
+            rows.append(tuple(self._data[start:start + WIDTH]))
+        return rows
+
+    def latest(self):
+        return self.samples(1)[0] if self._size else None
+
+
+def _rate(first, last, index):
+    # Counters restart with the container; a drop means no usable rate.
+    elapsed = last[0] - first[0]
+    delta = last[index] - first[index]
+    return round(delta / elapsed, 1) if elapsed > 0 and delta >= 0 else 0.0
+
+def summarize(samples):
+    """Latest usage plus mean CPU and throughput (bytes/s) across ``samples``."""
+    first, last = samples[0], samples[-1]
+    return {
+        "cpu_percent": round(last[1], 2),
+        "cpu_avg": round(sum(s[1] for s in samples) / len(samples), 2),
+        "memory_bytes": int(last[2]),
+        "memory_limit": int(last[3]),
+        "memory_percent": round(last[2] / last[3] * 100, 2) if last[3] else 0.0,
+        "net_rx_rate": _rate(first, last, 4),
+        "net_tx_rate": _rate(first, last, 5),
+        "block_read_rate": _rate(first, last, 6),
+        "block_write_rate": _rate(first, last, 7),
+        "samples": len(samples),
+    }
+
+
+class MetricsSampler:
+    """Samples Frappe project containers into per-container ring buffers.
+
+    Call ``sample()`` for one round, or ``start()`` to sample every
+    ``interval`` seconds on a daemon thread until ``stop()``.
+    """
+
+    def __init__(self, client=None, capacity=DEFAULT_CAPACITY, interval=DEFAULT_INTERVAL, jobs=MAX_WORKERS,
+                 timeout=STATS_TIMEOUT, clock=time.time):
+        self._client = client
+        self.capacity = capacity
+        self.interval = interval
+        self.jobs = jobs
+        self.timeout = timeout
+        self.clock = clock
+        # container name -> (project, service, RingBuffer)
+        self._series = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import docker
+            self._client = docker.from_env()
+        return profiling.instrument_client(self._client)
+
+    def _targets(self, client):
+        """``(id, name, project, service)`` for running containers of projects with a frappe service."""
+        summaries = client.api.containers(filters={"label": PROJECT_LABEL, "status": "running"})
+        frappe_projects = {s["Labels"][PROJECT_LABEL] for s in summaries
+                           if (s.get("Labels") or {}).get(SERVICE_LABEL) == "frappe"}
+        return [(s["Id"], (s.get("Names") or [""])[0].lstrip("/"), s["Labels"][PROJECT_LABEL],
+                 s["Labels"].get(SERVICE_LABEL))
+                for s in summaries if s["Labels"][PROJECT_LABEL] in frappe_projects]
+
+    @profiling.timed("metrics.sample")
+    def sample(self, on_event=None):
+        """Take one reading of every target container; returns how many were recorded."""
+        client = self.client
+        targets = {name: (container_id, project, service)
+                   for container_id, name, project, service in self._targets(client)}
+        tasks = [(name, lambda container_id=container_id: client.api.stats(container_id, stream=False))
+                 for name, (container_id, _, _) in targets.items()]
+
+        readings = {}
+        for name, outcome, value in run_bounded(tasks, max(1, self.jobs), self.timeout):
+            if outcome == "ok":
+                readings[name] = parse_stats(value, self.clock())
+            elif on_event:
+                error = str(value) if outcome == "error" else f"Timed out after {self.timeout}s"
+                on_event({"type": "error", "container": name, "error": error})
+
+        with self._lock:
+            for name in list(self._series):
+                if name not in targets:
+                    del self._series[name]
+            for name, reading in readings.items():
+                _, project, service = targets[name]
+                if name not in self._series:
+                    self._series[name] = (project, service, RingBuffer(self.capacity))
+                self._series[name][2].append(reading)
+        if on_event:
+            on_event({"type": "progress", "stage": "sampled", "containers": len(readings)})
+        return len(readings)
+
+    def start(self, on_event=None):
+        """Sample now and then every ``interval`` seconds on a background thread."""
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+
+        def run():
+            while not self._stopping.is_set():
+                started = time.monotonic()
+                try:
+                    self.sample(on_event)
+                except Exception as e:
+                    if on_event:
+                        on_event({"type": "error", "error": str(e)})
+                self._stopping.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+        self._thread = threading.Thread(target=run, name="metrics-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.timeout + 1)
+            self._thread = None
+
+    def history(self, container_name, window=None):
+        """The recorded samples of one container as dicts, oldest first."""
+        with self._lock:
+            series = self._series.get(container_name)
+            samples = series[2].samples(window) if series else []
+        return [dict(zip(FIELDS, sample)) for sample in samples]
+
+    def containers(self, project_name=None, window=None):
+        """A summary per container, optionally for one project."""
+        with self._lock:
+            series = [(name, project, service, buffer.samples(window))
+                      for name, (project, service, buffer) in self._series.items()
+                      if project_name is None or project == project_name]
+        return [dict(summarize(samples), container=name, project=project, service=service)
+                for name, project, service, samples in series if samples]
+
+    def projects(self, window=None):
+        """Container summaries added up per project (CPU percentages add up across containers)."""
+        summed = [key for key in SORT_KEYS if key != "memory_percent"] + ["memory_limit"]
+        projects = {}
+        for row in self.containers(window=window):
+            if row["project"] not in projects:
+                projects[row["project"]] = dict(dict.fromkeys(summed, 0), project=row["project"], containers=0)
+            total = projects[row["project"]]
+            total["containers"] += 1
+            for key in summed:
+                total[key] += row[key]
+        for total in projects.values():
+            total["cpu_percent"] = round(total["cpu_percent"], 2)
+            total["cpu_avg"] = round(total["cpu_avg"], 2)
+            total["memory_percent"] = (round(total["memory_bytes"] / total["memory_limit"] * 100, 2)
+                                       if total["memory_limit"] else 0.0)
+        return list(projects.values())
+
+    def top(self, n=5, sort_by="cpu_percent", by="container", window=None):
+        """The ``n`` heaviest containers (or projects, with ``by="project"``) by ``sort_by``."""
+        if sort_by not in SORT_KEYS:
+            raise ValueError(f"Unknown sort key: {sort_by} (expected one of {', '.join(SORT_KEYS)})")
+        rows = self.projects(window) if by == "project" else self.containers(window=window)
+        return sorted(rows, key=lambda row: -row[sort_by])[:n]
+
+def main():
+    parser = argparse.ArgumentParser(description="Sample CPU, memory, network and disk use of Frappe containers")
+    parser.add_argument("--samples", type=int, default=3, help="Rounds to take before reporting (default: 3)")
+    parser.add_argument("--interval", type=float, default=2.0, help="Seconds between rounds (default: 2)")
+    parser.add_argument("-j", "--jobs", type=int, default=MAX_WORKERS,
+                        help=f"Stats readings in flight at once (default: {MAX_WORKERS})")
+    parser.add_argument("--project", help="Only report this project's containers")
+    parser.add_argument("--by", choices=("container", "project"), default="project")
+    parser.add_argument("--sort-by", choices=SORT_KEYS, default="cpu_percent")
+    parser.add_argument("--top", type=int, help="Only report the N heaviest")
+    profiling.add_argument(parser)
+    add_stream_argument(parser)
+    args = parser.parse_args()
+    profiling.enable_from_args(args)
+
+    sampler = MetricsSampler(capacity=max(args.samples, 1), jobs=args.jobs)
+
+    def sample(on_event=None):
+        for round_number in range(args.samples):
+            if round_number:
+                time.sleep(args.interval)
+            sampler.sample(on_event=on_event)
+        if args.project:
+            rows = sorted(sampler.containers(args.project), key=lambda row: -row[args.sort_by])
+        else:
+            rows = sampler.top(len(sampler.containers()), args.sort_by, args.by)
+        return rows[:args.top] if args.top else rows
+
+    if args.stream:
+        def summarize(rows, writer):
+            for row in rows:
+                writer.emit(dict(row, type="result"))
+            return "ok", {"containers": len(sampler.containers())}
+
+        run_streamed(sample, summarize)
+        return
+    try:
+        rows = sample()
+    except Exception as e:
+        print(json.dumps({"status": "error", "message": str(e)}))
+        sys.exit(1)
+    print(json.dumps(rows, indent=2))
+
+if __name__ == "__main__":
+    main()
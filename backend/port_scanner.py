@@ -1,21 +1,122 @@
 # port_scanner.py
+"""Pick host ports for new Frappe instances.
+
+A port counts as free only if it can be bound right now, no Docker container
+publishes it or has it configured (a stopped project still owns its
+bindings), and the database has no live reservation or recorded container
+state for it. Reservations are written in the same BEGIN IMMEDIATE
+transaction that chooses them, so concurrent create_instance calls, even from
+separate processes, never receive the same port.
+"""
+import argparse
+import json
 import socket
 import sys
+import time
+
+from db_operations import (
+    expire_port_reservations, get_port_reservations, get_used_ports, set_port_reservations, write_transaction,
+)
+from list_instances import PROJECT_LABEL
+
+MAX_PORT = 65535
+SERVICES = ("web", "socketio", "mariadb")
+# Seconds an unconfirmed reservation is held; long enough for an image pull.
+RESERVATION_TTL = 15 * 60
+
+def is_port_free(port, host=""):
+    """Whether ``port`` can be bound on ``host`` (all interfaces by default) and on loopback."""
+    # No SO_REUSEADDR: on macOS and the BSDs it lets the bind succeed next to
+    # a listening socket. A port with connections in TIME_WAIT reads as taken,
+    # which only costs the next port. A listener on loopback alone doesn't
+    # always block a wildcard bind, so loopback is bound separately.
+    for address in dict.fromkeys((host, "127.0.0.1")):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            try:
+                sock.bind((address, port))
+            except OSError:
+                return False
+    return True
+
+def docker_host_ports(client):
+    """Host ports published by any container, plus those configured on stopped compose containers."""
+    from list_instances import get_host_ports, get_summary_host_ports
+
+    ports = set()
+    for summary in client.api.containers(all=True):
+        host_ports = get_summary_host_ports(summary)
+        labels = summary.get('Labels') or {}
+        if not host_ports and summary.get('State') != 'running' and PROJECT_LABEL in labels:
+            host_ports = get_host_ports(client.api.inspect_container(summary['Id']))
+        ports.update(int(port) for port in host_ports if port)
+    return ports
+
+def _find_block(start_port, count, taken):
+    """First run of ``count`` consecutive free ports at or above ``start_port``."""
+    port = start_port
+    while port + count - 1 <= MAX_PORT:
+        for offset in range(count):
+            candidate = port + offset
+            if candidate in taken or not is_port_free(candidate):
+                port = candidate + 1
+                break
+        else:
+            return list(range(port, port + count))
+    return None
+
+def find_available_port(start_port, client=None, conn=None):
+    """Find the first available port starting from the given port, without reserving it."""
+    taken = docker_host_ports(client) if client is not None else set()
+    taken |= get_used_ports(conn=conn)
+    block = _find_block(int(start_port), 1, taken)
+    return block[0] if block else None
 
-def find_available_port(start_port):
-    """Find the first available port starting from the given port."""
-    port = int(start_port)
-    while port < 65535:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        result = sock.connect_ex(('localhost', port))
-        if result != 0:
+def reserve_ports(project_name, services=SERVICES, start_port=8000, client=None, conn=None, ttl=RESERVATION_TTL):
+    """Reserve consecutive ports for ``services`` and return ``{service: port}``.
+
+    A project that already holds ports for every requested service gets the
+    same ones back. Reservations lapse after ``ttl`` seconds unless
+    confirm_port_reservations() is called once the instance exists.
+    """
+    services = list(services)
+    taken = docker_host_ports(client) if client is not None else set()
+    with write_transaction(conn) as conn:
+        now = time.time()
+        expire_port_reservations(conn, now)
+        existing = get_port_reservations(project_name, conn=conn)
+        if existing and all(service in existing for service in services):
+            return {service: existing[service] for service in services}
+
+        # The project's own (partial) reservation is replaced, so its ports are fair game.
+        taken |= get_used_ports(now, conn=conn) - set(existing.values())
+        block = _find_block(int(start_port), len(services), taken)
+        if block is None:
+            raise Exception(f"No {len(services)} consecutive free ports at or above {start_port}")
+        ports = dict(zip(services, block))
+        set_port_reservations(conn, project_name, ports, now, now + ttl)
+    return ports
+
+def main():
+    parser = argparse.ArgumentParser(description="Find or reserve free host ports")
+    parser.add_argument("start_port", type=int, help="First port to consider")
+    parser.add_argument("--reserve", metavar="PROJECT", help="Reserve the ports for this project")
+    parser.add_argument("--services", nargs="+", default=list(SERVICES),
+                        help=f"Services to reserve ports for (default: {' '.join(SERVICES)})")
+    args = parser.parse_args()
+
+    try:
+        import docker
+        client = docker.from_env()
+    except Exception as e:
+        print(f"Docker unavailable, checking local ports only: {e}", file=sys.stderr)
+        client = None
+
+    if args.reserve:
+        print(json.dumps(reserve_ports(args.reserve, args.services, args.start_port, client=client)))
+    else:
+        port = find_available_port(args.start_port, client=client)
+        if port is not None:
             print(port)
-            return
-        port += 1
-        
+
 if __name__ == "__main__":
-    if len(sys.argv) == 2:
-        start_port = sys.argv[1]
-        find_available_port(start_port)
-    else:
-        print("Usage: python port_scanner.py <start_port>")
\ No newline at end of file
+    main()
@@ -0,0 +1,309 @@
+# profiling.py
+"""Opt-in timing of Docker API calls, execs and SQLite statements.
+
+Set CW_PROFILE=table (or 1) to print a summary with p50/p95 per span name to
+stderr when the process exits, or CW_PROFILE=json for one JSON line per span
+followed by the summary. Scripts also accept ``--profile[=json]``, and
+CW_PROFILE_FILE sends the report to a file instead of stderr.
+
+Span names say where the time went:
+
+    docker.containers.list     a Docker API call (docker.api.* for the low-level client)
+    docker.container.exec_run[find]    an exec, by program
+    sqlite.SELECT              a statement, by verb
+    update_db.collect_project  a block of backend code (includes its children)
+
+While disabled, span() returns a shared no-op context manager and clients and
+connections are not wrapped at all, so the cost is a global lookup per call
+site.
+"""
+import atexit
+import functools
+import json
+import math
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import defaultdict
+
+ENV_VAR = "CW_PROFILE"
+FILE_ENV_VAR = "CW_PROFILE_FILE"
+MODES = ("table", "json")
+
+# Client attributes whose methods are Docker API calls.
+DOCKER_COLLECTIONS = {"api", "containers", "images", "volumes", "networks"}
+
+_mode = None
+_output = None
+_registered = False
+
+
+def _percentile(values, fraction):
+    # Nearest rank on sorted values.
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+class Recorder:
+    """Collected spans ``(name, seconds, tags)`` and counters, safe to share across threads."""
+
+    def __init__(self):
+        self.spans = []
+        self.counters = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, tags=None):
+        with self._lock:
+            self.spans.append((name, seconds, tags or {}))
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def clear(self):
+        with self._lock:
+            self.spans = []
+            self.counters = defaultdict(int)
+
+    def summary(self):
+        """Per span name: count, total, p50, p95 and max in milliseconds, slowest total first."""
+        with self._lock:
+            durations = defaultdict(list)
+            for name, seconds, _ in self.spans:
+                durations[name].append(seconds * 1000)
+        rows = {}
+        for name, values in sorted(durations.items(), key=lambda item: -sum(item[1])):
+            values.sort()
+            rows[name] = {
+                "count": len(values),
+                "total_ms": round(sum(values), 3),
+                "p50_ms": round(_percentile(values, 0.50), 3),
+                "p95_ms": round(_percentile(values, 0.95), 3),
+                "max_ms": round(values[-1], 3),
+            }
+        return rows
+
+    def format_table(self):
+        summary = self.summary()
+        width = max([len("span")] + [len(name) for name in summary])
+        lines = [f"{'span':<{width}}  {'count':>7}  {'total ms':>10}  {'p50 ms':>9}  {'p95 ms':>9}  {'max ms':>9}"]
+        for name, row in summary.items():
+            lines.append(f"{name:<{width}}  {row['count']:>7}  {row['total_ms']:>10.2f}  {row['p50_ms']:>9.3f}  "
+                         f"{row['p95_ms']:>9.3f}  {row['max_ms']:>9.3f}")
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"{name:<{width}}  {value:>7}")
+        return "\n".join(lines) + "\n"
+
+    def json_lines(self):
+        with self._lock:
+            spans = list(self.spans)
+            counters = dict(self.counters)
+        lines = [json.dumps({"type": "span", "name": name, "ms": round(seconds * 1000, 3), "tags": tags})
+                 for name, seconds, tags in spans]
+        lines.append(json.dumps({"type": "summary", "spans": self.summary(), "counters": counters}))
+        return "\n".join(lines) + "\n"
+
+
+recorder = Recorder()
+
+
+class _Span:
+    __slots__ = ("name", "tags", "started")
+
+    def __init__(self, name, tags):
+        self.name = name
+        self.tags = tags
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.tags["error"] = exc_type.__name__
+        recorder.record(self.name, time.perf_counter() - self.started, self.tags)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def enabled():
+    return _mode is not None
+
+def enable(mode="table", output=None):
+    """Start recording; the report is written in ``mode`` to ``output`` (a path, default stderr) at exit."""
+    global _mode, _output, _registered
+    if mode not in MODES:
+        raise ValueError(f"Unknown profile mode: {mode}")
+    _mode = mode
+    _output = output
+    if not _registered:
+        atexit.register(_report_at_exit)
+        _registered = True
+
+def disable():
+    global _mode
+    _mode = None
+
+def span(name, **tags):
+    """Time the enclosed block as ``name`` when profiling is enabled."""
+    return _Span(name, tags) if _mode is not None else _NULL_SPAN
+
+def timed(name):
+    """Decorator form of span(); whether to record is decided on each call."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _mode is None:
+                return func(*args, **kwargs)
+            with _Span(name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def count(name, n=1):
+    if _mode is not None:
+        recorder.count(name, n)
+
+def report(mode=None):
+    """The recorded spans as a summary table or JSON lines."""
+    return recorder.json_lines() if (mode or _mode) == "json" else recorder.format_table()
+
+def _report_at_exit():
+    if _mode is None or not recorder.spans:
+        return
+    text = report()
+    if _output:
+        with open(_output, "a") as f:
+            f.write(text)
+    else:
+        sys.stderr.write(text)
+
+
+def _program(args, kwargs):
+    cmd = args[0] if args else kwargs.get("cmd", "")
+    if isinstance(cmd, str):
+        cmd = cmd.split()
+    return os.path.basename(cmd[0]) if cmd else ""
+
+def _wrap_result(result):
+    # Containers handed out by list()/get()/run() are wrapped so their execs are timed too.
+    if hasattr(result, "exec_run") and not isinstance(result, _DockerProxy):
+        return _DockerProxy(result, "docker.container")
+    if isinstance(result, list) and result and hasattr(result[0], "exec_run"):
+        return [_DockerProxy(item, "docker.container") for item in result]
+    return result
+
+
+class _DockerProxy:
+    """Times every method called on a Docker client, its collections and its containers.
+
+    Calls returning a stream (pulls, events, archives) are timed until the
+    stream is returned, not until it is consumed.
+    """
+
+    def __init__(self, target, prefix):
+        object.__setattr__(self, "_target", target)
+        object.__setattr__(self, "_prefix", prefix)
+
+    def __getattr__(self, attr):
+        value = getattr(self._target, attr)
+        if self._prefix == "docker" and attr in DOCKER_COLLECTIONS:
+            return _DockerProxy(value, f"docker.{attr}")
+        if not callable(value):
+            return value
+        name = f"{self._prefix}.{attr}"
+
+        def call(*args, **kwargs):
+            label = f"{name}[{_program(args, kwargs)}]" if attr == "exec_run" else name
+            with span(label):
+                return _wrap_result(value(*args, **kwargs))
+        return call
+
+    def __setattr__(self, attr, value):
+        setattr(self._target, attr, value)
+
+    def __eq__(self, other):
+        return self._target == (other._target if isinstance(other, _DockerProxy) else other)
+
+    def __hash__(self):
+        return hash(self._target)
+
+    def __repr__(self):
+        return f"<profiled {self._target!r}>"
+
+def instrument_client(client):
+    """``client`` wrapped so its calls are recorded, or unchanged while profiling is disabled."""
+    if _mode is None or isinstance(client, _DockerProxy):
+        return client
+    return _DockerProxy(client, "docker")
+
+
+def _verb(sql):
+    words = sql.split(None, 1)
+    return words[0].upper() if words else ""
+
+class ProfiledCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        with span(f"sqlite.{_verb(sql)}"):
+            return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        with span(f"sqlite.{_verb(sql)}", many=True):
+            return super().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        with span("sqlite.script"):
+            return super().executescript(sql_script)
+
+class ProfiledConnection(sqlite3.Connection):
+    """A connection whose statements (through it or its cursors) are recorded as spans."""
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+def connection_factory():
+    """The ``factory`` for sqlite3.connect(): ProfiledConnection only while profiling."""
+    return ProfiledConnection if _mode is not None else sqlite3.Connection
+
+
+def add_argument(parser):
+    parser.add_argument("--profile", nargs="?", const="table", choices=MODES,
+                        help=f"Report Docker, exec and SQLite timings on stderr at exit (or set {ENV_VAR})")
+
+def enable_from_args(args):
+    if getattr(args, "profile", None):
+        enable(args.profile, os.environ.get(FILE_ENV_VAR))
+
+def enable_from_argv(argv):
+    """For scripts without argparse: handle and remove ``--profile[=MODE]`` from ``argv``."""
+    for arg in list(argv[1:]):
+        if arg == "--profile" or arg.startswith("--profile="):
+            argv.remove(arg)
+            enable(arg.partition("=")[2] or "table", os.environ.get(FILE_ENV_VAR))
+
+
+_env_mode = os.environ.get(ENV_VAR, "").strip().lower()
+if _env_mode and _env_mode not in ("0", "false", "off"):
+    enable(_env_mode if _env_mode in MODES else "table", os.environ.get(FILE_ENV_VAR))
@@ -0,0 +1,314 @@
+# provisioning.py
+"""Get images and containers ready before a create request arrives.
+
+Images are pulled ahead of time with per-layer progress events and each tag is
+pinned to the digest that was pulled, so instances are always created from a
+known image rather than whatever ``:latest`` points at today.
+
+A WarmPool keeps a few containers created (but stopped) from the pinned image,
+with host ports already reserved. Claiming one writes the instance settings
+into it, renames it and starts it, which takes a fraction of a full create.
+Docker cannot change a container's environment or port bindings after
+creation, so members are created with an entrypoint that exports
+POOL_ENV_FILE before running the image's own, and a claim writes the same
+environment a cold create would pass (instance_environment) to that file. The
+instance keeps the ports reserved when the pool was filled. A claim that fails
+partway removes the member and releases its ports, or if that fails too, gives
+the member back its pool name and ports.
+"""
+import argparse
+import io
+import json
+import shlex
+import sys
+import tarfile
+import threading
+import time
+import uuid
+
+from db_operations import (
+    confirm_port_reservations, get_image_pin, get_port_reservations, pin_image, release_port_reservations,
+    rename_port_reservations,
+)
+from port_scanner import reserve_ports
+
+DEFAULT_IMAGE = "frappe/frappe-docker:latest"
+# Service -> container port published for it.
+CONTAINER_PORTS = {
+    'web': '80/tcp',
+}
+
+POOL_LABEL = "caffeinated-whale.pool"
+POOL_REFERENCE_LABEL = "caffeinated-whale.pool.reference"
+POOL_CREATED_LABEL = "caffeinated-whale.pool.created"
+POOL_NAME_PREFIX = "cw-pool-"
+POOL_ENV_FILE = "/etc/frappe-instance.env"
+# Prefixed to a member's entrypoint: exports POOL_ENV_FILE, once claimed, and runs the image's command.
+ENV_LOADER = ["sh", "-c", f'if [ -f {POOL_ENV_FILE} ]; then set -a; . {POOL_ENV_FILE}; set +a; fi; exec "$@"', "sh"]
+POOL_SIZE = 1
+# Seconds before an unused pool container is replaced.
+POOL_MAX_AGE = 24 * 60 * 60
+# Minimum seconds between byte-count updates for one layer.
+PROGRESS_INTERVAL = 0.25
+
+def _docker_client(client):
+    # The SDK is imported on first use rather than with this module.
+    if client is not None:
+        return client
+    import docker
+    return docker.from_env()
+
+def split_image(image):
+    """``"repo:tag"`` -> ``("repo", "tag")``; a registry port is not mistaken for a tag."""
+    repository, _, tag = image.rpartition(":")
+    if not repository or "/" in tag:
+        return image, "latest"
+    return repository, tag
+
+def image_reference(client, image):
+    """The ``repo@sha256:...`` digest of a local image, or its image ID if it was never pushed."""
+    attrs = client.images.get(image).attrs
+    repository = split_image(image)[0]
+    digests = attrs.get("RepoDigests") or []
+    for digest in digests:
+        if digest.split("@")[0] == repository:
+            return digest
+    return digests[0] if digests else attrs["Id"]
+
+def pull_image(image=DEFAULT_IMAGE, client=None, conn=None, on_event=None):
+    """Pull ``image``, reporting layer progress, then pin the tag to the digest pulled."""
+    client = _docker_client(client)
+    on_event = on_event or (lambda event: None)
+    repository, tag = split_image(image)
+    last_sent = {}
+
+    for message in client.api.pull(repository, tag=tag, stream=True, decode=True):
+        if "error" in message:
+            raise Exception(f"Pulling {image} failed: {message['error']}")
+        layer = message.get("id")
+        detail = message.get("progressDetail") or {}
+        status = message.get("status", "")
+        now = time.monotonic()
+        # Byte counts arrive many times a second per layer; status changes always go through.
+        previous_status, sent_at = last_sent.get(layer, (None, 0))
+        if status == previous_status and detail.get("current") is not None and now - sent_at < PROGRESS_INTERVAL:
+            continue
+        last_sent[layer] = (status, now)
+        on_event({
+            "type": "pull_progress",
+            "image": image,
+            "layer": layer,
+            "status": status,
+            "current": detail.get("current"),
+            "total": detail.get("total"),
+        })
+
+    reference = image_reference(client, image)
+    pin_image(image, reference, conn=conn)
+    on_event({"type": "pull_complete", "image": image, "reference": reference})
+    return reference
+
+def resolve_image(image=DEFAULT_IMAGE, client=None, conn=None, on_event=None):
+    """The pinned reference for ``image``, pulling it first if it isn't available locally."""
+    import docker
+    client = _docker_client(client)
+    reference = get_image_pin(image, conn=conn)
+    if reference:
+        try:
+            client.images.get(reference)
+            return reference
+        except docker.errors.ImageNotFound:
+            pass
+    return pull_image(image, client=client, conn=conn, on_event=on_event)
+
+def start_prepull(images=(DEFAULT_IMAGE,), client=None, on_event=None):
+    """Pull ``images`` on a background thread; failures are reported as pull_error events."""
+    client = _docker_client(client)
+    on_event = on_event or (lambda event: None)
+
+    def run():
+        for image in images:
+            try:
+                # A connection of its own: the caller's belongs to its thread.
+                pull_image(image, client=client, on_event=on_event)
+            except Exception as e:
+                on_event({"type": "pull_error", "image": image, "error": str(e)})
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+def instance_environment(config):
+    """The environment a new instance runs with, from a create request's ``config``."""
+    environment = {'SITE_NAME': config['siteName']}
+    if config.get('adminPassword'):
+        environment['ADMIN_PASSWORD'] = config['adminPassword']
+    return environment
+
+def _env_archive(settings):
+    # Sourced by ENV_LOADER's shell, so values are quoted.
+    content = "".join(f"{key}={shlex.quote(str(value))}\n" for key, value in settings.items()).encode()
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        info = tarfile.TarInfo(POOL_ENV_FILE.rsplit("/", 1)[1])
+        info.size = len(content)
+        info.mtime = int(time.time())
+        tar.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+class WarmPool:
+    """Stopped containers created ahead of time from the pinned image."""
+
+    def __init__(self, client=None, conn=None, image=DEFAULT_IMAGE, size=POOL_SIZE, max_age=POOL_MAX_AGE,
+                 start_port=8000):
+        self.client = _docker_client(client)
+        self.conn = conn
+        self.image = image
+        self.size = size
+        self.max_age = max_age
+        self.start_port = start_port
+        self._lock = threading.Lock()
+
+    def members(self):
+        """Unclaimed pool containers, oldest first."""
+        containers = self.client.containers.list(all=True, filters={"label": f"{POOL_LABEL}={self.image}"})
+        # Claimed containers keep their labels but not their pool name.
+        containers = [c for c in containers if c.name.startswith(POOL_NAME_PREFIX)]
+        return sorted(containers, key=lambda c: float(c.labels.get(POOL_CREATED_LABEL, 0)))
+
+    def evict(self, now=None):
+        """Remove members that are too old, built from an outdated image, or beyond the pool size."""
+        now = time.time() if now is None else now
+        reference = get_image_pin(self.image, conn=self.conn)
+        keep, evicted = [], []
+        for container in self.members():
+            created = float(container.labels.get(POOL_CREATED_LABEL, 0))
+            if now - created > self.max_age or container.labels.get(POOL_REFERENCE_LABEL) != reference:
+                evicted.append(container)
+            else:
+                keep.append(container)
+        # Over capacity (the size was lowered): drop the oldest.
+        evicted += keep[:max(0, len(keep) - self.size)]
+        for container in evicted:
+            container.remove(force=True)
+            release_port_reservations(container.name, conn=self.conn)
+        return [c.name for c in evicted]
+
+    def fill(self, on_event=None):
+        """Evict stale members and create new ones up to the pool size; returns the names created."""
+        with self._lock:
+            self.evict()
+            missing = self.size - len(self.members())
+            if missing <= 0:
+                return []
+            reference = resolve_image(self.image, client=self.client, conn=self.conn, on_event=on_event)
+            return [self._create(reference).name for _ in range(missing)]
+
+    def claim(self, project_name, environment):
+        """Turn the oldest member into ``project_name`` running with ``environment``.
+
+        Returns ``(container, ports)``, or None if the pool is empty. If any
+        step fails the claim is rolled back and the error raised.
+        """
+        with self._lock:
+            members = self.members()
+            if not members:
+                return None
+            container = members[0]
+            pool_name = container.name
+            steps = []
+            try:
+                container.put_archive(POOL_ENV_FILE.rsplit("/", 1)[0] or "/", _env_archive(environment))
+                container.rename(project_name)
+                steps.append("renamed")
+                rename_port_reservations(pool_name, project_name, conn=self.conn)
+                steps.append("reserved")
+                container.start()
+            except Exception:
+                self._roll_back(container, pool_name, project_name, steps)
+                raise
+            return container, get_port_reservations(project_name, conn=self.conn)
+
+    def _roll_back(self, container, pool_name, project_name, steps):
+        # The member may hold the claimed settings or have half started, so it is removed rather than reused.
+        try:
+            container.remove(force=True)
+        except Exception as e:
+            print(f"Could not remove pool container {pool_name} after a failed claim: {e}", file=sys.stderr)
+        else:
+            release_port_reservations(pool_name, conn=self.conn)
+            release_port_reservations(project_name, conn=self.conn)
+            return
+        # Still there: free the project name and keep the ports with the member until it is evicted.
+        if "renamed" in steps:
+            try:
+                container.rename(pool_name)
+            except Exception as e:
+                print(f"Could not rename {project_name} back to {pool_name}: {e}", file=sys.stderr)
+        if "reserved" in steps:
+            rename_port_reservations(project_name, pool_name, conn=self.conn)
+
+    def refill_in_background(self, on_event=None):
+        def run():
+            try:
+                self.fill(on_event=on_event)
+            except Exception as e:
+                print(f"Error refilling warm pool: {e}", file=sys.stderr)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def _create(self, reference):
+        name = f"{POOL_NAME_PREFIX}{uuid.uuid4().hex[:12]}"
+        ports = reserve_ports(name, list(CONTAINER_PORTS), self.start_port, client=self.client, conn=self.conn)
+        # Members hold their ports until they are claimed or evicted.
+        confirm_port_reservations(name, conn=self.conn)
+        config = self.client.images.get(reference).attrs.get("Config") or {}
+        try:
+            return self.client.containers.create(
+                reference,
+                name=name,
+                detach=True,
+                entrypoint=ENV_LOADER + (config.get("Entrypoint") or []),
+                command=config.get("Cmd"),
+                ports={CONTAINER_PORTS[service]: port for service, port in ports.items()},
+                labels={
+                    POOL_LABEL: self.image,
+                    POOL_REFERENCE_LABEL: reference,
+                    POOL_CREATED_LABEL: str(time.time()),
+                },
+            )
+        except Exception:
+            release_port_reservations(name, conn=self.conn)
+            raise
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-pull images and manage the warm container pool")
+    parser.add_argument("--image", default=DEFAULT_IMAGE, help=f"Image to provision (default: {DEFAULT_IMAGE})")
+    parser.add_argument("--pull", action="store_true", help="Pull the image and pin its digest")
+    parser.add_argument("--fill-pool", action="store_true", help="Create pool containers up to --size")
+    parser.add_argument("--evict", action="store_true", help="Remove stale pool containers")
+    parser.add_argument("--size", type=int, default=POOL_SIZE, help=f"Warm pool size (default: {POOL_SIZE})")
+    parser.add_argument("--max-age", type=float, default=POOL_MAX_AGE,
+                        help=f"Seconds before a pool container is replaced (default: {POOL_MAX_AGE})")
+    args = parser.parse_args()
+
+    def emit(event):
+        print(json.dumps(event), flush=True)
+
+    if not (args.pull or args.fill_pool or args.evict):
+        parser.error("nothing to do: use --pull, --fill-pool or --evict")
+
+    pool = WarmPool(image=args.image, size=args.size, max_age=args.max_age)
+    if args.pull:
+        pull_image(args.image, client=pool.client, on_event=emit)
+    if args.evict:
+        emit({"type": "pool_evicted", "containers": pool.evict()})
+    if args.fill_pool:
+        emit({"type": "pool_filled", "containers": pool.fill(on_event=emit)})
+
+if __name__ == "__main__":
+    main()
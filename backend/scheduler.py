@@ -0,0 +1,324 @@
+# scheduler.py
+"""Keep the inventory fresh by refreshing projects in the background.
+
+Each round lists the running frappe containers and picks the projects due
+for a refresh, most urgent first:
+
+    viewed    the project the UI is showing, once its data is viewed_max_age seconds old
+    changed   projects whose container started after their last refresh, latest start first
+    stale     the rest, once not refreshed for max_age seconds, oldest first
+
+A round costs two Docker requests however many containers run: the list
+summaries and the container start events since the previous round. Only a
+container seen for the first time is inspected, for its StartedAt.
+
+The unit of work is update_database for one project with a single worker, so
+a refresh has at most one Docker exec in flight. The execs are counted in a
+``budget`` (workers.ExecBudget) that foreground refreshes in the same process
+share, and the scheduler only starts a refresh while the total is below
+``max_concurrent``. A refresh that outlives ``timeout`` is recorded as failed
+but keeps its slot until it really returns. No project is attempted more than
+once every ``min_interval`` seconds, and a failing one is retried after
+``backoff`` seconds, doubling up to ``max_backoff``. Successes, attempts,
+failures and backoffs are kept per project in the refresh_status table, so
+they survive restarts.
+
+tick() runs one round on the calling thread and the clock is injectable, so
+rounds can be driven by hand; start() runs them on a background thread.
+Events passed to ``on_event``:
+
+    {"type": "result", "project": "...", "reason": "viewed", "seconds": 1.2, "skipped": false}
+    {"type": "error", "project": "...", "reason": "stale", "error": "...", "failures": 2, "retry_at": 1700000060.0}
+"""
+import argparse
+import contextlib
+import functools
+import json
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+
+import profiling
+from db_operations import connect, get_refresh_status, record_refresh
+from event_stream import add_argument as add_stream_argument, run_streamed
+from list_instances import PROJECT_LABEL, SERVICE_LABEL
+from update_db import update_database
+from workers import ExecBudget, run_bounded
+
+MAX_CONCURRENT = 2
+MAX_AGE = 15 * 60
+VIEWED_MAX_AGE = 30
+MIN_INTERVAL = 10
+BACKOFF = 30
+MAX_BACKOFF = 30 * 60
+REFRESH_TIMEOUT = 120
+POLL_INTERVAL = 5
+REASONS = ("viewed", "changed", "stale")
+
+_STARTED_AT = re.compile(r"(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(?:\.(\d+))?(Z|[+-]\d\d:\d\d)?$")
+
+def parse_started_at(value):
+    """Docker's StartedAt (RFC 3339, nanoseconds) as a Unix timestamp; None if the container never started."""
+    match = _STARTED_AT.match(value or "")
+    if not match or match[1].startswith("0001-"):
+        return None
+    zone = match[3] if match[3] and match[3] != "Z" else "+00:00"
+    return datetime.fromisoformat(match[1] + zone).timestamp() + float("0." + (match[2] or "0"))
+
+
+class RefreshScheduler:
+    def __init__(self, client=None, connect=connect, clock=time.time, max_concurrent=MAX_CONCURRENT,
+                 max_age=MAX_AGE, viewed_max_age=VIEWED_MAX_AGE, min_interval=MIN_INTERVAL, backoff=BACKOFF,
+                 max_backoff=MAX_BACKOFF, timeout=REFRESH_TIMEOUT, poll_interval=POLL_INTERVAL, inventory=True,
+                 budget=None):
+        self._client = client
+        # Each refresh opens its own connection: they run on worker threads, side by side.
+        self.connect = connect
+        self.clock = clock
+        self.max_concurrent = max_concurrent
+        self.max_age = max_age
+        self.viewed_max_age = viewed_max_age
+        self.min_interval = min_interval
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.inventory = inventory
+        self.viewed = None
+        self.budget = budget or ExecBudget()
+        # Running frappe container id -> (project, StartedAt), and when they were last listed.
+        self._containers = {}
+        self._listed_at = None
+        self._listing_lock = threading.Lock()
+        # Projects whose refresh hasn't returned yet, timed out or not.
+        self._running = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import docker
+            self._client = docker.from_env()
+        return profiling.instrument_client(self._client)
+
+    def view(self, project_name):
+        """Put ``project_name`` (None for no project) first in line, and wake the background loop."""
+        self.viewed = project_name
+        self._wake.set()
+
+    def _started(self, client):
+        # Project -> latest StartedAt among its running frappe containers.
+        with self._listing_lock:
+            listed_at = time.time()
+            summaries = client.api.containers(filters={"label": f"{SERVICE_LABEL}=frappe"})
+            known = self._containers
+            if known:
+                # A restart keeps the container listed, so restarts show up as start events. Whole
+                # seconds: the rest of the last one is asked for again next round.
+                for event in client.events(decode=True, since=int(self._listed_at), until=int(listed_at), filters={
+                    "type": "container", "event": ["start"], "label": f"{SERVICE_LABEL}=frappe",
+                }):
+                    container_id = (event.get("Actor") or {}).get("ID") or event.get("id")
+                    if container_id in known:
+                        event_time = event["timeNano"] / 1e9 if event.get("timeNano") else event.get("time", 0)
+                        project, started_at = known[container_id]
+                        known[container_id] = (project, max(started_at, event_time))
+            containers = {}
+            for summary in summaries:
+                project = (summary.get("Labels") or {}).get(PROJECT_LABEL)
+                if not project:
+                    continue
+                if summary["Id"] not in known:
+                    attrs = client.api.inspect_container(summary["Id"])
+                    known[summary["Id"]] = (project, parse_started_at(attrs.get("State", {}).get("StartedAt")) or 0.0)
+                containers[summary["Id"]] = known[summary["Id"]]
+            self._containers, self._listed_at = containers, listed_at
+        started = {}
+        for project, started_at in containers.values():
+            started[project] = max(started.get(project, 0.0), started_at)
+        return started
+
+    def _status(self):
+        conn = self.connect()
+        try:
+            return get_refresh_status(conn=conn)
+        finally:
+            conn.close()
+
+    def _plan(self, now, started, status):
+        with self._lock:
+            running = set(self._running)
+        due = {reason: [] for reason in REASONS}
+        for project, started_at in started.items():
+            row = status.get(project, {})
+            if project in running or (row.get("retry_at") or 0) > now:
+                continue
+            if row.get("attempted_at") is not None and now - row["attempted_at"] < self.min_interval:
+                continue
+            refreshed = row.get("refreshed_at")
+            age = now - refreshed if refreshed is not None else float("inf")
+            if project == self.viewed and age >= self.viewed_max_age:
+                due["viewed"].append((0, project))
+            elif refreshed is not None and started_at > refreshed:
+                due["changed"].append((-started_at, project))
+            elif age >= self.max_age:
+                due["stale"].append((refreshed if refreshed is not None else float("-inf"), project))
+        return [(project, reason) for reason in REASONS for _, project in sorted(due[reason])]
+
+    def plan(self):
+        """``(project, reason)`` for every project due now, in the order they would be refreshed."""
+        return self._plan(self.clock(), self._started(self.client), self._status())
+
+    def _refresh(self, project):
+        started = time.monotonic()
+        conn = self.connect()
+        try:
+            results = update_database(project_name=project, client=self.client, conn=conn, jobs=1,
+                                      inventory=self.inventory)
+        finally:
+            conn.close()
+            with self._lock:
+                self._running.discard(project)
+            self.budget.release()
+        problems = results["failed"] + results["timed_out"]
+        if problems:
+            raise Exception(problems[0].get("error") or f"Timed out refreshing project: {project}")
+        return {"seconds": round(time.monotonic() - started, 3), "skipped": bool(results["skipped"])}
+
+    @profiling.timed("scheduler.tick")
+    def tick(self, on_event=None):
+        """Refresh the most urgent due projects that fit in the free slots and wait for them.
+
+        Returns the number of refreshes started.
+        """
+        on_event = on_event or (lambda event: None)
+        now = self.clock()
+        status = self._status()
+        batch = []
+        for project, reason in self._plan(now, self._started(self.client), status):
+            if not self.budget.try_acquire(self.max_concurrent):
+                break
+            batch.append((project, reason))
+            with self._lock:
+                self._running.add(project)
+        if not batch:
+            return 0
+
+        reasons = dict(batch)
+        tasks = [(project, functools.partial(self._refresh, project)) for project, _ in batch]
+        conn = self.connect()
+        try:
+            for project, outcome, value in run_bounded(tasks, len(tasks), self.timeout):
+                if outcome == "ok":
+                    record_refresh(project, now, conn=conn)
+                    on_event(dict(value, type="result", project=project, reason=reasons[project]))
+                    continue
+                failures = status.get(project, {}).get("failures", 0) + 1
+                retry_at = now + min(self.max_backoff, self.backoff * 2 ** (failures - 1))
+                error = str(value) if outcome == "error" else f"Timed out after {self.timeout}s"
+                record_refresh(project, now, error=error, retry_at=retry_at, conn=conn)
+                on_event({"type": "error", "project": project, "reason": reasons[project], "error": error,
+                          "failures": failures, "retry_at": retry_at})
+        finally:
+            conn.close()
+        return len(batch)
+
+    def status(self):
+        """Freshness of every project with a running frappe container."""
+        now = self.clock()
+        status = self._status()
+        with self._lock:
+            running = set(self._running)
+        rows = []
+        for project in sorted(self._started(self.client)):
+            row = status.get(project, {})
+            refreshed = row.get("refreshed_at")
+            rows.append({"project": project, "refreshed_at": refreshed,
+                         "age": round(now - refreshed, 3) if refreshed is not None else None,
+                         "failures": row.get("failures", 0), "retry_at": row.get("retry_at"),
+                         "error": row.get("error"), "running": project in running,
+                         "viewed": project == self.viewed})
+        return rows
+
+    def start(self, on_event=None):
+        """Run rounds on a background thread: back to back while there is work, else every ``poll_interval``."""
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+
+        def run():
+            while not self._stopping.is_set():
+                try:
+                    started = self.tick(on_event)
+                except Exception as e:
+                    started = 0
+                    if on_event:
+                        on_event({"type": "error", "error": str(e)})
+                if not started:
+                    self._wake.wait(self.poll_interval)
+                    self._wake.clear()
+
+        self._thread = threading.Thread(target=run, name="refresh-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.timeout + 1)
+            self._thread = None
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh Frappe projects in priority order until none is due")
+    parser.add_argument("--view", help="Project to treat as the one being viewed")
+    parser.add_argument("--follow", action="store_true", help="Keep running, refreshing projects as they fall due")
+    parser.add_argument("-j", "--max-concurrent", type=int, default=MAX_CONCURRENT,
+                        help=f"Refreshes (and so Docker execs) in flight at once (default: {MAX_CONCURRENT})")
+    parser.add_argument("--max-age", type=float, default=MAX_AGE,
+                        help=f"Seconds before a project is refreshed again (default: {MAX_AGE})")
+    parser.add_argument("--timeout", type=float, default=REFRESH_TIMEOUT,
+                        help=f"Seconds allowed per refresh (default: {REFRESH_TIMEOUT})")
+    parser.add_argument("--no-inventory", action="store_true", help="Skip collecting app versions and site sizes")
+    profiling.add_argument(parser)
+    add_stream_argument(parser)
+    args = parser.parse_args()
+    profiling.enable_from_args(args)
+    if args.max_concurrent < 1:
+        parser.error("--max-concurrent must be at least 1")
+
+    scheduler = RefreshScheduler(max_concurrent=args.max_concurrent, max_age=args.max_age, timeout=args.timeout,
+                                 inventory=not args.no_inventory)
+    scheduler.view(args.view)
+
+    def run(on_event):
+        try:
+            if args.follow:
+                scheduler.start(on_event)
+                while True:
+                    time.sleep(3600)
+            while scheduler.tick(on_event):
+                pass
+        except KeyboardInterrupt:
+            scheduler.stop()
+        return scheduler.status()
+
+    if args.stream:
+        def summarize(rows, writer):
+            for row in rows:
+                writer.emit(dict(row, type="result"))
+            return "ok", {"projects": len(rows), "failing": len([row for row in rows if row["failures"]])}
+
+        run_streamed(run, summarize)
+        return
+    # update_database reports what it does on stdout; that belongs in the log, not the output.
+    with contextlib.redirect_stdout(sys.stderr):
+        rows = run(lambda event: print(json.dumps(event), file=sys.stderr))
+    print(json.dumps(rows, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+# site_inventory.py
+"""Collect app versions and per-site sizes from a bench in one exec.
+
+A short Python script runs inside the container with the bench's own
+interpreter (which has the MariaDB client library Frappe uses) and prints one
+JSON document:
+
+    {"apps": {app: {"version", "branch", "commit"}},
+     "sites": {site: {"db_size", "files_size", "last_backup"}}}
+
+Versions come from each app's ``__init__.py`` and the git HEAD is read from
+``.git`` directly, so neither git nor bench has to be installed. DB sizes are
+queried with each site's own credentials; any value that can't be read is
+null rather than failing the whole inventory.
+"""
+import json
+
+INVENTORY_SCRIPT = r'''
+import json, os, re, sys
+
+bench = sys.argv[1]
+result = {"apps": {}, "sites": {}}
+
+def read(path):
+    try:
+        with open(path) as f:
+            return f.read()
+    except (OSError, UnicodeDecodeError):
+        return None
+
+def git_head(app_path):
+    git = os.path.join(app_path, ".git")
+    head = (read(os.path.join(git, "HEAD")) or "").strip()
+    if not head.startswith("ref: "):
+        return None, head or None
+    ref = head[5:]
+    branch = ref[len("refs/heads/"):] if ref.startswith("refs/heads/") else ref
+    commit = (read(os.path.join(git, ref)) or "").strip()
+    if not commit:
+        for line in (read(os.path.join(git, "packed-refs")) or "").splitlines():
+            if line.endswith(" " + ref):
+                commit = line.split(" ", 1)[0]
+    return branch, commit or None
+
+apps_dir = os.path.join(bench, "apps")
+for app in sorted(os.listdir(apps_dir)) if os.path.isdir(apps_dir) else []:
+    path = os.path.join(apps_dir, app)
+    if not os.path.isdir(path):
+        continue
+    match = re.search(r"""__version__\s*=\s*['"]([^'"]+)""", read(os.path.join(path, app, "__init__.py")) or "")
+    branch, commit = git_head(path)
+    result["apps"][app] = {"version": match.group(1) if match else None, "branch": branch, "commit": commit}
+
+def tree_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+def newest_mtime(path):
+    newest = None
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                mtime = os.lstat(os.path.join(root, name)).st_mtime
+            except OSError:
+                continue
+            newest = mtime if newest is None else max(newest, mtime)
+    return newest
+
+def connect(config):
+    kwargs = dict(host=config.get("db_host") or "127.0.0.1", port=int(config.get("db_port") or 3306),
+                  user=config.get("db_user") or config["db_name"], password=config.get("db_password") or "",
+                  connect_timeout=5)
+    try:
+        import pymysql
+        return pymysql.connect(**kwargs)
+    except ImportError:
+        import MySQLdb
+        kwargs["passwd"] = kwargs.pop("password")
+        return MySQLdb.connect(**kwargs)
+
+def db_size(config):
+    try:
+        conn = connect(config)
+    except Exception:
+        return None
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT SUM(data_length + index_length) FROM information_schema.tables WHERE table_schema = %s",
+                       (config["db_name"],))
+        row = cursor.fetchone()
+        return int(row[0]) if row and row[0] is not None else None
+    except Exception:
+        return None
+    finally:
+        conn.close()
+
+sites_dir = os.path.join(bench, "sites")
+common = json.loads(read(os.path.join(sites_dir, "common_site_config.json")) or "{}")
+for site in sorted(os.listdir(sites_dir)) if os.path.isdir(sites_dir) else []:
+    site_path = os.path.join(sites_dir, site)
+    try:
+        config = json.loads(read(os.path.join(site_path, "site_config.json")) or "null")
+    except ValueError:
+        config = None
+    if not isinstance(config, dict):
+        continue
+    config = dict(common, **config)
+    result["sites"][site] = {
+        "db_size": db_size(config) if config.get("db_name") else None,
+        "files_size": tree_size(os.path.join(site_path, "public", "files"))
+                      + tree_size(os.path.join(site_path, "private", "files")),
+        "last_backup": newest_mtime(os.path.join(site_path, "private", "backups")),
+    }
+
+print(json.dumps(result))
+'''
+
+# Interpreters to try, in order; the bench's virtualenv has the DB driver.
+def _interpreters(bench_dir):
+    return [f"{bench_dir.rstrip('/')}/env/bin/python", "python3"]
+
+def inventory_command(bench_dir, python=None):
+    """The exec printing the inventory as JSON, run with ``python`` (the first interpreter to try by default)."""
+    return [python or _interpreters(bench_dir)[0], "-c", INVENTORY_SCRIPT, bench_dir]
+
+def collect_inventory(container, bench_dir, first_result=None):
+    """App versions and site sizes for the bench at ``bench_dir``, or None if they couldn't be read.
+
+    ``first_result`` is the ``(exit_code, output)`` of inventory_command when
+    the caller has already run it; the other interpreters are only tried if
+    that one was missing.
+    """
+    for index, python in enumerate(_interpreters(bench_dir)):
+        try:
+            if index == 0 and first_result is not None:
+                exit_code, output = first_result
+            else:
+                exit_code, output = container.exec_run(inventory_command(bench_dir, python), stderr=False)
+        except Exception as e:
+            print(f"Error collecting site inventory: {e}")
+            return None
+        if exit_code in (126, 127):
+            continue  # interpreter not found, try the next one
+        if exit_code != 0:
+            return None
+        try:
+            inventory = json.loads(output.decode("utf-8"))
+        except ValueError:
+            return None
+        return inventory if isinstance(inventory, dict) else None
+    return None
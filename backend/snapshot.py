@@ -0,0 +1,275 @@
+# snapshot.py
+"""Export and import the instance inventory as a columnar snapshot file.
+
+A snapshot holds the tables update_db fills (projects, containers, sites,
+apps, site_apps, bench_cache, app_versions, site_inventory and
+refresh_fingerprints), so a fresh machine or a lost database file can be
+restored without refreshing every live container. Live state (container
+status, port reservations, image pins) is not included, and the search index
+is rebuilt on import rather than stored.
+
+Layout, little-endian, every block padded to 8 bytes:
+
+    magic b"CWSNAP\\0\\0", u32 format version, u32 header length
+    header: JSON with the schema version and each table's columns
+    chunks: u32 table index, u32 row count, then one block per column
+    end: u32 0xFFFFFFFF
+
+A column block is u8 type, u8 has-nulls, 6 bytes padding and u64 data
+length, then the null bitmap (when has-nulls) and the data: int64 or float64
+values, or for text a uint64 offset array followed by the UTF-8 bytes.
+Values of mixed types are stored as JSON text.
+
+Export streams each table through the cursor ``CHUNK_ROWS`` rows at a time;
+import maps the file and decodes whole columns with memoryview casts, then
+bulk-inserts in one transaction.
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from pathlib import Path
+
+import profiling
+from db_operations import SCHEMA_VERSION, project_cache, read_transaction, rebuild_search_index, write_transaction
+
+MAGIC = b"CWSNAP\0\0"
+FORMAT_VERSION = 1
+END_OF_CHUNKS = 0xFFFFFFFF
+CHUNK_ROWS = 4096
+# Parents before children, so rows can be inserted in this order and deleted in reverse.
+TABLES = ("projects", "containers", "sites", "apps", "site_apps", "bench_cache", "app_versions",
+          "site_inventory", "refresh_fingerprints")
+
+INTEGER, REAL, TEXT, JSON = 1, 2, 3, 4
+_FILE_HEADER = struct.Struct("<8sII")
+_CHUNK_HEADER = struct.Struct("<II")
+_COLUMN_HEADER = struct.Struct("<BB6xQ")
+_LITTLE_ENDIAN = sys.byteorder == "little"
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _pad(length):
+    return -length % 8
+
+def _numeric_bytes(typecode, values):
+    data = array(typecode, values)
+    if not _LITTLE_ENDIAN:
+        data.byteswap()
+    return data.tobytes()
+
+def _column_type(values):
+    types = {type(v) for v in values if v is not None}
+    if types <= {int}:
+        return INTEGER
+    if types <= {int, float}:
+        return REAL
+    if types <= {str}:
+        return TEXT
+    return JSON
+
+def encode_column(values):
+    """One column block for ``values``."""
+    kind = _column_type(values)
+    nulls = bytearray((len(values) + 7) // 8)
+    has_nulls = False
+    for i, value in enumerate(values):
+        if value is None:
+            nulls[i >> 3] |= 1 << (i & 7)
+            has_nulls = True
+
+    if kind == INTEGER:
+        data = _numeric_bytes("q", [0 if v is None else v for v in values])
+    elif kind == REAL:
+        data = _numeric_bytes("d", [0.0 if v is None else v for v in values])
+    else:
+        encode = (lambda v: v) if kind == TEXT else json.dumps
+        encoded = [b"" if v is None else encode(v).encode() for v in values]
+        offsets = [0]
+        for item in encoded:
+            offsets.append(offsets[-1] + len(item))
+        data = _numeric_bytes("Q", offsets) + b"".join(encoded)
+
+    parts = [_COLUMN_HEADER.pack(kind, has_nulls, len(data))]
+    if has_nulls:
+        parts += [bytes(nulls), b"\0" * _pad(len(nulls))]
+    parts += [data, b"\0" * _pad(len(data))]
+    return b"".join(parts)
+
+def _numbers(view, typecode):
+    if _LITTLE_ENDIAN:
+        with view.cast(typecode) as values:
+            return values.tolist()
+    data = array(typecode)
+    data.frombytes(view)
+    data.byteswap()
+    return data.tolist()
+
+def decode_column(view, pos, rows):
+    """``(values, next position)`` for the column block at ``pos`` of ``view``."""
+    if pos + _COLUMN_HEADER.size > len(view):
+        raise SnapshotError("Snapshot is truncated")
+    kind, has_nulls, length = _COLUMN_HEADER.unpack_from(view, pos)
+    pos += _COLUMN_HEADER.size
+    nulls = None
+    if has_nulls:
+        size = (rows + 7) // 8
+        nulls = bytes(view[pos:pos + size])
+        pos += size + _pad(size)
+    if pos + length > len(view):
+        raise SnapshotError("Snapshot is truncated")
+
+    with view[pos:pos + length] as data:
+        if kind == INTEGER:
+            values = _numbers(data, "q")
+        elif kind == REAL:
+            values = _numbers(data, "d")
+        elif kind in (TEXT, JSON):
+            offset_bytes = 8 * (rows + 1)
+            with data[:offset_bytes] as offset_view:
+                offsets = _numbers(offset_view, "Q")
+            blob = bytes(data[offset_bytes:])
+            values = [blob[offsets[i]:offsets[i + 1]].decode() for i in range(rows)]
+            if kind == JSON:
+                values = [json.loads(v) if v else None for v in values]
+        else:
+            raise SnapshotError(f"Unknown column type {kind}")
+    pos += length + _pad(length)
+
+    if nulls:
+        values = [None if nulls[i >> 3] & (1 << (i & 7)) else value for i, value in enumerate(values)]
+    return values, pos
+
+
+def _columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+@profiling.timed("snapshot.export_snapshot")
+def export_snapshot(path, conn=None, chunk_rows=CHUNK_ROWS):
+    """Write the inventory to ``path``; returns rows written per table.
+
+    The file is written next to ``path`` and renamed into place, so an
+    interrupted export never leaves a truncated snapshot behind.
+    """
+    path = Path(path)
+    partial = path.with_name(path.name + ".partial")
+    counts = {}
+    try:
+        _write_snapshot(partial, conn, chunk_rows, counts)
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+    os.replace(partial, path)
+    return counts
+
+def _write_snapshot(partial, conn, chunk_rows, counts):
+    # One read transaction, so the tables are consistent with each other.
+    with read_transaction(conn) as conn, open(partial, "wb") as f:
+        columns = {table: _columns(conn, table) for table in TABLES}
+        header = json.dumps({"schema_version": SCHEMA_VERSION, "created_at": time.time(),
+                             "tables": [[table, columns[table]] for table in TABLES]}).encode()
+        f.write(_FILE_HEADER.pack(MAGIC, FORMAT_VERSION, len(header)) + header + b"\0" * _pad(len(header)))
+
+        for index, table in enumerate(TABLES):
+            counts[table] = 0
+            cursor = conn.execute(f"SELECT {', '.join(columns[table])} FROM {table}")
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                f.write(_CHUNK_HEADER.pack(index, len(rows)))
+                f.write(b"\0" * _pad(_CHUNK_HEADER.size))
+                for values in zip(*rows):
+                    f.write(encode_column(values))
+                counts[table] += len(rows)
+        f.write(struct.pack("<I", END_OF_CHUNKS))
+
+def read_snapshot(path):
+    """Yield ``(header, table, columns, rows)`` for each chunk of the snapshot at ``path``."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < _FILE_HEADER.size:
+            raise SnapshotError(f"{path} is not a snapshot")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+            magic, version, header_length = _FILE_HEADER.unpack_from(view, 0)
+            if magic != MAGIC:
+                raise SnapshotError(f"{path} is not a snapshot")
+            if version > FORMAT_VERSION:
+                raise SnapshotError(f"Snapshot format {version} is newer than this version supports ({FORMAT_VERSION})")
+            pos = _FILE_HEADER.size
+            header = json.loads(bytes(view[pos:pos + header_length]))
+            pos += header_length + _pad(header_length)
+            tables = header["tables"]
+
+            while True:
+                if pos + 4 > len(view):
+                    raise SnapshotError(f"{path} is truncated")
+                (index,) = struct.unpack_from("<I", view, pos)
+                if index == END_OF_CHUNKS:
+                    return
+                _, rows = _CHUNK_HEADER.unpack_from(view, pos)
+                pos += _CHUNK_HEADER.size + _pad(_CHUNK_HEADER.size)
+                table, columns = tables[index]
+                values = []
+                for _ in columns:
+                    column, pos = decode_column(view, pos, rows)
+                    values.append(column)
+                yield header, table, columns, list(zip(*values))
+
+@profiling.timed("snapshot.import_snapshot")
+def import_snapshot(path, conn=None):
+    """Replace the inventory with the snapshot at ``path``; returns rows loaded per table.
+
+    Everything happens in one transaction: a snapshot that fails to load
+    leaves the database as it was.
+    """
+    counts = dict.fromkeys(TABLES, 0)
+    with write_transaction(conn) as conn:
+        known = {table: set(_columns(conn, table)) for table in TABLES}
+        for table in reversed(TABLES):
+            conn.execute(f"DELETE FROM {table}")
+        checked = False
+        for header, table, columns, rows in read_snapshot(path):
+            if not checked:
+                if header["schema_version"] > SCHEMA_VERSION:
+                    raise SnapshotError(f"Snapshot schema {header['schema_version']} is newer than this "
+                                        f"database ({SCHEMA_VERSION})")
+                checked = True
+            if table not in known or not set(columns) <= known[table]:
+                raise SnapshotError(f"Snapshot table {table} has columns this version doesn't know")
+            conn.executemany(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows
+            )
+            counts[table] += len(rows)
+        rebuild_search_index(conn)
+    project_cache.invalidate()
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import the instance inventory snapshot")
+    parser.add_argument("command", choices=("export", "import"))
+    parser.add_argument("path", help="Snapshot file")
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+    profiling.enable_from_args(args)
+
+    started = time.monotonic()
+    try:
+        if args.command == "export":
+            counts = export_snapshot(args.path)
+        else:
+            counts = import_snapshot(args.path)
+    except (SnapshotError, OSError) as e:
+        print(json.dumps({"status": "error", "message": str(e)}))
+        sys.exit(1)
+    print(json.dumps({"status": "success", "path": args.path, "tables": counts,
+                      "seconds": round(time.monotonic() - started, 3)}))
+
+if __name__ == "__main__":
+    main()
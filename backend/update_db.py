@@ -1,9 +1,21 @@
-# ToDo: get site db user and password 
-
-import docker
+# update_db.py
+import contextlib
+import functools
 import json
 import argparse
-from db_operations import update_project, get_project_info
+import sys
+import time
+import profiling
+from event_stream import add_argument as add_stream_argument, run_streamed
+from bench_metadata import config_archive_command, parse_config_archive
+from exec_session import ExecPool, exec_batch
+from list_instances import PROJECT_LABEL, SERVICE_LABEL
+from db_operations import (
+    update_projects, get_project_info, get_cached_bench_dir, cache_bench_dir, cache_bench_dirs,
+    get_refresh_fingerprints, save_refresh_fingerprints, get_inventory_times, save_inventories,
+)
+from site_inventory import collect_inventory, inventory_command
+from workers import run_bounded
 
 def is_bench_directory(container, path):
     required_files = [
@@ -12,129 +24,396 @@ def is_bench_directory(container, path):
         "sites/common_site_config.json",
     ]
     try:
-        for file in required_files:
-            exit_code, _ = container.exec_run(f"test -e {path}/{file}")
-            if exit_code != 0:
-                return False
-        return True
+        # One round-trip for all three tests on a pooled container.
+        results = exec_batch(container, [f"test -e {path}/{file}" for file in required_files])
+        return all(exit_code == 0 for exit_code, _ in results)
     except Exception as e:
         print(f"Error validating bench directory: {e}")
         return False
 
-def find_bench_directory_in_container(container):
-    search_roots = ["/home/frappe", "/workspace", "/frappe", "/app"]
-    search_depth = 3
-    
-    for search_root in set(search_roots):  # Use set to remove duplicates
-        try:
-            # Check if directory exists
-            exit_code, _ = container.exec_run(f"test -d {search_root}")
-            if exit_code != 0:
-                print(f"Directory {search_root} does not exist")
-                continue
+BENCH_SEARCH_ROOTS = ["/home/frappe", "/workspace", "/frappe", "/app"]
+BENCH_SEARCH_DEPTH = 3
+# Seconds before an unchanged container's inventory (DB and file sizes) is read again.
+INVENTORY_MAX_AGE = 60 * 60
+
+def _bench_discovery_command(search_roots, search_depth):
+    # A bench directory holds apps/ and sites/common_site_config.json. A single
+    # find prints both markers and the pairing happens locally, so discovery
+    # costs one exec no matter how many directories the roots contain.
+    return [
+        "find", *search_roots, "-maxdepth", str(search_depth + 2),
+        "(", "-name", ".*", "-o", "-name", "node_modules", ")", "-prune",
+        "-o", "-type", "d", "-name", "apps", "-print",
+        "-o", "-type", "f", "-path", "*/sites/common_site_config.json", "-print",
+    ]
 
-            # List directories to get more context
-            list_cmd = f"find {search_root} -maxdepth {search_depth} -type d -not -path '*/\.*'"
-            exit_code, output = container.exec_run(list_cmd)
+def _bench_candidates(output, search_roots, search_depth):
+    with_apps, with_config = set(), set()
+    for line in output.decode("utf-8").splitlines():
+        path = line.strip()
+        if path.endswith("/sites/common_site_config.json"):
+            with_config.add(path[:-len("/sites/common_site_config.json")])
+        elif path.endswith("/apps"):
+            with_apps.add(path[:-len("/apps")])
 
-            if exit_code != 0:
-                print(f"Error executing find command in {search_root}")
-                continue
+    candidates = []
+    for bench_dir in with_apps & with_config:
+        for index, root in enumerate(search_roots):
+            if bench_dir == root or bench_dir.startswith(root.rstrip("/") + "/"):
+                depth = bench_dir[len(root):].count("/")
+                if depth <= search_depth:
+                    candidates.append((index, depth, bench_dir))
+                break
+    # Same preference as a root-by-root, shallowest-first search.
+    return [bench_dir for _, _, bench_dir in sorted(candidates)]
 
-            # Decode and process output
-            directories = output.decode("utf-8").splitlines()
-            print(f"Searching in {search_root}, found {len(directories)} directories")
-
-            for dirpath in directories:
-                # Extended logging for diagnostics
-                print(f"Checking directory: {dirpath}")
-                
-                # Check for bench-specific files/directories
-                checks = [
-                    f"test -d {dirpath}/sites",
-                    f"test -d {dirpath}/apps",
-                    f"test -f {dirpath}/sites/common_site_config.json"
-                ]
-                
-                is_bench = all(
-                    container.exec_run(check)[0] == 0 
-                    for check in checks
-                )
-                
-                if is_bench:
-                    print(f"Found bench directory: {dirpath}")
-                    return dirpath
+def _container_image_id(container):
+    try:
+        return container.attrs.get("Image") or ""
+    except Exception:
+        return ""
 
-        except Exception as e:
-            print(f"Error searching for bench directory in {search_root}: {e}")
+def find_bench_directory_in_container(container, use_cache=True, conn=None):
+    image_id = _container_image_id(container)
+    if use_cache:
+        cached = get_cached_bench_dir(container.id, image_id, conn=conn)
+        if cached:
+            return cached
 
-        # If no bench directory found
+    bench_dir = discover_bench_directory(container)
+    if bench_dir:
+        cache_bench_dir(container.id, image_id, bench_dir, conn=conn)
+    return bench_dir
+
+def discover_bench_directory(container):
+    """Search the container for a bench directory without consulting the cache."""
+    search_roots = list(dict.fromkeys(BENCH_SEARCH_ROOTS))  # Remove duplicates, keep order
+    try:
+        # Missing roots make find exit non-zero; their errors go to stderr,
+        # which is left out so only matches are parsed.
+        _, output = container.exec_run(_bench_discovery_command(search_roots, BENCH_SEARCH_DEPTH), stderr=False)
+    except Exception as e:
+        print(f"Error searching for bench directory: {e}")
+        return None
+
+    candidates = _bench_candidates(output, search_roots, BENCH_SEARCH_DEPTH)
+    if not candidates:
         print("No bench directory found. Possible reasons:")
         print("1. Bench may be installed in a non-standard location")
         print("2. Container might not have Frappe/Bench installed")
         print("3. Search roots and depth may need adjustment")
         print("4. Container might not be running")
-    
-    return None
+        return None
+
+    bench_dir = candidates[0]
+    print(f"Found bench directory: {bench_dir}")
+    return bench_dir
 
 def get_sites(container, bench_dir):
-    exit_code, _ = container.exec_run(f"test -d {bench_dir}/sites")
+    """Sites listed with an exec: directories under sites/ that hold a site_config.json."""
+    cmd = ["find", f"{bench_dir}/sites", "-maxdepth", "2", "-path", "*/sites/*/site_config.json"]
+    exit_code, output = container.exec_run(cmd, stderr=False)
     if exit_code != 0:
         return []
-    cmd = f"bash -c 'ls {bench_dir}/sites | grep -v 'apps' | grep -v '.json' | grep -v 'assets''"
-    exit_code, output = container.exec_run(cmd)
-    if exit_code != 0:
-        raise Exception(f"Error executing command: {cmd}")
-    
-    sites = output.decode('utf-8').replace('\r', '').strip().split('\n')
-    return [site for site in sites if site]
+    sites = [line.strip().split("/")[-2] for line in output.decode('utf-8').splitlines() if line.strip()]
+    return sorted(set(sites))
 
 def get_available_apps(container, bench_dir):
-    exit_code, _ = container.exec_run(f"test -d {bench_dir}/apps")
+    """Apps listed with an exec: the entries of apps/."""
+    exit_code, output = container.exec_run(["ls", f"{bench_dir}/apps"], stderr=False)
     if exit_code != 0:
         return []
-    cmd = f"bash -c 'ls {bench_dir}/apps'"
-    exit_code, output = container.exec_run(cmd)
-    if exit_code != 0:
-        raise Exception(f"Error executing command: {cmd}")
-    
     apps = output.decode('utf-8').replace('\r', '').strip().split('\n')
     return [app for app in apps if app]
 
-def update_database(project_name=None, specific_site=None, update_bench=True, update_sites=True, update_apps=True):
-    client = docker.from_env()
-    filters = {"label": "com.docker.compose.service=frappe"}
+def site_apps_command(site=None):
+    """The exec (run in the bench directory) listing the apps installed on ``site``, or on every site."""
+    return ["bench", "--site", site or "all", "list-apps", "--format", "json"]
+
+def get_site_installed_apps(container, bench_dir, site=None):
+    """Map each site to its installed apps, or return None if bench can't tell us.
+
+    ``bench list-apps`` reads the installation records from each site's
+    database, so this needs the site databases to be reachable.
+    """
+    try:
+        result = container.exec_run(site_apps_command(site), workdir=bench_dir, stderr=False)
+    except Exception as e:
+        print(f"Error listing installed apps: {e}")
+        return None
+    return _parse_site_apps(result)
+
+def _parse_site_apps(result):
+    exit_code, output = result
+    if exit_code != 0:
+        return None
+
+    # bench may print warnings ahead of the JSON document.
+    text = output.decode('utf-8')
+    start, end = text.find('{'), text.rfind('}')
+    if start == -1 or end < start:
+        return None
+    try:
+        installed = json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+    return {site_name: list(apps) for site_name, apps in installed.items() if isinstance(apps, list)}
+
+def fingerprint_command(bench_dir):
+    return ["stat", "-c", "%n %Y", f"{bench_dir}/sites", f"{bench_dir}/apps"]
+
+def container_fingerprint(container, bench_dir):
+    """A cheap summary of what a refresh would read, or None if it can't be taken.
+
+    Adding or removing a site or an app changes the mtime of ``sites/`` or
+    ``apps/``, and a restart changes StartedAt; both mtimes come from one exec.
+    Apps installed into an existing site change neither, which is what
+    ``--force`` is for.
+    """
+    try:
+        result = container.exec_run(fingerprint_command(bench_dir), stderr=False)
+    except Exception as e:
+        print(f"Error reading container fingerprint: {e}")
+        return None
+    return _fingerprint(container, result)
+
+def _fingerprint(container, result):
+    exit_code, output = result
+    if exit_code != 0:
+        return None
+    started_at = container.attrs.get("State", {}).get("StartedAt", "")
+    return f"{started_at}\n{output.decode('utf-8').strip()}"
+
+def _exec_named(container, bench_dir, commands):
+    """Run the ``{name: cmd}`` commands in the bench directory as one batch; returns ``{name: (exit_code, output)}``."""
+    if not commands:
+        return {}
+    names = list(commands)
+    results = exec_batch(container, [commands[name] for name in names], workdir=bench_dir, stderr=False)
+    return dict(zip(names, results))
+
+@profiling.timed("update_db.collect_project")
+def _collect_project(container, current_project, bench_dir, existing_info, specific_site, update_sites, update_apps,
+                     known_fingerprint=None, inventory=False, inventory_due=False):
+    # Runs on a worker thread: Docker execs only, the database is left to the caller.
+    started = time.monotonic()
+    if bench_dir is None:
+        bench_dir = discover_bench_directory(container)
+    if not bench_dir:
+        raise Exception(f"No bench directory found for project: {current_project}")
+
+    # The fingerprint, the config archive, bench list-apps and the inventory
+    # go out as one batch: a single round-trip on a pooled container. With a
+    # fingerprint on record the container is probably unchanged, so only what
+    # a skip needs is asked for first and the rest once it has changed.
+    collect = update_sites or update_apps
+    first = {"fingerprint": fingerprint_command(bench_dir)}
+    rest = {}
+    if collect:
+        # Site and app metadata comes from the config files; listing them is the fallback.
+        rest["metadata"] = config_archive_command()
+        # Installations are only re-read alongside the lists they relate.
+        rest["site_apps"] = site_apps_command(specific_site)
+        if inventory:
+            rest["inventory"] = inventory_command(bench_dir)
+    # Sizes grow without touching the fingerprint, so they are re-read once they're old.
+    if inventory_due:
+        first["inventory"] = inventory_command(bench_dir)
+    if known_fingerprint is None:
+        first.update(rest)
+    results = _exec_named(container, bench_dir, first)
+
+    fingerprint = _fingerprint(container, results["fingerprint"])
+    if fingerprint is not None and fingerprint == known_fingerprint:
+        result = {"skipped": True, "bench_dir": bench_dir, "seconds": time.monotonic() - started}
+        if inventory_due:
+            result["inventory"] = collect_inventory(container, bench_dir, results["inventory"]) or {}
+        return result
+    results.update(_exec_named(container, bench_dir, {name: cmd for name, cmd in rest.items() if name not in results}))
+
+    metadata = None
+    if collect:
+        try:
+            metadata = parse_config_archive(results["metadata"], bench_dir)
+        except Exception as e:
+            print(f"Error reading bench metadata, listing directories instead: {e}")
+
+    # Get all sites if no specific site is provided
+    if update_sites:
+        sites = [site["name"] for site in metadata["sites"]] if metadata else get_sites(container, bench_dir)
+    else:
+        sites = existing_info.get("sites", []) if existing_info else []
+
+    # Filter sites if a specific site is provided
+    if specific_site:
+        sites = [site for site in sites if site == specific_site]
+        if not sites:
+            raise Exception(f"Site {specific_site} not found in project {current_project}")
+
+    if update_apps:
+        # apps.txt is what bench itself reads; very old benches lack it.
+        apps = metadata["apps"] if metadata and metadata["apps"] is not None else get_available_apps(container, bench_dir)
+    else:
+        apps = existing_info.get("available_apps", []) if existing_info else []
+    site_db_names = {site["name"]: site["db_name"] for site in metadata["sites"]} if metadata else None
+
+    site_apps = _parse_site_apps(results["site_apps"]) if collect else None
+    result = {"bench_dir": bench_dir, "sites": sites, "apps": apps, "site_apps": site_apps,
+              "site_db_names": site_db_names, "fingerprint": fingerprint}
+    if inventory and collect:
+        # Versions and sizes for every app and site. A failed read is stored
+        # as empty so it isn't retried until it is due.
+        result["inventory"] = collect_inventory(container, bench_dir, results["inventory"]) or {}
+    result["seconds"] = time.monotonic() - started
+    return result
+
+def _run_collections(tasks, jobs, timeout, pool):
+    # The sessions are closed once every container is done, or when the caller stops early.
+    try:
+        yield from run_bounded(tasks, max(1, jobs), timeout)
+    finally:
+        if pool:
+            pool.close()
+
+@profiling.timed("update_db.update_database")
+def update_database(project_name=None, specific_site=None, update_bench=True, update_sites=True, update_apps=True,
+                    client=None, conn=None, jobs=1, timeout=None, force=False, inventory=True,
+                    inventory_max_age=INVENTORY_MAX_AGE, exec_sessions=True, on_event=None):
+    """Refresh the database from running Frappe containers.
+
+    Containers are inspected on up to ``jobs`` threads, each limited to
+    ``timeout`` seconds; all database reads and writes stay on the calling
+    thread. Containers whose fingerprint matches the one recorded by their
+    last full refresh are skipped unless ``force`` is set. Returns lists of
+    the projects that succeeded, were skipped, failed and timed out, plus the
+    estimated seconds the skips saved.
+
+    With ``inventory`` set, app versions and site sizes are collected along
+    with the sites and apps, and for skipped containers whose inventory is
+    older than ``inventory_max_age`` seconds.
+
+    With ``exec_sessions`` set, each container's commands go through one
+    long-lived shell (see exec_session) instead of an exec apiece; the
+    round-trips that saved are reported under ``exec``.
+
+    ``on_event`` receives a progress event once the containers are listed, a
+    result or error event as each container finishes (with ``done`` and
+    ``total``), and a progress event before the database is written.
+    """
+    if client is None:
+        import docker
+        client = docker.from_env()
+    client = profiling.instrument_client(client)
+    filters = {"label": [f"{SERVICE_LABEL}=frappe"]}
     if project_name:
-        filters["label"] = f"com.docker.compose.project={project_name}"
+        filters["label"].append(f"{PROJECT_LABEL}={project_name}")
     containers = client.containers.list(filters=filters)
+    on_event = on_event or (lambda event: None)
+    on_event({"type": "progress", "stage": "refreshing", "total": len(containers)})
+    done = 0
 
+    results = {"succeeded": [], "skipped": [], "failed": [], "timed_out": [], "time_saved": 0.0}
+    tasks = []
+    projects = {}
+    # Only a full refresh records a fingerprint, so only it can vouch for every list.
+    full_refresh = update_sites and update_apps and not specific_site
+    fingerprints = {} if force else get_refresh_fingerprints([c.id for c in containers], conn=conn)
+    inventory_times = get_inventory_times([c.id for c in containers], conn=conn) if inventory else {}
+    now = time.time()
+    pool = ExecPool(client, timeout=timeout) if exec_sessions else None
     for container in containers:
-        current_project = container.labels.get("com.docker.compose.project", "unknown")
-        existing_info = get_project_info(current_project)
-
-        bench_dir = find_bench_directory_in_container(container) if update_bench else existing_info.get("bench_directory") if existing_info else None
-        
-        if bench_dir:
-            # Get all sites if no specific site is provided
-            sites = get_sites(container, bench_dir) if update_sites else existing_info.get("sites", []) if existing_info else []
-            
-            # Filter sites if a specific site is provided
-            if specific_site:
-                sites = [site for site in sites if site == specific_site]
-                if not sites:
-                    print(f"Site {specific_site} not found in project {current_project}")
-                    continue
-
-            apps = get_available_apps(container, bench_dir) if update_apps else existing_info.get("available_apps", []) if existing_info else []
-            
-            update_project(current_project, container.id, bench_dir, sites, apps)
-            print(f"Updated information for project: {current_project}")
-            
-            # If a specific site was updated, print its details
-            if specific_site:
-                print(f"Updated site: {specific_site}")
+        current_project = container.labels.get(PROJECT_LABEL, "unknown")
+        existing_info = get_project_info(current_project, conn=conn)
+
+        if update_bench:
+            bench_dir = get_cached_bench_dir(container.id, _container_image_id(container), conn=conn)
+        else:
+            bench_dir = existing_info.get("bench_directory") if existing_info else None
+            if not bench_dir:
+                print(f"No bench directory found for project: {current_project}")
+                results["failed"].append({"project": current_project, "container_id": container.id,
+                                          "error": "No bench directory recorded"})
+                done += 1
+                on_event(dict(results["failed"][-1], type="error", outcome="failed", done=done,
+                              total=len(containers)))
+                continue
+
+        known_fingerprint = None
+        if existing_info and bench_dir and container.id in fingerprints:
+            known_fingerprint = fingerprints[container.id][0]
+
+        projects[container.id] = (container, current_project)
+        tasks.append((container.id, functools.partial(
+            _collect_project, pool.wrap(container) if pool else container, current_project, bench_dir, existing_info,
+            specific_site, update_sites, update_apps, known_fingerprint, inventory,
+            inventory and now - inventory_times.get(container.id, float("-inf")) > inventory_max_age
+        )))
+
+    records = []
+    inventories = {}
+    discovered = []
+    refreshed = []
+    for container_id, outcome, value in _run_collections(tasks, jobs, timeout, pool):
+        container, current_project = projects[container_id]
+        entry = {"project": current_project, "container_id": container_id}
+
+        if outcome == "ok" and "inventory" in value:
+            inventories[container_id] = value["inventory"]
+
+        if outcome == "ok" and value.get("skipped"):
+            saved = max(0.0, fingerprints[container_id][1] - value["seconds"])
+            results["skipped"].append(dict(entry, bench_dir=value["bench_dir"], saved=round(saved, 3)))
+            results["time_saved"] += saved
+        elif outcome == "ok":
+            records.append({
+                "project_name": current_project,
+                "container_id": container_id,
+                "bench_dir": value["bench_dir"],
+                "sites": value["sites"],
+                "apps": value["apps"],
+                "site_apps": value["site_apps"],
+                "site_db_names": value["site_db_names"],
+            })
+            if update_bench:
+                discovered.append((container_id, _container_image_id(container), value["bench_dir"]))
+            if full_refresh and value["fingerprint"] is not None:
+                refreshed.append((container_id, value["fingerprint"], value["seconds"]))
+            results["succeeded"].append(dict(entry, bench_dir=value["bench_dir"], sites=len(value["sites"]),
+                                             apps=len(value["apps"])))
+        elif outcome == "error":
+            results["failed"].append(dict(entry, error=str(value)))
         else:
-            print(f"No bench directory found for project: {current_project}")
+            print(f"Timed out after {timeout}s refreshing project: {current_project}")
+            results["timed_out"].append(dict(entry, timeout=timeout))
+
+        if outcome == "ok":
+            key = "skipped" if value.get("skipped") else "succeeded"
+        else:
+            key = "failed" if outcome == "error" else "timed_out"
+        done += 1
+        on_event(dict(results[key][-1], type="result" if outcome == "ok" else "error", outcome=key, done=done,
+                      total=len(containers)))
+
+    if pool:
+        results["exec"] = pool.stats()
+
+    # One transaction for the whole refresh instead of one per container.
+    on_event({"type": "progress", "stage": "writing", "records": len(records)})
+    with profiling.span("update_db.write"):
+        update_projects(records, conn=conn)
+        save_inventories(inventories, conn=conn)
+        cache_bench_dirs(discovered, conn=conn)
+        save_refresh_fingerprints(refreshed, conn=conn)
+    results["time_saved"] = round(results["time_saved"], 3)
+    if results["skipped"]:
+        print(f"Skipped {len(results['skipped'])} unchanged containers, saving about {results['time_saved']}s")
+    for record in records:
+        print(f"Updated information for project: {record['project_name']}")
+        # If a specific site was updated, print its details
+        if specific_site:
+            print(f"Updated site: {specific_site}")
+
+    return results
 
 def main():
     parser = argparse.ArgumentParser(description="Update Frappe instance information in the database")
@@ -144,8 +423,17 @@ def main():
     parser.add_argument("--sites", action="store_true", help="Update sites information")
     parser.add_argument("--apps", action="store_true", help="Update available apps information")
     parser.add_argument("--all", action="store_true", help="Update all information (default if no specific update is selected)")
+    parser.add_argument("-j", "--jobs", type=int, default=4, help="Number of containers to refresh in parallel (default: 4)")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds allowed per container (default: 120, 0 disables)")
+    parser.add_argument("--force", action="store_true", help="Refresh every container, even if its fingerprint is unchanged")
+    parser.add_argument("--no-inventory", action="store_true", help="Skip collecting app versions and site sizes")
+    parser.add_argument("--no-exec-sessions", action="store_true",
+                        help="Run each command as its own exec instead of through one shell per container")
+    profiling.add_argument(parser)
+    add_stream_argument(parser)
 
     args = parser.parse_args()
+    profiling.enable_from_args(args)
 
     # Validate site update requires project specification
     if args.site and not args.project:
@@ -159,13 +447,38 @@ def main():
     if not (update_bench or update_sites or update_apps):
         update_bench = update_sites = update_apps = True
 
-    update_database(
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    refresh = functools.partial(
+        update_database,
         project_name=args.project, 
         specific_site=args.site, 
         update_bench=update_bench, 
         update_sites=update_sites, 
-        update_apps=update_apps
+        update_apps=update_apps,
+        jobs=args.jobs,
+        timeout=args.timeout or None,
+        force=args.force,
+        inventory=not args.no_inventory,
+        exec_sessions=not args.no_exec_sessions
     )
+    if not args.stream:
+        # Progress goes to stderr so stdout is only the JSON result.
+        with contextlib.redirect_stdout(sys.stderr):
+            results = refresh()
+        print(json.dumps(results))
+        return
+
+    # Per-container results were streamed as they finished; the last line only counts them.
+    def summarize(results, writer):
+        counts = {key: len(results[key]) for key in ("succeeded", "skipped", "failed", "timed_out")}
+        if "exec" in results:
+            counts["round_trips_saved"] = results["exec"]["round_trips_saved"]
+        return ("error" if results["failed"] or results["timed_out"] else "ok",
+                dict(counts, time_saved=results["time_saved"]))
+
+    run_streamed(lambda writer: refresh(on_event=writer), summarize)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,187 @@
+# workers.py
+"""Bounded thread pools with per-task timeouts, shared by the commands that fan out over containers."""
+import collections
+import contextlib
+import queue
+import threading
+import time
+
+# Default thread count for commands that fan out over containers.
+MAX_WORKERS = 8
+# Seconds a container gets to shut down cleanly before it is killed.
+STOP_GRACE_PERIOD = 10
+
+class ExecBudget:
+    """Docker execs in flight in one process, shared by foreground and background work.
+
+    Foreground work is counted while it runs (``held``) but never waits;
+    background work only starts while the total stays within its own limit
+    (``try_acquire``), so it gives way whenever the user is waiting on something.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_use = 0
+
+    def try_acquire(self, limit, count=1):
+        with self._lock:
+            if self.in_use + count > limit:
+                return False
+            self.in_use += count
+            return True
+
+    def release(self, count=1):
+        with self._lock:
+            self.in_use -= count
+
+    @contextlib.contextmanager
+    def held(self, count=1):
+        with self._lock:
+            self.in_use += count
+        try:
+            yield
+        finally:
+            self.release(count)
+
+def run_bounded(tasks, jobs, timeout):
+    """Run ``(key, func)`` tasks on at most ``jobs`` threads and yield ``(key, outcome, value)``.
+
+    ``outcome`` is "ok", "error" or "timeout". Workers are daemon threads: a
+    timed out task keeps its thread until the Docker call returns, but it no
+    longer holds a slot (a replacement worker is started), its thread exits
+    instead of taking another task, and it cannot keep the process alive on
+    exit.
+    """
+    task_queue = queue.Queue()
+    results = queue.Queue()
+    started = {}
+    # Tasks whose call has returned, and timed out tasks whose slot went to a replacement worker.
+    lock = threading.Lock()
+    finished, abandoned = set(), set()
+    for task in tasks:
+        task_queue.put(task)
+    remaining = {key for key, _ in tasks}
+
+    def worker():
+        while True:
+            try:
+                key, func = task_queue.get_nowait()
+            except queue.Empty:
+                return
+            started[key] = time.monotonic()
+            try:
+                results.put((key, "ok", func()))
+            except Exception as e:
+                results.put((key, "error", e))
+            with lock:
+                finished.add(key)
+                if key in abandoned:
+                    return
+
+    def start_worker():
+        threading.Thread(target=worker, daemon=True).start()
+
+    for _ in range(min(jobs, len(tasks))):
+        start_worker()
+
+    while remaining:
+        try:
+            key, outcome, value = results.get(timeout=0.05 if timeout else None)
+            if key in remaining:
+                remaining.discard(key)
+                yield key, outcome, value
+        except queue.Empty:
+            pass
+
+        if timeout:
+            now = time.monotonic()
+            for key in [k for k in remaining if k in started and now - started[k] > timeout]:
+                with lock:
+                    if key in finished:
+                        continue  # its result is already queued
+                    abandoned.add(key)
+                remaining.discard(key)
+                start_worker()
+                yield key, "timeout", None
+
+def run_grouped(groups, jobs, per_group, timeout):
+    """Like run_bounded for lists of tasks, with at most ``per_group`` tasks of any one list running at once.
+
+    Each group is its own queue: a worker only takes a task whose group has
+    room, so tasks waiting on a busy group hold no thread and their timeout
+    has not started. Groups take turns, least busy first.
+    """
+    condition = threading.Condition()
+    pending = [collections.deque(group) for group in groups]
+    running = [0] * len(pending)
+    group_of = {}
+    finished, abandoned = set(), set()
+    results = queue.Queue()
+    started = {}
+    remaining = {key for group in groups for key, _ in group}
+
+    def take():
+        ready = [i for i, tasks in enumerate(pending) if tasks and running[i] < per_group]
+        if not ready:
+            return None
+        index = min(ready, key=lambda i: running[i])
+        key, func = pending[index].popleft()
+        running[index] += 1
+        group_of[key] = index
+        started[key] = time.monotonic()
+        return key, func
+
+    def release(key):
+        with condition:
+            # A timed out task is released once; its late result changes nothing.
+            index = group_of.pop(key, None)
+            if index is not None:
+                running[index] -= 1
+                condition.notify_all()
+
+    def worker():
+        while True:
+            with condition:
+                task = take()
+                while task is None and any(pending):
+                    condition.wait()
+                    task = take()
+            if task is None:
+                return
+            key, func = task
+            try:
+                results.put((key, "ok", func()))
+            except Exception as e:
+                results.put((key, "error", e))
+            with condition:
+                finished.add(key)
+                if key in abandoned:
+                    return
+            release(key)
+
+    def start_worker():
+        threading.Thread(target=worker, daemon=True).start()
+
+    for _ in range(min(jobs, len(remaining))):
+        start_worker()
+
+    while remaining:
+        try:
+            key, outcome, value = results.get(timeout=0.05 if timeout else None)
+            if key in remaining:
+                remaining.discard(key)
+                yield key, outcome, value
+        except queue.Empty:
+            pass
+
+        if timeout:
+            now = time.monotonic()
+            for key in [k for k in remaining if k in started and now - started[k] > timeout]:
+                with condition:
+                    if key in finished:
+                        continue
+                    abandoned.add(key)
+                remaining.discard(key)
+                release(key)
+                start_worker()
+                yield key, "timeout", None
@@ -1,12 +1,13 @@
 import { app, BrowserWindow, ipcMain } from 'electron'
 import * as path from 'path'
-import { spawn } from 'child_process'
+import { PythonBackend } from './python-backend'
 if (require('electron-squirrel-startup')) {
   app.quit();
 }
 
 class ElectronApp {
   private mainWindow: BrowserWindow | null = null
+  private backend = new PythonBackend()
 
   constructor() {
     this.initApp()
@@ -16,6 +17,7 @@ class ElectronApp {
     app.on('ready', this.createWindow.bind(this))
     
     app.on('window-all-closed', () => {
+      this.backend.stop()
       if (process.platform !== 'darwin') {
         app.quit()
       }
@@ -58,108 +60,66 @@ class ElectronApp {
     ipcMain.handle('create-frappe-instance', this.createFrappeInstance.bind(this))
     ipcMain.handle('list-frappe-instances', this.listFrappeInstances.bind(this))
     ipcMain.handle('delete-frappe-instance', this.deleteFrappeInstance.bind(this))
+    ipcMain.handle('bulk-lifecycle', this.bulkLifecycle.bind(this))
     ipcMain.handle('run-frappe-command', this.runFrappeCommand.bind(this))
+    ipcMain.handle('subscribe-instances', this.subscribeInstances.bind(this))
+    ipcMain.handle('view-project', this.viewProject.bind(this))
+
+    // Instance state changes pushed by the backend watcher go straight to the UI.
+    this.backend.on('notification', (method: string, params: any) => {
+      if (method === 'instance_changed' || method === 'instance_removed') {
+        this.mainWindow?.webContents.send('instance-event', params)
+      } else if (method === 'delete_progress') {
+        this.mainWindow?.webContents.send('delete-progress', params)
+      } else if (method === 'backup_progress') {
+        this.mainWindow?.webContents.send('backup-progress', params)
+      } else if (method === 'lifecycle_progress') {
+        this.mainWindow?.webContents.send('lifecycle-progress', params)
+      } else if (method === 'refresh_progress') {
+        this.mainWindow?.webContents.send('refresh-progress', params)
+      } else if (method === 'background_refresh') {
+        this.mainWindow?.webContents.send('background-refresh', params)
+      } else if (method.startsWith('pull_')) {
+        this.mainWindow?.webContents.send('pull-progress', params)
+      }
+    })
   }
 
   private async findAvailablePort(event: Electron.IpcMainInvokeEvent, startPort: number = 8000): Promise<number> {
-    const pythonProcess = spawn('python', [
-      path.join(__dirname, '../../backend/port_scanner.py'), 
-      startPort.toString()
-    ])
-
-    return new Promise((resolve, reject) => {
-      pythonProcess.stdout.on('data', (data: Buffer) => {
-        resolve(parseInt(data.toString().trim()))
-      })
-
-      pythonProcess.stderr.on('data', (error: Buffer) => {
-        reject(error.toString())
-      })
-    })
+    return this.backend.call<number>('find_available_port', { start_port: startPort })
   }
 
   private async createFrappeInstance(event: Electron.IpcMainInvokeEvent, instanceConfig: any): Promise<string> {
-    const pythonProcess = spawn('python', [
-      path.join(__dirname, '../../backend/create_instance.py'),
-      JSON.stringify(instanceConfig)
-    ])
-
-    return new Promise((resolve, reject) => {
-      pythonProcess.stdout.on('data', (data: Buffer) => {
-        resolve(data.toString().trim())
-      })
-
-      pythonProcess.stderr.on('data', (error: Buffer) => {
-        reject(error.toString())
-      })
-    })
+    const result = await this.backend.call('create_frappe_instance', { config: instanceConfig })
+    return JSON.stringify(result)
   }
 
   private async listFrappeInstances(): Promise<any[]> {
-    const pythonProcess = spawn('python', [
-      path.join(__dirname, '../../backend/list_instances.py')
-    ])
-
-    return new Promise((resolve, reject) => {
-      pythonProcess.stdout.on('data', (data: Buffer) => {
-        try {
-          const instances = JSON.parse(data.toString().trim());
-          resolve(instances);
-        } catch (error) {
-          reject(`Error parsing JSON: ${error}`);
-        }
-      })
-
-      pythonProcess.stderr.on('data', (error: Buffer) => {
-        reject(error.toString())
-      })
-    })
+    return this.backend.call<any[]>('list_docker_compose_projects')
   }
 
   private async deleteFrappeInstance(event: Electron.IpcMainInvokeEvent, projectName: string): Promise<void> {
-    const pythonProcess = spawn('python', [
-      path.join(__dirname, '../../backend/delete_instance.py'),
-      projectName
-    ])
-
-    return new Promise((resolve, reject) => {
-      pythonProcess.stdout.on('data', (data: Buffer) => {
-        console.log(`Delete instance output: ${data.toString().trim()}`)
-        resolve()
-      })
-
-      pythonProcess.stderr.on('data', (error: Buffer) => {
-        console.error(`Delete instance error: ${error.toString().trim()}`)
-        reject(error.toString())
-      })
-    })
+    const result = await this.backend.call('delete_frappe_instance', { project_name: projectName })
+    console.log(`Delete instance output: ${JSON.stringify(result)}`)
   }
 
-  private runFrappeCommand(event: Electron.IpcMainInvokeEvent, args: string[]): Promise<string> {
-    return new Promise((resolve, reject) => {
-      const scriptPath = path.join(__dirname, '..', '..', 'backend', 'frappe_instance_info.py');
-      console.log('Executing Python script with args:', args); // For debugging
-      const pythonProcess = spawn('python', [scriptPath, ...args]);
-
-      let output = '';
-      let errorOutput = '';
+  private async bulkLifecycle(event: Electron.IpcMainInvokeEvent, action: string, projectNames: string[]): Promise<any> {
+    return this.backend.call('bulk_lifecycle', { action, projects: projectNames })
+  }
 
-      pythonProcess.stdout.on('data', (data) => {
-        output += data.toString();
-      });
+  private async subscribeInstances(): Promise<any[]> {
+    return this.backend.call<any[]>('subscribe_instances')
+  }
 
-      pythonProcess.stderr.on('data', (data) => {
-        errorOutput += data.toString();
-      });
+  // Starts background refreshes on first use; the viewed project is kept freshest.
+  private async viewProject(event: Electron.IpcMainInvokeEvent, projectName: string | null): Promise<any> {
+    return this.backend.call('view_project', { project_name: projectName })
+  }
 
-      pythonProcess.on('close', (code) => {
-        if (code === 0) {
-          resolve(output);
-        } else {
-          reject(new Error(`Python script exited with code ${code}. Error: ${errorOutput}`));
-        }
-      });
-    });
+  private async runFrappeCommand(event: Electron.IpcMainInvokeEvent, args: string[]): Promise<string> {
+    console.log('Executing instance info query with args:', args); // For debugging
+    const result = await this.backend.call('instance_info', { args })
+    return JSON.stringify(result, null, 2)
   }
 }
 
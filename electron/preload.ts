@@ -5,7 +5,17 @@ interface ElectronAPI {
   createFrappeInstance: (instanceConfig: any) => Promise<string>
   listFrappeInstances: () => Promise<any[]>
   deleteFrappeInstance: (projectName: string) => Promise<void>
+  bulkLifecycle: (action: 'start' | 'stop' | 'restart', projectNames: string[]) => Promise<any>
   runFrappeCommand: (args: string[]) => Promise<string>
+  subscribeInstances: () => Promise<any[]>
+  viewProject: (projectName: string | null) => Promise<any>
+  onInstanceEvent: (callback: (event: any) => void) => () => void
+  onDeleteProgress: (callback: (event: any) => void) => () => void
+  onPullProgress: (callback: (event: any) => void) => () => void
+  onRefreshProgress: (callback: (event: any) => void) => () => void
+  onLifecycleProgress: (callback: (event: any) => void) => () => void
+  onBackupProgress: (callback: (event: any) => void) => () => void
+  onBackgroundRefresh: (callback: (event: any) => void) => () => void
 }
 
 const electronAPI: ElectronAPI = {
@@ -13,7 +23,46 @@ const electronAPI: ElectronAPI = {
   createFrappeInstance: (instanceConfig: any) => ipcRenderer.invoke('create-frappe-instance', instanceConfig),
   listFrappeInstances: () => ipcRenderer.invoke('list-frappe-instances'),
   deleteFrappeInstance: (projectName: string) => ipcRenderer.invoke('delete-frappe-instance', projectName),
+  bulkLifecycle: (action: 'start' | 'stop' | 'restart', projectNames: string[]) =>
+    ipcRenderer.invoke('bulk-lifecycle', action, projectNames),
   runFrappeCommand: (args: string[]) => ipcRenderer.invoke('run-frappe-command', args),
+  subscribeInstances: () => ipcRenderer.invoke('subscribe-instances'),
+  viewProject: (projectName: string | null) => ipcRenderer.invoke('view-project', projectName),
+  onInstanceEvent: (callback: (event: any) => void) => {
+    const listener = (_event: Electron.IpcRendererEvent, change: any) => callback(change)
+    ipcRenderer.on('instance-event', listener)
+    return () => { ipcRenderer.removeListener('instance-event', listener) }
+  },
+  onDeleteProgress: (callback: (event: any) => void) => {
+    const listener = (_event: Electron.IpcRendererEvent, progress: any) => callback(progress)
+    ipcRenderer.on('delete-progress', listener)
+    return () => { ipcRenderer.removeListener('delete-progress', listener) }
+  },
+  onPullProgress: (callback: (event: any) => void) => {
+    const listener = (_event: Electron.IpcRendererEvent, progress: any) => callback(progress)
+    ipcRenderer.on('pull-progress', listener)
+    return () => { ipcRenderer.removeListener('pull-progress', listener) }
+  },
+  onRefreshProgress: (callback: (event: any) => void) => {
+    const listener = (_event: Electron.IpcRendererEvent, progress: any) => callback(progress)
+    ipcRenderer.on('refresh-progress', listener)
+    return () => { ipcRenderer.removeListener('refresh-progress', listener) }
+  },
+  onLifecycleProgress: (callback: (event: any) => void) => {
+    const listener = (_event: Electron.IpcRendererEvent, progress: any) => callback(progress)
+    ipcRenderer.on('lifecycle-progress', listener)
+    return () => { ipcRenderer.removeListener('lifecycle-progress', listener) }
+  },
+  onBackupProgress: (callback: (event: any) => void) => {
+    const listener = (_event: Electron.IpcRendererEvent, progress: any) => callback(progress)
+    ipcRenderer.on('backup-progress', listener)
+    return () => { ipcRenderer.removeListener('backup-progress', listener) }
+  },
+  onBackgroundRefresh: (callback: (event: any) => void) => {
+    const listener = (_event: Electron.IpcRendererEvent, progress: any) => callback(progress)
+    ipcRenderer.on('background-refresh', listener)
+    return () => { ipcRenderer.removeListener('background-refresh', listener) }
+  },
 }
 
 contextBridge.exposeInMainWorld('electronAPI', electronAPI)
@@ -0,0 +1,91 @@
+import * as path from 'path'
+import { EventEmitter } from 'events'
+import * as readline from 'readline'
+import { spawn, ChildProcessWithoutNullStreams } from 'child_process'
+
+interface PendingCall {
+  resolve: (value: any) => void
+  reject: (reason: Error) => void
+}
+
+// Client for backend/backend_server.py: one long-lived Python process that
+// answers JSON-RPC requests over stdio, started on first use. Notifications
+// pushed by the backend are emitted as 'notification' (method, params).
+export class PythonBackend extends EventEmitter {
+  private process: ChildProcessWithoutNullStreams | null = null
+  private pending = new Map<number, PendingCall>()
+  private nextId = 1
+
+  constructor(private scriptPath: string = path.join(__dirname, '../../backend/backend_server.py')) {
+    super()
+  }
+
+  call<T = any>(method: string, params: Record<string, any> = {}): Promise<T> {
+    const backend = this.ensureStarted()
+    const id = this.nextId++
+
+    return new Promise<T>((resolve, reject) => {
+      this.pending.set(id, { resolve, reject })
+      backend.stdin.write(JSON.stringify({ jsonrpc: '2.0', id, method, params }) + '\n')
+    })
+  }
+
+  stop(): void {
+    if (this.process) {
+      this.process.stdin.end()
+      this.process = null
+    }
+  }
+
+  private ensureStarted(): ChildProcessWithoutNullStreams {
+    if (this.process) {
+      return this.process
+    }
+
+    const backend = spawn('python', [this.scriptPath])
+    this.process = backend
+
+    readline.createInterface({ input: backend.stdout }).on('line', (line: string) => {
+      let response: any
+      try {
+        response = JSON.parse(line)
+      } catch (error) {
+        console.error(`Backend sent invalid JSON: ${line}`)
+        return
+      }
+
+      if (response.id === undefined && response.method) {
+        this.emit('notification', response.method, response.params)
+        return
+      }
+
+      const call = this.pending.get(response.id)
+      if (!call) {
+        return
+      }
+      this.pending.delete(response.id)
+      if (response.error) {
+        call.reject(new Error(response.error.message))
+      } else {
+        call.resolve(response.result)
+      }
+    })
+
+    backend.stderr.on('data', (data: Buffer) => {
+      console.log(`Backend: ${data.toString().trim()}`)
+    })
+
+    backend.on('exit', (code) => {
+      // Fail whatever was in flight; the next call starts a fresh process.
+      if (this.process === backend) {
+        this.process = null
+      }
+      for (const call of this.pending.values()) {
+        call.reject(new Error(`Python backend exited with code ${code}`))
+      }
+      this.pending.clear()
+    })
+
+    return backend
+  }
+}
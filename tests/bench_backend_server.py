@@ -0,0 +1,115 @@
+"""Startup/latency benchmark: one interpreter per call vs the long-lived backend server.
+
+Run from the repository root:
+
+    python tests/bench_backend_server.py [--calls N]
+
+Only read-only methods are timed so the benchmark is safe to run on a machine
+with real instances.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+# method name -> (script command line for the spawn path, server params)
+CASES = {
+    "find_available_port": (["port_scanner.py", "8000"], {"start_port": 8000}),
+    "get_all_projects_info": (["frappe_instance_info.py"], {}),
+}
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        "calls": len(samples),
+        "mean_ms": round(statistics.mean(samples) * 1000, 2),
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 2),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 2),
+    }
+
+
+def bench_spawn(script_args, calls):
+    samples = []
+    failures = 0
+    for _ in range(calls):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, *script_args], cwd=BACKEND_DIR, capture_output=True, text=True)
+        samples.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            failures += 1
+    return dict(summarize(samples), failures=failures)
+
+
+class ServerProcess:
+    def __init__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, "backend_server.py"],
+            cwd=BACKEND_DIR,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            bufsize=1,
+        )
+        self.next_id = 1
+
+    def call(self, method, params=None):
+        request = {"jsonrpc": "2.0", "id": self.next_id, "method": method, "params": params or {}}
+        self.next_id += 1
+        self.process.stdin.write(json.dumps(request) + "\n")
+        self.process.stdin.flush()
+        return json.loads(self.process.stdout.readline())
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+
+def bench_server(method, params, calls, server):
+    samples = []
+    failures = 0
+    for _ in range(calls):
+        start = time.perf_counter()
+        response = server.call(method, params)
+        samples.append(time.perf_counter() - start)
+        if "error" in response:
+            failures += 1
+    return dict(summarize(samples), failures=failures)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-call spawn latency with the backend server")
+    parser.add_argument("--calls", type=int, default=20, help="Calls per method and path (default: 20)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    server = ServerProcess()
+    server.call("ping")
+    startup_ms = round((time.perf_counter() - start) * 1000, 2)
+
+    results = {"server_startup_ms": startup_ms, "methods": {}}
+    try:
+        for method, (script_args, params) in CASES.items():
+            # Warm the server path once so the first-use import is not counted per call.
+            server.call(method, params)
+            results["methods"][method] = {
+                "spawn": bench_spawn(script_args, args.calls),
+                "server": bench_server(method, params, args.calls, server),
+            }
+            spawn_mean = results["methods"][method]["spawn"]["mean_ms"]
+            server_mean = results["methods"][method]["server"]["mean_ms"]
+            results["methods"][method]["speedup"] = round(spawn_mean / server_mean, 1) if server_mean else None
+    finally:
+        server.close()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Count Docker exec round-trips spent on bench discovery, before and after.
+
+Run from the repository root:
+
+    python tests/bench_bench_discovery.py [--apps N] [--sites N]
+
+"legacy" is the per-directory ``test`` search update_db used before discovery
+moved to a single find; "single_exec" is the current implementation with an
+empty cache, "cached" is a second refresh of the same container. The legacy
+count varies between runs because it walked the search roots in set order.
+"""
+import argparse
+import contextlib
+import io
+import json
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import db_operations
+import update_db
+from fake_docker import FakeContainer, bench_files
+
+
+def legacy_find_bench_directory_in_container(container):
+    search_roots = ["/home/frappe", "/workspace", "/frappe", "/app"]
+    for search_root in set(search_roots):
+        exit_code, _ = container.exec_run(f"test -d {search_root}")
+        if exit_code != 0:
+            continue
+        exit_code, output = container.exec_run(f"find {search_root} -maxdepth 3 -type d -not -path '*/\\.*'")
+        if exit_code != 0:
+            continue
+        for dirpath in output.decode("utf-8").splitlines():
+            checks = [
+                f"test -d {dirpath}/sites",
+                f"test -d {dirpath}/apps",
+                f"test -f {dirpath}/sites/common_site_config.json",
+            ]
+            if all(container.exec_run(check)[0] == 0 for check in checks):
+                return dirpath
+    return None
+
+
+def make_container(apps, sites, exec_latency):
+    # frappe_docker devcontainer layout: the bench lives under
+    # /workspace/development while /home/frappe holds tooling directories.
+    bench_dir = "/workspace/development/frappe-bench"
+    app_names = [f"app_{i}" for i in range(apps)]
+    site_names = [f"site{i}.localhost" for i in range(sites)]
+    files = bench_files(bench_dir, sites=site_names, apps=app_names)
+    for app in app_names:
+        files += [f"{bench_dir}/apps/{app}/{app}/public/.keep", f"{bench_dir}/apps/{app}/{app}/hooks.py"]
+    files += [f"{bench_dir}/env/bin/python", f"{bench_dir}/logs/web.log"]
+    files += [f"/home/frappe/tools/tool_{i}/bin/run" for i in range(20)]
+    return FakeContainer("bench-1", project="bench", files=files, exec_latency=exec_latency)
+
+
+def measure(label, find, container):
+    container.exec_calls.clear()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        bench_dir = find(container)
+    return {
+        "label": label,
+        "bench_dir": bench_dir,
+        "exec_calls": len(container.exec_calls),
+        "seconds": round(time.perf_counter() - start, 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bench discovery exec round-trip benchmark")
+    parser.add_argument("--apps", type=int, default=10)
+    parser.add_argument("--sites", type=int, default=5)
+    parser.add_argument("--exec-latency", type=float, default=0.0, help="Simulated seconds per exec")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(":memory:")
+    with contextlib.closing(conn):
+        db_operations.init_db(conn)
+
+        container = make_container(args.apps, args.sites, args.exec_latency)
+        results = [
+            measure("legacy", legacy_find_bench_directory_in_container, container),
+            measure("single_exec", lambda c: update_db.find_bench_directory_in_container(c, conn=conn), container),
+            measure("cached", lambda c: update_db.find_bench_directory_in_container(c, conn=conn), container),
+        ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Benchmark the project readers against the old cross-product queries.
+
+Run from the repository root:
+
+    python tests/bench_db_queries.py [--projects 500] [--sites 20] [--apps 30]
+
+"legacy" replays the GROUP_CONCAT queries get_project_info and
+get_all_projects_info used before the set-based query layer; "current" runs
+the readers with the query cache cleared and "cached" with it warm.
+"""
+import argparse
+import json
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import db_operations
+
+
+def legacy_get_project_info(conn, project_name):
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    cursor.execute('''
+    SELECT c.bench_dir, s.name as site_name, GROUP_CONCAT(DISTINCT a.name) as apps
+    FROM projects p
+    JOIN containers c ON p.id = c.project_id
+    LEFT JOIN sites s ON c.id = s.container_id
+    LEFT JOIN apps a ON c.id = a.container_id
+    WHERE p.name = ?
+    GROUP BY c.id, s.id
+    ''', (project_name,))
+    rows = cursor.fetchall()
+    result = {"bench_directory": rows[0]['bench_dir'], "sites": [], "available_apps": set()}
+    for row in rows:
+        if row['site_name']:
+            result["sites"].append(row['site_name'])
+        if row['apps']:
+            result["available_apps"].update(row['apps'].split(','))
+    return result
+
+
+def legacy_get_all_projects_info(conn):
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    cursor.execute('''
+    SELECT p.name as project_name, c.bench_dir, s.name as site_name, GROUP_CONCAT(DISTINCT a.name) as apps
+    FROM projects p
+    JOIN containers c ON p.id = c.project_id
+    LEFT JOIN sites s ON c.id = s.container_id
+    LEFT JOIN apps a ON c.id = a.container_id
+    GROUP BY p.id, c.id, s.id
+    ''')
+    projects = {}
+    for row in cursor.fetchall():
+        project = projects.setdefault(row['project_name'], {"bench_directory": row['bench_dir'], "sites": [],
+                                                            "available_apps": set()})
+        if row['site_name']:
+            project["sites"].append(row['site_name'])
+        if row['apps']:
+            project["available_apps"].update(row['apps'].split(','))
+    return {"projects": projects}
+
+
+def populate(conn, projects, sites, apps):
+    app_names = [f"app_{k}" for k in range(apps)]
+    records = []
+    for i in range(projects):
+        site_names = [f"site{j}.project{i}.localhost" for j in range(sites)]
+        records.append({
+            "project_name": f"project{i}",
+            "container_id": f"{i:064x}",
+            "bench_dir": "/home/frappe/frappe-bench",
+            "sites": site_names,
+            "apps": app_names,
+            # Each site has a different subset installed.
+            "site_apps": {site: app_names[:1 + (j * 7) % apps] for j, site in enumerate(site_names)},
+        })
+    db_operations.update_projects(records, conn=conn)
+
+
+def timed(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return round(statistics.median(samples) * 1000, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Project reader benchmark")
+    parser.add_argument("--projects", type=int, default=500)
+    parser.add_argument("--sites", type=int, default=20)
+    parser.add_argument("--apps", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = db_operations.configure_connection(sqlite3.connect(str(Path(tmp) / "bench.db")))
+        db_operations.init_db(conn)
+        populate(conn, args.projects, args.sites, args.apps)
+
+        target = f"project{args.projects // 2}"
+
+        def uncached(func):
+            def run():
+                db_operations.project_cache.invalidate()
+                func()
+            return run
+
+        get_one = lambda: db_operations.get_project_info(target, conn=conn)
+        get_all = lambda: db_operations.get_all_projects_info(conn=conn)
+        results = {
+            "get_project_info_ms": {
+                "legacy": timed(lambda: legacy_get_project_info(conn, target), args.repeat * 10),
+                "current": timed(uncached(get_one), args.repeat * 10),
+                "cached": timed(get_one, args.repeat * 10),
+            },
+            "get_all_projects_info_ms": {
+                "legacy": timed(lambda: legacy_get_all_projects_info(conn), args.repeat),
+                "current": timed(uncached(get_all), args.repeat),
+                "cached": timed(get_all, args.repeat),
+            },
+        }
+        conn.close()
+
+    for timings in results.values():
+        timings["speedup"] = round(timings["legacy"] / timings["current"], 1) if timings["current"] else None
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Microbenchmark: refreshing 1,000 synthetic projects into the SQLite cache.
+
+Run from the repository root:
+
+    python tests/bench_db_writes.py [--projects N] [--sites N] [--apps N]
+
+"legacy" replays the old per-project update_project (one connection and
+commit per project, row-by-row INSERT OR REPLACE); "bulk" is update_projects
+on a WAL connection. Each is timed for the initial load and for a refresh in
+which 10% of the projects gained a site.
+"""
+import argparse
+import json
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import db_operations
+
+
+def legacy_update_project(db_file, project_name, container_id, bench_dir, sites, apps):
+    conn = sqlite3.connect(db_file)
+    cursor = conn.cursor()
+    cursor.execute('INSERT OR IGNORE INTO projects (name) VALUES (?)', (project_name,))
+    cursor.execute('SELECT id FROM projects WHERE name = ?', (project_name,))
+    project_id = cursor.fetchone()[0]
+    cursor.execute('INSERT OR REPLACE INTO containers (project_id, container_id, bench_dir) VALUES (?, ?, ?)',
+                   (project_id, container_id, bench_dir))
+    container_db_id = cursor.lastrowid
+    cursor.execute('DELETE FROM sites WHERE container_id = ?', (container_db_id,))
+    for site in set(sites):
+        cursor.execute('INSERT OR IGNORE INTO sites (container_id, name) VALUES (?, ?)', (container_db_id, site))
+    cursor.execute('DELETE FROM apps WHERE container_id = ?', (container_db_id,))
+    for app in set(apps):
+        cursor.execute('INSERT OR IGNORE INTO apps (container_id, name) VALUES (?, ?)', (container_db_id, app))
+    conn.commit()
+    conn.close()
+
+
+def synthetic_projects(count, sites, apps, generation=0):
+    records = []
+    for i in range(count):
+        site_names = [f"site{j}.project{i}.localhost" for j in range(sites)]
+        if generation and i % 10 == 0:
+            site_names.append(f"new{generation}.project{i}.localhost")
+        records.append({
+            "project_name": f"project{i}",
+            "container_id": f"{i:064x}",
+            "bench_dir": "/home/frappe/frappe-bench",
+            "sites": site_names,
+            "apps": [f"app_{k}" for k in range(apps)],
+        })
+    return records
+
+
+def time_legacy(db_file, records):
+    start = time.perf_counter()
+    for r in records:
+        legacy_update_project(db_file, r["project_name"], r["container_id"], r["bench_dir"], r["sites"], r["apps"])
+    return time.perf_counter() - start
+
+
+def time_bulk(db_file, records):
+    start = time.perf_counter()
+    conn = db_operations.configure_connection(sqlite3.connect(db_file))
+    db_operations.update_projects(records, conn=conn)
+    conn.close()
+    return time.perf_counter() - start
+
+
+def row_count(db_file):
+    conn = sqlite3.connect(db_file)
+    counts = {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in ("containers", "sites", "apps")}
+    conn.close()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk SQLite write microbenchmark")
+    parser.add_argument("--projects", type=int, default=1000)
+    parser.add_argument("--sites", type=int, default=5)
+    parser.add_argument("--apps", type=int, default=10)
+    args = parser.parse_args()
+
+    initial = synthetic_projects(args.projects, args.sites, args.apps)
+    refresh = synthetic_projects(args.projects, args.sites, args.apps, generation=1)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, timer in (("legacy", time_legacy), ("bulk", time_bulk)):
+            db_file = str(Path(tmp) / f"{label}.db")
+            conn = sqlite3.connect(db_file)
+            db_operations.init_db(conn)
+            conn.close()
+            results[label] = {
+                "initial_seconds": round(timer(db_file, initial), 3),
+                "refresh_seconds": round(timer(db_file, refresh), 3),
+                "rows": row_count(db_file),
+            }
+    results["speedup"] = {
+        phase: round(results["legacy"][phase] / results["bulk"][phase], 1)
+        for phase in ("initial_seconds", "refresh_seconds")
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
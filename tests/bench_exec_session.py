@@ -0,0 +1,59 @@
+"""Benchmark: a cold refresh with one exec per command versus pooled exec sessions.
+
+Run from the repository root:
+
+    python tests/bench_exec_session.py [--projects 50] [--request-latency 0.002] [--jobs 4]
+
+The fake engine charges ``--request-latency`` per Docker API request: three
+for an exec_run, two to open a session and one per batch written to it.
+Reported for each mode: wall seconds, API requests made and commands run,
+plus the session stats update_database returns.
+"""
+import argparse
+import contextlib
+import io
+import json
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import db_operations
+import update_db
+from bench_suite import make_client
+
+
+def refresh(args, exec_sessions):
+    client = make_client(args.projects, args.sites, args.apps, 3 * args.request_latency, args.request_latency)
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    db_operations.init_db(conn)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = update_db.update_database(client=client, conn=conn, jobs=args.jobs, exec_sessions=exec_sessions)
+    seconds = time.perf_counter() - start
+    conn.close()
+    report = {"seconds": round(seconds, 3), "api_requests": client.api_calls + 3 * sum(
+        len(c.exec_calls) for c in client.container_list if not c.shells), "commands": client.exec_count}
+    if "exec" in results:
+        report["sessions"] = results["exec"]
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exec session benchmark")
+    parser.add_argument("--projects", type=int, default=50)
+    parser.add_argument("--sites", type=int, default=5)
+    parser.add_argument("--apps", type=int, default=4)
+    parser.add_argument("--request-latency", type=float, default=0.002, help="Simulated seconds per API request")
+    parser.add_argument("--jobs", type=int, default=4)
+    args = parser.parse_args()
+
+    report = {"exec_run": refresh(args, False), "sessions": refresh(args, True)}
+    report["speedup"] = round(report["exec_run"]["seconds"] / report["sessions"]["seconds"], 2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Benchmark list_docker_compose_projects against a stubbed Docker API.
+
+Run from the repository root:
+
+    python tests/bench_list_instances.py [--containers 1000] [--frappe 40] [--api-latency 0.0005]
+
+The host runs ``--containers`` containers, of which ``--frappe`` belong to
+Frappe projects. "legacy" is the listing used before label filtering moved
+into the daemon: list every container (the SDK inspects each one) and filter
+by label in Python. Every stubbed API call sleeps ``--api-latency`` seconds.
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from list_instances import get_host_ports, list_docker_compose_projects
+from fake_docker import FakeContainer, FakeDockerClient
+
+
+def legacy_list_docker_compose_projects(client, service_name="frappe"):
+    projects = {}
+    for container in client.containers.list(all=True):
+        labels = container.labels
+        project_name = labels.get('com.docker.compose.project', None)
+        if labels.get('com.docker.compose.service', None) == service_name and project_name:
+            if project_name not in projects:
+                projects[project_name] = {"ports": [], "status": container.status}
+            for host_port in get_host_ports(container.attrs):
+                if host_port not in projects[project_name]["ports"]:
+                    projects[project_name]["ports"].append(host_port)
+    return [{"projectName": n, "ports": d["ports"], "status": d["status"]} for n, d in projects.items()]
+
+
+def make_containers(total, frappe):
+    containers = []
+    for i in range(frappe):
+        status = "exited" if i % 5 == 0 else "running"
+        containers.append(FakeContainer(f"bench{i}-frappe-1", project=f"bench{i}", status=status,
+                                        ports={"8000/tcp": 8000 + i}))
+    for i in range(total - frappe):
+        containers.append(FakeContainer(f"ci-job-{i}", project=f"ci{i % 50}", service="worker"))
+    return containers
+
+
+def measure(label, func, client):
+    client.api_calls = 0
+    start = time.perf_counter()
+    projects = func(client)
+    return {
+        "label": label,
+        "projects": len(projects),
+        "api_calls": client.api_calls,
+        "seconds": round(time.perf_counter() - start, 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Container listing benchmark")
+    parser.add_argument("--containers", type=int, default=1000)
+    parser.add_argument("--frappe", type=int, default=40)
+    parser.add_argument("--api-latency", type=float, default=0.0005, help="Simulated seconds per API call")
+    args = parser.parse_args()
+
+    client = FakeDockerClient(make_containers(args.containers, args.frappe), api_latency=args.api_latency)
+    results = [
+        measure("legacy", legacy_list_docker_compose_projects, client),
+        measure("filtered_summary", lambda c: list_docker_compose_projects(client=c), client),
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Latency benchmark for db_operations.search at 10,000 sites.
+
+Run from the repository root:
+
+    python tests/bench_search.py [--projects 1000] [--sites 10] [--apps 6] [--runs 50]
+
+The cache is filled with synthetic projects through update_projects (so the
+index is maintained the way a refresh keeps it) and each query is run ``--runs`` times with
+the query cache cleared. Reported per query: total matches and p50/p95
+milliseconds, next to filtering get_all_projects_info in Python, which is what
+the UI had to do before.
+"""
+import argparse
+import json
+import math
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import db_operations
+
+QUERIES = {
+    "site substring": dict(query="site7.project42"),
+    "site glob": dict(query="*.project99.*", mode="glob", kinds=["site"]),
+    "app prefix": dict(query="app_3", mode="prefix", kinds=["app"]),
+    "project prefix, page 3": dict(query="project1", mode="prefix", kinds=["project"], offset=100),
+    "bench path": dict(query="bench-42", kinds=["bench"]),
+    "two characters": dict(query="s7"),
+    "no match": dict(query="nothing-like-this"),
+}
+
+
+def populate(conn, projects, sites, apps):
+    db_operations.update_projects([
+        {"project_name": f"project{i}", "container_id": f"{i:064x}",
+         "bench_dir": f"/home/frappe/bench-{i}",
+         "sites": [f"site{j}.project{i}.localhost" for j in range(sites)],
+         "apps": ["frappe"] + [f"app_{k}" for k in range(apps - 1)]}
+        for i in range(projects)
+    ], conn=conn)
+
+
+def percentiles(samples):
+    samples = sorted(s * 1000 for s in samples)
+    return {"p50_ms": round(statistics.median(samples), 3),
+            "p95_ms": round(samples[max(0, math.ceil(len(samples) * 0.95) - 1)], 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search index latency benchmark")
+    parser.add_argument("--projects", type=int, default=1000)
+    parser.add_argument("--sites", type=int, default=10)
+    parser.add_argument("--apps", type=int, default=6)
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = db_operations.configure_connection(sqlite3.connect(str(Path(tmp) / "search.db")))
+        db_operations.init_db(conn)
+        start = time.perf_counter()
+        populate(conn, args.projects, args.sites, args.apps)
+        report = {"sites": args.projects * args.sites, "populate_seconds": round(time.perf_counter() - start, 3),
+                  "queries": {}}
+
+        for name, params in QUERIES.items():
+            samples = []
+            for _ in range(args.runs):
+                db_operations.project_cache.invalidate()
+                start = time.perf_counter()
+                result = db_operations.search(limit=50, conn=conn, **params)
+                samples.append(time.perf_counter() - start)
+            report["queries"][name] = dict(total=result["total"], **percentiles(samples))
+
+        samples = []
+        for _ in range(max(1, args.runs // 10)):
+            db_operations.project_cache.invalidate()
+            start = time.perf_counter()
+            projects = db_operations.get_all_projects_info(conn=conn)["projects"]
+            [site for info in projects.values() for site in info["sites"] if "site7.project42" in site]
+            samples.append(time.perf_counter() - start)
+        report["queries"]["site substring, filtered in Python"] = percentiles(samples)
+        conn.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Benchmark: restoring a 10,000-site inventory from a snapshot versus a live refresh.
+
+Run from the repository root:
+
+    python tests/bench_snapshot.py [--projects 1000] [--sites 10] [--exec-latency 0.001]
+
+A FakeDockerClient with ``--projects`` benches of ``--sites`` sites each is
+refreshed into one database with update_database; that inventory is exported
+and then imported into an empty database. Reported: the refresh, export and
+import times, the snapshot size and the import speedup over the refresh.
+"""
+import argparse
+import contextlib
+import io
+import json
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import db_operations
+import update_db
+from snapshot import export_snapshot, import_snapshot
+from bench_suite import make_client
+
+
+def new_conn(path):
+    conn = db_operations.configure_connection(sqlite3.connect(str(path), check_same_thread=False))
+    db_operations.init_db(conn)
+    return conn
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Snapshot import benchmark")
+    parser.add_argument("--projects", type=int, default=1000)
+    parser.add_argument("--sites", type=int, default=10)
+    parser.add_argument("--apps", type=int, default=4)
+    parser.add_argument("--exec-latency", type=float, default=0.001, help="Simulated seconds per exec")
+    parser.add_argument("--jobs", type=int, default=8)
+    args = parser.parse_args()
+
+    client = make_client(args.projects, args.sites, args.apps, args.exec_latency, 0.0)
+    with tempfile.TemporaryDirectory() as tmp:
+        live = new_conn(Path(tmp) / "live.db")
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            update_db.update_database(client=client, conn=live, jobs=args.jobs, inventory=False)
+        refresh_seconds = time.perf_counter() - start
+
+        path = Path(tmp) / "inventory.cwsnap"
+        start = time.perf_counter()
+        exported = export_snapshot(path, conn=live)
+        export_seconds = time.perf_counter() - start
+
+        restored = new_conn(Path(tmp) / "restored.db")
+        start = time.perf_counter()
+        import_snapshot(path, conn=restored)
+        import_seconds = time.perf_counter() - start
+
+        report = {
+            "sites": exported["sites"],
+            "refresh_seconds": round(refresh_seconds, 3),
+            "export_seconds": round(export_seconds, 3),
+            "import_seconds": round(import_seconds, 3),
+            "snapshot_bytes": path.stat().st_size,
+            "import_speedup": round(refresh_seconds / import_seconds, 1),
+        }
+        live.close()
+        restored.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Cold-start benchmark for the read-only backend scripts, with a time budget.
+
+Run from the repository root:
+
+    python tests/bench_startup.py [--runs 10] [--budget-ms 250]
+
+Each command is started ``--runs`` times as a fresh interpreter and the median
+wall time is compared against ``--budget-ms``; the script exits with status 1
+if any command is over budget or a read path pulls in the Docker SDK. The
+heaviest imports of each read path, from ``python -X importtime``, are listed
+next to what importing the Docker SDK alone costs.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parent.parent / "backend"
+
+# Read paths that must start without the Docker SDK.
+READ_MODULES = ["frappe_instance_info", "db_operations"]
+COMMANDS = {
+    "frappe_instance_info --inventory": [sys.executable, str(BACKEND / "frappe_instance_info.py"), "--inventory",
+                                         "--limit", "1"],
+    "import frappe_instance_info": [sys.executable, "-c", "import frappe_instance_info"],
+}
+
+
+def wall_ms(command, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=BACKEND, capture_output=True, check=False)
+        samples.append(time.perf_counter() - start)
+    return round(statistics.median(samples) * 1000, 1)
+
+
+def import_profile(module):
+    """``(ms to import module, {heaviest imports: cumulative ms}, names of all modules loaded)``."""
+    code = f"import sys, {module}; print(' '.join(sorted(sys.modules)))"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=BACKEND,
+                            capture_output=True, text=True)
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, ms, name = line[len("import time:"):].split("|")
+        cumulative[name.strip()] = round(int(ms) / 1000, 1)
+    heaviest = dict(sorted(cumulative.items(), key=lambda item: -item[1])[:8])
+    return cumulative.get(module), heaviest, set(result.stdout.split())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend cold-start benchmark")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, default=250.0, help="Allowed median wall time per command")
+    args = parser.parse_args()
+
+    report = {"budget_ms": args.budget_ms, "commands": {}, "imports": {}, "over_budget": [], "docker_imported": []}
+    for name, command in COMMANDS.items():
+        ms = wall_ms(command, args.runs)
+        report["commands"][name] = ms
+        if ms > args.budget_ms:
+            report["over_budget"].append(name)
+
+    for module in READ_MODULES:
+        total, heaviest, modules = import_profile(module)
+        report["imports"][module] = {"import_ms": total, "heaviest": heaviest}
+        if "docker" in modules:
+            report["docker_imported"].append(module)
+
+    docker = subprocess.run([sys.executable, "-c", "import docker"], capture_output=True)
+    report["docker_sdk_import_ms"] = import_profile("docker")[0] if docker.returncode == 0 else None
+
+    print(json.dumps(report, indent=2))
+    if report["over_budget"] or report["docker_imported"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
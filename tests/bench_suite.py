@@ -0,0 +1,193 @@
+"""Benchmark suite for the backend hot paths against the fake Docker engine.
+
+Run from the repository root:
+
+    python tests/bench_suite.py [--scales 1 10 100 500] [--exec-latency 0.001] [--save]
+
+For each scale a FakeDockerClient is built with that many Frappe projects (a
+frappe container with a bench of ``--sites`` sites and ``--apps`` apps, plus a
+mariadb container), and these are measured against a fresh SQLite file:
+
+    update_database.cold    first refresh: discovery, config archives, writes
+    update_database.warm    second refresh, skipped by fingerprint
+    list_docker_compose_projects
+    get_project_info        every project, query cache cleared
+    get_all_projects_info   query cache cleared
+    get_site_inventory      ten heaviest sites, query cache cleared
+    find_available_port     scanning past every project's published port
+
+Each result has the median milliseconds over ``--repeat`` runs and the Docker
+API calls, execs and SQL statements of one run. ``--save`` writes the results
+to the baseline file; otherwise they are compared with it, and any count that
+grew or time that slowed by more than ``--tolerance`` (and ``--min-delta-ms``)
+is reported as a regression and the script exits with status 1.
+"""
+import argparse
+import contextlib
+import io
+import json
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import db_operations
+import update_db
+from list_instances import list_docker_compose_projects
+from port_scanner import find_available_port
+from fake_docker import FakeContainer, FakeDockerClient, bench_files
+
+BASELINE = Path(__file__).resolve().parent / "baselines" / "bench_suite.json"
+BENCH_DIR = "/home/frappe/frappe-bench"
+# Clear of the usual 8000/9000/3306 so a developer's running benches don't interfere.
+BASE_PORT = 42000
+COUNTS = ("api_calls", "execs", "statements")
+
+
+def make_client(projects, sites, apps, exec_latency, api_latency):
+    app_names = ["frappe"] + [f"app_{k}" for k in range(apps - 1)]
+    containers = []
+    for i in range(projects):
+        files = bench_files(BENCH_DIR, sites=[f"site{j}.bench{i}.localhost" for j in range(sites)], apps=app_names)
+        containers.append(FakeContainer(f"bench{i}-frappe-1", project=f"bench{i}", files=files,
+                                        exec_latency=exec_latency, ports={"8000/tcp": BASE_PORT + i}))
+        containers.append(FakeContainer(f"bench{i}-mariadb-1", project=f"bench{i}", service="mariadb"))
+    return FakeDockerClient(containers, api_latency=api_latency)
+
+
+class Run:
+    """Counts one run's Docker calls, execs and statements."""
+
+    def __init__(self, client, conn):
+        self.client = client
+        self.conn = conn
+        self.statements = 0
+
+    def __enter__(self):
+        self.client.api_calls = 0
+        self.client.exec_count = 0
+        self.conn.set_trace_callback(self._trace)
+        return self
+
+    def __exit__(self, *exc):
+        self.conn.set_trace_callback(None)
+        return False
+
+    def _trace(self, statement):
+        self.statements += 1
+
+    def counts(self):
+        return {"api_calls": self.client.api_calls, "execs": self.client.exec_count, "statements": self.statements}
+
+
+def measure(func, client, conn_factory, repeat, setup=None):
+    """Median ms of ``func(conn)`` over ``repeat`` runs, with the counts of the last run."""
+    samples = []
+    counts = None
+    for _ in range(repeat):
+        conn = conn_factory()
+        if setup:
+            setup(conn)
+        db_operations.project_cache.invalidate()
+        with Run(client, conn) as run, contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            func(conn)
+            samples.append(time.perf_counter() - start)
+        counts = run.counts()
+    return dict(ms=round(statistics.median(samples) * 1000, 2), **counts)
+
+
+def run_scale(projects, args, tmp):
+    client = make_client(projects, args.sites, args.apps, args.exec_latency, args.api_latency)
+    path = Path(tmp) / f"bench{projects}.db"
+    shared = db_operations.configure_connection(sqlite3.connect(str(path), check_same_thread=False))
+    db_operations.init_db(shared)
+
+    def fresh_conn():
+        # A new database file per run, so every cold refresh starts from nothing.
+        fresh = Path(tmp) / f"cold{projects}-{time.perf_counter_ns()}.db"
+        conn = db_operations.configure_connection(sqlite3.connect(str(fresh), check_same_thread=False))
+        db_operations.init_db(conn)
+        return conn
+
+    def refresh(conn):
+        update_db.update_database(client=client, conn=conn, jobs=args.jobs)
+
+    def read_every_project(conn):
+        for i in range(projects):
+            db_operations.project_cache.invalidate()
+            db_operations.get_project_info(f"bench{i}", conn=conn)
+
+    results = {
+        "update_database.cold": measure(refresh, client, fresh_conn, args.repeat),
+        "update_database.warm": measure(refresh, client, lambda: shared, args.repeat, setup=refresh),
+        "list_docker_compose_projects": measure(lambda conn: list_docker_compose_projects(client=client),
+                                                client, lambda: shared, args.repeat),
+        "get_project_info": measure(read_every_project, client, lambda: shared, args.repeat),
+        "get_all_projects_info": measure(lambda conn: db_operations.get_all_projects_info(conn=conn),
+                                         client, lambda: shared, args.repeat),
+        "get_site_inventory": measure(lambda conn: db_operations.get_site_inventory(limit=10, conn=conn),
+                                      client, lambda: shared, args.repeat),
+        "find_available_port": measure(lambda conn: find_available_port(BASE_PORT, client=client, conn=conn),
+                                       client, lambda: shared, args.repeat),
+    }
+    shared.close()
+    return results
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """Regressions of ``results`` against ``baseline``, as readable strings."""
+    regressions = []
+    for scale, benchmarks in results.items():
+        for name, current in benchmarks.items():
+            previous = baseline.get(scale, {}).get(name)
+            if previous is None:
+                continue
+            for count in COUNTS:
+                if current[count] > previous.get(count, current[count]):
+                    regressions.append(f"{scale}/{name}: {count} {previous[count]} -> {current[count]}")
+            if current["ms"] > previous["ms"] * (1 + tolerance) and current["ms"] - previous["ms"] > min_delta_ms:
+                regressions.append(f"{scale}/{name}: {previous['ms']}ms -> {current['ms']}ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend benchmark suite on the fake Docker engine")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100, 500], help="Project counts to run")
+    parser.add_argument("--sites", type=int, default=3)
+    parser.add_argument("--apps", type=int, default=4)
+    parser.add_argument("--exec-latency", type=float, default=0.001, help="Simulated seconds per exec")
+    parser.add_argument("--api-latency", type=float, default=0.0002, help="Simulated seconds per API call")
+    parser.add_argument("--jobs", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--save", action="store_true", help="Write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Allowed slowdown before a time regresses")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0, help="Ignore slowdowns smaller than this")
+    args = parser.parse_args()
+
+    config = {key: getattr(args, key) for key in ("sites", "apps", "exec_latency", "api_latency", "jobs", "repeat")}
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {str(scale): run_scale(scale, args, tmp) for scale in args.scales}
+    report = {"config": config, "results": results}
+
+    if args.save:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(report, indent=2) + "\n")
+    elif args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text())
+        if baseline.get("config") != config:
+            report["warning"] = "baseline was recorded with different settings; times are not comparable"
+        report["regressions"] = compare(results, baseline["results"], args.tolerance, args.min_delta_ms)
+
+    print(json.dumps(report, indent=2))
+    if report.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,962 @@
+"""In-process stand-in for the parts of the Docker SDK the backend uses.
+
+Containers carry an in-memory filesystem and answer ``exec_run`` for the small
+set of commands the backend issues (``test``, ``find``, ``tar``, ``ls``
+pipelines), so tests and benchmarks can count exec round-trips without a
+Docker daemon. The same commands can be sent down an attached ``sh`` exec the
+way exec_session frames them. A small registry serves image pulls with the
+progress messages Docker streams.
+"""
+import fnmatch
+import hashlib
+import io
+import json
+import os
+import posixpath
+import re
+import shlex
+import struct
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+from collections import namedtuple
+
+ExecResult = namedtuple("ExecResult", ["exit_code", "output"])
+# A shell feeding an environment variable to a command's stdin, as backup.STDIN_FROM_ENV does.
+_STDIN_FROM_ENV = re.compile(r'printf "%s\\n" "\$(\w+)" \| \(unset \1; exec "\$@"\)')
+
+
+def _bytes(output):
+    # Commands answer in text, except the few (tar) that write binary.
+    return output if isinstance(output, bytes) else output.encode()
+
+
+class FakeFilesystem:
+    """A set of absolute paths; every parent of a file is implicitly a directory."""
+
+    def __init__(self, files=()):
+        self.files = {}
+        self.dirs = {"/"}
+        # Directory mtimes, bumped whenever an entry is added or removed.
+        self.mtimes = {}
+        self.clock = 1700000000
+        for path in files:
+            if isinstance(path, tuple):
+                self.add_file(*path)
+            else:
+                self.add_file(path)
+
+    def add_file(self, path, content=b""):
+        path = posixpath.normpath(path)
+        if path not in self.files:
+            self.touch(posixpath.dirname(path))
+        self.files[path] = content.encode() if isinstance(content, str) else content
+        self.add_dir(posixpath.dirname(path))
+
+    def add_dir(self, path):
+        path = posixpath.normpath(path)
+        while path not in self.dirs:
+            self.dirs.add(path)
+            path = posixpath.dirname(path)
+            self.touch(path)
+
+    def remove(self, path):
+        """Delete a file or a directory tree."""
+        path = posixpath.normpath(path)
+        self.files = {p: c for p, c in self.files.items() if p != path and not p.startswith(path + "/")}
+        self.dirs = {d for d in self.dirs if d != path and not d.startswith(path + "/")}
+        self.touch(posixpath.dirname(path))
+
+    def touch(self, path):
+        self.clock += 1
+        self.mtimes[posixpath.normpath(path)] = self.clock
+
+    def mtime(self, path):
+        return self.mtimes.get(posixpath.normpath(path), 0)
+
+    def is_dir(self, path):
+        return posixpath.normpath(path) in self.dirs
+
+    def is_file(self, path):
+        return posixpath.normpath(path) in self.files
+
+    def exists(self, path):
+        return self.is_dir(path) or self.is_file(path)
+
+    def listdir(self, path):
+        path = posixpath.normpath(path)
+        children = set()
+        for entry in self.dirs | set(self.files):
+            if entry != path and posixpath.dirname(entry) == path:
+                children.add(posixpath.basename(entry))
+        return sorted(children)
+
+    def walk(self, root, maxdepth):
+        """Yield (path, depth) in find(1) pre-order, down to maxdepth."""
+        yield root, 0
+        if maxdepth == 0 or not self.is_dir(root):
+            return
+        for name in self.listdir(root):
+            for entry in self.walk(posixpath.join(root, name), maxdepth - 1):
+                yield entry[0], entry[1] + 1
+
+
+class _FindExpression:
+    """Evaluator for the find(1) predicates the backend uses: -name, -path,
+    -type, -prune, -print, -print0, ! / -not, -a, -o and parentheses."""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+        self.has_action = "-print" in tokens or "-print0" in tokens
+        self.tree = self._parse_or() if tokens else ("true",)
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _next(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def _parse_or(self):
+        node = self._parse_and()
+        while self._peek() == "-o":
+            self._next()
+            node = ("or", node, self._parse_and())
+        return node
+
+    def _parse_and(self):
+        node = self._parse_not()
+        while self._peek() not in (None, "-o", ")"):
+            if self._peek() == "-a":
+                self._next()
+            node = ("and", node, self._parse_not())
+        return node
+
+    def _parse_not(self):
+        if self._peek() in ("!", "-not"):
+            self._next()
+            return ("not", self._parse_not())
+        return self._parse_primary()
+
+    def _parse_primary(self):
+        token = self._next()
+        if token == "(":
+            node = self._parse_or()
+            self._next()  # ")"
+            return node
+        if token in ("-name", "-path", "-type"):
+            return (token, self._next())
+        if token in ("-prune", "-print", "-print0"):
+            return (token,)
+        raise ValueError(f"unsupported find predicate {token}")
+
+    def evaluate(self, fs, path, state, node=None, shown=None):
+        # ``path`` is looked up in ``fs``; ``shown`` is how find prints it (relative to a relative root).
+        node = node or self.tree
+        shown = shown or path
+        kind = node[0]
+        if kind == "true":
+            return True
+        if kind == "and":
+            return (self.evaluate(fs, path, state, node[1], shown)
+                    and self.evaluate(fs, path, state, node[2], shown))
+        if kind == "or":
+            return (self.evaluate(fs, path, state, node[1], shown)
+                    or self.evaluate(fs, path, state, node[2], shown))
+        if kind == "not":
+            return not self.evaluate(fs, path, state, node[1], shown)
+        if kind == "-name":
+            return fnmatch.fnmatchcase(posixpath.basename(path), node[1])
+        if kind == "-path":
+            return fnmatch.fnmatchcase(shown, node[1])
+        if kind == "-type":
+            return fs.is_dir(path) if node[1] == "d" else fs.is_file(path)
+        if kind == "-prune":
+            state["pruned"] = True
+            return True
+        if kind in ("-print", "-print0"):
+            # Each name with its terminator.
+            state["printed"].append(shown + ("\0" if kind == "-print0" else "\n"))
+            return True
+        raise ValueError(kind)
+
+
+class FakeContainer:
+    def __init__(self, name, project=None, service="frappe", files=(), image="frappe/bench:latest",
+                 status="running", labels=None, exec_latency=0.0, client=None, commands=None, ports=None,
+                 stop_latency=0.0, usage=None, stats_latency=0.0):
+        self.name = name
+        self.id = hashlib.sha256(name.encode()).hexdigest()
+        self.image_name = image
+        self.image_id = "sha256:" + hashlib.sha256(image.encode()).hexdigest()
+        self.status = status
+        self.started_at = "2024-01-01T00:00:00.000000000Z"
+        self.labels = dict(labels or {})
+        if project:
+            self.labels.setdefault("com.docker.compose.project", project)
+        if service:
+            self.labels.setdefault("com.docker.compose.service", service)
+        self.fs = FakeFilesystem(files)
+        self.exec_latency = exec_latency
+        self.exec_calls = []
+        self.client = client
+        # program name -> callable(container, args, workdir) returning (exit_code, stdout, stderr)
+        self.commands = dict(commands or {})
+        # "80/tcp" -> host port
+        self.ports = dict(ports or {})
+        # Seconds the container's processes take to exit after SIGTERM.
+        self.stop_latency = stop_latency
+        # What stats() reports: cpu_percent, memory, memory_limit and the cumulative
+        # rx_bytes, tx_bytes, read_bytes and write_bytes counters.
+        self.usage = dict({"cpu_percent": 0.0, "memory": 0, "memory_limit": 2 * 1024 ** 3, "rx_bytes": 0,
+                           "tx_bytes": 0, "read_bytes": 0, "write_bytes": 0}, **(usage or {}))
+        # Seconds a one-shot stats() call takes (the daemon waits for a second CPU reading).
+        self.stats_latency = stats_latency
+        # Attached shells opened with exec_create/exec_start.
+        self.shells = []
+        # What the container was created with.
+        self.environment = {}
+        self.entrypoint = None
+        self.command = None
+
+    @property
+    def short_id(self):
+        return self.id[:12]
+
+    @property
+    def attrs(self):
+        return {
+            "Id": self.id,
+            "Name": "/" + self.name,
+            "Image": self.image_id,
+            "Config": {"Labels": self.labels, "Image": self.image_name, "Entrypoint": self.entrypoint,
+                       "Cmd": self.command, "Env": [f"{key}={value}" for key, value in self.environment.items()]},
+            "State": {"Status": self.status, "Running": self.status == "running", "StartedAt": self.started_at},
+            "HostConfig": {"PortBindings": self._bindings()},
+            "NetworkSettings": {"Ports": self._bindings() if self.status == "running" else {}},
+        }
+
+    def summary(self):
+        """The entry ``GET /containers/json`` returns for this container."""
+        return {
+            "Id": self.id,
+            "Names": ["/" + self.name],
+            "Image": self.image_name,
+            "ImageID": self.image_id,
+            "Labels": self.labels,
+            "State": self.status,
+            "Status": "Up 5 minutes" if self.status == "running" else "Exited (0) 5 minutes ago",
+            "Ports": [
+                {"IP": "0.0.0.0", "PrivatePort": int(port.split("/")[0]), "PublicPort": int(host),
+                 "Type": port.split("/")[1]}
+                for port, host in self.ports.items()
+            ] if self.status == "running" else [],
+        }
+
+    def _bindings(self):
+        return {port: [{"HostIp": "0.0.0.0", "HostPort": str(host)}] for port, host in self.ports.items()}
+
+    def rename(self, name):
+        if self.client is not None:
+            self.client.api_call()
+            if any(c.name == name for c in self.client.container_list if c is not self):
+                raise Exception(f'Conflict. The container name "/{name}" is already in use')
+        self.name = name
+
+    def get_archive(self, path, chunk_size=4096):
+        """``(chunks, stat)`` for a tar of ``path``, members named from its basename down."""
+        if self.client is not None:
+            self.client.api_call()
+        path = posixpath.normpath(path)
+        if not self.fs.exists(path):
+            import docker.errors
+            raise docker.errors.NotFound(f"Could not find the file {path} in container {self.name}")
+        parent = posixpath.dirname(path)
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w") as tar:
+            entries = sorted(d for d in self.fs.dirs if d == path or d.startswith(path + "/"))
+            entries += sorted(f for f in self.fs.files if f == path or f.startswith(path + "/"))
+            for entry in sorted(entries):
+                info = tarfile.TarInfo(posixpath.relpath(entry, parent))
+                info.mtime = self.fs.mtime(entry)
+                if entry in self.fs.files:
+                    info.size = len(self.fs.files[entry])
+                    tar.addfile(info, io.BytesIO(self.fs.files[entry]))
+                else:
+                    info.type = tarfile.DIRTYPE
+                    tar.addfile(info)
+        data = buffer.getvalue()
+        self.archive_bytes_sent = 0
+
+        def chunks():
+            for offset in range(0, len(data), chunk_size):
+                self.archive_bytes_sent = offset + chunk_size
+                yield data[offset:offset + chunk_size]
+
+        stat = {"name": posixpath.basename(path), "size": 0, "mode": 0o20000000755 if path in self.fs.dirs else 0o644}
+        return chunks(), stat
+
+    def put_archive(self, path, data):
+        """Unpack a tar stream into the container filesystem; works on stopped containers too."""
+        if self.client is not None:
+            self.client.api_call()
+        # The SDK streams file objects; the daemon also accepts gzip-compressed tars.
+        if hasattr(data, "read"):
+            data = data.read()
+        with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+            for member in tar.getmembers():
+                if member.isfile():
+                    target = path.rstrip("/") + "/" + member.name
+                    self.fs.add_file(target, tar.extractfile(member).read())
+        return True
+
+    def stats(self, stream=False, decode=None, one_shot=None):
+        """A ``GET /containers/{id}/stats?stream=false`` payload built from ``usage``."""
+        if self.client is not None:
+            self.client.api_call()
+        time.sleep(self.stats_latency)
+        if self.status != "running":
+            return {"read": "0001-01-01T00:00:00Z", "cpu_stats": {"cpu_usage": {"total_usage": 0}},
+                    "precpu_stats": {"cpu_usage": {"total_usage": 0}}, "memory_stats": {}, "blkio_stats": {}}
+        online_cpus, system_delta = 4, 4 * 10 ** 9
+        cpu_delta = int(self.usage["cpu_percent"] / 100 / online_cpus * system_delta)
+        return {
+            "read": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "cpu_stats": {"cpu_usage": {"total_usage": 10 ** 12 + cpu_delta}, "online_cpus": online_cpus,
+                          "system_cpu_usage": 10 ** 15 + system_delta},
+            "precpu_stats": {"cpu_usage": {"total_usage": 10 ** 12}, "online_cpus": online_cpus,
+                             "system_cpu_usage": 10 ** 15},
+            "memory_stats": {"usage": self.usage["memory"] + 4096, "limit": self.usage["memory_limit"],
+                             "stats": {"inactive_file": 4096}},
+            "networks": {"eth0": {"rx_bytes": self.usage["rx_bytes"], "tx_bytes": self.usage["tx_bytes"]}},
+            "blkio_stats": {"io_service_bytes_recursive": [
+                {"major": 8, "minor": 0, "op": "read", "value": self.usage["read_bytes"]},
+                {"major": 8, "minor": 0, "op": "write", "value": self.usage["write_bytes"]},
+            ]},
+        }
+
+    def stop(self, timeout=10):
+        if self.client is not None:
+            self.client.api_call()
+        # Docker waits up to ``timeout`` seconds, then kills the container.
+        time.sleep(min(self.stop_latency, timeout))
+        self.status = "exited"
+
+    def start(self):
+        if self.client is not None:
+            self.client.api_call()
+        self.status = "running"
+        self.started_at = time.strftime("%Y-%m-%dT%H:%M:%S.", time.gmtime()) + f"{time.time_ns() % 10**9:09d}Z"
+
+    def remove(self, force=False, v=False):
+        if self.status == "running" and not force:
+            raise RuntimeError(f"You cannot remove a running container {self.id}")
+        if self.client is not None:
+            self.client.api_call()
+            self.client.container_list.remove(self)
+
+    def exec_run(self, cmd, stdout=True, stderr=True, workdir=None, **kwargs):
+        self.exec_calls.append(cmd)
+        if self.client is not None:
+            self.client.exec_count += 1
+        if self.exec_latency:
+            time.sleep(self.exec_latency)
+        if self.status != "running":
+            raise RuntimeError(f"Container {self.id} is not running")
+        args = shlex.split(cmd) if isinstance(cmd, str) else list(cmd)
+        exit_code, out, err = self._run(args, workdir, kwargs.get("environment"))
+        return ExecResult(exit_code, (_bytes(out) if stdout else b"") + (_bytes(err) if stderr else b""))
+
+    def drop_shells(self):
+        """Cut every attached shell, as a daemon restart or network blip would."""
+        for shell in self.shells:
+            shell.close()
+
+    def _run(self, args, workdir, environment=None, stdin=None):
+        program = args[0]
+        if program in self.commands:
+            if stdin is not None:
+                return self.commands[program](self, args, workdir, stdin=stdin)
+            return self.commands[program](self, args, workdir)
+        if program in ("sh", "bash") and len(args) >= 3 and args[1] == "-c":
+            feed = _STDIN_FROM_ENV.fullmatch(args[2])
+            if feed:
+                # sh -c 'printf "%s\n" "$VAR" | (unset VAR; exec "$@")' sh CMD...
+                return self._run(args[4:], workdir, stdin=(environment or {}).get(feed[1], "") + "\n")
+            return self._run_pipeline(args[2], workdir)
+        if program == "test":
+            flag, path = args[1], args[2]
+            ok = {"-d": self.fs.is_dir, "-f": self.fs.is_file, "-e": self.fs.exists}[flag](path)
+            return (0 if ok else 1), "", ""
+        if program == "find":
+            return self._find(args[1:], workdir)
+        if program == "tar" and args[1:3] == ["-cf", "-"]:
+            return self._tar(args[3:], workdir)
+        if program == "stat" and args[1:2] == ["-c"]:
+            lines, missing = [], []
+            for path in args[3:]:
+                if not self.fs.exists(path):
+                    missing.append(f"stat: cannot statx '{path}': No such file or directory\n")
+                    continue
+                lines.append(args[2].replace("%n", path).replace("%Y", str(self.fs.mtime(path))) + "\n")
+            return (1 if missing else 0), "".join(lines), "".join(missing)
+        if program == "mkdir" and args[1:2] == ["-p"]:
+            for path in args[2:]:
+                self.fs.add_dir(path)
+            return 0, "", ""
+        if program == "rm" and args[1:2] == ["-rf"]:
+            for path in args[2:]:
+                self.fs.remove(path)
+            return 0, "", ""
+        if program == "ls":
+            path = args[1] if len(args) > 1 else workdir or "/"
+            if not self.fs.is_dir(path):
+                return 2, "", f"ls: cannot access '{path}': No such file or directory\n"
+            return 0, "".join(name + "\n" for name in self.fs.listdir(path)), ""
+        return 127, "", f"{program}: command not found\n"
+
+    def _run_pipeline(self, script, workdir):
+        # Supports "ls DIR | grep -v X | ..." which is all the legacy helpers use.
+        stages = [shlex.split(stage) for stage in script.split("|")]
+        exit_code, out, err = self._run(stages[0], workdir)
+        for stage in stages[1:]:
+            if stage[:2] != ["grep", "-v"]:
+                return 127, "", f"unsupported pipeline stage {stage}\n"
+            out = "".join(line + "\n" for line in out.splitlines() if stage[2] not in line)
+        return exit_code, out, err
+
+    def _find(self, args, workdir=None):
+        roots = []
+        while args and not args[0].startswith("-") and args[0] not in ("(", "!"):
+            roots.append(args.pop(0))
+        maxdepth = None
+        if args[:1] == ["-maxdepth"]:
+            maxdepth = int(args[1])
+            args = args[2:]
+        command = None
+        if "-exec" in args:
+            # Only the batching form, "-exec CMD ... {} +", as the last predicate.
+            command = args[args.index("-exec") + 1:-2]
+            args = args[:args.index("-exec")]
+        expression = _FindExpression(args)
+
+        out, err, exit_code = [], [], 0
+        for root in roots:
+            # Relative roots are walked from workdir and printed as given.
+            path_root = posixpath.normpath(posixpath.join(workdir or "/", root))
+            if not self.fs.exists(path_root):
+                err.append(f"find: '{root}': No such file or directory\n")
+                exit_code = 1
+                continue
+            pruned_below = None
+            for path, _depth in self.fs.walk(path_root, maxdepth if maxdepth is not None else -1):
+                if pruned_below and path.startswith(pruned_below + "/"):
+                    continue
+                shown = root + path[len(path_root):]
+                state = {"pruned": False, "printed": []}
+                matched = expression.evaluate(self.fs, path, state, shown=shown)
+                if expression.has_action:
+                    out.extend(state["printed"])
+                elif matched:
+                    out.append(shown + "\n")
+                if state["pruned"]:
+                    pruned_below = path
+        if command is not None:
+            if not out:
+                return exit_code, "", "".join(err)
+            code, output, command_err = self._run(command + [line[:-1] for line in out], workdir)
+            return exit_code or code, output, "".join(err) + command_err
+        return exit_code, "".join(out), "".join(err)
+
+    def _tar(self, paths, workdir):
+        # "tar -cf - PATH..." of files only, written to stdout as bytes.
+        buffer, err = io.BytesIO(), []
+        with tarfile.open(fileobj=buffer, mode="w") as tar:
+            for path in paths:
+                full = posixpath.normpath(posixpath.join(workdir or "/", path))
+                if full not in self.fs.files:
+                    err.append(f"tar: {path}: Cannot stat: No such file or directory\n")
+                    continue
+                info = tarfile.TarInfo(path.lstrip("/"))
+                info.size = len(self.fs.files[full])
+                info.mtime = self.fs.mtime(full)
+                tar.addfile(info, io.BytesIO(self.fs.files[full]))
+        return (2 if err else 0), buffer.getvalue(), "".join(err)
+
+
+_WORD = re.compile(r"""(?:[^\s'"\\]+|'[^']*'|"(?:\\.|[^"\\])*"|\\.)+""", re.S)
+_PIECE = re.compile(r"""([^\s'"\\]+)|'([^']*)'|"((?:\\.|[^"\\])*)"|\\(.)""", re.S)
+
+def _split_words(text):
+    """shlex.split for the quoting shlex.join produces, without its per-character loop."""
+    return ["".join(bare or single or re.sub(r"\\(.)", r"\1", double) or escaped
+                    for bare, single, double, escaped in _PIECE.findall(word))
+            for word in _WORD.findall(text)]
+
+
+class FakeShellSocket:
+    """The attached socket of an ``sh`` exec, understanding the lines exec_session writes.
+
+    Commands run as soon as they are written and answer with Docker's
+    multiplexed stdout frames. exec_latency stands for the three requests of
+    an exec_run, so each write costs a third of it: the one round-trip a
+    session pays per batch.
+    """
+
+    FRAME = re.compile(
+        r"\( (?:cd (?P<workdir>'[^']*'|\S+) && )?exec (?P<args>.*?) \) </dev/null 2>(?P<stderr>&1|/dev/null); "
+        r"printf '%s %d\\n' (?P<marker>\S+) \"\$\?\"\n", re.S)
+
+    def __init__(self, container):
+        self.container = container
+        self.pending = ""
+        self.out = bytearray()
+        self.closed = False
+        self.timeout = None
+
+    def sendall(self, data):
+        if self.closed or self.container.status != "running":
+            self.closed = True
+            raise BrokenPipeError("attached shell is gone")
+        if self.container.exec_latency:
+            time.sleep(self.container.exec_latency / 3)
+        self.pending += data.decode()
+        while self.pending:
+            if self.pending.startswith("exit\n"):
+                self.close()
+                return
+            match = self.FRAME.match(self.pending)
+            if not match:
+                return
+            self.pending = self.pending[match.end():]
+            args = _split_words(match["args"])
+            self.container.exec_calls.append(args)
+            if self.container.client is not None:
+                self.container.client.exec_count += 1
+            workdir = _split_words(match["workdir"])[0] if match["workdir"] else None
+            exit_code, out, err = self.container._run(args, workdir)
+            payload = (_bytes(out) + (_bytes(err) if match["stderr"] == "&1" else b"")
+                       + f"{match['marker']} {exit_code}\n".encode())
+            self.out += struct.pack(">BxxxL", 1, len(payload)) + payload
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def recv(self, size):
+        chunk = bytes(self.out[:size])
+        del self.out[:size]
+        return chunk
+
+    def close(self):
+        self.closed = True
+        self.out.clear()
+
+
+def _matches_filters(container, filters, include_stopped):
+    if not include_stopped and container.status != "running":
+        return False
+    labels = (filters or {}).get("label", [])
+    for label in [labels] if isinstance(labels, str) else labels:
+        key, _, value = label.partition("=")
+        if key not in container.labels or (value and container.labels[key] != value):
+            return False
+    statuses = (filters or {}).get("status")
+    if statuses:
+        if container.status not in ([statuses] if isinstance(statuses, str) else statuses):
+            return False
+    return True
+
+
+class FakeContainerCollection:
+    def __init__(self, client):
+        self.client = client
+
+    def list(self, all=False, filters=None, sparse=False, **kwargs):
+        containers = [c for c in self.client.container_list if _matches_filters(c, filters, all)]
+        # Like the SDK, a non-sparse list inspects every container it returns.
+        self.client.api_call(1 if sparse else 1 + len(containers))
+        return containers
+
+    def get(self, container_id):
+        self.client.api_call()
+        return self.client.find_container(container_id)
+
+    def run(self, image, name=None, ports=None, labels=None, environment=None, detach=False, **kwargs):
+        self.client.api_call(2)  # create + start
+        if name and any(c.name == name for c in self.client.container_list):
+            raise Exception(f'Conflict. The container name "/{name}" is already in use')
+        container = FakeContainer(name or f"container-{len(self.client.container_list)}", image=image,
+                                  service=None, labels=labels, ports=ports)
+        container.environment = dict(environment or {})
+        return self.client.add_container(container)
+
+    def create(self, image, name=None, ports=None, labels=None, environment=None, **kwargs):
+        self.client.api_call()
+        self.client.images.get(image)  # create never pulls
+        if name and any(c.name == name for c in self.client.container_list):
+            raise Exception(f'Conflict. The container name "/{name}" is already in use')
+        container = FakeContainer(name or f"container-{len(self.client.container_list)}", image=image,
+                                  service=None, labels=labels, ports=ports, status="created")
+        container.environment = dict(environment or {})
+        container.entrypoint = kwargs.get("entrypoint")
+        container.command = kwargs.get("command")
+        return self.client.add_container(container)
+
+
+class FakeImage:
+    def __init__(self, attrs):
+        self.attrs = attrs
+        self.id = attrs["Id"]
+
+
+class FakeImageCollection:
+    def __init__(self, client):
+        self.client = client
+        # tag, repo@digest or image ID -> image attrs
+        self.local = {}
+
+    def get(self, name):
+        self.client.api_call()
+        if name not in self.local:
+            import docker.errors
+            raise docker.errors.ImageNotFound(f"No such image: {name}")
+        return FakeImage(self.local[name])
+
+
+class FakeResource:
+    """A volume or network; removal fails while a container of its project exists."""
+
+    def __init__(self, name, project=None, labels=None, collection=None):
+        self.name = name
+        self.id = hashlib.sha256(name.encode()).hexdigest()
+        self.labels = dict(labels or {})
+        if project:
+            self.labels.setdefault("com.docker.compose.project", project)
+        self.collection = collection
+
+    def remove(self, force=False):
+        client = self.collection.client
+        client.api_call()
+        project = self.labels.get("com.docker.compose.project")
+        if project and any(c.labels.get("com.docker.compose.project") == project for c in client.container_list):
+            raise RuntimeError(f"{self.name} is in use by a container")
+        self.collection.items.remove(self)
+
+
+class FakeResourceCollection:
+    def __init__(self, client):
+        self.client = client
+        self.items = []
+
+    def add(self, name, project=None, labels=None):
+        resource = FakeResource(name, project, labels, collection=self)
+        self.items.append(resource)
+        return resource
+
+    def list(self, filters=None, **kwargs):
+        self.client.api_call()
+        labels = (filters or {}).get("label", [])
+        labels = [labels] if isinstance(labels, str) else labels
+        found = []
+        for resource in self.items:
+            matches = True
+            for label in labels:
+                key, _, value = label.partition("=")
+                if key not in resource.labels or (value and resource.labels[key] != value):
+                    matches = False
+            if matches:
+                found.append(resource)
+        return found
+
+
+class FakeEventStream:
+    def __init__(self, events):
+        self._events = iter(events)
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.closed:
+            raise StopIteration
+        return next(self._events)
+
+    def close(self):
+        self.closed = True
+
+
+def container_event(action, container, **attributes):
+    """A decoded Docker container event the way ``client.events(decode=True)`` yields it."""
+    return {
+        "Type": "container",
+        "Action": action,
+        "status": action,
+        "id": container.id,
+        "Actor": {"ID": container.id, "Attributes": dict(container.labels, name=container.name, **attributes)},
+        "time": int(time.time()),
+    }
+
+
+class FakeAPIClient:
+    """The low-level ``client.api`` calls, answering with plain dicts."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def containers(self, all=False, filters=None, **kwargs):
+        self.client.api_call()
+        return [c.summary() for c in self.client.container_list if _matches_filters(c, filters, all)]
+
+    def inspect_container(self, container_id):
+        self.client.api_call()
+        return self.client.find_container(container_id).attrs
+
+    def stats(self, container, decode=None, stream=True, one_shot=None):
+        return self.client.find_container(container).stats(stream=stream, one_shot=one_shot)
+
+    def exec_create(self, container, cmd, stdout=True, stderr=True, stdin=False, tty=False, **kwargs):
+        self.client.api_call()
+        container = self.client.find_container(container)
+        if container.status != "running":
+            raise RuntimeError(f"Container {container.id} is not running")
+        if list(cmd) != ["sh"] or not stdin or tty:
+            raise NotImplementedError("only an attached, non-TTY sh is supported")
+        self.client.execs[f"exec{len(self.client.execs)}"] = container
+        return {"Id": f"exec{len(self.client.execs) - 1}"}
+
+    def exec_start(self, exec_id, detach=False, tty=False, stream=False, socket=False, demux=False):
+        self.client.api_call()
+        if not socket:
+            raise NotImplementedError("only socket=True is supported")
+        container = self.client.execs[exec_id]
+        container.shells.append(FakeShellSocket(container))
+        return container.shells[-1]
+
+    def pull(self, repository, tag=None, stream=False, decode=False, **kwargs):
+        """Stream the progress messages ``docker pull`` sends, then make the image local."""
+        self.client.api_call()
+        image = f"{repository}:{tag or 'latest'}"
+        if image not in self.client.registry:
+            yield {"error": f"manifest for {image} not found"}
+            return
+        digest, layers, chunks = self.client.registry[image]
+        yield {"status": f"Pulling from {repository}", "id": tag or "latest"}
+        for layer in layers:
+            yield {"status": "Pulling fs layer", "progressDetail": {}, "id": layer}
+        for layer in layers:
+            for step in range(1, chunks + 1):
+                if self.client.pull_latency:
+                    time.sleep(self.client.pull_latency)
+                yield {"status": "Downloading", "progressDetail": {"current": step * 1024, "total": chunks * 1024},
+                       "id": layer}
+            yield {"status": "Download complete", "progressDetail": {}, "id": layer}
+            yield {"status": "Pull complete", "progressDetail": {}, "id": layer}
+        yield {"status": f"Digest: {digest}"}
+        yield {"status": f"Status: Downloaded newer image for {image}"}
+
+        attrs = {"Id": "sha256:" + hashlib.sha256(digest.encode()).hexdigest(), "RepoTags": [image],
+                 "RepoDigests": [f"{repository}@{digest}"]}
+        for name in (image, f"{repository}@{digest}", attrs["Id"]):
+            self.client.images.local[name] = attrs
+
+
+class FakeDockerClient:
+    def __init__(self, containers=(), api_latency=0.0):
+        self.container_list = []
+        self.api_calls = 0
+        # Simulated seconds per Docker API round-trip.
+        self.api_latency = api_latency
+        self.exec_count = 0
+        # exec id -> container, for exec_create/exec_start
+        self.execs = {}
+        # Decoded events handed out by events(), in order.
+        self.event_log = []
+        self.containers = FakeContainerCollection(self)
+        self.api = FakeAPIClient(self)
+        self.volumes = FakeResourceCollection(self)
+        self.networks = FakeResourceCollection(self)
+        self.images = FakeImageCollection(self)
+        # "repo:tag" -> (digest, layer ids, progress messages per layer) available to pull
+        self.registry = {}
+        self.pull_latency = 0.0
+        self.publish_count = 0
+        for container in containers:
+            self.add_container(container)
+
+    def api_call(self, count=1):
+        self.api_calls += count
+        if self.api_latency:
+            time.sleep(self.api_latency * count)
+
+    def find_container(self, container_id):
+        for container in self.container_list:
+            if container_id in (container.id, container.name) or container.id.startswith(container_id):
+                return container
+        raise KeyError(container_id)
+
+    def publish_image(self, image, layers=3, chunks=4):
+        """Make ``image`` pullable; publishing again moves the tag to a new digest."""
+        self.publish_count += 1
+        digest = "sha256:" + hashlib.sha256(f"{image}/{self.publish_count}".encode()).hexdigest()
+        layer_ids = [hashlib.sha256(f"{digest}/{n}".encode()).hexdigest()[:12] for n in range(layers)]
+        self.registry[image] = (digest, layer_ids, chunks)
+        return digest
+
+    def add_container(self, container):
+        container.client = self
+        self.container_list.append(container)
+        return container
+
+    def events(self, decode=False, filters=None, **kwargs):
+        self.api_call()
+        filters = filters or {}
+        actions = filters.get("event")
+        labels = filters.get("label", [])
+        labels = [labels] if isinstance(labels, str) else labels
+
+        def wanted(event):
+            if filters.get("type") and event.get("Type") != filters["type"]:
+                return False
+            if actions and event.get("Action") not in actions:
+                return False
+            attributes = event.get("Actor", {}).get("Attributes", {})
+            for label in labels:
+                key, _, value = label.partition("=")
+                if key not in attributes or (value and attributes[key] != value):
+                    return False
+            return True
+
+        return FakeEventStream(event for event in self.event_log if wanted(event))
+
+    def close(self):
+        pass
+
+
+def site_db_name(site):
+    return "_" + hashlib.sha1(site.encode()).hexdigest()[:16]
+
+
+def bench_files(bench_dir, sites=(), apps=(), extra_dirs=()):
+    """Paths (or ``(path, content)`` pairs) making up a minimal bench directory tree for a FakeContainer."""
+    files = [
+        (f"{bench_dir}/sites/common_site_config.json", json.dumps({"webserver_port": 8000})),
+        (f"{bench_dir}/sites/apps.txt", "".join(app + "\n" for app in apps)),
+    ]
+    files.append(f"{bench_dir}/sites/assets/.keep")
+    for site in sites:
+        files.append((f"{bench_dir}/sites/{site}/site_config.json",
+                      json.dumps({"db_name": site_db_name(site), "db_password": "secret"})))
+    for app in apps:
+        files.append(f"{bench_dir}/apps/{app}/setup.py")
+    for directory in extra_dirs:
+        files.append(f"{directory}/.keep")
+    return files
+
+
+def fake_bench_command(site_apps):
+    """A ``bench`` stand-in answering ``bench --site SITE|all list-apps --format json``."""
+    def bench(container, args, workdir):
+        if "list-apps" not in args:
+            return 1, "", f"unsupported bench command {args}\n"
+        site = args[args.index("--site") + 1]
+        sites = site_apps if site == "all" else {site: site_apps.get(site, [])}
+        return 0, "WARN: bench is running as root\n" + json.dumps(sites) + "\n", ""
+    return bench
+
+
+def fake_bench_backup_command(latency=0.0, database_size=4096):
+    """A ``bench`` stand-in for ``bench --site SITE backup --with-files --backup-path DIR`` and ``restore``.
+
+    backup writes the files bench would into DIR; every restore is recorded
+    as ``(site, args)`` in the returned function's ``restored`` list after
+    checking the files it names exist, and the root password it read from
+    stdin, if it was not given on the command line, in ``passwords``.
+    """
+    def bench(container, args, workdir, stdin=None):
+        site = args[args.index("--site") + 1]
+        if not container.fs.is_file(f"{workdir}/sites/{site}/site_config.json"):
+            return 1, "", f"Site {site} does not exist!\n"
+        time.sleep(latency)
+        if "backup" in args:
+            prefix = f"{args[args.index('--backup-path') + 1]}/20240101_000000-{site.replace('.', '_')}"
+            container.fs.add_file(f"{prefix}-database.sql.gz", os.urandom(database_size))
+            container.fs.add_file(f"{prefix}-files.tar", b"public files " * 64)
+            container.fs.add_file(f"{prefix}-private-files.tar", b"private files " * 64)
+            container.fs.add_file(f"{prefix}-site_config_backup.json", b"{}")
+            return 0, f"Backup Summary for {site}\n", ""
+        if "restore" in args:
+            paths = [arg for arg in args if arg.startswith("/")]
+            missing = [path for path in paths if not container.fs.is_file(path)]
+            if missing:
+                return 1, "", f"No such file: {missing[0]}\n"
+            bench.restored.append((site, args))
+            if "--mariadb-root-password" not in args:
+                # Asked for at the prompt, which reads stdin when there is no TTY.
+                bench.passwords.append((stdin or "").rstrip("\n"))
+            return 0, f"Site {site} has been restored\n", ""
+        return 1, "", f"unsupported bench command {args}\n"
+    bench.restored = []
+    bench.passwords = []
+    return bench
+
+
+# Stand-in pymysql for fake_python_command: table sizes come from a JSON map of db_name -> bytes.
+_FAKE_PYMYSQL = '''
+import json, os
+
+SIZES = json.loads(os.environ["FAKE_DB_SIZES"])
+
+class _Cursor:
+    def execute(self, query, params):
+        self.row = (SIZES.get(params[0]),)
+
+    def fetchone(self):
+        return self.row
+
+class _Connection:
+    def cursor(self):
+        return _Cursor()
+
+    def close(self):
+        pass
+
+def connect(user, password, **kwargs):
+    if user not in SIZES:
+        raise Exception("Access denied for user " + user)
+    return _Connection()
+'''
+
+
+def fake_python_command(db_sizes=None):
+    """A ``python`` stand-in for ``python -c SCRIPT BENCH_DIR`` execs.
+
+    The container's files under BENCH_DIR are written to a temporary directory
+    (with each file's fake mtime) and the script runs there in a real
+    interpreter. ``db_sizes`` maps database names to the size the MariaDB
+    server would report; other databases can't be connected to.
+    """
+    def python(container, args, workdir):
+        if len(args) < 4 or args[1] != "-c":
+            return 1, "", f"unsupported python invocation {args}\n"
+        bench_dir = posixpath.normpath(args[3])
+        with tempfile.TemporaryDirectory() as root:
+            for path, content in container.fs.files.items():
+                if not path.startswith(bench_dir + "/"):
+                    continue
+                target = os.path.join(root, path[len(bench_dir) + 1:])
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with open(target, "wb") as f:
+                    f.write(content)
+                mtime = container.fs.mtimes.get(path, container.fs.clock)
+                os.utime(target, (mtime, mtime))
+            with open(os.path.join(root, "pymysql.py"), "w") as f:
+                f.write(_FAKE_PYMYSQL)
+            env = dict(os.environ, PYTHONPATH=root, FAKE_DB_SIZES=json.dumps(db_sizes or {}))
+            completed = subprocess.run([sys.executable, "-c", args[2], root], capture_output=True, text=True, env=env)
+        return completed.returncode, completed.stdout, completed.stderr
+    return python
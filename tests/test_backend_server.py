@@ -0,0 +1,99 @@
+import io
+import json
+import sqlite3
+import sys
+import threading
+import time
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import backend_server
+
+
+class TestBackendServer(unittest.TestCase):
+    def setUp(self):
+        self.ctx = backend_server.BackendContext(client=object(), conn=sqlite3.connect(":memory:"))
+
+    def call(self, request):
+        return backend_server.handle_request(self.ctx, json.dumps(request))
+
+    def test_ping(self):
+        response = self.call({"jsonrpc": "2.0", "id": 1, "method": "ping"})
+        self.assertEqual(response, {"jsonrpc": "2.0", "id": 1, "result": "pong"})
+
+    def test_unknown_method(self):
+        response = self.call({"jsonrpc": "2.0", "id": 2, "method": "missing"})
+        self.assertEqual(response["error"]["code"], backend_server.METHOD_NOT_FOUND)
+
+    def test_invalid_params(self):
+        response = self.call({"jsonrpc": "2.0", "id": 3, "method": "ping", "params": {"extra": 1}})
+        self.assertEqual(response["error"]["code"], backend_server.INVALID_PARAMS)
+
+    def test_parse_error(self):
+        response = backend_server.handle_request(self.ctx, "not json")
+        self.assertEqual(response["error"]["code"], backend_server.PARSE_ERROR)
+
+    def test_handler_output_does_not_reach_protocol_stream(self):
+        def noisy(ctx):
+            print("progress message")
+            return "done"
+
+        backend_server.METHODS["noisy"] = noisy
+        self.addCleanup(backend_server.METHODS.pop, "noisy")
+
+        stdout = io.StringIO()
+        stdin = io.StringIO(json.dumps({"jsonrpc": "2.0", "id": 4, "method": "noisy"}) + "\n")
+        backend_server.serve(self.ctx, stdin=stdin, stdout=stdout)
+
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(json.loads(lines[0])["result"], "done")
+
+    def test_notifications_share_the_protocol_stream(self):
+        def announce(ctx):
+            ctx.notify("instance_changed", {"project": "alpha"})
+            return "ok"
+
+        backend_server.METHODS["announce"] = announce
+        self.addCleanup(backend_server.METHODS.pop, "announce")
+
+        stdout = io.StringIO()
+        stdin = io.StringIO(json.dumps({"jsonrpc": "2.0", "id": 5, "method": "announce"}) + "\n")
+        backend_server.serve(self.ctx, stdin=stdin, stdout=stdout)
+
+        messages = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual(messages[0], {"jsonrpc": "2.0", "method": "instance_changed", "params": {"project": "alpha"}})
+        self.assertEqual(messages[1]["result"], "ok")
+
+    def test_slow_request_does_not_delay_others(self):
+        released = threading.Event()
+
+        def slow(ctx):
+            released.wait(5)
+            return "slow"
+
+        class Stdout(io.StringIO):
+            def write(self, text):
+                # The slow handler is released once ping has been answered.
+                if '"pong"' in text:
+                    released.set()
+                return super().write(text)
+
+        backend_server.METHODS["slow"] = slow
+        self.addCleanup(backend_server.METHODS.pop, "slow")
+
+        stdout = Stdout()
+        stdin = io.StringIO(json.dumps({"jsonrpc": "2.0", "id": 6, "method": "slow"}) + "\n"
+                            + json.dumps({"jsonrpc": "2.0", "id": 7, "method": "ping"}) + "\n")
+        started = time.monotonic()
+        backend_server.serve(self.ctx, stdin=stdin, stdout=stdout, workers=2)
+
+        self.assertLess(time.monotonic() - started, 4)
+        responses = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual([(r["id"], r["result"]) for r in responses], [(7, "pong"), (6, "slow")])
+
+
+if __name__ == "__main__":
+    unittest.main()
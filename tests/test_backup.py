@@ -0,0 +1,127 @@
+import gzip
+import io
+import json
+import sqlite3
+import sys
+import tarfile
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import db_operations
+from backup import backup_sites, restore_sites
+from fake_docker import FakeContainer, FakeDockerClient, bench_files, fake_bench_backup_command
+
+BENCH_DIR = "/home/frappe/frappe-bench"
+
+
+class TestBackupRestore(unittest.TestCase):
+    def setUp(self):
+        self.conn = db_operations.configure_connection(sqlite3.connect(":memory:", check_same_thread=False))
+        db_operations.init_db(self.conn)
+        self.addCleanup(self.conn.close)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dest = Path(directory.name)
+
+        self.bench = fake_bench_backup_command(latency=0.1)
+        self.containers = {
+            project: FakeContainer(f"{project}-frappe-1", project=project, commands={"bench": self.bench},
+                                   files=bench_files(BENCH_DIR, sites=[f"s{i}.{project}.localhost" for i in range(3)],
+                                                     apps=["frappe"]))
+            for project in ("alpha", "beta")
+        }
+        self.client = FakeDockerClient(list(self.containers.values()) + [
+            FakeContainer("alpha-mariadb-1", project="alpha", service="mariadb")])
+
+    def backup(self, *projects, **kwargs):
+        events = []
+        lock = threading.Lock()
+
+        def on_event(event):
+            with lock:
+                events.append(event)
+        results = backup_sites(projects, self.dest, client=self.client, conn=self.conn, on_event=on_event, **kwargs)
+        return results, events
+
+    def test_backs_up_sites_in_parallel_to_gzipped_tars(self):
+        results, events = self.backup("alpha", "beta", jobs=6, per_container=3)
+
+        self.assertEqual(len(results["succeeded"]), 6)
+        self.assertLess(results["seconds"], 0.5)  # six 0.1s backups, all at once
+        self.assertEqual(results["bytes"], sum(item["bytes"] for item in results["succeeded"]))
+        self.assertEqual(len([e for e in events if e["type"] == "result"]), 6)
+
+        archive = next(Path(item["archive"]) for item in results["succeeded"] if item["site"] == "s1.beta.localhost")
+        self.assertEqual(archive.parent, self.dest / "beta")
+        with gzip.open(archive) as f, tarfile.open(fileobj=f) as tar:
+            names = sorted(name.split("-", 2)[-1] for name in tar.getnames() if name.endswith((".gz", ".tar", ".json")))
+        self.assertEqual(names, ["database.sql.gz", "files.tar", "private-files.tar", "site_config_backup.json"])
+
+        manifest = json.loads((self.dest / "manifest.json").read_text())
+        self.assertEqual(len(manifest["archives"]), 6)
+        # Scratch directories are gone from the containers.
+        self.assertFalse([p for p in self.containers["alpha"].fs.files if p.startswith("/tmp/")])
+
+    def test_per_container_limit(self):
+        results, _ = self.backup("alpha", jobs=8, per_container=1)
+        self.assertEqual(len(results["succeeded"]), 3)
+        self.assertGreaterEqual(results["seconds"], 0.3)
+
+    def test_queued_sites_do_not_burn_their_timeout(self):
+        # Three 0.1s backups one at a time: the last waits 0.2s, which must not count against its 0.15s.
+        results, _ = self.backup("alpha", "beta", jobs=4, per_container=1, timeout=0.15)
+        self.assertEqual(len(results["succeeded"]), 6)
+        self.assertEqual(results["timed_out"], [])
+        self.assertGreaterEqual(results["seconds"], 0.3)
+
+    def test_failures_are_reported_per_site(self):
+        results, events = self.backup("alpha", "gamma", sites=["s0.alpha.localhost"])
+        self.assertEqual([item["site"] for item in results["succeeded"]], ["s0.alpha.localhost"])
+        self.assertEqual(results["failed"], [{"project": "gamma", "site": None, "error": "No running bench found"}])
+
+    def test_restore_sends_archives_back_and_runs_bench_restore(self):
+        self.backup("alpha", "beta")
+        events = []
+        results = restore_sites(self.dest, projects=["alpha"], client=self.client, conn=self.conn,
+                                db_root_password="root", on_event=events.append)
+
+        self.assertEqual(sorted(item["site"] for item in results["succeeded"]),
+                         [f"s{i}.alpha.localhost" for i in range(3)])
+        site, args = sorted(self.bench.restored)[0]
+        self.assertEqual(site, "s0.alpha.localhost")
+        self.assertTrue(args[args.index("restore") + 1].endswith("-database.sql.gz"))
+        self.assertTrue(args[args.index("--with-public-files") + 1].endswith("_localhost-files.tar"))
+        self.assertTrue(args[args.index("--with-private-files") + 1].endswith("-private-files.tar"))
+        self.assertFalse([p for p in self.containers["alpha"].fs.files if p.startswith("/tmp/")])
+
+    def test_restore_handles_spaces_in_file_names(self):
+        results, _ = self.backup("alpha", sites=["s0.alpha.localhost"])
+        archive = Path(results["succeeded"][0]["archive"])
+        with gzip.open(archive) as f, tarfile.open(fileobj=f) as tar:
+            members = [(member, tar.extractfile(member).read() if member.isfile() else None) for member in tar]
+        with gzip.open(archive, "wb") as f, tarfile.open(fileobj=f, mode="w") as tar:
+            for member, data in members:
+                member.name = member.name.replace("-database.sql.gz", " copy-database.sql.gz")
+                tar.addfile(member, io.BytesIO(data) if data is not None else None)
+
+        results = restore_sites(self.dest, client=self.client, conn=self.conn)
+        self.assertEqual(len(results["succeeded"]), 1, results["failed"])
+        _, args = self.bench.restored[0]
+        self.assertTrue(args[args.index("restore") + 1].endswith(" copy-database.sql.gz"))
+
+    def test_root_password_is_not_on_the_command_line(self):
+        self.backup("alpha")
+        results = restore_sites(self.dest, client=self.client, conn=self.conn, db_root_password="s3cret")
+
+        self.assertEqual(len(results["succeeded"]), 3)
+        self.assertEqual(self.bench.passwords, ["s3cret"] * 3)
+        argv = [str(arg) for cmd in self.containers["alpha"].exec_calls for arg in cmd]
+        self.assertFalse([arg for arg in argv if "s3cret" in arg])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+import contextlib
+import io
+import json
+import sqlite3
+import sys
+import tarfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import db_operations
+import update_db
+from bench_metadata import ArchiveTooLarge, config_archive_command, parse_sites_archive, read_bench_metadata
+from fake_docker import FakeContainer, FakeDockerClient, bench_files, site_db_name
+
+
+def make_tar(entries):
+    """Tar bytes from ``(name, content)`` pairs; None content is a directory, ("->", target) a symlink."""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        for name, content in entries:
+            info = tarfile.TarInfo(name)
+            if content is None:
+                info.type = tarfile.DIRTYPE
+                tar.addfile(info)
+            elif isinstance(content, tuple):
+                info.type = tarfile.SYMTYPE
+                info.linkname = content[1]
+                tar.addfile(info)
+            else:
+                data = content.encode() if isinstance(content, str) else content
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+# A sites/ directory as `docker cp` would archive it.
+SITES_ARCHIVE = make_tar([
+    ("sites", None),
+    ("sites/apps.txt", "frappe\nerpnext\n\nhrms\n"),
+    ("sites/apps.json", "{}"),
+    ("sites/common_site_config.json", json.dumps({"webserver_port": 8000, "socketio_port": 9000})),
+    ("sites/currentsite.txt", "erp.localhost"),
+    ("sites/assets", None),
+    ("sites/assets/frappe", ("->", "../../apps/frappe/frappe/public")),
+    ("sites/assets/assets.json", "{}"),
+    ("sites/erp.localhost", None),
+    ("sites/erp.localhost/site_config.json", json.dumps({"db_name": "_e1", "db_password": "secret"})),
+    ("sites/erp.localhost/private/backups/20240101-database.sql.gz", b"\x1f\x8b" + b"\0" * 4096),
+    ("sites/apps.example.com", None),
+    ("sites/apps.example.com/site_config.json", json.dumps({"db_name": "_a1"})),
+    ("sites/reports.json.local", None),
+    ("sites/reports.json.local/site_config.json", "{not json"),
+    ("sites/not-a-site", None),
+    ("sites/not-a-site/notes.txt", "no site_config.json here"),
+])
+
+
+class TestParseSitesArchive(unittest.TestCase):
+    def test_sites_and_apps(self):
+        metadata = parse_sites_archive(chunked(SITES_ARCHIVE, 2048))
+        self.assertEqual(metadata["apps"], ["frappe", "erpnext", "hrms"])
+        self.assertEqual(metadata["sites"], [
+            {"name": "apps.example.com", "db_name": "_a1"},
+            {"name": "erp.localhost", "db_name": "_e1"},
+            {"name": "reports.json.local", "db_name": None},
+        ])
+        self.assertEqual(metadata["common_config"]["socketio_port"], 9000)
+
+    def test_secrets_are_not_returned(self):
+        self.assertNotIn("secret", json.dumps(parse_sites_archive([SITES_ARCHIVE])))
+
+    def test_odd_chunk_boundaries(self):
+        self.assertEqual(parse_sites_archive(chunked(SITES_ARCHIVE, 7)), parse_sites_archive([SITES_ARCHIVE]))
+
+    def test_missing_apps_txt(self):
+        archive = make_tar([("sites", None), ("sites/a.localhost/site_config.json", "{}")])
+        metadata = parse_sites_archive([archive])
+        self.assertIsNone(metadata["apps"])
+        self.assertEqual(metadata["common_config"], {})
+
+    def test_empty_output(self):
+        self.assertEqual(parse_sites_archive([b""]), {"apps": None, "sites": [], "common_config": {}})
+
+    def test_concatenated_archives(self):
+        # find -exec ... + runs tar again when the paths don't fit one command line.
+        first = make_tar([("sites/apps.txt", "frappe\n")])
+        second = make_tar([("sites/a.localhost/site_config.json", json.dumps({"db_name": "_a"}))])
+        metadata = parse_sites_archive(chunked(first + second, 100))
+        self.assertEqual((metadata["apps"], metadata["sites"]), (["frappe"], [{"name": "a.localhost", "db_name": "_a"}]))
+
+    def test_byte_limit(self):
+        with self.assertRaises(ArchiveTooLarge):
+            parse_sites_archive(chunked(SITES_ARCHIVE, 512), max_bytes=4096)
+
+
+class TestReadBenchMetadata(unittest.TestCase):
+    def make_container(self, extra_files=()):
+        files = bench_files("/home/frappe/frappe-bench", sites=["a.localhost", "apps.localhost"],
+                            apps=["frappe", "erpnext"])
+        return FakeDockerClient([FakeContainer("alpha", project="alpha", files=files + list(extra_files))]
+                                ).find_container("alpha")
+
+    def test_one_exec(self):
+        container = self.make_container()
+        metadata = read_bench_metadata(container, "/home/frappe/frappe-bench")
+
+        self.assertEqual([s["name"] for s in metadata["sites"]], ["a.localhost", "apps.localhost"])
+        self.assertEqual(metadata["sites"][0]["db_name"], site_db_name("a.localhost"))
+        self.assertEqual(metadata["apps"], ["frappe", "erpnext"])
+        self.assertEqual(container.exec_calls, [config_archive_command()])
+
+    def test_only_config_files_are_archived(self):
+        bench = "/home/frappe/frappe-bench"
+        container = self.make_container([
+            (f"{bench}/sites/a.localhost/private/files/video.mp4", b"\0" * (1024 * 1024)),
+            (f"{bench}/sites/assets/frappe/dist/bundle.js", b"x" * (512 * 1024)),
+            (f"{bench}/sites/a.localhost/private/backups/site_config.json", "{}"),
+        ])
+        tars = []
+        run = container._run
+
+        def recording_run(args, workdir, *rest):
+            result = run(args, workdir, *rest)
+            if args[0] == "tar":
+                tars.append((args[3:], len(result[1])))
+            return result
+
+        container._run = recording_run
+        metadata = read_bench_metadata(container, bench, max_bytes=64 * 1024)
+
+        self.assertEqual([s["name"] for s in metadata["sites"]], ["a.localhost", "apps.localhost"])
+        (paths, size), = tars
+        self.assertEqual(sorted(paths), ["sites/a.localhost/site_config.json", "sites/apps.localhost/site_config.json",
+                                         "sites/apps.txt", "sites/common_site_config.json"])
+        self.assertLess(size, 64 * 1024)
+
+    def test_refresh_stores_db_names(self):
+        container = self.make_container()
+        conn = sqlite3.connect(":memory:", check_same_thread=False)
+        self.addCleanup(conn.close)
+        db_operations.init_db(conn)
+        with contextlib.redirect_stdout(io.StringIO()):
+            update_db.update_database(client=container.client, conn=conn)
+
+        info = db_operations.get_project_info("alpha", conn=conn)
+        self.assertEqual(info["sites"], ["a.localhost", "apps.localhost"])
+        self.assertEqual(info["site_db_names"]["apps.localhost"], site_db_name("apps.localhost"))
+        # Discovery, fingerprint, the config archive, bench list-apps and the inventory
+        # (both interpreters missing in this container).
+        self.assertEqual(len(container.exec_calls), 6)
+
+    def test_exec_fallback_classifies_sites(self):
+        container = self.make_container()
+        self.assertEqual(update_db.get_sites(container, "/home/frappe/frappe-bench"), ["a.localhost", "apps.localhost"])
+        self.assertEqual(update_db.get_available_apps(container, "/home/frappe/frappe-bench"), ["erpnext", "frappe"])
+
+
+if __name__ == "__main__":
+    unittest.main()
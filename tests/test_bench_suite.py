@@ -0,0 +1,37 @@
+import argparse
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import bench_suite
+
+
+class TestBenchSuite(unittest.TestCase):
+    def test_small_scale_runs(self):
+        args = argparse.Namespace(sites=2, apps=2, exec_latency=0.0, api_latency=0.0, jobs=2, repeat=1)
+        with tempfile.TemporaryDirectory() as tmp:
+            results = bench_suite.run_scale(3, args, tmp)
+
+        self.assertEqual(set(results), {
+            "update_database.cold", "update_database.warm", "list_docker_compose_projects", "get_project_info",
+            "get_all_projects_info", "get_site_inventory", "find_available_port",
+        })
+        # Warm refreshes only fingerprint each bench.
+        self.assertEqual(results["update_database.warm"]["execs"], 3)
+        self.assertEqual(results["list_docker_compose_projects"]["api_calls"], 1)
+
+    def test_compare_flags_counts_and_slowdowns(self):
+        baseline = {"10": {"op": {"ms": 100.0, "api_calls": 1, "execs": 10, "statements": 4}}}
+        same = {"10": {"op": {"ms": 120.0, "api_calls": 1, "execs": 10, "statements": 4}}}
+        worse = {"10": {"op": {"ms": 200.0, "api_calls": 1, "execs": 11, "statements": 4}}}
+
+        self.assertEqual(bench_suite.compare(same, baseline, 0.5, 5.0), [])
+        self.assertEqual(bench_suite.compare(worse, baseline, 0.5, 5.0),
+                         ["10/op: execs 10 -> 11", "10/op: 100.0ms -> 200.0ms"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,229 @@
+import sqlite3
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import db_operations
+
+
+class TestUpdateProjects(unittest.TestCase):
+    def setUp(self):
+        self.conn = db_operations.configure_connection(sqlite3.connect(":memory:"))
+        db_operations.init_db(self.conn)
+        self.addCleanup(self.conn.close)
+
+    def rows(self, table):
+        return sorted(self.conn.execute(f"SELECT id, container_id, name FROM {table}").fetchall())
+
+    def test_refresh_keeps_row_ids_stable(self):
+        db_operations.update_project("p1", "c1", "/bench", ["a.localhost"], ["frappe"], conn=self.conn)
+        containers = self.conn.execute("SELECT id, container_id FROM containers").fetchall()
+        sites = self.rows("sites")
+
+        db_operations.update_project("p1", "c1", "/bench", ["a.localhost"], ["frappe"], conn=self.conn)
+
+        self.assertEqual(self.conn.execute("SELECT id, container_id FROM containers").fetchall(), containers)
+        self.assertEqual(self.rows("sites"), sites)
+
+    def test_only_changed_sites_and_apps_are_touched(self):
+        db_operations.update_project("p1", "c1", "/bench", ["a.localhost", "b.localhost"], ["frappe", "erpnext"],
+                                     conn=self.conn)
+        kept_site = [row for row in self.rows("sites") if row[2] == "a.localhost"]
+
+        db_operations.update_project("p1", "c1", "/bench", ["a.localhost", "c.localhost"], ["frappe"], conn=self.conn)
+
+        self.assertEqual({row[2] for row in self.rows("sites")}, {"a.localhost", "c.localhost"})
+        self.assertIn(kept_site[0], self.rows("sites"))
+        self.assertEqual({row[2] for row in self.rows("apps")}, {"frappe"})
+
+    def test_bulk_update_many_projects(self):
+        db_operations.update_projects([
+            {"project_name": f"p{i}", "container_id": f"c{i}", "bench_dir": "/bench",
+             "sites": [f"s{i}.localhost", f"s{i}.localhost"], "apps": ["frappe"]}
+            for i in range(1200)
+        ], conn=self.conn)
+
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM containers").fetchone()[0], 1200)
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM sites").fetchone()[0], 1200)
+        info = db_operations.get_project_info("p7", conn=self.conn)
+        self.assertEqual(info["sites"], ["s7.localhost"])
+
+
+
+class TestQueries(unittest.TestCase):
+    def setUp(self):
+        self.conn = db_operations.configure_connection(sqlite3.connect(":memory:"))
+        db_operations.init_db(self.conn)
+        self.addCleanup(self.conn.close)
+        db_operations.update_projects([
+            {"project_name": "p1", "container_id": "c1", "bench_dir": "/bench",
+             "sites": ["a.localhost", "b.localhost"], "apps": ["frappe", "erpnext", "hrms"],
+             "site_apps": {"a.localhost": ["frappe", "erpnext"], "b.localhost": ["frappe", "hrms"]}},
+            {"project_name": "p2", "container_id": "c2", "bench_dir": "/bench",
+             "sites": ["c.localhost"], "apps": ["frappe"]},
+        ], conn=self.conn)
+
+    def test_project_info_has_per_site_apps(self):
+        info = db_operations.get_project_info("p1", conn=self.conn)
+        self.assertEqual(info["sites"], ["a.localhost", "b.localhost"])
+        self.assertEqual(info["available_apps"], ["frappe", "erpnext", "hrms"])
+        self.assertEqual(info["site_apps"], {"a.localhost": ["frappe", "erpnext"], "b.localhost": ["frappe", "hrms"]})
+
+    def test_search_index_follows_writes(self):
+        def names(query, **kwargs):
+            db_operations.project_cache.invalidate()
+            result = db_operations.search(query, conn=self.conn, **kwargs)
+            return [(r["kind"], r["name"], r["project"]) for r in result["results"]]
+
+        self.assertEqual(names("erpnext"), [("app", "erpnext", "p1")])
+        self.assertEqual(names("LOCAL", kinds=["site"], project_name="p1"),
+                         [("site", "a.localhost", "p1"), ("site", "b.localhost", "p1")])
+        self.assertEqual(names("p", mode="prefix", kinds=["project"]), [("project", "p1", "p1"), ("project", "p2", "p2")])
+        self.assertEqual(names("/ben", mode="prefix"), [("bench", "/bench", "p1"), ("bench", "/bench", "p2")])
+        self.assertEqual(names("?.localhost", mode="glob"), [("site", "a.localhost", "p1"), ("site", "b.localhost", "p1"),
+                                                            ("site", "c.localhost", "p2")])
+
+        db_operations.update_projects([
+            {"project_name": "p1", "container_id": "c1", "bench_dir": "/srv/bench",
+             "sites": ["a.localhost"], "apps": ["frappe", "erpnext_custom"]},
+        ], conn=self.conn)
+        self.assertEqual(names("b.local"), [])
+        self.assertEqual(names("erpnext_"), [("app", "erpnext_custom", "p1")])
+        self.assertEqual(names("erpnext%"), [])
+        self.assertEqual(names("srv"), [("bench", "/srv/bench", "p1")])
+
+        db_operations.delete_project("p2", conn=self.conn)
+        self.assertEqual(names("c.localhost"), [])
+        self.assertEqual(names("p2"), [])
+
+    def test_all_projects_info(self):
+        projects = db_operations.get_all_projects_info(conn=self.conn)["projects"]
+        self.assertEqual(sorted(projects), ["p1", "p2"])
+        self.assertEqual(projects["p2"]["sites"], ["c.localhost"])
+        self.assertEqual(projects["p2"]["site_apps"], {})
+
+    def test_site_apps_falls_back_to_bench_apps(self):
+        self.assertEqual(db_operations.get_site_apps("p1", "b.localhost", conn=self.conn)["installed_apps"],
+                         ["frappe", "hrms"])
+        self.assertEqual(db_operations.get_site_apps("p2", "c.localhost", conn=self.conn)["installed_apps"],
+                         ["frappe"])
+
+    def test_removed_site_drops_its_installations(self):
+        db_operations.update_projects([
+            {"project_name": "p1", "container_id": "c1", "bench_dir": "/bench",
+             "sites": ["a.localhost"], "apps": ["frappe", "erpnext", "hrms"],
+             "site_apps": {"a.localhost": ["frappe"]}},
+        ], conn=self.conn)
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM site_apps").fetchone()[0], 1)
+
+
+class TestQueriesWithoutTrigramIndex(TestQueries):
+    """The same queries on a SQLite without FTS5 trigrams, where search() scans with LIKE."""
+
+    def setUp(self):
+        patcher = mock.patch.object(db_operations, "_trigram_supported", return_value=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        super().setUp()
+
+    def test_search_index_is_a_plain_table(self):
+        sql = self.conn.execute("SELECT sql FROM sqlite_master WHERE name = 'search_index'").fetchone()[0]
+        self.assertNotIn("VIRTUAL", sql.upper())
+
+
+class TestQueryCache(unittest.TestCase):
+    def setUp(self):
+        self.conn = db_operations.configure_connection(sqlite3.connect(":memory:"))
+        db_operations.init_db(self.conn)
+        self.addCleanup(self.conn.close)
+        self.now = 0.0
+        cache = db_operations.QueryCache(maxsize=2, ttl=10, clock=lambda: self.now)
+        patcher = mock.patch.object(db_operations, "project_cache", cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = cache
+        self.record = {"project_name": "p1", "container_id": "c1", "bench_dir": "/bench",
+                       "sites": ["a.localhost"], "apps": ["frappe"]}
+        db_operations.update_projects([self.record], conn=self.conn)
+
+    def test_repeated_reads_hit(self):
+        first = db_operations.get_project_info("p1", conn=self.conn)
+        self.assertIs(db_operations.get_project_info("p1", conn=self.conn), first)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_entries_expire(self):
+        db_operations.get_all_projects_info(conn=self.conn)
+        self.now = 11
+        db_operations.get_all_projects_info(conn=self.conn)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 2))
+
+    def test_writes_invalidate(self):
+        db_operations.get_project_info("p1", conn=self.conn)
+        db_operations.update_project("p1", "c1", "/bench", ["a.localhost", "b.localhost"], ["frappe"], conn=self.conn)
+        self.assertEqual(db_operations.get_project_info("p1", conn=self.conn)["sites"], ["a.localhost", "b.localhost"])
+        db_operations.delete_project("p1", conn=self.conn)
+        self.assertIsNone(db_operations.get_project_info("p1", conn=self.conn))
+
+    def test_least_recently_used_is_evicted(self):
+        for name in ("p1", "p2", "p1", "p3"):
+            db_operations.get_project_info(name, conn=self.conn)
+        db_operations.get_project_info("p1", conn=self.conn)
+        stats = db_operations.get_cache_stats()
+        self.assertEqual((stats["hits"], stats["evictions"], stats["size"]), (2, 1, 2))
+
+    def test_connections_do_not_share_entries(self):
+        other = db_operations.configure_connection(sqlite3.connect(":memory:"))
+        self.addCleanup(other.close)
+        db_operations.init_db(other)
+        db_operations.get_project_info("p1", conn=self.conn)
+        self.assertIsNone(db_operations.get_project_info("p1", conn=other))
+
+
+class TestMigrations(unittest.TestCase):
+    def test_upgrades_unversioned_database(self):
+        conn = sqlite3.connect(":memory:")
+        self.addCleanup(conn.close)
+        conn.executescript(db_operations.MIGRATIONS[0])
+        conn.execute("INSERT INTO projects (name) VALUES ('old')")
+
+        db_operations.init_db(conn)
+        db_operations.init_db(conn)
+
+        self.assertEqual(conn.execute("PRAGMA user_version").fetchone()[0], db_operations.SCHEMA_VERSION)
+        self.assertEqual(conn.execute("SELECT name FROM projects").fetchall(), [("old",)])
+        indexes = {row[1] for row in conn.execute("PRAGMA index_list(containers)")}
+        self.assertIn("idx_containers_project_id", indexes)
+
+    def test_trigram_support_is_probed(self):
+        conn = sqlite3.connect(":memory:")
+        self.addCleanup(conn.close)
+        self.assertTrue(db_operations._trigram_supported(conn))
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM temp.sqlite_master").fetchone()[0], 0)
+
+        old_sqlite = mock.Mock()
+        old_sqlite.execute.side_effect = sqlite3.OperationalError("no such tokenizer: trigram")
+        self.assertFalse(db_operations._trigram_supported(old_sqlite))
+
+    def test_first_connection_sets_up_schema_once(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        db_file = Path(directory.name) / "instances.db"
+
+        with mock.patch.object(db_operations, "DB_FILE", db_file), \
+                mock.patch.object(db_operations, "_schema_checked", set()):
+            with mock.patch.object(db_operations, "_init_db", wraps=db_operations._init_db) as init:
+                for _ in range(3):
+                    db_operations.connect().close()
+            self.assertEqual(init.call_count, 1)
+
+            conn = db_operations.connect()
+            self.addCleanup(conn.close)
+            self.assertEqual(conn.execute("PRAGMA user_version").fetchone()[0], db_operations.SCHEMA_VERSION)
+
+
+if __name__ == "__main__":
+    unittest.main()
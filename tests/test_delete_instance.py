@@ -0,0 +1,125 @@
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import db_operations
+import delete_instance
+from delete_instance import delete_frappe_instance
+from fake_docker import FakeContainer, FakeDockerClient
+
+
+class TestDeleteFrappeInstance(unittest.TestCase):
+    def setUp(self):
+        self.conn = db_operations.configure_connection(sqlite3.connect(":memory:"))
+        db_operations.init_db(self.conn)
+        self.addCleanup(self.conn.close)
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.projects_dir = directory.name
+        patcher = mock.patch.object(delete_instance, "PROJECTS_DIR", self.projects_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.client = FakeDockerClient([
+            FakeContainer(f"alpha-{service}-1", project="alpha", service=service, stop_latency=0.2)
+            for service in ("frappe", "db", "redis-cache", "redis-queue", "worker")
+        ] + [FakeContainer("beta-frappe-1", project="beta")])
+        for name in ("alpha_sites", "alpha_db-data", "beta_sites"):
+            self.client.volumes.add(name, project=name.split("_")[0])
+        for name in ("alpha_default", "beta_default"):
+            self.client.networks.add(name, project=name.split("_")[0])
+
+        db_operations.update_projects([
+            {"project_name": project, "container_id": f"{project}-id", "bench_dir": "/bench",
+             "sites": [f"{project}.localhost"], "apps": ["frappe"], "site_apps": {f"{project}.localhost": ["frappe"]}}
+            for project in ("alpha", "beta")
+        ], conn=self.conn)
+        db_operations.save_container_states([("alpha-id", "alpha", "running", ["8000"], 0)], conn=self.conn)
+
+    def delete(self, project_name="alpha", **kwargs):
+        events = []
+        result = json.loads(delete_frappe_instance(project_name, client=self.client, conn=self.conn,
+                                                   on_event=events.append, **kwargs))
+        return result, events
+
+    def test_removes_only_the_project(self):
+        result, _ = self.delete()
+        self.assertEqual(result["status"], "success")
+        self.assertEqual([c.name for c in self.client.container_list], ["beta-frappe-1"])
+        self.assertEqual([v.name for v in self.client.volumes.items], ["beta_sites"])
+        self.assertEqual([n.name for n in self.client.networks.items], ["beta_default"])
+
+    def test_containers_stop_concurrently(self):
+        started = time.monotonic()
+        self.delete()
+        # Five containers taking 0.2s each would need a second one after another.
+        self.assertLess(time.monotonic() - started, 0.6)
+
+    def test_grace_period_bounds_the_stop(self):
+        for container in self.client.container_list:
+            container.stop_latency = 30
+        started = time.monotonic()
+        result, _ = self.delete(grace=0)
+        self.assertEqual(result["status"], "success")
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_reports_progress_per_resource(self):
+        os.makedirs(os.path.join(self.projects_dir, "alpha", "sites"))
+        _, events = self.delete()
+        resources = [(e["resource"], e["status"]) for e in events]
+        self.assertEqual(resources.count(("container", "ok")), 5)
+        self.assertEqual(resources.count(("volume", "ok")), 2)
+        self.assertEqual(resources.count(("network", "ok")), 1)
+        self.assertEqual(resources[-2:], [("directory", "ok"), ("database", "ok")])
+        self.assertFalse(os.path.exists(os.path.join(self.projects_dir, "alpha")))
+
+    def test_cleans_the_project_out_of_the_cache(self):
+        self.delete()
+        self.assertIsNone(db_operations.get_project_info("alpha", conn=self.conn))
+        self.assertEqual(db_operations.get_container_states("alpha", conn=self.conn), [])
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM site_apps").fetchone()[0], 1)
+        self.assertEqual(db_operations.get_project_info("beta", conn=self.conn)["sites"], ["beta.localhost"])
+
+    def test_site_apps_go_without_foreign_keys(self):
+        self.conn.execute("PRAGMA foreign_keys = OFF")
+        self.delete()
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM site_apps").fetchone()[0], 1)
+
+    def test_failures_are_reported(self):
+        container = self.client.find_container("alpha-db-1")
+        with mock.patch.object(container, "remove", side_effect=RuntimeError("device busy")):
+            result, events = self.delete()
+        self.assertEqual(result["status"], "error")
+        self.assertIn("container alpha-db-1", result["message"])
+        failed = [e for e in events if e["status"] == "error"]
+        # Volumes and networks stay while a container still uses them.
+        self.assertEqual(sorted(e["resource"] for e in failed), ["container", "network", "volume", "volume"])
+
+    def test_rejects_paths_outside_the_projects_directory(self):
+        result, events = self.delete("../alpha")
+        self.assertEqual(result["status"], "error")
+        self.assertEqual(events, [])
+
+    def test_symlinked_project_directory_is_unlinked(self):
+        target = tempfile.TemporaryDirectory()
+        self.addCleanup(target.cleanup)
+        os.symlink(target.name, os.path.join(self.projects_dir, "alpha"))
+
+        result, events = self.delete()
+        self.assertEqual(result["status"], "success")
+        self.assertEqual([c.name for c in self.client.container_list], ["beta-frappe-1"])
+        self.assertFalse(os.path.lexists(os.path.join(self.projects_dir, "alpha")))
+        self.assertTrue(os.path.isdir(target.name))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import contextlib
+import io
+import json
+import sqlite3
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import db_operations
+import update_db
+from event_stream import PROTOCOL_VERSION, JsonLinesWriter, run_streamed
+from fake_docker import FakeContainer, FakeDockerClient, bench_files
+
+
+def read_events(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+class TestJsonLinesWriter(unittest.TestCase):
+    def test_prints_become_log_events_and_done_is_last(self):
+        out = io.StringIO()
+        writer = JsonLinesWriter(out)
+        with writer.capture_prints():
+            print("Checking directory: /home/frappe")
+            writer({"type": "progress", "stage": "x"})
+            print("partial", end="")
+        writer.finish(items=1)
+
+        events = read_events(out)
+        self.assertEqual([e["type"] for e in events], ["log", "progress", "log", "timing", "done"])
+        self.assertEqual(events[0]["message"], "Checking directory: /home/frappe")
+        self.assertEqual(events[2]["message"], "partial")
+        self.assertEqual(events[-1], dict(events[-1], status="ok", items=1, v=PROTOCOL_VERSION))
+
+
+class TestRunStreamed(unittest.TestCase):
+    def run_streamed(self, run, summarize=None):
+        out = io.StringIO()
+        code = None
+        with contextlib.redirect_stdout(out):
+            try:
+                run_streamed(run, summarize)
+            except SystemExit as e:
+                code = e.code
+        return read_events(out), code
+
+    def test_results_and_summary(self):
+        def run(writer):
+            print("working")
+            return [1, 2]
+
+        def summarize(items, writer):
+            for item in items:
+                writer.emit({"type": "result", "item": item})
+            return "ok", {"items": len(items)}
+
+        events, code = self.run_streamed(run, summarize)
+        self.assertIsNone(code)
+        self.assertEqual([e["type"] for e in events], ["log", "result", "result", "timing", "done"])
+        self.assertEqual((events[-1]["status"], events[-1]["items"]), ("ok", 2))
+
+    def test_failures_exit_with_status_1(self):
+        def run(writer):
+            raise RuntimeError("Docker is not running")
+
+        events, code = self.run_streamed(run)
+        self.assertEqual(code, 1)
+        self.assertEqual(events[0], dict(events[0], type="error", message="Docker is not running"))
+        self.assertEqual(events[-1]["status"], "error")
+
+        events, code = self.run_streamed(lambda writer: None, lambda value, writer: ("error", {}))
+        self.assertEqual(code, 1)
+        self.assertEqual(events[-1]["status"], "error")
+
+class TestRefreshEvents(unittest.TestCase):
+    def test_results_stream_per_container(self):
+        conn = sqlite3.connect(":memory:", check_same_thread=False)
+        self.addCleanup(conn.close)
+        db_operations.init_db(conn)
+        client = FakeDockerClient([
+            FakeContainer("alpha", project="alpha", files=bench_files("/home/frappe/frappe-bench",
+                                                                      sites=["a.localhost"], apps=["frappe"])),
+            FakeContainer("broken", project="broken"),  # no bench anywhere
+        ])
+
+        out = io.StringIO()
+        writer = JsonLinesWriter(out)
+        with writer.capture_prints():
+            update_db.update_database(client=client, conn=conn, inventory=False, on_event=writer)
+
+        events = [e for e in read_events(out) if e["type"] != "log"]
+        self.assertEqual(events[0], dict(events[0], type="progress", stage="refreshing", total=2))
+        finished = {e["project"]: e for e in events if e["type"] in ("result", "error")}
+        self.assertEqual(finished["alpha"]["type"], "result")
+        self.assertEqual(finished["alpha"]["outcome"], "succeeded")
+        self.assertEqual(finished["broken"]["type"], "error")
+        self.assertEqual(sorted(e["done"] for e in finished.values()), [1, 2])
+        self.assertEqual(events[-1], dict(events[-1], type="progress", stage="writing", records=1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import contextlib
+import io
+import sqlite3
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import db_operations
+import update_db
+from exec_session import ExecPool, SessionDropped, exec_batch, frame_command
+from fake_docker import FakeContainer, FakeDockerClient, bench_files
+
+BENCH_DIR = "/home/frappe/frappe-bench"
+
+
+class TestExecSession(unittest.TestCase):
+    def setUp(self):
+        self.container = FakeContainer("alpha", project="alpha",
+                                       files=bench_files(BENCH_DIR, sites=["a.localhost"], apps=["frappe", "erpnext"]))
+        self.client = FakeDockerClient([self.container])
+        self.pool = ExecPool(self.client)
+        self.addCleanup(self.pool.close)
+
+    def test_batch_matches_exec_run(self):
+        commands = [f"test -e {BENCH_DIR}/apps", ["test", "-e", "/missing"], ["ls", f"{BENCH_DIR}/apps"],
+                    ["ls", "/missing"]]
+        expected = [self.container.exec_run(cmd) for cmd in commands]
+        self.assertEqual(exec_batch(self.pool.wrap(self.container), commands), expected)
+        self.assertEqual(exec_batch(self.container, commands), expected)
+
+        # Two requests to open the shell, then nothing per command.
+        api_calls = self.client.api_calls
+        self.pool.wrap(self.container).exec_run(["ls", "/"], stderr=False)
+        self.assertEqual(self.client.api_calls, api_calls)
+        self.assertEqual(len(self.container.shells), 1)
+
+        stats = self.pool.stats()
+        self.assertEqual((stats["sessions"], stats["commands"], stats["fallbacks"]), (1, 5, 0))
+        self.assertEqual(stats["round_trips"], 2 + 2)  # open, then two batches
+        self.assertEqual(stats["round_trips_saved"], 3 * 5 - 4)
+
+    def test_dropped_session_is_reopened(self):
+        pooled = self.pool.wrap(self.container)
+        pooled.exec_run(["ls", BENCH_DIR])
+        self.container.drop_shells()
+        self.assertEqual(pooled.exec_run(["ls", f"{BENCH_DIR}/apps"]).output, b"erpnext\nfrappe\n")
+        self.assertEqual(self.pool.stats()["reconnects"], 1)
+
+    def test_falls_back_to_exec_run(self):
+        self.container.status = "exited"
+        with contextlib.redirect_stdout(io.StringIO()), self.assertRaises(RuntimeError):
+            self.pool.wrap(self.container).exec_run(["ls", "/"])
+        self.assertEqual(self.pool.stats()["fallbacks"], 1)
+
+        # Options a shell can't reproduce go straight to exec_run.
+        self.container.status = "running"
+        self.pool.wrap(self.container).exec_run(["ls", "/"], user="root")
+        self.assertEqual(self.container.shells, [])
+
+    def test_closed_pool_does_not_reopen_sessions(self):
+        session = self.pool.session(self.container)
+        session.run_many([["ls", "/"]])
+        self.pool.close()
+        with self.assertRaises(SessionDropped):
+            session.run_many([["ls", "/"]])
+        self.assertEqual(len(self.container.shells), 1)
+
+    def test_reads_time_out(self):
+        with ExecPool(self.client, timeout=2.5) as pool:
+            pool.wrap(self.container).exec_run(["ls", "/"])
+        self.assertEqual(self.container.shells[0].timeout, 2.5)
+
+    def test_framing_in_a_real_shell(self):
+        script = "".join([
+            frame_command(["printf", "no newline"], "m:1"),
+            frame_command(["cat"], "m:2"),  # must not swallow the lines behind it
+            frame_command("ls /definitely-missing", "m:3", stderr=False),
+            frame_command(["pwd"], "m:4", workdir="/"),
+            frame_command(["sh", "-c", "exit 3"], "m:5"),
+        ])
+        output = subprocess.run(["sh"], input=script.encode(), capture_output=True, check=True).stdout
+        self.assertEqual(output.split(b"m:")[0], b"no newline")
+        self.assertEqual([line.split()[-1] for line in output.splitlines() if b"m:" in line],
+                         [b"0", b"0", b"2", b"0", b"3"])
+        self.assertIn(b"/\nm:4 0\n", output)
+
+
+class TestRefreshThroughSessions(unittest.TestCase):
+    def test_refresh_uses_one_shell_per_container(self):
+        conn = sqlite3.connect(":memory:", check_same_thread=False)
+        self.addCleanup(conn.close)
+        db_operations.init_db(conn)
+        containers = [FakeContainer(name, project=name, files=bench_files(BENCH_DIR, sites=[f"{name}.localhost"],
+                                                                          apps=["frappe"]))
+                      for name in ("alpha", "beta")]
+        client = FakeDockerClient(containers)
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = update_db.update_database(client=client, conn=conn, jobs=2)
+
+        self.assertEqual(len(results["succeeded"]), 2)
+        self.assertEqual([len(c.shells) for c in containers], [1, 1])
+        self.assertTrue(all(shell.closed for c in containers for shell in c.shells))
+        self.assertEqual(results["exec"]["sessions"], 2)
+        self.assertGreater(results["exec"]["round_trips_saved"], 0)
+        # Opening the shell, discovery, one batch for everything else, then the
+        # inventory's second interpreter since the bench has no virtualenv.
+        self.assertEqual(results["exec"]["round_trips"], 2 * (2 + 1 + 1 + 1))
+        self.assertEqual(db_operations.get_project_info("beta", conn=conn)["sites"], ["beta.localhost"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import sqlite3
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import db_operations
+from frappe_instance_info import build_parser, run_query
+
+
+class TestRunQuery(unittest.TestCase):
+    def setUp(self):
+        self.conn = db_operations.configure_connection(sqlite3.connect(":memory:"))
+        db_operations.init_db(self.conn)
+        self.addCleanup(self.conn.close)
+        db_operations.update_projects([
+            {"project_name": "p1", "container_id": "c1", "bench_dir": "/bench",
+             "sites": ["a.localhost", "b.localhost"], "apps": ["frappe", "erpnext"],
+             "site_apps": {"a.localhost": ["frappe", "erpnext"], "b.localhost": ["frappe"]}},
+        ], conn=self.conn)
+
+    def query(self, *args):
+        return run_query(build_parser().parse_args(list(args)), conn=self.conn)
+
+    def test_single_queries(self):
+        self.assertEqual(self.query("-p", "p1", "--get-sites"), {"sites": ["a.localhost", "b.localhost"]})
+        self.assertEqual(self.query("-p", "p1", "--get-site-apps", "b.localhost"),
+                         {"site": "b.localhost", "installed_apps": ["frappe"]})
+
+    def test_get_many_reads_the_project_once(self):
+        misses = db_operations.get_cache_stats()["misses"]
+        result = self.query("-p", "p1", "--get-many", "sites", "apps", "site-info=a.localhost",
+                            "site-apps=z.localhost", "bogus")
+
+        self.assertEqual(db_operations.get_cache_stats()["misses"], misses + 1)
+        self.assertEqual(result["sites"], ["a.localhost", "b.localhost"])
+        self.assertEqual(result["apps"], ["frappe", "erpnext"])
+        self.assertEqual(result["site-info=a.localhost"]["installed_apps"], ["frappe", "erpnext"])
+        self.assertIn("error", result["site-apps=z.localhost"])
+        self.assertIn("error", result["bogus"])
+
+    def test_search(self):
+        result = self.query("--search", "*.localhost", "--kind", "site", "--limit", "1", "--offset", "1")
+        self.assertEqual((result["mode"], result["total"]), ("glob", 2))
+        self.assertEqual(result["results"], [{"kind": "site", "name": "b.localhost", "project": "p1"}])
+        self.assertEqual([r["kind"] for r in self.query("--search", "erp", "-p", "p1")["results"]], ["app"])
+
+
+if __name__ == "__main__":
+    unittest.main()
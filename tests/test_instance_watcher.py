@@ -0,0 +1,121 @@
+import contextlib
+import io
+import sqlite3
+import sys
+import threading
+import time
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import db_operations
+from instance_watcher import InstanceWatcher
+from fake_docker import FakeContainer, FakeDockerClient, FakeEventStream, container_event
+
+
+class TestInstanceWatcher(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:", check_same_thread=False)
+        db_operations.init_db(self.conn)
+        self.addCleanup(self.conn.close)
+
+        self.web = FakeContainer("alpha-frappe-1", project="alpha", ports={"8000/tcp": 8000})
+        self.db = FakeContainer("alpha-db-1", project="alpha", service="db")
+        self.client = FakeDockerClient([self.web, self.db])
+        self.watcher = InstanceWatcher(client=self.client, conn=self.conn)
+        self.changes = []
+        self.watcher.subscribe(self.changes.append)
+
+    def test_load_snapshot_is_persisted(self):
+        snapshot = self.watcher.load()
+
+        self.assertEqual([(p["project"], p["status"], p["ports"]) for p in snapshot], [("alpha", "running", ["8000"])])
+        stored = db_operations.get_container_states(conn=self.conn)
+        self.assertEqual([(s["container_id"], s["status"]) for s in stored], [(self.web.id, "running")])
+
+    def test_events_update_state_and_notify_subscribers(self):
+        self.watcher.load()
+        self.web.status = "exited"
+        beta = self.client.add_container(FakeContainer("beta-frappe-1", project="beta", ports={"8000/tcp": 8001}))
+        self.client.event_log = [
+            container_event("die", self.web),
+            container_event("exec_start: bash", self.web),
+            container_event("stop", self.db),  # not a frappe service container
+            container_event("start", beta),
+            container_event("destroy", self.web),
+        ]
+
+        self.watcher.follow()
+
+        self.assertEqual([(c["type"], c["project"], c.get("status")) for c in self.changes], [
+            ("instance_changed", "alpha", "exited"),
+            ("instance_changed", "beta", "running"),
+            ("instance_removed", "alpha", None),
+        ])
+        self.assertEqual(self.changes[0]["ports"], ["8000"])
+        self.assertEqual(self.changes[1]["ports"], ["8001"])
+        stored = db_operations.get_container_states(conn=self.conn)
+        self.assertEqual([(s["project_name"], s["status"], s["ports"]) for s in stored], [("beta", "running", ["8001"])])
+
+    def test_mixed_container_statuses_report_partial(self):
+        second = self.client.add_container(FakeContainer("alpha-frappe-2", project="alpha"))
+        self.watcher.load()
+        second.status = "exited"
+
+        change = self.watcher.handle_event(container_event("die", second))
+
+        self.assertEqual(change["status"], "partial")
+        self.assertEqual(sorted(c["status"] for c in change["containers"]), ["exited", "running"])
+
+    def test_snapshot_does_not_wait_on_port_inspection(self):
+        self.watcher.load()
+        self.client.api_latency = 0.3
+        handler = threading.Thread(target=self.watcher.handle_event, args=(container_event("start", self.web),))
+        handler.start()
+        time.sleep(0.05)
+
+        started = time.monotonic()
+        self.watcher.snapshot()
+        self.assertLess(time.monotonic() - started, 0.2)
+        handler.join()
+        self.assertEqual(self.changes[-1]["ports"], ["8000"])
+
+    def test_reconnects_and_resyncs_when_the_stream_drops(self):
+        self.watcher.reconnect_delay = 0.01
+        self.watcher.load()
+        gamma = FakeContainer("gamma-frappe-1", project="gamma", ports={"8000/tcp": 8002})
+        calls = []
+
+        def events(decode=False, since=None, filters=None):
+            calls.append(since)
+            if len(calls) == 1:
+                self.web.status = "exited"
+                return FakeEventStream([container_event("die", self.web)])
+            if len(calls) == 2:
+                # Started while the daemon was away: only the resync can see it.
+                self.client.add_container(gamma)
+                raise ConnectionError("daemon restarting")
+            if len(calls) == 3:
+                gamma.status = "exited"
+                return FakeEventStream([container_event("die", gamma)])
+            self.watcher.stop()
+            return FakeEventStream([])
+
+        self.client.events = events
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr):
+            self.watcher.run()
+
+        self.assertEqual([(c["project"], c["status"]) for c in self.changes],
+                         [("alpha", "exited"), ("gamma", "running"), ("gamma", "exited")])
+        self.assertEqual(len(calls), 4)
+        self.assertTrue(all(isinstance(since, int) for since in calls))
+        self.assertIn("daemon restarting", stderr.getvalue())
+        stored = db_operations.get_container_states(conn=self.conn)
+        self.assertEqual(sorted((s["project_name"], s["status"]) for s in stored),
+                         [("alpha", "exited"), ("gamma", "exited")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import sys
+import time
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from lifecycle import bulk_action, select_projects, service_tier
+from fake_docker import FakeContainer, FakeDockerClient
+
+SERVICES = ("frappe", "mariadb", "redis-cache", "worker")
+
+
+def project(name, status="running", stop_latency=0.0, labels=None):
+    return [FakeContainer(f"{name}-{service}-1", project=name, service=service, status=status,
+                          stop_latency=stop_latency, labels=labels)
+            for service in SERVICES]
+
+
+class TestBulkLifecycle(unittest.TestCase):
+    def run_action(self, client, action, *projects, **kwargs):
+        events = []
+        results = bulk_action(action, projects, client=client, on_event=events.append, **kwargs)
+        return results, events
+
+    def test_service_tiers(self):
+        self.assertEqual([service_tier(s) for s in ("mariadb", "db", "redis-queue", "frappe", "redisish", None)],
+                         [0, 0, 0, 1, 1, 1])
+
+    def test_start_brings_up_backing_services_first(self):
+        client = FakeDockerClient(project("alpha", status="exited") + project("beta", status="exited"))
+        results, events = self.run_action(client, "start", "alpha", "beta")
+
+        self.assertEqual(sorted(r["project"] for r in results["succeeded"]), ["alpha", "beta"])
+        self.assertEqual({c.status for c in client.containers.list(all=True)}, {"running"})
+        alpha = [e["service"] for e in events if e.get("project") == "alpha" and e["type"] == "progress"]
+        self.assertEqual(set(alpha[:2]), {"mariadb", "redis-cache"})
+        self.assertEqual(set(alpha[2:]), {"frappe", "worker"})
+
+    def test_restart_stops_in_reverse_order_then_starts(self):
+        client = FakeDockerClient(project("alpha"))
+        _, events = self.run_action(client, "restart", "alpha")
+
+        steps = [(e["action"], service_tier(e["service"])) for e in events if "container" in e]
+        self.assertEqual(steps, [("stop", 1)] * 2 + [("stop", 0)] * 2 + [("start", 0)] * 2 + [("start", 1)] * 2)
+
+    def test_containers_already_in_state_are_left_alone(self):
+        containers = project("alpha")
+        containers[0].status = "exited"
+        client = FakeDockerClient(containers)
+        _, events = self.run_action(client, "stop", "alpha")
+
+        statuses = {e["service"]: e["status"] for e in events if "container" in e}
+        self.assertEqual(statuses, {"frappe": "unchanged", "mariadb": "ok", "redis-cache": "ok", "worker": "ok"})
+
+    def test_projects_run_concurrently_within_timeout(self):
+        client = FakeDockerClient(project("alpha", stop_latency=0.05) + project("beta", stop_latency=0.05)
+                                  + project("slow", stop_latency=2.0))
+        started = time.monotonic()
+        results, events = self.run_action(client, "stop", "alpha", "beta", "slow", "missing", jobs=3,
+                                          timeout=0.5)
+
+        self.assertLess(time.monotonic() - started, 1.5)
+        self.assertEqual(sorted(r["project"] for r in results["succeeded"]), ["alpha", "beta"])
+        self.assertEqual(results["timed_out"], [{"project": "slow", "timeout": 0.5}])
+        self.assertEqual(results["failed"], [{"project": "missing", "error": "No containers found"}])
+        self.assertEqual(sorted(e["project"] for e in events if e["type"] == "error"), ["missing", "slow"])
+
+    def test_label_selector(self):
+        client = FakeDockerClient(project("alpha", labels={"team": "qa"}) + project("beta", labels={"team": "dev"})
+                                  + [FakeContainer("loose-1", project=None, labels={"team": "qa"})])
+
+        self.assertEqual(list(select_projects(client, labels=["team=qa"])), ["alpha"])
+        self.assertEqual(sorted(select_projects(client, labels=["team"])), ["alpha", "beta"])
+        self.assertEqual(list(select_projects(client, projects=["beta"], labels=["team=qa"])), [])
+
+        results = bulk_action("stop", labels=["team=dev"], client=client)
+        self.assertEqual([r["project"] for r in results["succeeded"]], ["beta"])
+        self.assertEqual({c.status for c in client.containers.list(all=True) if c.name.startswith("alpha")},
+                         {"running"})
+
+    def test_rejects_unknown_action_and_empty_selection(self):
+        client = FakeDockerClient(project("alpha"))
+        with self.assertRaises(ValueError):
+            bulk_action("pause", ["alpha"], client=client)
+        with self.assertRaises(ValueError):
+            bulk_action("stop", client=client)
+
+
+if __name__ == "__main__":
+    unittest.main()
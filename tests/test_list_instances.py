@@ -0,0 +1,47 @@
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from list_instances import list_docker_compose_projects
+from fake_docker import FakeContainer, FakeDockerClient
+
+
+class TestListDockerComposeProjects(unittest.TestCase):
+    def setUp(self):
+        self.client = FakeDockerClient([
+            FakeContainer("alpha-frappe-1", project="alpha", ports={"8000/tcp": 8000, "9000/tcp": 9000}),
+            FakeContainer("alpha-db-1", project="alpha", service="db", ports={"3306/tcp": 3306}),
+            FakeContainer("beta-frappe-1", project="beta", status="exited", ports={"8000/tcp": 8001}),
+            FakeContainer("gamma-frappe-1", project="gamma", ports={"8000/tcp": 8002}),
+            FakeContainer("gamma-frappe-2", project="gamma", status="exited"),
+            FakeContainer("unrelated", service=None),
+        ])
+
+    def projects(self):
+        return {p["projectName"]: p for p in list_docker_compose_projects(client=self.client)}
+
+    def test_reports_frappe_projects_only(self):
+        projects = self.projects()
+        self.assertEqual(sorted(projects), ["alpha", "beta", "gamma"])
+        self.assertEqual(projects["alpha"]["ports"], ["8000", "9000"])
+        self.assertEqual(projects["alpha"]["status"], "running")
+
+    def test_stopped_container_reports_configured_ports(self):
+        self.assertEqual(self.projects()["beta"]["ports"], ["8001"])
+
+    def test_every_container_status_is_reported(self):
+        gamma = self.projects()["gamma"]
+        self.assertEqual(gamma["status"], "partial")
+        self.assertEqual([(c["name"], c["status"]) for c in gamma["containers"]],
+                         [("gamma-frappe-1", "running"), ("gamma-frappe-2", "exited")])
+
+    def test_one_list_call_plus_stopped_inspects(self):
+        self.projects()
+        # One filtered list, one inspect for the stopped container without published ports.
+        self.assertEqual(self.client.api_calls, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
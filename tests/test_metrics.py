@@ -0,0 +1,119 @@
+import sys
+import time
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from metrics import FIELDS, MetricsSampler, RingBuffer, parse_stats
+from fake_docker import FakeContainer, FakeDockerClient
+
+MB = 1024 ** 2
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRingBuffer(unittest.TestCase):
+    def test_keeps_only_the_newest_samples(self):
+        buffer = RingBuffer(3)
+        self.assertIsNone(buffer.latest())
+        for i in range(5):
+            buffer.append((i,) * len(FIELDS))
+
+        self.assertEqual(len(buffer), 3)
+        self.assertEqual([s[0] for s in buffer.samples()], [2, 3, 4])
+        self.assertEqual([s[0] for s in buffer.samples(2)], [3, 4])
+        self.assertEqual(buffer.latest()[0], 4)
+        self.assertEqual(len(buffer._data), 3 * len(FIELDS))
+
+
+class TestMetricsSampler(unittest.TestCase):
+    def setUp(self):
+        self.containers = {
+            name: FakeContainer(f"{name}-1", project=name.split("-")[0], service=name.split("-")[1],
+                                usage=usage, stats_latency=0.05)
+            for name, usage in {
+                "alpha-frappe": {"cpu_percent": 150.0, "memory": 900 * MB},
+                "alpha-mariadb": {"cpu_percent": 20.0, "memory": 300 * MB},
+                "beta-frappe": {"cpu_percent": 40.0, "memory": 500 * MB},
+            }.items()
+        }
+        self.containers["other-nginx"] = FakeContainer("other-nginx-1", project="other", service="nginx",
+                                                       usage={"cpu_percent": 99.0})
+        self.client = FakeDockerClient(self.containers.values())
+        self.clock = FakeClock()
+        self.sampler = MetricsSampler(client=self.client, capacity=4, jobs=4, clock=self.clock)
+
+    def test_parse_stats_matches_docker_stats(self):
+        sample = dict(zip(FIELDS, parse_stats(self.containers["alpha-frappe"].stats(stream=False), now=1.0)))
+        self.assertAlmostEqual(sample["cpu_percent"], 150.0)
+        self.assertEqual(sample["memory_bytes"], 900 * MB)
+        self.assertEqual(sample["memory_limit"], 2 * 1024 ** 3)
+
+    def test_samples_frappe_projects_in_parallel(self):
+        started = time.monotonic()
+        self.assertEqual(self.sampler.sample(), 3)
+        self.assertLess(time.monotonic() - started, 0.15)
+        self.assertEqual({row["container"] for row in self.sampler.containers()},
+                         {"alpha-frappe-1", "alpha-mariadb-1", "beta-frappe-1"})
+
+    def test_history_is_bounded_and_rates_come_from_counters(self):
+        frappe = self.containers["alpha-frappe"]
+        for _ in range(10):
+            self.clock.now += 10
+            frappe.usage["rx_bytes"] += 1000
+            frappe.usage["write_bytes"] += 5000
+            self.sampler.sample()
+
+        self.assertEqual(len(self.sampler.history("alpha-frappe-1")), 4)
+        row = next(r for r in self.sampler.containers("alpha") if r["service"] == "frappe")
+        self.assertEqual((row["net_rx_rate"], row["block_write_rate"], row["samples"]), (100.0, 500.0, 4))
+
+        frappe.usage["rx_bytes"] = 0  # container restarted
+        self.clock.now += 10
+        self.sampler.sample()
+        self.assertEqual(self.sampler.containers("alpha", window=2)[0]["net_rx_rate"], 0.0)
+
+    def test_project_aggregates_and_top(self):
+        self.sampler.sample()
+        self.containers["alpha-frappe"].usage["cpu_percent"] = 50.0
+        self.sampler.sample()
+
+        alpha = next(p for p in self.sampler.projects() if p["project"] == "alpha")
+        self.assertEqual(alpha["containers"], 2)
+        self.assertEqual(alpha["cpu_percent"], 70.0)
+        self.assertEqual(alpha["cpu_avg"], 120.0)
+        self.assertEqual(alpha["memory_bytes"], 1200 * MB)
+
+        self.assertEqual([r["container"] for r in self.sampler.top(2)], ["alpha-frappe-1", "beta-frappe-1"])
+        self.assertEqual([r["project"] for r in self.sampler.top(1, "memory_bytes", by="project")], ["alpha"])
+        with self.assertRaises(ValueError):
+            self.sampler.top(sort_by="colour")
+
+    def test_stopped_containers_are_dropped(self):
+        self.sampler.sample()
+        self.containers["beta-frappe"].stop()
+        self.sampler.sample()
+        self.assertEqual([p["project"] for p in self.sampler.projects()], ["alpha"])
+        self.assertEqual(self.sampler.history("beta-frappe-1"), [])
+
+    def test_background_sampling(self):
+        rounds = []
+        sampler = MetricsSampler(client=self.client, interval=0.05)
+        sampler.start(on_event=lambda event: rounds.append(event) if event["type"] == "progress" else None)
+        time.sleep(0.3)
+        sampler.stop()
+        count = len(rounds)
+        self.assertGreaterEqual(count, 2)
+        time.sleep(0.15)
+        self.assertEqual(len(rounds), count)
+
+
+if __name__ == "__main__":
+    unittest.main()
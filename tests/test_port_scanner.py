@@ -0,0 +1,129 @@
+import socket
+import sqlite3
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import db_operations
+from create_instance import create_frappe_instance
+from port_scanner import find_available_port, is_port_free, reserve_ports
+from provisioning import DEFAULT_IMAGE
+from fake_docker import FakeContainer, FakeDockerClient
+
+# Clear of the usual 8000/9000/3306 so a developer's running benches don't interfere.
+BASE_PORT = 41000
+
+
+class TestPortScanner(unittest.TestCase):
+    def setUp(self):
+        self.conn = db_operations.configure_connection(sqlite3.connect(":memory:"))
+        db_operations.init_db(self.conn)
+        self.addCleanup(self.conn.close)
+        self.start = find_available_port(BASE_PORT, conn=self.conn)
+
+    def test_skips_bound_port(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.bind(("", self.start))
+            sock.listen()
+            self.assertGreater(find_available_port(self.start, conn=self.conn), self.start)
+
+    def test_reused_address_listener_is_not_free(self):
+        # The listener's own SO_REUSEADDR must not make the probe's bind succeed.
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(("127.0.0.1", self.start))
+            sock.listen()
+            self.assertFalse(is_port_free(self.start))
+            self.assertFalse(is_port_free(self.start, host="127.0.0.1"))
+        self.assertTrue(is_port_free(self.start))
+
+    def test_loopback_only_binding_is_not_free(self):
+        # Bound but not listening: a connect probe would call it free.
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.bind(("127.0.0.1", self.start))
+            self.assertFalse(is_port_free(self.start))
+
+    def test_skips_ports_known_to_docker(self):
+        client = FakeDockerClient([
+            FakeContainer("alpha-frappe-1", project="alpha", ports={"8000/tcp": self.start}),
+            # Stopped: nothing is bound, but the project still owns the port.
+            FakeContainer("beta-frappe-1", project="beta", status="exited", ports={"8000/tcp": self.start + 1}),
+        ])
+        port = find_available_port(self.start, client=client, conn=self.conn)
+        self.assertNotIn(port, (self.start, self.start + 1))
+
+    def test_skips_ports_in_container_state(self):
+        db_operations.save_container_states([("c1", "alpha", "exited", [str(self.start)], 0)], conn=self.conn)
+        self.assertNotEqual(find_available_port(self.start, conn=self.conn), self.start)
+
+    def test_reserves_consecutive_ports_per_service(self):
+        ports = reserve_ports("alpha", start_port=self.start, conn=self.conn)
+        self.assertEqual(list(ports), ["web", "socketio", "mariadb"])
+        first = ports["web"]
+        self.assertEqual(list(ports.values()), [first, first + 1, first + 2])
+
+        other = reserve_ports("beta", start_port=self.start, conn=self.conn)
+        self.assertFalse(set(ports.values()) & set(other.values()))
+        # Asking again returns the same reservation.
+        self.assertEqual(reserve_ports("alpha", start_port=self.start, conn=self.conn), ports)
+
+    def test_unconfirmed_reservations_expire(self):
+        first = reserve_ports("alpha", ["web"], self.start, conn=self.conn, ttl=-1)
+        self.assertEqual(reserve_ports("beta", ["web"], self.start, conn=self.conn), first)
+
+    def test_concurrent_reservations_never_share_a_port(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        db_file = Path(directory.name) / "ports.db"
+        setup = db_operations.configure_connection(sqlite3.connect(db_file))
+        db_operations.init_db(setup)
+        setup.close()
+
+        results = {}
+
+        def reserve(project):
+            conn = db_operations.configure_connection(sqlite3.connect(db_file))
+            try:
+                results[project] = reserve_ports(project, start_port=self.start, conn=conn)
+            finally:
+                conn.close()
+
+        threads = [threading.Thread(target=reserve, args=(f"p{i}",)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        ports = [port for reserved in results.values() for port in reserved.values()]
+        self.assertEqual(len(results), 8)
+        self.assertEqual(len(ports), len(set(ports)))
+
+    def test_create_instance_uses_reserved_port(self):
+        client = FakeDockerClient([FakeContainer("alpha-frappe-1", project="alpha", ports={"80/tcp": self.start})])
+        client.publish_image(DEFAULT_IMAGE)
+        config = {"projectName": "beta", "siteName": "beta.localhost", "port": self.start}
+        result = create_frappe_instance(config, client=client, conn=self.conn)
+
+        self.assertEqual(result["status"], "success")
+        self.assertNotEqual(result["port"], self.start)
+        self.assertEqual(client.find_container("beta").ports, {"80/tcp": result["port"]})
+        # Confirmed reservations outlive the TTL.
+        self.assertEqual(db_operations.get_port_reservations("beta", conn=self.conn), {"web": result["port"]})
+        self.assertIsNone(self.conn.execute("SELECT expires_at FROM port_reservations").fetchone()[0])
+
+    def test_failed_create_releases_ports(self):
+        client = FakeDockerClient([FakeContainer("beta", project="other")])
+        client.publish_image(DEFAULT_IMAGE)
+        config = {"projectName": "beta", "siteName": "beta.localhost", "port": self.start}
+        result = create_frappe_instance(config, client=client, conn=self.conn)
+
+        self.assertEqual(result["status"], "error")
+        self.assertEqual(db_operations.get_port_reservations("beta", conn=self.conn), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
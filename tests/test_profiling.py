@@ -0,0 +1,86 @@
+import contextlib
+import io
+import json
+import sqlite3
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import db_operations
+import profiling
+import update_db
+from fake_docker import FakeContainer, FakeDockerClient, bench_files
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        profiling.recorder.clear()
+        self.addCleanup(profiling.recorder.clear)
+        self.addCleanup(profiling.disable)
+
+    def test_disabled_is_a_no_op(self):
+        client = FakeDockerClient()
+        self.assertIs(profiling.instrument_client(client), client)
+        self.assertIs(profiling.connection_factory(), sqlite3.Connection)
+        with profiling.span("nothing"):
+            pass
+        self.assertEqual(profiling.recorder.spans, [])
+
+    def test_percentiles(self):
+        for ms in range(1, 101):
+            profiling.recorder.record("op", ms / 1000)
+        row = profiling.recorder.summary()["op"]
+        self.assertEqual((row["count"], row["p50_ms"], row["p95_ms"], row["max_ms"]), (100, 50, 95, 100))
+
+    def test_refresh_breakdown(self):
+        profiling.enable("json")
+        client = FakeDockerClient([
+            FakeContainer(name, project=name, files=bench_files("/home/frappe/frappe-bench",
+                                                                sites=[f"{name}.localhost"], apps=["frappe"]))
+            for name in ("alpha", "beta")
+        ])
+        conn = sqlite3.connect(":memory:", check_same_thread=False, factory=profiling.connection_factory())
+        self.addCleanup(conn.close)
+        db_operations.init_db(conn)
+        with contextlib.redirect_stdout(io.StringIO()):
+            update_db.update_database(client=client, conn=conn, inventory=False)
+
+        summary = profiling.recorder.summary()
+        self.assertEqual(summary["docker.containers.list"]["count"], 1)
+        # Commands go through one attached shell per container.
+        self.assertEqual(summary["docker.api.exec_create"]["count"], 2)
+        # Discovery, then the rest of each container's commands in one batch.
+        self.assertEqual(summary["exec_session.exec_run[find]"]["count"], 2)
+        self.assertEqual(summary["exec_session.exec_batch"]["count"], 2)
+        self.assertNotIn("exec_session.exec_run[stat]", summary)
+        self.assertNotIn("docker.container.exec_run[find]", summary)
+        self.assertEqual(summary["update_db.collect_project"]["count"], 2)
+        self.assertEqual(summary["update_db.update_database"]["count"], 1)
+        self.assertIn("sqlite.INSERT", summary)
+        self.assertIn("sqlite.SELECT", summary)
+
+        lines = [json.loads(line) for line in profiling.report().splitlines()]
+        self.assertEqual(lines[-1]["type"], "summary")
+        self.assertTrue(all(line["type"] == "span" for line in lines[:-1]))
+
+    def test_failed_calls_are_tagged(self):
+        profiling.enable()
+        client = profiling.instrument_client(FakeDockerClient())
+        with self.assertRaises(Exception):
+            client.containers.get("missing")
+        name, _, tags = profiling.recorder.spans[0]
+        self.assertEqual(name, "docker.containers.get")
+        self.assertIn("error", tags)
+        self.assertIn("docker.containers.get", profiling.report("table"))
+
+    def test_profile_flag_is_removed_from_argv(self):
+        argv = ["create_instance.py", "--profile=json", "{}"]
+        profiling.enable_from_argv(argv)
+        self.assertEqual(argv, ["create_instance.py", "{}"])
+        self.assertTrue(profiling.enabled())
+
+
+if __name__ == "__main__":
+    unittest.main()
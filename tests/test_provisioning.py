@@ -0,0 +1,187 @@
+import contextlib
+import io
+import shlex
+import sqlite3
+import sys
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import db_operations
+import provisioning
+from create_instance import create_frappe_instance
+from provisioning import DEFAULT_IMAGE, WarmPool, pull_image, resolve_image, split_image
+from fake_docker import FakeDockerClient
+
+BASE_PORT = 42000
+
+
+class TestImagePull(unittest.TestCase):
+    def setUp(self):
+        self.conn = db_operations.configure_connection(sqlite3.connect(":memory:"))
+        db_operations.init_db(self.conn)
+        self.addCleanup(self.conn.close)
+        self.client = FakeDockerClient()
+        self.digest = self.client.publish_image(DEFAULT_IMAGE, layers=2, chunks=50)
+
+    def test_split_image(self):
+        self.assertEqual(split_image("frappe/bench:v15"), ("frappe/bench", "v15"))
+        self.assertEqual(split_image("frappe/bench"), ("frappe/bench", "latest"))
+        self.assertEqual(split_image("localhost:5000/bench"), ("localhost:5000/bench", "latest"))
+
+    def test_pull_streams_thinned_progress_and_pins_digest(self):
+        events = []
+        reference = pull_image(DEFAULT_IMAGE, client=self.client, conn=self.conn, on_event=events.append)
+
+        self.assertEqual(reference, f"frappe/frappe-docker@{self.digest}")
+        self.assertEqual(db_operations.get_image_pin(DEFAULT_IMAGE, conn=self.conn), reference)
+        self.assertEqual(events[-1], {"type": "pull_complete", "image": DEFAULT_IMAGE, "reference": reference})
+        downloading = [e for e in events if e.get("status") == "Downloading"]
+        # 50 byte-count updates per layer arrive faster than PROGRESS_INTERVAL.
+        self.assertEqual(len(downloading), 2)
+        self.assertEqual([e["status"] for e in events if e.get("status") == "Pull complete"], ["Pull complete"] * 2)
+
+    def test_pull_error(self):
+        with self.assertRaises(Exception):
+            pull_image("frappe/missing:latest", client=self.client, conn=self.conn)
+
+    def test_resolve_uses_local_pin(self):
+        reference = resolve_image(client=self.client, conn=self.conn)
+        # A newer :latest is ignored until the image is pulled again.
+        self.client.publish_image(DEFAULT_IMAGE)
+        self.assertEqual(resolve_image(client=self.client, conn=self.conn), reference)
+
+        del self.client.images.local[reference]
+        self.assertNotEqual(resolve_image(client=self.client, conn=self.conn), reference)
+
+    def test_create_runs_the_pinned_digest(self):
+        config = {"projectName": "alpha", "siteName": "alpha.localhost", "port": BASE_PORT}
+        result = create_frappe_instance(config, client=self.client, conn=self.conn)
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(self.client.find_container("alpha").image_name, f"frappe/frappe-docker@{self.digest}")
+
+
+class TestWarmPool(unittest.TestCase):
+    def setUp(self):
+        # The pool refills from a background thread.
+        self.conn = db_operations.configure_connection(sqlite3.connect(":memory:", check_same_thread=False))
+        db_operations.init_db(self.conn)
+        self.addCleanup(self.conn.close)
+        self.client = FakeDockerClient()
+        self.client.publish_image(DEFAULT_IMAGE)
+        self.pool = WarmPool(client=self.client, conn=self.conn, size=2, max_age=60, start_port=BASE_PORT)
+
+    def test_fill_creates_stopped_members_with_ports(self):
+        created = self.pool.fill()
+        self.assertEqual(len(created), 2)
+        self.assertEqual(self.pool.fill(), [])
+        for container in self.pool.members():
+            self.assertEqual(container.status, "created")
+            web = db_operations.get_port_reservations(container.name, conn=self.conn)["web"]
+            self.assertEqual(container.ports, {"80/tcp": web})
+
+    def test_claim_configures_and_starts_a_member(self):
+        self.pool.fill()
+        oldest = self.pool.members()[0]
+        container, ports = self.pool.claim("alpha", {"SITE_NAME": "alpha.localhost", "ADMIN_PASSWORD": "a b"})
+
+        self.assertIs(container, oldest)
+        self.assertEqual((container.name, container.status), ("alpha", "running"))
+        self.assertEqual(container.fs.files[provisioning.POOL_ENV_FILE],
+                         b"SITE_NAME=alpha.localhost\nADMIN_PASSWORD='a b'\n")
+        self.assertEqual(ports, {"web": container.ports["80/tcp"]})
+        self.assertEqual(len(self.pool.members()), 1)
+
+    def test_create_claims_from_the_pool_and_refills(self):
+        self.pool.fill()
+        config = {"projectName": "alpha", "siteName": "alpha.localhost", "port": BASE_PORT}
+        result = create_frappe_instance(config, client=self.client, conn=self.conn, pool=self.pool)
+
+        self.assertEqual(result["status"], "success")
+        self.assertTrue(result["pooled"])
+        deadline = time.monotonic() + 2
+        while len(self.pool.members()) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(self.pool.members()), 2)
+
+    def test_claimed_instance_matches_a_cold_one(self):
+        def configuration(container):
+            # The environment its processes see: Config.Env, then the file ENV_LOADER exports.
+            environment = dict(entry.split("=", 1) for entry in container.attrs["Config"]["Env"])
+            if container.attrs["Config"]["Entrypoint"]:
+                self.assertEqual(container.attrs["Config"]["Entrypoint"][:len(provisioning.ENV_LOADER)],
+                                 provisioning.ENV_LOADER)
+                env_file = container.fs.files[provisioning.POOL_ENV_FILE].decode()
+                environment.update(shlex.split(line)[0].split("=", 1) for line in env_file.splitlines())
+            return {"name": container.name, "image": container.image_name, "status": container.status,
+                    "ports": sorted(container.ports), "environment": environment}
+
+        config = {"projectName": "alpha", "siteName": "alpha.localhost", "adminPassword": "s3cret pass",
+                  "port": BASE_PORT}
+        cold_client = FakeDockerClient()
+        cold_client.publish_image(DEFAULT_IMAGE)
+        cold_conn = db_operations.configure_connection(sqlite3.connect(":memory:"))
+        db_operations.init_db(cold_conn)
+        self.addCleanup(cold_conn.close)
+        cold = create_frappe_instance(config, client=cold_client, conn=cold_conn)
+
+        self.pool.fill()
+        self.pool.refill_in_background = lambda on_event=None: None
+        pooled = create_frappe_instance(config, client=self.client, conn=self.conn, pool=self.pool)
+
+        self.assertTrue(pooled["pooled"])
+        self.assertEqual(configuration(self.client.find_container(pooled["containerId"])),
+                         configuration(cold_client.find_container(cold["containerId"])))
+
+    def test_failed_claim_is_rolled_back(self):
+        self.pool.fill()
+        member = self.pool.members()[0]
+        member.start = mock.Mock(side_effect=RuntimeError("port is already allocated"))
+
+        with self.assertRaises(RuntimeError):
+            self.pool.claim("alpha", {"SITE_NAME": "alpha.localhost"})
+        self.assertNotIn(member, self.client.container_list)
+        self.assertEqual(db_operations.get_port_reservations(member.name, conn=self.conn), {})
+        self.assertEqual(db_operations.get_port_reservations("alpha", conn=self.conn), {})
+
+        # Removal failing too: the member gets its pool name and ports back.
+        member = self.pool.members()[0]
+        ports = db_operations.get_port_reservations(member.name, conn=self.conn)
+        member.start = mock.Mock(side_effect=RuntimeError("port is already allocated"))
+        member.remove = mock.Mock(side_effect=RuntimeError("device busy"))
+        with contextlib.redirect_stderr(io.StringIO()), self.assertRaises(RuntimeError):
+            self.pool.claim("alpha", {"SITE_NAME": "alpha.localhost"})
+        self.assertTrue(member.name.startswith(provisioning.POOL_NAME_PREFIX))
+        self.assertEqual(db_operations.get_port_reservations(member.name, conn=self.conn), ports)
+        self.assertEqual(db_operations.get_port_reservations("alpha", conn=self.conn), {})
+
+    def test_empty_pool_falls_back_to_run(self):
+        config = {"projectName": "alpha", "siteName": "alpha.localhost", "port": BASE_PORT}
+        result = create_frappe_instance(config, client=self.client, conn=self.conn,
+                                        pool=WarmPool(client=self.client, conn=self.conn, size=0))
+        self.assertEqual(result["status"], "success")
+        self.assertNotIn("pooled", result)
+        self.assertEqual(self.client.find_container("alpha").environment, {"SITE_NAME": "alpha.localhost"})
+
+    def test_evicts_old_outdated_and_excess_members(self):
+        self.pool.fill()
+        first, second = self.pool.members()
+
+        self.pool.size = 1
+        self.assertEqual(self.pool.evict(), [first.name])
+        self.assertEqual(db_operations.get_port_reservations(first.name, conn=self.conn), {})
+
+        self.assertEqual(self.pool.evict(now=time.time() + 120), [second.name])
+
+        self.pool.fill()
+        (member,) = self.pool.members()
+        self.client.publish_image(DEFAULT_IMAGE)
+        pull_image(client=self.client, conn=self.conn)
+        self.assertEqual(self.pool.evict(), [member.name])
+
+
+if __name__ == "__main__":
+    unittest.main()
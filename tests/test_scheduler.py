@@ -0,0 +1,185 @@
+import contextlib
+import io
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import db_operations
+from scheduler import RefreshScheduler, parse_started_at
+from fake_docker import FakeContainer, FakeDockerClient, FakeFilesystem, bench_files, container_event
+from workers import ExecBudget
+
+BENCH_DIR = "/home/frappe/frappe-bench"
+START = 1_700_000_000.0
+
+
+class FakeClock:
+    def __init__(self, now=START):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def started_at(timestamp):
+    return time.strftime("%Y-%m-%dT%H:%M:%S.000000000Z", time.gmtime(timestamp))
+
+
+def bench_container(name, **kwargs):
+    container = FakeContainer(name, project=name, files=bench_files(BENCH_DIR, sites=[f"{name}.localhost"],
+                                                                    apps=["frappe"]), **kwargs)
+    container.started_at = started_at(START - 3600)
+    return container
+
+
+class TestRefreshScheduler(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.db_file = str(Path(directory.name) / "instances.db")
+        db_operations.init_db(self.connect())
+        self.clock = FakeClock()
+        self.events = []
+
+    def connect(self):
+        return db_operations.configure_connection(sqlite3.connect(self.db_file, check_same_thread=False))
+
+    def scheduler(self, containers, **kwargs):
+        self.client = FakeDockerClient(containers)
+        return RefreshScheduler(client=self.client, connect=self.connect, clock=self.clock, inventory=False,
+                                **kwargs)
+
+    def tick(self, scheduler):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return scheduler.tick(self.events.append)
+
+    def test_parse_started_at(self):
+        self.assertEqual(parse_started_at("2023-11-14T22:13:20.500000000Z"), 1_700_000_000.5)
+        self.assertEqual(parse_started_at("2023-11-15T00:13:20+02:00"), 1_700_000_000.0)
+        self.assertIsNone(parse_started_at("0001-01-01T00:00:00Z"))
+
+    def test_viewed_then_changed_then_stale(self):
+        scheduler = self.scheduler([bench_container(name) for name in ("alpha", "beta", "gamma")], max_concurrent=1)
+        scheduler.view("gamma")
+        self.assertEqual(scheduler.plan(), [("gamma", "viewed"), ("alpha", "stale"), ("beta", "stale")])
+        for _ in range(3):
+            self.assertEqual(self.tick(scheduler), 1)
+            self.clock.advance(1)
+        self.assertEqual([e["project"] for e in self.events], ["gamma", "alpha", "beta"])
+        self.assertEqual(scheduler.plan(), [])
+
+        # beta restarted after its refresh; gamma is still on screen and getting old.
+        self.clock.advance(100)
+        beta = self.client.find_container("beta")
+        beta.started_at = started_at(self.clock.now - 50)
+        self.client.event_log.append(dict(container_event("start", beta), time=int(self.clock.now - 50)))
+        self.assertEqual(scheduler.plan(), [("gamma", "viewed"), ("beta", "changed")])
+
+        scheduler.view(None)
+        self.clock.advance(scheduler.max_age)
+        self.assertEqual([reason for _, reason in scheduler.plan()], ["changed", "stale", "stale"])
+
+        status = db_operations.get_refresh_status(conn=self.connect())
+        self.assertEqual(status["gamma"]["refreshed_at"], START)
+        self.assertEqual(db_operations.get_project_info("alpha", conn=self.connect())["sites"], ["alpha.localhost"])
+
+    def test_failing_project_backs_off(self):
+        broken = FakeContainer("broken", project="broken", files=["/home/frappe/notes.txt"])
+        scheduler = self.scheduler([broken], backoff=30, max_backoff=100)
+
+        self.tick(scheduler)
+        self.assertEqual(self.events[-1]["failures"], 1)
+        self.assertEqual(self.events[-1]["retry_at"], START + 30)
+        self.clock.advance(29)
+        self.assertEqual(scheduler.plan(), [])
+        self.clock.advance(1)
+        self.tick(scheduler)
+        self.assertEqual(self.events[-1]["retry_at"], self.clock.now + 60)
+        self.clock.advance(60)
+        self.tick(scheduler)
+        self.assertEqual(self.events[-1]["retry_at"], self.clock.now + 100)  # capped
+
+        broken.fs = FakeFilesystem(bench_files(BENCH_DIR, sites=["broken.localhost"], apps=["frappe"]))
+        self.clock.advance(100)
+        self.tick(scheduler)
+        self.assertEqual(self.events[-1]["type"], "result")
+        row = db_operations.get_refresh_status(conn=self.connect())["broken"]
+        self.assertEqual((row["failures"], row["retry_at"], row["error"]), (0, None, None))
+
+    def test_exec_concurrency_is_capped(self):
+        in_flight, peak, lock = [0], [0], threading.Lock()
+
+        def bench(container, args, workdir):
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            time.sleep(0.05)
+            with lock:
+                in_flight[0] -= 1
+            return 1, "", "no sites reachable\n"
+
+        names = ("p1", "p2", "p3", "p4", "p5")
+        scheduler = self.scheduler([bench_container(name, commands={"bench": bench}) for name in names],
+                                   max_concurrent=2)
+        self.assertEqual([self.tick(scheduler) for _ in range(4)], [2, 2, 1, 0])
+        self.assertEqual(peak[0], 2)
+        self.assertEqual(sorted(e["project"] for e in self.events if e["type"] == "result"), list(names))
+
+    def test_rounds_do_not_inspect_known_containers(self):
+        scheduler = self.scheduler([bench_container(f"p{i}") for i in range(6)])
+        scheduler.plan()
+        self.client.api_calls = 0
+        for _ in range(3):
+            scheduler.plan()
+        # The summaries and the start events, per round.
+        self.assertEqual(self.client.api_calls, 3 * 2)
+
+        self.client.add_container(bench_container("p6"))
+        self.client.api_calls = 0
+        self.assertIn(("p6", "stale"), scheduler.plan())
+        self.assertEqual(self.client.api_calls, 2 + 1)
+
+    def test_foreground_refreshes_share_the_budget(self):
+        budget = ExecBudget()
+        scheduler = self.scheduler([bench_container(name) for name in ("p1", "p2", "p3")], max_concurrent=2,
+                                   budget=budget)
+        with budget.held(2):
+            self.assertEqual(self.tick(scheduler), 0)
+        with budget.held(1):
+            self.assertEqual(self.tick(scheduler), 1)
+        self.assertEqual(self.tick(scheduler), 2)
+        self.assertEqual(budget.in_use, 0)
+
+    def test_timed_out_refresh_keeps_its_slot(self):
+        release = threading.Event()
+
+        def bench(container, args, workdir):
+            release.wait(5)
+            return 1, "", ""
+
+        scheduler = self.scheduler([bench_container("a-slow", commands={"bench": bench}), bench_container("b-next")],
+                                   max_concurrent=1, timeout=0.1)
+        self.tick(scheduler)
+        self.assertEqual(self.events[-1]["error"], "Timed out after 0.1s")
+        self.assertEqual(scheduler.plan(), [("b-next", "stale")])
+        self.assertEqual(self.tick(scheduler), 0)  # a-slow still holds the only slot
+
+        release.set()
+        deadline = time.monotonic() + 5
+        while scheduler.status()[0]["running"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.tick(scheduler), 1)
+        self.assertEqual(self.events[-1]["project"], "b-next")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+import contextlib
+import io
+import sqlite3
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import db_operations
+import update_db
+from frappe_instance_info import build_parser, run_query
+from site_inventory import collect_inventory
+from fake_docker import FakeContainer, FakeDockerClient, bench_files, fake_bench_command, fake_python_command, site_db_name
+
+BENCH = "/home/frappe/frappe-bench"
+COMMIT = "0123456789abcdef0123456789abcdef01234567"
+
+
+def inventory_files(sites, apps):
+    files = bench_files(BENCH, sites=sites, apps=apps)
+    for app in apps:
+        files.append((f"{BENCH}/apps/{app}/{app}/__init__.py", f'__version__ = "15.{len(app)}.0"\n'))
+    # frappe: branch ref with a loose object; erpnext: packed ref; others: detached HEAD.
+    files.append((f"{BENCH}/apps/frappe/.git/HEAD", "ref: refs/heads/version-15\n"))
+    files.append((f"{BENCH}/apps/frappe/.git/refs/heads/version-15", COMMIT + "\n"))
+    files.append((f"{BENCH}/apps/erpnext/.git/HEAD", "ref: refs/heads/develop\n"))
+    files.append((f"{BENCH}/apps/erpnext/.git/packed-refs", f"# pack-refs\n{COMMIT[::-1]} refs/heads/develop\n"))
+    return files
+
+
+class TestCollectInventory(unittest.TestCase):
+    def test_versions_sizes_and_backups_in_one_exec(self):
+        files = inventory_files(["a.localhost", "b.localhost"], ["frappe", "erpnext", "hrms"])
+        files += [
+            (f"{BENCH}/sites/a.localhost/public/files/logo.png", b"x" * 300),
+            (f"{BENCH}/sites/a.localhost/private/files/invoice.pdf", b"x" * 700),
+            (f"{BENCH}/sites/a.localhost/private/backups/20240101-database.sql.gz", b"x" * 50),
+            (f"{BENCH}/apps/hrms/.git/HEAD", COMMIT[:40] + "\n"),
+        ]
+        container = FakeContainer("alpha", project="alpha", files=files, commands={
+            f"{BENCH}/env/bin/python": fake_python_command({site_db_name("a.localhost"): 4096}),
+        })
+        container.fs.touch(f"{BENCH}/sites/a.localhost/private/backups/20240101-database.sql.gz")
+        backup_time = container.fs.clock
+
+        inventory = collect_inventory(container, BENCH)
+
+        self.assertEqual(len(container.exec_calls), 1)
+        self.assertEqual(inventory["apps"]["frappe"], {"version": "15.6.0", "branch": "version-15", "commit": COMMIT})
+        self.assertEqual(inventory["apps"]["erpnext"]["commit"], COMMIT[::-1])
+        self.assertEqual(inventory["apps"]["hrms"], {"version": "15.4.0", "branch": None, "commit": COMMIT})
+        self.assertEqual(inventory["sites"]["a.localhost"],
+                         {"db_size": 4096, "files_size": 1000, "last_backup": backup_time})
+        # No credentials accepted and no files: sizes are known to be empty, the DB size is not.
+        self.assertEqual(inventory["sites"]["b.localhost"], {"db_size": None, "files_size": 0, "last_backup": None})
+
+    def test_falls_back_to_system_python(self):
+        container = FakeContainer("alpha", project="alpha", files=inventory_files(["a.localhost"], ["frappe"]),
+                                  commands={"python3": fake_python_command()})
+        inventory = collect_inventory(container, BENCH)
+        self.assertEqual(list(inventory["sites"]), ["a.localhost"])
+        self.assertEqual(len(container.exec_calls), 2)
+
+    def test_no_interpreter(self):
+        container = FakeContainer("alpha", project="alpha", files=inventory_files(["a.localhost"], ["frappe"]))
+        self.assertIsNone(collect_inventory(container, BENCH))
+
+
+class TestInventoryRefresh(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:", check_same_thread=False)
+        db_operations.init_db(self.conn)
+        self.addCleanup(self.conn.close)
+        sizes = {site_db_name("a.localhost"): 5000, site_db_name("b.localhost"): 100, site_db_name("c.localhost"): 900}
+        self.client = FakeDockerClient([
+            FakeContainer("alpha", project="alpha", files=inventory_files(["a.localhost", "b.localhost"],
+                                                                          ["frappe", "erpnext"]), commands={
+                "bench": fake_bench_command({"a.localhost": ["frappe", "erpnext"], "b.localhost": ["frappe"]}),
+                f"{BENCH}/env/bin/python": fake_python_command(sizes),
+            }),
+            FakeContainer("beta", project="beta", files=inventory_files(["c.localhost"], ["frappe"]), commands={
+                f"{BENCH}/env/bin/python": fake_python_command(sizes),
+            }),
+        ])
+
+    def update(self, **kwargs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return update_db.update_database(client=self.client, conn=self.conn, jobs=2, **kwargs)
+
+    def query(self, *args):
+        return run_query(build_parser().parse_args(list(args)), conn=self.conn)["sites"]
+
+    def test_heaviest_sites_across_projects(self):
+        self.update()
+
+        sites = self.query("--inventory", "--limit", "2")
+        self.assertEqual([(s["project"], s["site"], s["db_size"]) for s in sites],
+                         [("alpha", "a.localhost", 5000), ("beta", "c.localhost", 900)])
+        self.assertEqual(sites[0]["installed_apps"], [
+            {"name": "frappe", "version": "15.6.0", "branch": "version-15", "commit": COMMIT},
+            {"name": "erpnext", "version": "15.7.0", "branch": "develop", "commit": COMMIT[::-1]},
+        ])
+        # beta has no bench command: installations fall back to the bench's apps.
+        self.assertEqual([a["name"] for a in sites[1]["installed_apps"]], ["frappe"])
+
+        self.assertEqual([s["site"] for s in self.query("--inventory", "-p", "alpha", "--ascending")],
+                         ["b.localhost", "a.localhost"])
+        self.assertEqual([s["site"] for s in self.query("--inventory", "--sort-by", "site", "--ascending")],
+                         ["a.localhost", "b.localhost", "c.localhost"])
+
+    def test_unchanged_containers_reread_inventory_when_due(self):
+        self.update()
+        python = f"{BENCH}/env/bin/python"
+
+        def inventory_execs():
+            return sum(1 for c in self.client.container_list for call in c.exec_calls if call[0] == python)
+
+        before = inventory_execs()
+        self.assertEqual(len(self.update()["skipped"]), 2)
+        self.assertEqual(inventory_execs(), before)
+
+        self.update(inventory_max_age=0)
+        self.assertEqual(inventory_execs(), before + 2)
+
+    def test_removed_site_drops_its_inventory(self):
+        self.update()
+        self.client.find_container("alpha").fs.remove(f"{BENCH}/sites/b.localhost")
+        self.update()
+
+        self.assertEqual([s["site"] for s in self.query("--inventory", "-p", "alpha")], ["a.localhost"])
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM site_inventory").fetchone()[0], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import sqlite3
+import struct
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import db_operations
+import snapshot
+from snapshot import SnapshotError, decode_column, encode_column, export_snapshot, import_snapshot
+
+
+def new_conn():
+    conn = db_operations.configure_connection(sqlite3.connect(":memory:"))
+    db_operations.init_db(conn)
+    return conn
+
+
+class TestColumns(unittest.TestCase):
+    def test_round_trip_each_type(self):
+        for values in [(1, None, -2 ** 40), (1.5, None, 3.0), ("a", None, "", "ünïcode"),
+                       (None, None), (1, "x", None), ()]:
+            block = encode_column(values)
+            self.assertEqual(len(block) % 8, 0)
+            decoded, pos = decode_column(memoryview(block), 0, len(values))
+            self.assertEqual(decoded, list(values))
+            self.assertEqual(pos, len(block))
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / "inventory.cwsnap"
+
+        self.source = new_conn()
+        self.addCleanup(self.source.close)
+        db_operations.update_projects([
+            {"project_name": f"p{i}", "container_id": f"c{i}", "bench_dir": "/home/frappe/frappe-bench",
+             "sites": [f"s{j}.p{i}.localhost" for j in range(3)], "apps": ["frappe", "erpnext"],
+             "site_apps": {f"s0.p{i}.localhost": ["frappe", "erpnext"]},
+             "site_db_names": {f"s0.p{i}.localhost": f"_db{i}"}}
+            for i in range(5)
+        ], conn=self.source)
+        db_operations.save_inventories({
+            "c1": {"apps": {"frappe": {"version": "15.1.0", "branch": "version-15", "commit": "abc"}},
+                   "sites": {"s0.p1.localhost": {"db_size": 1024, "files_size": None, "last_backup": 1.5}}},
+        }, collected_at=100.0, conn=self.source)
+        db_operations.cache_bench_dir("c1", "sha256:img", "/home/frappe/frappe-bench", conn=self.source)
+
+        self.target = new_conn()
+        self.addCleanup(self.target.close)
+
+    def dump(self, conn):
+        return {table: sorted(conn.execute(f"SELECT * FROM {table}").fetchall(), key=repr)
+                for table in snapshot.TABLES}
+
+    def test_export_then_import_restores_inventory(self):
+        db_operations.update_project("stale", "old", "/bench", ["x.localhost"], ["frappe"], conn=self.target)
+        exported = export_snapshot(self.path, conn=self.source, chunk_rows=4)
+        self.assertFalse(self.path.with_name(self.path.name + ".partial").exists())
+
+        self.assertEqual(import_snapshot(self.path, conn=self.target), exported)
+        self.assertEqual(self.dump(self.target), self.dump(self.source))
+        self.assertEqual(exported["sites"], 15)
+        db_operations.project_cache.invalidate()
+        self.assertEqual(db_operations.get_all_projects_info(conn=self.target),
+                         db_operations.get_all_projects_info(conn=self.source))
+        self.assertEqual(db_operations.search("s2.p3", conn=self.target)["results"],
+                         [{"kind": "site", "name": "s2.p3.localhost", "project": "p3"}])
+        self.assertEqual(db_operations.search("stale", conn=self.target)["total"], 0)
+
+    def test_rejects_foreign_and_newer_files(self):
+        self.path.write_bytes(b"not a snapshot at all")
+        with self.assertRaises(SnapshotError):
+            import_snapshot(self.path, conn=self.target)
+
+        export_snapshot(self.path, conn=self.source)
+        data = bytearray(self.path.read_bytes())
+        struct.pack_into("<I", data, 8, snapshot.FORMAT_VERSION + 1)
+        self.path.write_bytes(bytes(data))
+        with self.assertRaises(SnapshotError):
+            import_snapshot(self.path, conn=self.target)
+
+    def test_failed_import_keeps_existing_inventory(self):
+        db_operations.update_project("keep", "k1", "/bench", ["k.localhost"], ["frappe"], conn=self.target)
+        export_snapshot(self.path, conn=self.source)
+        self.path.write_bytes(self.path.read_bytes()[:-40])  # truncated mid-chunk
+
+        with self.assertRaises(SnapshotError):
+            import_snapshot(self.path, conn=self.target)
+        self.assertEqual(self.target.execute("SELECT name FROM projects").fetchall(), [("keep",)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,31 @@
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parent.parent / "backend"
+
+
+def run_python(code):
+    return subprocess.run([sys.executable, "-c", code], cwd=BACKEND, capture_output=True, text=True)
+
+
+class TestStartup(unittest.TestCase):
+    def test_read_paths_do_not_import_docker(self):
+        result = run_python("import sys, frappe_instance_info, db_operations; print('docker' in sys.modules)")
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), "False")
+
+    def test_importing_db_operations_opens_no_connection(self):
+        result = run_python(
+            "import sqlite3\n"
+            "def refuse(*args, **kwargs):\n"
+            "    raise AssertionError('connected at import time')\n"
+            "sqlite3.connect = refuse\n"
+            "import db_operations, frappe_instance_info\n"
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+
+if __name__ == "__main__":
+    unittest.main()
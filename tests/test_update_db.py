@@ -0,0 +1,184 @@
+import contextlib
+import io
+import json
+import sqlite3
+import sys
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import db_operations
+import update_db
+from fake_docker import FakeContainer, FakeDockerClient, bench_files, fake_bench_command
+
+
+class TestFindBenchDirectory(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        db_operations.init_db(self.conn)
+        self.addCleanup(self.conn.close)
+
+    def find(self, container, **kwargs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return update_db.find_bench_directory_in_container(container, conn=self.conn, **kwargs)
+
+    def test_single_exec_discovery(self):
+        container = FakeContainer("c1", project="p1", files=bench_files("/workspace/development/frappe-bench",
+                                                                        sites=["a.localhost"], apps=["frappe"]))
+        self.assertEqual(self.find(container), "/workspace/development/frappe-bench")
+        self.assertEqual(len(container.exec_calls), 1)
+
+    def test_prefers_earlier_root_and_ignores_incomplete_benches(self):
+        files = bench_files("/workspace/frappe-bench", apps=["frappe"])
+        files += bench_files("/home/frappe/frappe-bench", apps=["frappe"])
+        files += ["/home/frappe/half-bench/sites/common_site_config.json"]  # no apps/
+        files += bench_files("/home/frappe/frappe-bench/apps/frappe/node_modules/x", apps=["y"])
+        container = FakeContainer("c2", project="p2", files=files)
+        self.assertEqual(self.find(container), "/home/frappe/frappe-bench")
+
+    def test_respects_search_depth(self):
+        container = FakeContainer("c3", project="p3", files=bench_files("/home/frappe/a/b/c/d/bench", apps=["frappe"]))
+        self.assertIsNone(self.find(container))
+
+    def test_cached_per_container_and_image(self):
+        container = FakeContainer("c4", project="p4", files=bench_files("/home/frappe/frappe-bench", apps=["frappe"]))
+        self.find(container)
+        self.assertEqual(self.find(container), "/home/frappe/frappe-bench")
+        self.assertEqual(len(container.exec_calls), 1)
+
+        container.image_id = "sha256:rebuilt"
+        self.find(container)
+        self.assertEqual(len(container.exec_calls), 2)
+
+        self.find(container, use_cache=False)
+        self.assertEqual(len(container.exec_calls), 3)
+
+
+
+class TestUpdateDatabase(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:", check_same_thread=False)
+        db_operations.init_db(self.conn)
+        self.addCleanup(self.conn.close)
+
+    def make_client(self):
+        return FakeDockerClient([
+            FakeContainer("alpha", project="alpha", files=bench_files("/home/frappe/frappe-bench",
+                                                                      sites=["a.localhost", "b.localhost"],
+                                                                      apps=["frappe", "erpnext"]),
+                          commands={"bench": fake_bench_command({"a.localhost": ["frappe", "erpnext"],
+                                                                 "b.localhost": ["frappe"]})}),
+            FakeContainer("beta", project="beta", files=bench_files("/workspace/frappe-bench",
+                                                                    sites=["b.localhost"], apps=["frappe"])),
+            FakeContainer("empty", project="empty", files=["/home/frappe/notes.txt"]),
+            FakeContainer("beta-db", project="beta", service="db"),
+        ])
+
+    def update(self, client, **kwargs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return update_db.update_database(client=client, conn=self.conn, **kwargs)
+
+    def test_parallel_refresh_aggregates_results(self):
+        results = self.update(self.make_client(), jobs=3)
+
+        self.assertEqual(sorted(r["project"] for r in results["succeeded"]), ["alpha", "beta"])
+        self.assertEqual([r["project"] for r in results["failed"]], ["empty"])
+        self.assertEqual(results["timed_out"], [])
+        info = db_operations.get_project_info("alpha", conn=self.conn)
+        self.assertEqual(info["sites"], ["a.localhost", "b.localhost"])
+        self.assertEqual(sorted(info["available_apps"]), ["erpnext", "frappe"])
+
+    def test_records_per_site_installed_apps(self):
+        self.update(self.make_client())
+
+        info = db_operations.get_project_info("alpha", conn=self.conn)
+        # Apps are ordered as in sites/apps.txt.
+        self.assertEqual(info["site_apps"], {"a.localhost": ["frappe", "erpnext"], "b.localhost": ["frappe"]})
+        # beta has no bench command, so installations stay unknown.
+        self.assertEqual(db_operations.get_project_info("beta", conn=self.conn)["site_apps"], {})
+
+    def test_project_filter_keeps_service_filter(self):
+        client = self.make_client()
+        results = self.update(client, project_name="beta")
+
+        self.assertEqual([r["project"] for r in results["succeeded"]], ["beta"])
+        self.assertEqual(client.containers.get("beta-db").exec_calls, [])
+
+    def test_slow_container_times_out(self):
+        client = self.make_client()
+        client.containers.get("beta").exec_latency = 0.5
+
+        results = self.update(client, jobs=2, timeout=0.2)
+
+        self.assertEqual([r["project"] for r in results["timed_out"]], ["beta"])
+        self.assertEqual([r["project"] for r in results["succeeded"]], ["alpha"])
+        self.assertIsNone(db_operations.get_project_info("beta", conn=self.conn))
+
+
+class TestIncrementalRefresh(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:", check_same_thread=False)
+        db_operations.init_db(self.conn)
+        self.addCleanup(self.conn.close)
+        self.client = FakeDockerClient([
+            FakeContainer(name, project=name, exec_latency=0.01,
+                          files=bench_files("/home/frappe/frappe-bench", sites=[f"{name}.localhost"], apps=["frappe"]))
+            for name in ("alpha", "beta", "gamma")
+        ])
+
+    def update(self, **kwargs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return update_db.update_database(client=self.client, conn=self.conn, jobs=3, **kwargs)
+
+    def test_unchanged_containers_are_skipped(self):
+        self.update()
+        execs = self.client.exec_count
+        results = self.update()
+
+        self.assertEqual(results["succeeded"], [])
+        self.assertEqual(sorted(r["project"] for r in results["skipped"]), ["alpha", "beta", "gamma"])
+        self.assertGreater(results["time_saved"], 0)
+        # One stat per container and nothing else.
+        self.assertEqual(self.client.exec_count - execs, 3)
+
+    def test_new_site_or_restart_triggers_refresh(self):
+        self.update()
+        self.client.find_container("alpha").fs.add_file("/home/frappe/frappe-bench/sites/new.localhost/site_config.json")
+        self.client.find_container("beta").start()
+
+        results = self.update()
+        self.assertEqual(sorted(r["project"] for r in results["succeeded"]), ["alpha", "beta"])
+        self.assertEqual([r["project"] for r in results["skipped"]], ["gamma"])
+        self.assertIn("new.localhost", db_operations.get_project_info("alpha", conn=self.conn)["sites"])
+
+    def test_force_refreshes_everything(self):
+        self.update()
+        results = self.update(force=True)
+        self.assertEqual(len(results["succeeded"]), 3)
+        self.assertEqual(results["skipped"], [])
+
+    def test_partial_refresh_does_not_record_fingerprint(self):
+        self.update(update_apps=False)
+        self.assertEqual(len(self.update()["succeeded"]), 3)
+
+
+class TestMain(unittest.TestCase):
+    def test_stdout_is_only_the_json_result(self):
+        def refresh(**kwargs):
+            print("Updated information for project: alpha")
+            return {"succeeded": [{"project": "alpha"}]}
+
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with mock.patch.object(update_db, "update_database", refresh), \
+                mock.patch.object(sys, "argv", ["update_db.py"]), \
+                contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            update_db.main()
+
+        self.assertEqual(json.loads(stdout.getvalue()), {"succeeded": [{"project": "alpha"}]})
+        self.assertIn("Updated information for project: alpha", stderr.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
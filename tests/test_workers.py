@@ -0,0 +1,70 @@
+import sys
+import threading
+import time
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from workers import run_bounded, run_grouped
+
+
+class ConcurrencyProbe:
+    """Task bodies that record how many of them run at once."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+
+    def task(self, seconds):
+        def run():
+            with self.lock:
+                self.running += 1
+                self.peak = max(self.peak, self.running)
+            time.sleep(seconds)
+            with self.lock:
+                self.running -= 1
+            return seconds
+        return run
+
+
+class TestRunBounded(unittest.TestCase):
+    def test_timed_out_thread_does_not_take_more_tasks(self):
+        probe = ConcurrencyProbe()
+        tasks = [("slow", lambda: time.sleep(0.3))] + [(f"t{i}", probe.task(0.1)) for i in range(10)]
+        outcomes = dict((key, outcome) for key, outcome, _ in run_bounded(tasks, jobs=2, timeout=0.2))
+
+        self.assertEqual(outcomes["slow"], "timeout")
+        self.assertEqual(list(outcomes.values()).count("ok"), 10)
+        # The slow call outlives its timeout, but its thread then exits instead of joining the replacement.
+        self.assertEqual(probe.peak, 2)
+
+    def test_errors_are_reported(self):
+        def fail():
+            raise ValueError("boom")
+        (key, outcome, value), = run_bounded([("a", fail)], jobs=1, timeout=1)
+        self.assertEqual((key, outcome, str(value)), ("a", "error", "boom"))
+
+
+class TestRunGrouped(unittest.TestCase):
+    def test_timed_out_thread_does_not_take_more_tasks(self):
+        probe = ConcurrencyProbe()
+        groups = [[("slow", lambda: time.sleep(0.3))] + [(f"a{i}", probe.task(0.1)) for i in range(5)],
+                  [(f"b{i}", probe.task(0.1)) for i in range(5)]]
+        outcomes = dict((key, outcome) for key, outcome, _ in run_grouped(groups, jobs=2, per_group=2, timeout=0.2))
+
+        self.assertEqual(outcomes["slow"], "timeout")
+        self.assertEqual(list(outcomes.values()).count("ok"), 10)
+        self.assertEqual(probe.peak, 2)
+
+    def test_per_group_limit(self):
+        probe = ConcurrencyProbe()
+        groups = [[(f"a{i}", probe.task(0.05)) for i in range(4)]]
+        results = list(run_grouped(groups, jobs=4, per_group=1, timeout=None))
+        self.assertEqual(len(results), 4)
+        self.assertEqual(probe.peak, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()